@@ -1,124 +1,129 @@
-# app.py — versión corregida
-import os
-import threading
-import time
-import logging
-import psycopg2
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-
-# 🔧 logging básico (opcional, útil para Render/uvicorn)
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# ✅ Inicialización de FastAPI
-app = FastAPI(title="asistente")
-
-# 🌐 Configuración de CORS
-origins = [
-    "https://licbustamante.com.ar",
-    "http://localhost",
-    "http://localhost:3000",
-    "http://127.0.0.1:3000",
-]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# 📌 Carga robusta de DATABASE_URL (env → constantes como respaldo)
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    try:
-        from core.constantes import DATABASE_URL as _DB_FROM_CONST
-        DATABASE_URL = _DB_FROM_CONST
-    except Exception:
-        raise ValueError("DATABASE_URL no está configurada en el entorno ni en core.constantes.")
-
-# 🧠 Variables de sesión (en memoria)
-user_sessions: dict[str, dict] = {}
-SESSION_TIMEOUT = 60 * 8  # 8 minutos
-
-# 🧠 Inicialización de síntomas cacheados
-sintomas_cacheados = set()
-
-# 📂 Importar y montar el router de /asistente
-from routes.asistente import router as asistente_router  # noqa: E402
-app.include_router(asistente_router)
-
-# 🔌 Startup: FAQ embeddings + limpieza de sesiones + precarga de síntomas
-@app.on_event("startup")
-def startup_event():
-    global sintomas_cacheados
-
-    # 🧠 Generar embeddings de FAQ si está disponible
-    try:
-        from core.faq_semantica import generate_embeddings_faq  # noqa: WPS433
-        generate_embeddings_faq()
-    except Exception:
-        pass
-
-    # 🧹 Inicia limpieza de sesiones
-    start_session_cleaner()
-
-    # 🗂️ Cargar cache de síntomas desde historial
-    try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT DISTINCT LOWER(unnest(emociones)) AS sintoma
-            FROM public.historial_clinico_usuario
-            WHERE emociones IS NOT NULL
-        """)
-        sintomas = cursor.fetchall()
-        conn.close()
-
-        sintomas_cacheados = {s[0].strip() for s in sintomas if s and s[0]}
-        logger.info("✅ Cache de síntomas cargado: %s ítems.", len(sintomas_cacheados))
-    except Exception as e:
-        logger.warning("⚠️ Error al inicializar cache de síntomas: %s", e)
-        sintomas_cacheados = set()
-
-# 🧽 Limpiador de sesiones inactivas
-def start_session_cleaner():
-    def cleaner():
-        while True:
-            current_time = time.time()
-            inactivos = [
-                user_id for user_id, session in list(user_sessions.items())
-                if current_time - session.get("ultima_interaccion", 0) > SESSION_TIMEOUT
-            ]
-            for user_id in inactivos:
-                user_sessions.pop(user_id, None)
-            time.sleep(30)
-
-    thread = threading.Thread(target=cleaner, daemon=True)
-    thread.start()
-
-# ✅ Endpoint raíz para evitar 404 y verificar estado básico
-@app.get("/")
-def root():
-    return {
-        "status": "ok",
-        "service": "asistente",
-        "endpoints": {
-            "POST /asistente": "Procesa la interacción del usuario",
-            "GET /health": "Chequeo de salud simple",
-        },
-    }
-
-# ✅ Healthcheck simple (útil para Render/monitoreo)
-@app.get("/health")
-def health():
-    try:
-        # intento liviano de conexión
-        conn = psycopg2.connect(DATABASE_URL)
-        conn.close()
-        db = "ok"
-    except Exception:
-        db = "fail"
-    return {"status": "ok", "db": db}
-
+# app.py — versión corregida
+from core.arranque import INICIO_PROCESO  # noqa: F401  ⏱️ primero: referencia para medir el arranque en frío
+import asyncio
+import os
+import logging
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+# 🔧 logging básico (opcional, útil para Render/uvicorn)
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ✅ Inicialización de FastAPI
+app = FastAPI(title="asistente")
+
+# 🌐 Configuración de CORS
+origins = [
+    "https://licbustamante.com.ar",
+    "http://localhost",
+    "http://localhost:3000",
+    "http://127.0.0.1:3000",
+]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# ⏱️ Arranque en frío: inicio del proceso → primera respuesta (se desactiva solo tras medirla)
+from core.arranque import MedidorArranque  # noqa: E402
+app.add_middleware(MedidorArranque)
+
+# 📌 Carga robusta de DATABASE_URL (env → constantes como respaldo)
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    try:
+        from core.constantes import DATABASE_URL as _DB_FROM_CONST
+        DATABASE_URL = _DB_FROM_CONST
+    except Exception:
+        raise ValueError("DATABASE_URL no está configurada en el entorno ni en core.constantes.")
+
+# 🧠 Sesiones en memoria: almacén único compartido con el router (expiran por SESSION_TIMEOUT)
+from core.contexto import user_sessions  # noqa: E402
+
+# 📂 Importar y montar el router de /asistente
+from routes.asistente import router as asistente_router  # noqa: E402
+app.include_router(asistente_router)
+
+# 🔌 Startup no bloqueante: el worker acepta tráfico enseguida y se calienta en segundo plano
+# (pool de DB, esquema, particiones, vocabulario, mapa emoción→cuadro, léxicos, pools HTTP de OpenAI,
+# embeddings de FAQ). El progreso se ve en /health → "arranque".
+@app.on_event("startup")
+async def startup_event():
+    from core.arranque import iniciar_arranque, calentar_async
+    iniciar_arranque()
+    asyncio.create_task(calentar_async())
+
+# ✅ Endpoint raíz para evitar 404 y verificar estado básico
+@app.get("/")
+def root():
+    return {
+        "status": "ok",
+        "service": "asistente",
+        "endpoints": {
+            "POST /asistente": "Procesa la interacción del usuario",
+            "GET /health": "Chequeo de salud simple",
+        },
+    }
+
+# ✅ Healthcheck simple (útil para Render/monitoreo)
+@app.get("/health")
+def health():
+    from core.db.conexion import conexion_del_pool, estadisticas_pool
+    from core.utils.generador_openai import estadisticas_cache_llm, estadisticas_coalescer_llm
+    from core.utils.circuito_openai import estadisticas_circuito_llm
+    from core.plazo import estadisticas_plazo
+    from core.utils.grafo_turno import estadisticas_grafo_turno
+    from core.utils.preclasificador import estadisticas_preclasificador
+    from core.concurrencia import estadisticas_concurrencia
+    from core.db.cola_escritura import estadisticas_cola_escritura
+    from core.db.migraciones import reporte_esquema
+    from core.db.sentencias import estadisticas_sentencias
+    from core.utils.mapa_emocion_cuadro import estadisticas_mapa_emocion_cuadro
+    from core.db.perfil_clinico import estadisticas_perfiles_clinicos
+    from core.db.particiones import estado_particiones
+    from core.db.rollups import estado_relleno
+    from core.db.sintomas import estado_carga_vocabulario
+    from core.arranque import estado_arranque
+    from core.utils.etiquetado_cuadros import estadisticas_etiquetado
+    try:
+        # intento liviano: toma una conexión del pool (health check incluido)
+        with conexion_del_pool():
+            pass
+        db = "ok"
+    except Exception:
+        db = "fail"
+    return {"status": "ok", "db": db, "db_pool": estadisticas_pool(), "llm_cache": estadisticas_cache_llm(),
+            "llm_coalescer": estadisticas_coalescer_llm(), "llm_circuito": estadisticas_circuito_llm(),
+            "plazo_turno": estadisticas_plazo(), "grafo_turno": estadisticas_grafo_turno(),
+            "preclasificador": estadisticas_preclasificador(),
+            "sesiones": user_sessions.estadisticas(), "concurrencia": estadisticas_concurrencia(),
+            "cola_escritura": estadisticas_cola_escritura(), "esquema": reporte_esquema(),
+            "sentencias": estadisticas_sentencias(), "mapa_emocion_cuadro": estadisticas_mapa_emocion_cuadro(),
+            "perfiles_clinicos": estadisticas_perfiles_clinicos(), "particiones": estado_particiones(),
+            "rollups": estado_relleno(), "vocabulario": estado_carga_vocabulario(), "arranque": estado_arranque(),
+            "etiquetas_cuadro": estadisticas_etiquetado()}
+
+
+# 🧠 Huella de memoria de las sesiones en memoria (diagnóstico; recorre todas las sesiones)
+@app.get("/health/sesiones")
+def health_sesiones():
+    from core.sesion import reporte_memoria_sesiones
+    return reporte_memoria_sesiones(user_sessions)
+
+
+# 🔌 Shutdown: drenar la cola de escritura, apagar executor de DB async y cerrar conexiones ociosas del pool
+@app.on_event("shutdown")
+async def shutdown_event():
+    from core.db.conexion_async import cerrar_executor_db
+    from core.db.cola_escritura import cerrar_cola_escritura
+    from core.utils.generador_openai import cerrar_cliente_openai
+    from core.db.particiones import detener_mantenimiento_particiones
+    detener_mantenimiento_particiones()
+    await cerrar_cliente_openai()
+    await asyncio.to_thread(cerrar_cola_escritura)   # antes de cerrar el pool
+    cerrar_executor_db()
+
@@ -0,0 +1,490 @@
+# core/almacen_sesiones.py
+"""
+Almacenes de sesiones intercambiables (SESSION_STORE):
+
+  - "memoria" (default): RegistroSesiones en el proceso. Un solo worker.
+  - "sqlite": archivo SQLite en modo WAL compartido por todos los workers del
+    MISMO host (gunicorn -w N sin sticky routing).
+  - "redis": KV de red para varios hosts (requiere `pip install redis`).
+
+Los backends compartidos guardan la sesión serializada en forma compacta
+(JSON sin espacios, comprimido con zlib si es grande) y usan versionado
+optimista: cada sesión lleva su "_version"; guardar con una versión vieja
+(otro worker escribió en el medio) se detecta y se resuelve re-basando sobre
+la versión remota.
+
+Para el código del asistente todo sigue siendo un dict:
+`user_sessions.get(user_id)` carga, `user_sessions[user_id] = session` guarda.
+
+Dentro de `async with user_sessions.turno(user_id):` (lo abre /asistente) la
+sesión se carga UNA vez al entrar y se guarda UNA vez al salir, ambas en un
+hilo (asyncio.to_thread): las asignaciones intermedias quedan en memoria del
+turno y el event loop no hace I/O de SQLite/Redis.
+"""
+import os
+import abc
+import json
+import time
+import zlib
+import asyncio
+import sqlite3
+import logging
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, date
+
+from core.constantes import SESSION_TIMEOUT
+from core.sesion import SesionUsuario, RegistroSesiones
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = "_version"
+UMBRAL_COMPRESION = 512   # bytes; por debajo, zlib no compensa
+
+
+class ConflictoVersionError(Exception):
+    """Otro worker guardó la sesión después de que la cargamos."""
+
+    def __init__(self, user_id, version_remota: int):
+        super().__init__(f"Conflicto de versión en la sesión de {user_id} (remota={version_remota})")
+        self.version_remota = version_remota
+
+
+# ============================================================
+# Serialización compacta
+# ============================================================
+def _codificar(obj):
+    if isinstance(obj, datetime):
+        return {"__dt__": obj.isoformat()}
+    if isinstance(obj, date):
+        return {"__d__": obj.isoformat()}
+    if isinstance(obj, (set, frozenset)):
+        return {"__set__": list(obj)}
+    # Sin fallback a str(): volvería como texto y corrompería la sesión al recargarla
+    raise TypeError(f"Valor de sesión no serializable: {type(obj).__name__}")
+
+
+def _decodificar(d: dict):
+    if len(d) == 1:
+        if "__dt__" in d:
+            return datetime.fromisoformat(d["__dt__"])
+        if "__d__" in d:
+            return date.fromisoformat(d["__d__"])
+        if "__set__" in d:
+            return set(d["__set__"])
+    return d
+
+
+def serializar_sesion(sesion: dict) -> bytes:
+    datos = json.dumps(sesion, separators=(",", ":"), ensure_ascii=False, default=_codificar).encode("utf-8")
+    if len(datos) > UMBRAL_COMPRESION:
+        return b"z" + zlib.compress(datos, 6)
+    return b"j" + datos
+
+
+def deserializar_sesion(blob: bytes) -> SesionUsuario:
+    blob = bytes(blob)
+    datos = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    return SesionUsuario(json.loads(datos.decode("utf-8"), object_hook=_decodificar))
+
+
+def _rebasar(local: dict, remota: dict) -> SesionUsuario:
+    """
+    Resolución de conflicto: gana lo local (es el turno en curso), salvo los
+    contadores numéricos, que nunca retroceden.
+    """
+    fusion = SesionUsuario(remota)
+    for clave, valor in local.items():
+        previo = remota.get(clave)
+        if (
+            isinstance(valor, (int, float)) and not isinstance(valor, bool)
+            and isinstance(previo, (int, float)) and not isinstance(previo, bool)
+        ):
+            fusion[clave] = max(valor, previo)
+        else:
+            fusion[clave] = valor
+    return fusion
+
+
+# ============================================================
+# Backends
+# ============================================================
+class AlmacenSesiones(abc.ABC):
+    """Interfaz de backend: carga/guarda blobs versionados con TTL."""
+
+    nombre = "base"
+
+    def __init__(self, ttl: float = SESSION_TIMEOUT):
+        self.ttl = float(ttl)
+
+    @abc.abstractmethod
+    def cargar(self, user_id: str) -> tuple[bytes | None, int, bool]:
+        """
+        (blob, version, vencida). (None, 0, False) si no existe; (None, 0, True)
+        si existía y venció (solo si el backend puede saberlo). Renueva el TTL (touch).
+        """
+
+    @abc.abstractmethod
+    def guardar(self, user_id: str, blob: bytes, version_esperada: int) -> int:
+        """Escribe si la versión remota coincide; devuelve la nueva versión o lanza ConflictoVersionError."""
+
+    @abc.abstractmethod
+    def eliminar(self, user_id: str) -> None:
+        """Borra la sesión (si existe)."""
+
+    @abc.abstractmethod
+    def claves(self) -> list[str]:
+        """user_id de las sesiones vigentes."""
+
+    def cantidad(self) -> int:
+        return len(self.claves())
+
+
+class AlmacenSQLite(AlmacenSesiones):
+    """Un archivo SQLite (WAL) compartido por los workers de un mismo host."""
+
+    nombre = "sqlite"
+    PURGA_CADA = 200   # escrituras entre purgas de vencidas
+
+    def __init__(self, ruta: str, ttl: float = SESSION_TIMEOUT):
+        super().__init__(ttl)
+        self.ruta = ruta
+        self._local = threading.local()
+        self._escrituras = 0
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS sesiones ("
+            " user_id TEXT PRIMARY KEY, datos BLOB NOT NULL,"
+            " version INTEGER NOT NULL, expira_en REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS idx_sesiones_expira_en ON sesiones (expira_en)")
+
+    def _db(self) -> sqlite3.Connection:
+        # Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.ruta, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def cargar(self, user_id):
+        ahora = time.time()
+        db = self._db()
+        fila = db.execute(
+            "SELECT datos, version, expira_en FROM sesiones WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if fila is None:
+            return None, 0, False
+        if fila[2] <= ahora:
+            # Venció y todavía no la purgaron: se borra acá (solo si sigue vencida) y se avisa
+            cur = db.execute("DELETE FROM sesiones WHERE user_id = ? AND expira_en <= ?", (user_id, ahora))
+            return None, 0, bool(cur.rowcount)
+        db.execute("UPDATE sesiones SET expira_en = ? WHERE user_id = ?", (ahora + self.ttl, user_id))
+        return fila[0], fila[1], False
+
+    def guardar(self, user_id, blob, version_esperada):
+        ahora = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            fila = db.execute(
+                "SELECT version FROM sesiones WHERE user_id = ? AND expira_en > ?", (user_id, ahora)
+            ).fetchone()
+            actual = fila[0] if fila else 0
+            if actual != version_esperada:
+                db.execute("ROLLBACK")
+                raise ConflictoVersionError(user_id, actual)
+            nueva = actual + 1
+            db.execute(
+                "INSERT INTO sesiones (user_id, datos, version, expira_en) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET datos = excluded.datos, "
+                "version = excluded.version, expira_en = excluded.expira_en",
+                (user_id, blob, nueva, ahora + self.ttl),
+            )
+            db.execute("COMMIT")
+        except ConflictoVersionError:
+            raise
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+        self._escrituras += 1
+        if self._escrituras % self.PURGA_CADA == 0:
+            self.purgar_vencidas()
+        return nueva
+
+    def purgar_vencidas(self) -> int:
+        # Rango sobre el índice de expira_en: proporcional a las vencidas, no al total
+        cur = self._db().execute("DELETE FROM sesiones WHERE expira_en <= ?", (time.time(),))
+        return cur.rowcount or 0
+
+    def eliminar(self, user_id):
+        self._db().execute("DELETE FROM sesiones WHERE user_id = ?", (user_id,))
+
+    def claves(self):
+        filas = self._db().execute("SELECT user_id FROM sesiones WHERE expira_en > ?", (time.time(),)).fetchall()
+        return [f[0] for f in filas]
+
+    def cantidad(self):
+        return self._db().execute("SELECT COUNT(*) FROM sesiones WHERE expira_en > ?", (time.time(),)).fetchone()[0]
+
+
+class AlmacenRedis(AlmacenSesiones):
+    """KV de red: hash {v: version, d: blob} por usuario, TTL nativo (PEXPIRE) y CAS con Lua."""
+
+    nombre = "redis"
+    PREFIJO = "sesion:"
+
+    _CAS = """
+    local actual = tonumber(redis.call('HGET', KEYS[1], 'v') or '0')
+    if actual ~= tonumber(ARGV[1]) then return -actual - 1 end
+    local nueva = actual + 1
+    redis.call('HSET', KEYS[1], 'v', nueva, 'd', ARGV[2])
+    redis.call('PEXPIRE', KEYS[1], ARGV[3])
+    return nueva
+    """
+
+    def __init__(self, url: str, ttl: float = SESSION_TIMEOUT):
+        super().__init__(ttl)
+        import redis  # dependencia opcional: solo si SESSION_STORE=redis
+
+        self._r = redis.Redis.from_url(url, socket_timeout=2.0, health_check_interval=30)
+        self._cas = self._r.register_script(self._CAS)
+        self._ttl_ms = int(self.ttl * 1000)
+
+    def cargar(self, user_id):
+        clave = self.PREFIJO + user_id
+        with self._r.pipeline() as p:
+            p.hmget(clave, "v", "d")
+            p.pexpire(clave, self._ttl_ms)
+            (version, datos), _ = p.execute()
+        if datos is None:
+            # El vencimiento lo hace Redis (PEXPIRE): no se distingue de "nunca existió"
+            return None, 0, False
+        return datos, int(version or 0), False
+
+    def guardar(self, user_id, blob, version_esperada):
+        resultado = int(self._cas(keys=[self.PREFIJO + user_id], args=[version_esperada, blob, self._ttl_ms]))
+        if resultado < 0:
+            raise ConflictoVersionError(user_id, -resultado - 1)
+        return resultado
+
+    def eliminar(self, user_id):
+        self._r.delete(self.PREFIJO + user_id)
+
+    def claves(self):
+        n = len(self.PREFIJO)
+        return [k.decode("utf-8")[n:] for k in self._r.scan_iter(match=self.PREFIJO + "*", count=500)]
+
+
+# ============================================================
+# Fachada tipo dict sobre un backend compartido
+# ============================================================
+class _EstadoTurno:
+    """Sesiones cargadas y escritas durante un turno (se guardan al cerrarlo)."""
+
+    __slots__ = ("cargadas", "escritas")
+
+    def __init__(self):
+        self.cargadas: dict = {}   # user_id -> SesionUsuario | None
+        self.escritas: dict = {}   # user_id -> SesionUsuario (pendiente de guardar)
+
+
+_turno_actual: ContextVar[_EstadoTurno | None] = ContextVar("sesiones_del_turno", default=None)
+
+
+class RegistroSesionesCompartido:
+    """
+    Misma interfaz de dict que RegistroSesiones, pero get() carga del backend
+    y cada asignación guarda (con versionado optimista). Dentro de turno(),
+    carga y guardado ocurren una sola vez, fuera del event loop.
+    Nunca propaga errores del backend: loggea y sigue (sesión nueva / no guardada).
+    """
+
+    MAX_REINTENTOS_CONFLICTO = 3
+
+    def __init__(self, almacen: AlmacenSesiones):
+        self.almacen = almacen
+        self.ttl = almacen.ttl
+        self._lock = threading.Lock()
+        # Misma API que RegistroSesiones: el vencimiento lo hace el backend, así que
+        # se avisa al eliminar y cuando una lectura ya no encuentra la sesión
+        self.al_expirar: list = []
+        self.lecturas = 0
+        self.escrituras = 0
+        self.conflictos = 0
+        self.errores = 0
+        self.bytes_ultima_escritura = 0
+
+    def _contar(self, campo: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + n)
+
+    def _avisar(self, user_id) -> None:
+        for callback in self.al_expirar:
+            try:
+                callback(user_id)
+            except Exception:
+                logger.exception("Callback al_expirar falló para %s", user_id)
+
+    def _cargar(self, user_id):
+        """Lectura directa del backend (sin pasar por el turno). None si no hay sesión."""
+        self._contar("lecturas")
+        try:
+            blob, version, vencida = self.almacen.cargar(user_id)
+        except Exception:
+            self._contar("errores")
+            logger.exception("No se pudo cargar la sesión de %s desde %s", user_id, self.almacen.nombre)
+            return None
+        if blob is None:
+            if vencida:
+                # Solo una sesión guardada que venció suelta las cachés del usuario
+                self._avisar(user_id)
+            return None
+        sesion = deserializar_sesion(blob)
+        sesion[CLAVE_VERSION] = version
+        return sesion
+
+    def get(self, user_id, default=None):
+        turno = _turno_actual.get()
+        if turno is not None:
+            if user_id in turno.escritas:
+                return turno.escritas[user_id]
+            if user_id not in turno.cargadas:
+                turno.cargadas[user_id] = self._cargar(user_id)
+            sesion = turno.cargadas[user_id]
+        else:
+            sesion = self._cargar(user_id)
+        return default if sesion is None else sesion
+
+    @asynccontextmanager
+    async def turno(self, user_id):
+        """
+        `async with user_sessions.turno(user_id):` — carga la sesión en un hilo al
+        entrar, deja las asignaciones del turno en memoria y guarda cada sesión
+        modificada UNA vez al salir (también en un hilo).
+        """
+        estado = _EstadoTurno()
+        token = _turno_actual.set(estado)
+        try:
+            estado.cargadas[user_id] = await asyncio.to_thread(self._cargar, user_id)
+            yield
+        finally:
+            _turno_actual.reset(token)
+            for uid, sesion in list(estado.escritas.items()):
+                await asyncio.to_thread(self._guardar, uid, sesion)
+
+    def __getitem__(self, user_id):
+        sesion = self.get(user_id)
+        if sesion is None:
+            raise KeyError(user_id)
+        return sesion
+
+    def __contains__(self, user_id) -> bool:
+        return self.get(user_id) is not None
+
+    def __setitem__(self, user_id, sesion) -> None:
+        sesion = SesionUsuario.desde(sesion)
+        turno = _turno_actual.get()
+        if turno is not None:
+            turno.escritas[user_id] = sesion
+            return
+        self._guardar(user_id, sesion)
+
+    def _guardar(self, user_id, sesion) -> None:
+        for _ in range(self.MAX_REINTENTOS_CONFLICTO):
+            version = int(sesion.get(CLAVE_VERSION) or 0)
+            datos = {k: v for k, v in sesion.items() if k != CLAVE_VERSION}
+            blob = serializar_sesion(datos)
+            try:
+                nueva = self.almacen.guardar(user_id, blob, version)
+            except ConflictoVersionError:
+                self._contar("conflictos")
+                remota = self._cargar(user_id) or SesionUsuario()
+                # Se re-basa sobre la remota y se reintenta; el objeto del llamador queda actualizado
+                fusion = _rebasar(sesion, remota)
+                sesion.update(fusion)
+                sesion[CLAVE_VERSION] = remota.get(CLAVE_VERSION, 0)
+                continue
+            except Exception:
+                self._contar("errores")
+                logger.exception("No se pudo guardar la sesión de %s en %s", user_id, self.almacen.nombre)
+                return
+            sesion[CLAVE_VERSION] = nueva
+            self._contar("escrituras")
+            self.bytes_ultima_escritura = len(blob)
+            return
+        logger.warning("Sesión de %s no guardada: conflictos de versión reiterados", user_id)
+
+    def setdefault(self, user_id, default=None):
+        sesion = self.get(user_id)
+        if sesion is None:
+            self[user_id] = default if default is not None else SesionUsuario()
+            sesion = self.get(user_id) or SesionUsuario.desde(default)
+        return sesion
+
+    def pop(self, user_id, *default):
+        sesion = self.get(user_id)
+        turno = _turno_actual.get()
+        if turno is not None:
+            turno.escritas.pop(user_id, None)
+            turno.cargadas[user_id] = None
+        try:
+            self.almacen.eliminar(user_id)
+        except Exception:
+            self._contar("errores")
+            logger.exception("No se pudo eliminar la sesión de %s", user_id)
+        self._avisar(user_id)
+        if sesion is None:
+            if default:
+                return default[0]
+            raise KeyError(user_id)
+        return sesion
+
+    def __delitem__(self, user_id) -> None:
+        self.pop(user_id)
+
+    def __len__(self) -> int:
+        try:
+            return self.almacen.cantidad()
+        except Exception:
+            return 0
+
+    def items(self):
+        pares = []
+        for user_id in self.almacen.claves():
+            sesion = self._cargar(user_id)
+            if sesion is not None:
+                pares.append((user_id, sesion))
+        return pares
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.almacen.nombre,
+                "activas": len(self),
+                "ttl_seg": self.ttl,
+                "lecturas": self.lecturas,
+                "escrituras": self.escrituras,
+                "conflictos": self.conflictos,
+                "errores": self.errores,
+                "bytes_ultima_escritura": self.bytes_ultima_escritura,
+            }
+
+
+def crear_registro_sesiones():
+    """Instancia el almacén según SESSION_STORE (memoria | sqlite | redis)."""
+    tipo = os.getenv("SESSION_STORE", "memoria").strip().lower()
+    try:
+        if tipo == "sqlite":
+            ruta = os.getenv("SESSION_STORE_PATH", "/tmp/asistente_sesiones.sqlite3")
+            return RegistroSesionesCompartido(AlmacenSQLite(ruta))
+        if tipo == "redis":
+            url = os.getenv("SESSION_STORE_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+            return RegistroSesionesCompartido(AlmacenRedis(url))
+    except Exception:
+        logger.exception("SESSION_STORE=%s no disponible; se usan sesiones en memoria", tipo)
+    return RegistroSesiones()
@@ -0,0 +1,254 @@
+# core/arranque.py
+"""
+Arranque escalonado del worker.
+
+Antes, startup_event bloqueaba la disponibilidad del worker: migraciones,
+carga completa del vocabulario de síntomas e intento de embeddings de FAQ,
+todo antes de aceptar el primer request. Con redeploys en Render eso se
+traducía en requests caídos durante el arranque.
+
+Ahora startup_event solo lanza este calentamiento en segundo plano y vuelve:
+- ETAPAS corre en orden en un hilo (todas son bloqueantes: DB, HTTP):
+  léxicos, pool de DB, esquema, particiones, relleno de rollups (lanza su
+  hilo), vocabulario, mapa emoción→cuadro, pool HTTP de OpenAI y embeddings
+  de FAQ (si existe el módulo).
+- La sesión aiohttp de OpenAI se precalienta como tarea del event loop.
+- /health expone el progreso (estado y ms por etapa) y las métricas de
+  arranque en frío: inicio del proceso → fin del import, → worker listo,
+  → primera respuesta HTTP y → primer turno de /asistente respondido.
+
+Los caminos que usan algo todavía no calentado siguen funcionando: cargan a
+demanda (pool, mapa) o devuelven lo que haya (vocabulario parcial).
+"""
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _inicio_del_proceso() -> float:
+    """Epoch de inicio del proceso (Linux: /proc); si no se puede, el momento del import."""
+    try:
+        with open("/proc/self/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        inicio_ticks = int(campos[19])   # campo 22 de stat (starttime), contando desde "state"
+        with open("/proc/stat") as f:
+            btime = next(int(l.split()[1]) for l in f if l.startswith("btime"))
+        return btime + inicio_ticks / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        return time.time()
+
+
+INICIO_PROCESO = _inicio_del_proceso()
+
+_lock = threading.Lock()
+_etapas: dict[str, dict] = {}
+_metricas: dict = {
+    "importado_seg": None,          # inicio del proceso → startup_event
+    "listo_seg": None,              # inicio del proceso → fin del calentamiento
+    "primera_respuesta_seg": None,  # inicio del proceso → primera respuesta HTTP
+    "primer_turno_seg": None,       # inicio del proceso → primera respuesta de /asistente
+}
+_hilo: threading.Thread | None = None
+
+
+class EtapaOmitida(Exception):
+    """La etapa no aplica en este despliegue (no es un error)."""
+
+
+def _desde_inicio() -> float:
+    return round(time.time() - INICIO_PROCESO, 3)
+
+
+# ------------------------------------------------------------------ etapas
+def _etapa_lexicos():
+    from core.utils.preclasificador import _evaluar
+    from core.utils.modulo_administrativo import normalizar
+    # Recorre los regex del preclasificador (los compilados y los de es_consulta_contacto)
+    _evaluar(normalizar("hola, quisiera saber los honorarios y el whatsapp"))
+
+
+def _etapa_pool_db():
+    from core.db.conexion import obtener_pool
+    obtener_pool().precalentar()
+
+
+def _etapa_esquema():
+    from core.db.migraciones import preparar_esquema
+    reporte = preparar_esquema()
+    if reporte.get("estado") == "error":
+        raise RuntimeError(reporte.get("error"))
+    return reporte.get("estado")
+
+
+def _etapa_particiones():
+    from core.db.particiones import iniciar_mantenimiento_particiones
+    iniciar_mantenimiento_particiones()
+
+
+def _etapa_rollups():
+    from core.db.rollups import iniciar_relleno_rollups
+    iniciar_relleno_rollups()
+    return "en segundo plano"
+
+
+def _etapa_vocabulario():
+    from core.funciones_asistente import sintomas_cacheados
+    from core.db.sintomas import iniciar_carga_vocabulario, estado_carga_vocabulario
+    iniciar_carga_vocabulario(sintomas_cacheados, en_hilo=False)
+    estado = estado_carga_vocabulario()
+    if estado["estado"] == "error":
+        raise RuntimeError(estado["error"])
+    return f"{len(sintomas_cacheados)} términos"
+
+
+def _etapa_mapa_emocion_cuadro():
+    from core.utils.mapa_emocion_cuadro import obtener_mapa_emocion_cuadro
+    return f"{len(obtener_mapa_emocion_cuadro())} emociones"
+
+
+def _etapa_openai_http():
+    import openai
+    from core.utils.generador_openai import precalentar_cliente_openai
+    if not openai.api_key:
+        raise EtapaOmitida("sin OPENAI_API_KEY")
+    if not precalentar_cliente_openai():
+        raise RuntimeError("no se pudo abrir la conexión")
+
+
+def _etapa_faq_embeddings():
+    try:
+        from core.faq_semantica import generate_embeddings_faq  # noqa: WPS433
+    except ImportError:
+        raise EtapaOmitida("core.faq_semantica no está disponible")
+    generate_embeddings_faq()
+
+
+ETAPAS = [
+    ("lexicos", _etapa_lexicos),
+    ("pool_db", _etapa_pool_db),
+    ("esquema", _etapa_esquema),
+    ("particiones", _etapa_particiones),
+    ("rollups", _etapa_rollups),
+    ("vocabulario", _etapa_vocabulario),
+    ("mapa_emocion_cuadro", _etapa_mapa_emocion_cuadro),
+    ("openai_http", _etapa_openai_http),
+    ("faq_embeddings", _etapa_faq_embeddings),
+]
+
+
+def _registrar(nombre: str, **datos) -> None:
+    with _lock:
+        _etapas.setdefault(nombre, {"estado": "pendiente"}).update(datos)
+
+
+def _correr_etapa(nombre: str, funcion) -> None:
+    _registrar(nombre, estado="en_curso")
+    t0 = time.perf_counter()
+    try:
+        detalle = funcion()
+        _registrar(nombre, estado="ok", **({"detalle": detalle} if detalle is not None else {}))
+    except EtapaOmitida as e:
+        _registrar(nombre, estado="omitida", detalle=str(e))
+    except Exception as e:
+        _registrar(nombre, estado="error", error=(str(e).strip().splitlines() or [repr(e)])[0])
+        logger.warning("⚠️ Etapa de arranque %s falló: %s", nombre, e)
+    finally:
+        _registrar(nombre, ms=round((time.perf_counter() - t0) * 1000, 1))
+
+
+def _calentar() -> None:
+    for nombre, funcion in ETAPAS:
+        _correr_etapa(nombre, funcion)
+    with _lock:
+        _metricas["listo_seg"] = _desde_inicio()
+        errores = [n for n, e in _etapas.items() if e["estado"] == "error"]
+    logger.info("✅ Calentamiento terminado a los %.2f s del inicio (errores: %s)", _metricas["listo_seg"], errores or "ninguno")
+
+
+def iniciar_arranque() -> None:
+    """Llamar desde startup_event: marca el fin del import y lanza el calentamiento sin bloquear."""
+    global _hilo
+    with _lock:
+        if _hilo is not None:
+            return
+        _metricas["importado_seg"] = _desde_inicio()
+        for nombre, _ in ETAPAS:
+            _etapas.setdefault(nombre, {"estado": "pendiente"})
+        _hilo = threading.Thread(target=_calentar, name="arranque", daemon=True)
+    _hilo.start()
+
+
+async def calentar_async() -> None:
+    """Parte del calentamiento que vive en el event loop (sesión aiohttp de OpenAI)."""
+    import openai
+    from core.utils.generador_openai import precalentar_cliente_openai_async
+
+    async def _etapa():
+        if not openai.api_key:
+            raise EtapaOmitida("sin OPENAI_API_KEY")
+        if not await precalentar_cliente_openai_async():
+            raise RuntimeError("no se pudo abrir la conexión")
+
+    _registrar("openai_async", estado="en_curso")
+    t0 = time.perf_counter()
+    try:
+        await _etapa()
+        _registrar("openai_async", estado="ok")
+    except EtapaOmitida as e:
+        _registrar("openai_async", estado="omitida", detalle=str(e))
+    except Exception as e:
+        _registrar("openai_async", estado="error", error=str(e))
+    finally:
+        _registrar("openai_async", ms=round((time.perf_counter() - t0) * 1000, 1))
+
+
+# ------------------------------------------------------------------ métricas de arranque en frío
+class MedidorArranque:
+    """
+    Middleware ASGI: anota el tiempo desde el inicio del proceso hasta la
+    primera respuesta (y la primera de /asistente). Una vez medidas ambas,
+    solo delega.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _metricas["primer_turno_seg"] is not None:
+            return await self.app(scope, receive, send)
+
+        ruta = scope.get("path", "")
+
+        async def _send(mensaje):
+            if mensaje["type"] == "http.response.start":
+                _anotar_respuesta(ruta)
+            await send(mensaje)
+
+        await self.app(scope, receive, _send)
+
+
+def _anotar_respuesta(ruta: str) -> None:
+    with _lock:
+        if _metricas["primera_respuesta_seg"] is None:
+            _metricas["primera_respuesta_seg"] = _desde_inicio()
+            logger.info("⏱️ Primera respuesta a los %.2f s del inicio del proceso", _metricas["primera_respuesta_seg"])
+        if _metricas["primer_turno_seg"] is None and ruta.startswith("/asistente"):
+            _metricas["primer_turno_seg"] = _desde_inicio()
+            logger.info("⏱️ Primer turno de /asistente a los %.2f s del inicio del proceso", _metricas["primer_turno_seg"])
+
+
+def estado_arranque() -> dict:
+    with _lock:
+        etapas = {n: dict(e) for n, e in _etapas.items()}
+        metricas = dict(_metricas)
+    terminadas = sum(1 for e in etapas.values() if e["estado"] in ("ok", "omitida", "error"))
+    return {
+        "listo": metricas["listo_seg"] is not None,
+        "progreso": f"{terminadas}/{len(etapas)}",
+        "uptime_seg": _desde_inicio(),
+        **metricas,
+        "etapas": etapas,
+    }
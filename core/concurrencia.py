@@ -0,0 +1,145 @@
+# core/concurrencia.py
+"""
+Control de concurrencia del endpoint /asistente.
+
+1) Serialización por usuario: dos mensajes seguidos del mismo user_id se
+   procesan uno detrás del otro (un asyncio.Lock por usuario). Sin esto, ambos
+   turnos leen-modifican-escriben la misma sesión (contador_interacciones,
+   emociones_detectadas) y duplican inserts en historial_clinico_usuario.
+   La espera es acotada: si el turno anterior no termina a tiempo, 429.
+
+2) Tope global de turnos en vuelo: cuando el backend de OpenAI se satura,
+   los turnos nuevos esperan un instante y, si no hay lugar, se rechazan con
+   429 + Retry-After en vez de apilarse hasta el timeout.
+
+Los locks son por proceso; entre workers la consistencia la da el versionado
+optimista del almacén de sesiones compartido (core.almacen_sesiones).
+"""
+import os
+import time
+import math
+import asyncio
+from contextlib import asynccontextmanager
+
+from core.utils.generador_openai import MAX_CONCURRENCIA as OPENAI_MAX_CONCURRENCIA
+
+# Cada turno hace 1–3 llamadas a OpenAI, casi nunca simultáneas → margen x4 sobre el semáforo de OpenAI
+MAX_TURNOS_EN_VUELO = int(os.getenv("ASISTENTE_MAX_EN_VUELO", str(OPENAI_MAX_CONCURRENCIA * 4)))
+ESPERA_GLOBAL_SEG = float(os.getenv("ASISTENTE_ESPERA_GLOBAL", "2"))
+ESPERA_USUARIO_SEG = float(os.getenv("ASISTENTE_ESPERA_USUARIO", "20"))
+MAX_EN_COLA_POR_USUARIO = int(os.getenv("ASISTENTE_MAX_COLA_USUARIO", "3"))
+
+
+class TurnoRechazado(Exception):
+    """El turno no se procesa (saturación o cola del usuario llena)."""
+
+    def __init__(self, motivo: str, retry_after: int):
+        super().__init__(motivo)
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+
+class _LockUsuario:
+    __slots__ = ("lock", "usuarios")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.usuarios = 0   # turnos esperando o procesando; en 0 se libera la entrada
+
+
+class ControlConcurrencia:
+    def __init__(
+        self,
+        max_en_vuelo: int = MAX_TURNOS_EN_VUELO,
+        espera_global: float = ESPERA_GLOBAL_SEG,
+        espera_usuario: float = ESPERA_USUARIO_SEG,
+        max_cola_usuario: int = MAX_EN_COLA_POR_USUARIO,
+    ):
+        self.max_en_vuelo = max(1, max_en_vuelo)
+        self.espera_global = espera_global
+        self.espera_usuario = espera_usuario
+        self.max_cola_usuario = max(1, max_cola_usuario)
+        self._locks: dict[str, _LockUsuario] = {}
+        self._semaforo: asyncio.Semaphore | None = None
+        self.en_vuelo = 0
+        self.pico_en_vuelo = 0
+        self.completados = 0
+        self.rechazados_saturacion = 0
+        self.rechazados_usuario = 0
+        self.serializados = 0      # turnos que tuvieron que esperar al anterior del mismo usuario
+        self._duracion_media = 3.0  # EWMA en segundos, base del Retry-After
+
+    def _retry_after(self) -> int:
+        # Tiempo estimado hasta que se libere un lugar (mínimo 1 s)
+        return max(1, math.ceil(self._duracion_media))
+
+    def _sem(self) -> asyncio.Semaphore:
+        # Se crea perezosamente dentro del event loop del servidor
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_en_vuelo)
+        return self._semaforo
+
+    @asynccontextmanager
+    async def turno(self, user_id: str):
+        """Serializa por usuario y limita los turnos en vuelo; lanza TurnoRechazado."""
+        entrada = self._locks.get(user_id)
+        if entrada is None:
+            entrada = self._locks[user_id] = _LockUsuario()
+        if entrada.usuarios >= self.max_cola_usuario:
+            self.rechazados_usuario += 1
+            raise TurnoRechazado("Demasiados mensajes seguidos del mismo usuario", self._retry_after())
+
+        if entrada.usuarios > 0:
+            self.serializados += 1
+        entrada.usuarios += 1
+        try:
+            try:
+                await asyncio.wait_for(entrada.lock.acquire(), timeout=self.espera_usuario)
+            except asyncio.TimeoutError:
+                self.rechazados_usuario += 1
+                raise TurnoRechazado("El mensaje anterior todavía se está procesando", self._retry_after())
+
+            try:
+                sem = self._sem()
+                try:
+                    await asyncio.wait_for(sem.acquire(), timeout=self.espera_global)
+                except asyncio.TimeoutError:
+                    self.rechazados_saturacion += 1
+                    raise TurnoRechazado("Servicio saturado", self._retry_after())
+
+                self.en_vuelo += 1
+                self.pico_en_vuelo = max(self.pico_en_vuelo, self.en_vuelo)
+                t0 = time.perf_counter()
+                try:
+                    yield
+                finally:
+                    self.en_vuelo -= 1
+                    sem.release()
+                    self.completados += 1
+                    self._duracion_media = 0.8 * self._duracion_media + 0.2 * (time.perf_counter() - t0)
+            finally:
+                entrada.lock.release()
+        finally:
+            entrada.usuarios -= 1
+            if entrada.usuarios == 0 and self._locks.get(user_id) is entrada:
+                del self._locks[user_id]
+
+    def estadisticas(self) -> dict:
+        return {
+            "max_en_vuelo": self.max_en_vuelo,
+            "en_vuelo": self.en_vuelo,
+            "pico_en_vuelo": self.pico_en_vuelo,
+            "usuarios_activos": len(self._locks),
+            "completados": self.completados,
+            "serializados": self.serializados,
+            "rechazados_saturacion": self.rechazados_saturacion,
+            "rechazados_usuario": self.rechazados_usuario,
+            "duracion_media_seg": round(self._duracion_media, 3),
+        }
+
+
+control_turnos = ControlConcurrencia()
+
+
+def estadisticas_concurrencia() -> dict:
+    return control_turnos.estadisticas()
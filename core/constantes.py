@@ -27,8 +27,8 @@ SALUDO_INICIAL = "¡Hola! ¿En qué puedo ayudarte?"
 # 🧠 Diccionario de sesiones (en memoria)
 user_sessions = {}
 
-# ⏱ Tiempo de expiración de sesiones (en segundos)
-SESSION_TIMEOUT = 60
+# ⏱ Tiempo de expiración de sesiones en memoria (en segundos, desde la última interacción)
+SESSION_TIMEOUT = int(os.getenv("SESSION_TIMEOUT", str(60 * 8)))
 
 # Umbral para mostrar el prefijo temporal emocional (0 = siempre)
 # Ejemplos: 1800 = 30 min, 7200 = 2 h
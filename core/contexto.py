@@ -1,4 +1,6 @@
 # core/contexto.py
+from core.almacen_sesiones import crear_registro_sesiones
 
-# Diccionario global de sesiones de usuario
-user_sessions = {}
+# Almacén global de sesiones de usuario (valores: SesionUsuario con historiales acotados).
+# Backend según SESSION_STORE: memoria (default) | sqlite (varios workers, un host) | redis.
+user_sessions = crear_registro_sesiones()
@@ -0,0 +1,302 @@
+# core/db/cola_escritura.py
+"""
+Cola de escritura diferida (write-behind) para auditoría e historial.
+
+Las escrituras que no devuelven nada al turno —auditorías, inferencias,
+historial clínico, respuesta de la interacción— se encolan en memoria y un
+hilo de fondo las persiste en lotes (psycopg2.extras.execute_values, una sola
+transacción por lote). Así la respuesta HTTP sale antes de que aterricen.
+
+- Disparadores de flush: COLA_ESCRITURA_LOTE filas pendientes o
+  COLA_ESCRITURA_INTERVALO segundos desde la primera fila pendiente.
+- Backpressure: la cola es acotada (COLA_ESCRITURA_MAX). Si se llena, desde
+  un hilo quien encola espera un instante y, si sigue llena, escribe esa fila
+  en forma directa (más lento, pero no se pierden registros de auditoría).
+  Desde el event loop nunca se espera ni se escribe en línea: la fila se
+  despacha al executor de DB (métrica `despachadas`).
+- Shutdown: cerrar_cola_escritura() drena lo pendiente antes de cerrar el pool.
+- Si un lote falla, se reintenta fila por fila para aislar la fila inválida.
+- al_escribir: callbacks(tipo, filas) cuando las filas salen de la cola
+  (persistidas o descartadas); p. ej. core.db.perfil_clinico suelta las
+  filas que tenía como pendientes.
+
+registrar_interaccion NO pasa por acá: necesita el id (RETURNING) en el turno.
+"""
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+
+from psycopg2.extras import execute_values
+
+from core.db.conexion import conexion_del_pool
+
+logger = logging.getLogger(__name__)
+
+COLA_MAX = int(os.getenv("COLA_ESCRITURA_MAX", "5000"))
+LOTE_MAX = int(os.getenv("COLA_ESCRITURA_LOTE", "200"))
+INTERVALO_FLUSH = float(os.getenv("COLA_ESCRITURA_INTERVALO", "0.5"))
+ESPERA_ENCOLAR = float(os.getenv("COLA_ESCRITURA_ESPERA", "0.05"))   # seg. de espera si la cola está llena
+
+
+# tipo -> (SQL con VALUES %s, template por fila o None). El esquema lo garantiza core.db.migraciones.
+TIPOS_ESCRITURA = {
+    "auditoria_input_original": (
+        """
+        INSERT INTO auditoria_input_original
+            (user_id, mensaje_original, mensaje_purificado, clasificacion, fecha)
+        VALUES %s
+        """,
+        None,
+    ),
+    "auditoria_respuestas": (
+        """
+        INSERT INTO auditoria_respuestas
+            (user_id, interaccion_id, respuesta_original, respuesta_final, motivo_modificacion, fecha)
+        VALUES %s
+        """,
+        None,
+    ),
+    "inferencias": (
+        "INSERT INTO inferencias_cerebro_simulado (user_id, interaccion_id, tipo, valor) VALUES %s",
+        None,
+    ),
+    "historial_clinico": (
+        """
+        INSERT INTO public.historial_clinico_usuario
+            (user_id, fecha, emociones, nuevas_emociones_detectadas, cuadro_clinico_probable,
+             interaccion_id, fuente, eliminado)
+        VALUES %s
+        """,
+        "(%s, %s, %s, %s, %s, %s, %s, false)",
+    ),
+    # UPDATE en lote: una sola sentencia para todas las respuestas pendientes
+    "respuesta_interaccion": (
+        """
+        UPDATE interacciones AS i
+        SET respuesta = v.respuesta
+        FROM (VALUES %s) AS v(id, respuesta)
+        WHERE i.id = v.id
+        """,
+        "(%s::bigint, %s::text)",
+    ),
+}
+
+_FIN = object()
+
+
+class ColaEscritura:
+    def __init__(self, maximo: int = COLA_MAX, lote: int = LOTE_MAX, intervalo: float = INTERVALO_FLUSH):
+        self.lote = max(1, lote)
+        self.intervalo = intervalo
+        self._cola: queue.Queue = queue.Queue(maxsize=max(1, maximo))
+        self._hilo: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._cerrada = False
+        self._despachos: set[asyncio.Task] = set()   # referencias fuertes a las escrituras despachadas
+        self.al_escribir: list = []       # callbacks(tipo, filas) al persistir/descartar filas
+
+        # Métricas
+        self.encoladas = 0
+        self.escritas = 0
+        self.lotes = 0
+        self.directas = 0        # filas escritas en línea por cola llena (o cerrada)
+        self.despachadas = 0     # ídem, pero llamadas desde el event loop: van al executor de DB
+        self.fallidas = 0
+        self.flush_ms_max = 0.0
+
+    # ---------- productor ----------
+    def _arrancar(self) -> None:
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="cola-escritura-db", daemon=True)
+                self._hilo.start()
+
+    def intentar_encolar(self, tipo: str, fila: tuple, espera: float = 0.0) -> bool:
+        """Encola sin escribir nunca en línea; False si la cola está llena o cerrada."""
+        if tipo not in TIPOS_ESCRITURA:
+            raise ValueError(f"Tipo de escritura desconocido: {tipo}")
+        if self._cerrada:
+            return False
+        if self._hilo is None or not self._hilo.is_alive():
+            self._arrancar()
+        try:
+            if espera > 0:
+                self._cola.put((tipo, fila), timeout=espera)
+            else:
+                self._cola.put_nowait((tipo, fila))
+        except queue.Full:
+            return False
+        self.encoladas += 1
+        return True
+
+    def encolar(self, tipo: str, fila: tuple, espera: float = ESPERA_ENCOLAR) -> bool:
+        """
+        Encola una fila; True si quedó diferida. Con la cola llena o cerrada la
+        escribe en el momento (False). Nunca lanza por errores de DB.
+
+        Llamada desde el event loop (p. ej. un helper sync dentro de un handler
+        async) no espera ni escribe en línea: la fila va al executor de DB.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if self.intentar_encolar(tipo, fila, 0.0 if loop else espera):
+            return True
+        if not self._cerrada:
+            logger.warning("Cola de escritura llena (%s): escritura directa de %s", self._cola.qsize(), tipo)
+        if loop is not None:
+            self._despachar(loop, tipo, fila)
+            return False
+        self.directas += 1
+        self._escribir({tipo: [fila]})
+        return False
+
+    def _despachar(self, loop: asyncio.AbstractEventLoop, tipo: str, fila: tuple) -> None:
+        from core.db.conexion_async import ejecutar_en_hilo_db
+        self.despachadas += 1
+        tarea = loop.create_task(ejecutar_en_hilo_db(self._escribir, {tipo: [fila]}))
+        self._despachos.add(tarea)
+        tarea.add_done_callback(self._despachos.discard)
+
+    # ---------- consumidor ----------
+    def _bucle(self) -> None:
+        pendientes: dict[str, list] = {}
+        n_pendientes = 0
+        primera_en = None
+        fin = False
+
+        while not fin:
+            timeout = None if primera_en is None else max(0.0, primera_en + self.intervalo - time.monotonic())
+            try:
+                item = self._cola.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _FIN:
+                fin = True
+            elif item is not None:
+                tipo, fila = item
+                pendientes.setdefault(tipo, []).append(fila)
+                n_pendientes += 1
+                if primera_en is None:
+                    primera_en = time.monotonic()
+                # Drenar sin bloquear lo que ya está en la cola (hasta completar el lote)
+                while n_pendientes < self.lote:
+                    try:
+                        item = self._cola.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _FIN:
+                        fin = True
+                        break
+                    tipo, fila = item
+                    pendientes.setdefault(tipo, []).append(fila)
+                    n_pendientes += 1
+
+            vencido = primera_en is not None and time.monotonic() - primera_en >= self.intervalo
+            if n_pendientes and (fin or vencido or n_pendientes >= self.lote):
+                self._escribir(pendientes)
+                pendientes, n_pendientes, primera_en = {}, 0, None
+
+    def _avisar(self, tipo: str, filas: list) -> None:
+        for callback in self.al_escribir:
+            try:
+                callback(tipo, filas)
+            except Exception:
+                logger.exception("Callback al_escribir falló (%s)", tipo)
+
+    @staticmethod
+    def _preparar(tipo: str, filas: list) -> list:
+        if tipo == "respuesta_interaccion":
+            # Si la misma interacción se actualizó dos veces en el lote, gana la última
+            return list({f[0]: f for f in filas}.values())
+        return filas
+
+    def _escribir(self, pendientes: dict[str, list]) -> None:
+        t0 = time.perf_counter()
+        total = sum(len(v) for v in pendientes.values())
+        try:
+            with conexion_del_pool() as conn, conn.cursor() as cursor:
+                for tipo, filas in pendientes.items():
+                    sql, template = TIPOS_ESCRITURA[tipo]
+                    execute_values(cursor, sql, self._preparar(tipo, filas), template=template, page_size=self.lote)
+                conn.commit()
+            self.escritas += total
+            self.lotes += 1
+            for tipo, filas in pendientes.items():
+                self._avisar(tipo, filas)
+        except Exception as e:
+            logger.warning("⚠️ Lote de escritura falló (%s filas): %s. Reintentando fila por fila.", total, e)
+            for tipo, filas in pendientes.items():
+                for fila in filas:
+                    self._escribir_una(tipo, fila)
+        self.flush_ms_max = max(self.flush_ms_max, (time.perf_counter() - t0) * 1000)
+
+    def _escribir_una(self, tipo: str, fila: tuple) -> None:
+        sql, template = TIPOS_ESCRITURA[tipo]
+        try:
+            with conexion_del_pool() as conn, conn.cursor() as cursor:
+                execute_values(cursor, sql, [fila], template=template)
+                conn.commit()
+            self.escritas += 1
+        except Exception as e:
+            self.fallidas += 1
+            logger.error("❌ Escritura diferida descartada (%s): %s", tipo, e)
+        self._avisar(tipo, [fila])
+
+    # ---------- ciclo de vida ----------
+    def cerrar(self, timeout: float = 10.0) -> None:
+        """Drena lo pendiente y detiene el hilo (shutdown de la app)."""
+        self._cerrada = True
+        hilo = self._hilo
+        if hilo is not None and hilo.is_alive():
+            self._cola.put(_FIN)
+            hilo.join(timeout)
+            if hilo.is_alive():
+                logger.warning("Cola de escritura: quedaron %s filas sin persistir", self._cola.qsize())
+
+    def estadisticas(self) -> dict:
+        return {
+            "pendientes": self._cola.qsize(),
+            "capacidad": self._cola.maxsize,
+            "encoladas": self.encoladas,
+            "escritas": self.escritas,
+            "lotes": self.lotes,
+            "filas_por_lote": round(self.escritas / self.lotes, 1) if self.lotes else 0.0,
+            "directas": self.directas,
+            "despachadas": self.despachadas,
+            "fallidas": self.fallidas,
+            "flush_ms_max": round(self.flush_ms_max, 1),
+        }
+
+
+cola_escritura = ColaEscritura()
+
+
+def encolar_escritura(tipo: str, fila: tuple) -> bool:
+    return cola_escritura.encolar(tipo, fila)
+
+
+async def encolar_escritura_async(tipo: str, fila: tuple) -> bool:
+    """
+    Variante para handlers async: encola sin esperar. Si la cola está llena,
+    la escritura directa corre en el executor de DB y se espera (no bloquea el loop).
+    """
+    if cola_escritura.intentar_encolar(tipo, fila):
+        return True
+    from core.db.conexion_async import ejecutar_en_hilo_db
+    cola_escritura.directas += 1
+    await ejecutar_en_hilo_db(cola_escritura._escribir, {tipo: [fila]})
+    return False
+
+
+def cerrar_cola_escritura(timeout: float = 10.0) -> None:
+    cola_escritura.cerrar(timeout)
+
+
+def estadisticas_cola_escritura() -> dict:
+    return cola_escritura.estadisticas()
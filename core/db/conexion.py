@@ -1,11 +1,29 @@
 # core/db/conexion.py
+import os
+import time
 import logging
+import itertools
+import threading
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import errors, extensions
 from psycopg2.extras import RealDictCursor
 from core.constantes import DATABASE_URL  # Debe estar seteada en tu entorno/constantes
+from core.plazo import restante, recortar, MIN_DB_SEG
 
 logger = logging.getLogger(__name__)
 
+
+# --- Tuning del pool (variables de entorno, con defaults prudentes para Render) ---
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT_CHECKOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))           # seg. esperando una conexión libre
+POOL_VIDA_MAXIMA = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))       # seg. antes de reciclar una conexión
+POOL_CHEQUEO_OCIOSA = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30"))  # seg. ociosa antes de hacer SELECT 1
+LOTE_STREAMING = int(os.getenv("DB_STREAMING_LOTE", "2000"))               # filas por viaje en cursores con nombre
+
+
 def obtener_conexion(timeout: int = 5):
     """
     Abre una conexión a PostgreSQL con parámetros seguros para Render:
@@ -24,34 +42,323 @@ def obtener_conexion(timeout: int = 5):
     )
 
 
+class PoolAgotadoError(psycopg2.OperationalError):
+    """No se liberó ninguna conexión dentro del timeout de checkout."""
+
+
+class PlazoVencidoError(Exception):
+    """El plazo del turno (core.plazo) no deja tiempo para la consulta."""
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones de proceso (thread-safe) sobre obtener_conexion():
+    - mínimo/máximo de conexiones abiertas
+    - health check (SELECT 1) si la conexión estuvo ociosa más de `chequeo_ociosa` seg.
+    - reciclado de conexiones con más de `vida_maxima` seg.
+    - timeout por checkout (PoolAgotadoError si no hay conexión libre a tiempo)
+    - estadísticas (en uso, ociosas, espera acumulada) para capacity planning
+    """
+
+    def __init__(
+        self,
+        minimo: int = POOL_MIN,
+        maximo: int = POOL_MAX,
+        timeout_checkout: float = POOL_TIMEOUT_CHECKOUT,
+        vida_maxima: float = POOL_VIDA_MAXIMA,
+        chequeo_ociosa: float = POOL_CHEQUEO_OCIOSA,
+    ):
+        self.minimo = max(0, minimo)
+        self.maximo = max(1, maximo, self.minimo)
+        self.timeout_checkout = timeout_checkout
+        self.vida_maxima = vida_maxima
+        self.chequeo_ociosa = chequeo_ociosa
+
+        self._cond = threading.Condition()
+        self._ociosas: list = []          # [(conn, devuelta_en)] — LIFO para mantener calientes las recientes
+        self._creadas_en: dict = {}       # id(conn) -> timestamp de creación
+        self._en_uso = 0
+        self._abiertas = 0
+        self.al_descartar: list = []      # callbacks(conn) al cerrar una conexión (p. ej. core.db.sentencias)
+
+        # Métricas
+        self._checkouts = 0
+        self._esperas = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._timeouts = 0
+        self._descartadas = 0
+
+    # ---------------- ciclo de vida de conexiones ----------------
+    def _abrir(self):
+        conn = obtener_conexion()
+        self._creadas_en[id(conn)] = time.monotonic()
+        return conn
+
+    def _descartar(self, conn) -> None:
+        self._creadas_en.pop(id(conn), None)
+        self._descartadas += 1
+        for callback in self.al_descartar:
+            try:
+                callback(conn)
+            except Exception:
+                pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _vencida(self, conn) -> bool:
+        creada = self._creadas_en.get(id(conn), 0.0)
+        return (time.monotonic() - creada) > self.vida_maxima
+
+    def _sana(self, conn, ociosa_desde: float) -> bool:
+        if conn.closed:
+            return False
+        if (time.monotonic() - ociosa_desde) < self.chequeo_ociosa:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # ---------------- API ----------------
+    def tomar(self, timeout: float | None = None):
+        """Devuelve una conexión sana del pool (o abre una nueva si hay cupo)."""
+        inicio = time.monotonic()
+        timeout = self.timeout_checkout if timeout is None else max(0.0, timeout)
+        limite = inicio + timeout
+        espero = False
+
+        candidata = None
+        abrir_nueva = False
+        with self._cond:
+            while not self._ociosas and self._abiertas >= self.maximo:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise PoolAgotadoError(
+                        f"Pool de conexiones agotado ({self.maximo}) tras {timeout:.1f}s"
+                    )
+                espero = True
+                self._cond.wait(restante)
+
+            if self._ociosas:
+                candidata = self._ociosas.pop()
+            else:
+                self._abiertas += 1
+                abrir_nueva = True
+            self._en_uso += 1
+
+        # Fuera del lock: handshake / health check (no bloquea a otros hilos)
+        try:
+            if abrir_nueva:
+                conn = self._abrir()
+            else:
+                conn, ociosa_desde = candidata
+                if self._vencida(conn) or not self._sana(conn, ociosa_desde):
+                    self._descartar(conn)
+                    conn = self._abrir()
+        except Exception:
+            with self._cond:
+                self._abiertas -= 1
+                self._en_uso -= 1
+                self._cond.notify()
+            raise
+
+        espera = time.monotonic() - inicio
+        with self._cond:
+            self._checkouts += 1
+            if espero:
+                self._esperas += 1
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        return conn
+
+    def devolver(self, conn, descartar: bool = False) -> None:
+        """Devuelve la conexión al pool (o la cierra si está rota/vencida)."""
+        if not descartar and not conn.closed:
+            try:
+                # Nunca devolver una conexión con transacción abierta
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                descartar = True
+
+        if descartar or conn.closed or self._vencida(conn):
+            self._descartar(conn)
+            with self._cond:
+                self._abiertas -= 1
+                self._en_uso -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._ociosas.append((conn, time.monotonic()))
+            self._en_uso -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def conexion(self, timeout: float | None = None):
+        """
+        Context manager: `with pool.conexion() as conn:`.
+        Si el bloque falla por un error de conexión, la descarta en lugar de reciclarla
+        (una consulta cancelada por statement_timeout no cuenta: la conexión sigue sana).
+        """
+        conn = self.tomar(timeout)
+        roto = False
+        try:
+            yield conn
+        except errors.QueryCanceled:
+            raise
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            roto = True
+            raise
+        finally:
+            self.devolver(conn, descartar=roto)
+
+    def precalentar(self) -> None:
+        """Abre hasta `minimo` conexiones para que el primer request no pague el handshake."""
+        conns = []
+        try:
+            while True:
+                with self._cond:
+                    if self._abiertas >= self.minimo:
+                        break
+                conns.append(self.tomar())
+        finally:
+            for c in conns:
+                self.devolver(c)
+
+    def cerrar(self) -> None:
+        """Cierra las conexiones ociosas (p. ej. en el shutdown de la app)."""
+        with self._cond:
+            ociosas, self._ociosas = self._ociosas, []
+            self._abiertas -= len(ociosas)
+        for conn, _ in ociosas:
+            self._descartar(conn)
+
+    def estadisticas(self) -> dict:
+        with self._cond:
+            return {
+                "min": self.minimo,
+                "max": self.maximo,
+                "abiertas": self._abiertas,
+                "en_uso": self._en_uso,
+                "ociosas": len(self._ociosas),
+                "checkouts": self._checkouts,
+                "esperas": self._esperas,
+                "timeouts": self._timeouts,
+                "descartadas": self._descartadas,
+                "espera_media_ms": round(1000 * self._espera_total / self._checkouts, 2) if self._checkouts else 0.0,
+                "espera_max_ms": round(1000 * self._espera_max, 2),
+            }
+
+
+# Pool global del proceso (se crea perezosamente: no conecta al importar)
+_pool: PoolConexiones | None = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool() -> PoolConexiones:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexiones()
+    return _pool
+
+
+def conexion_del_pool(timeout: float | None = None):
+    """Atajo: `with conexion_del_pool() as conn:` usando el pool global."""
+    return obtener_pool().conexion(timeout)
+
+
+def conexion_de_lectura():
+    """
+    Conexión para una lectura dentro del plazo del turno (core.plazo): el
+    checkout espera como mucho lo que le queda al turno. PlazoVencidoError
+    si ya no queda tiempo. Fuera de un turno es conexion_del_pool().
+    """
+    r = restante()
+    if r is not None and r < MIN_DB_SEG:
+        raise PlazoVencidoError("Plazo del turno vencido antes de la consulta")
+    return conexion_del_pool(recortar(POOL_TIMEOUT_CHECKOUT))
+
+
+def aplicar_plazo(cur) -> None:
+    """
+    Dentro de un turno con plazo: SET LOCAL statement_timeout al tiempo
+    restante (dura lo que la transacción en curso). Sin plazo, no hace nada.
+    """
+    r = restante()
+    if r is None:
+        return
+    if r < MIN_DB_SEG:
+        raise PlazoVencidoError("Plazo del turno vencido antes de la consulta")
+    cur.execute(f"SET LOCAL statement_timeout = {max(1, int(r * 1000))};")
+
+
+def estadisticas_pool() -> dict:
+    """Métricas del pool global (en uso, ociosas, espera) para /health y capacity planning."""
+    return obtener_pool().estadisticas()
+
+
 def ejecutar_consulta(query: str, params=None, commit: bool = False):
     """
     Ejecuta una consulta de forma segura.
     - SELECT: devuelve list[dict] (posiblemente vacía).
     - INSERT/UPDATE/DELETE con commit=True: devuelve True si se confirmó, False si falló.
     - Nunca propaga excepciones: loggea y devuelve [] / False según corresponda.
+    - Las lecturas respetan el plazo del turno (core.plazo); las escrituras no se cortan.
     """
     params = params or ()
-    conn = None
     try:
-        conn = obtener_conexion()
-        with conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(query, params)
-                if commit:
-                    return True
-                try:
-                    rows = cur.fetchall()
-                except psycopg2.ProgrammingError:
-                    rows = []
-                return rows or []
+        with (conexion_del_pool() if commit else conexion_de_lectura()) as conn:
+            with conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    if not commit:
+                        aplicar_plazo(cur)
+                    cur.execute(query, params)
+                    if commit:
+                        return True
+                    try:
+                        rows = cur.fetchall()
+                    except psycopg2.ProgrammingError:
+                        rows = []
+                    return rows or []
+    except (PlazoVencidoError, errors.QueryCanceled) as e:
+        logger.warning("⏱️ Lectura omitida/cancelada por el plazo del turno: %s", e)
+        return []
     except Exception:
         logger.exception("DB query failed", extra={"query": query, "commit": commit})
         return False if commit else []
-    finally:
-        if conn:
+
+
+_cursores_streaming = itertools.count(1)
+
+
+def iterar_consulta(query: str, params=None, lote: int = LOTE_STREAMING, dict_rows: bool = False):
+    """
+    Generador: ejecuta `query` en un cursor con nombre (server-side) y va
+    trayendo las filas de a `lote`. La memoria del cliente queda acotada al
+    lote, no al resultado completo.
+    La conexión del pool queda tomada mientras se itera; se devuelve al
+    agotar el generador o al cerrarlo (break / close()).
+    Propaga las excepciones (quien itera decide qué hacer con una carga parcial).
+    """
+    with conexion_del_pool() as conn:
+        nombre = f"stream_{next(_cursores_streaming)}"
+        cur = conn.cursor(name=nombre, cursor_factory=RealDictCursor if dict_rows else None)
+        try:
+            cur.itersize = max(1, lote)
+            cur.execute(query, params or ())
+            yield from cur
+        finally:
             try:
-                conn.close()
-            except Exception:
-                # No volver a lanzar excepciones en el cierre
-                pass
+                cur.close()
+            finally:
+                conn.rollback()   # solo lectura: cierra la transacción del DECLARE
@@ -0,0 +1,71 @@
+# core/db/conexion_async.py
+"""
+Contraparte asyncio de core.db.conexion.
+
+psycopg2 es bloqueante: en lugar de llamarlo directo desde los handlers
+`async def` (lo que frena el event loop de uvicorn para TODOS los usuarios),
+las consultas se despachan a un executor dedicado cuyo tamaño coincide con
+el máximo del pool de conexiones. Así:
+  - el event loop nunca espera I/O de Postgres,
+  - las consultas async comparten el MISMO pool que el código sync,
+  - la concurrencia hacia la DB queda acotada por DB_POOL_MAX (las demás
+    corutinas esperan su turno sin bloquear el loop).
+"""
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from core.db.conexion import ejecutar_consulta, obtener_pool, POOL_MAX
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _obtener_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(1, POOL_MAX), thread_name_prefix="db-async")
+    return _executor
+
+
+async def ejecutar_en_hilo_db(fn, *args, **kwargs):
+    """
+    Corre una función bloqueante de core.db en el executor de DB y la espera sin bloquear el loop.
+    Como asyncio.to_thread, copia el contexto (contextvars del turno) al hilo.
+    """
+    loop = asyncio.get_running_loop()
+    contexto = contextvars.copy_context()
+    return await loop.run_in_executor(_obtener_executor(), functools.partial(contexto.run, fn, *args, **kwargs))
+
+
+async def ejecutar_consulta_async(query: str, params=None, commit: bool = False):
+    """
+    Igual que ejecutar_consulta() pero awaitable:
+    - SELECT: list[dict] (posiblemente vacía).
+    - commit=True: True/False.
+    Nunca propaga excepciones (mismo contrato que la versión sync).
+    """
+    return await ejecutar_en_hilo_db(ejecutar_consulta, query, params, commit)
+
+
+def version_async(fn):
+    """
+    Deriva la variante `async` de una función sync de core.db:
+        obtener_x_async = version_async(obtener_x)
+    """
+    @functools.wraps(fn)
+    async def _wrapper(*args, **kwargs):
+        return await ejecutar_en_hilo_db(fn, *args, **kwargs)
+
+    _wrapper.__name__ = f"{fn.__name__}_async"
+    _wrapper.__qualname__ = _wrapper.__name__
+    return _wrapper
+
+
+def cerrar_executor_db() -> None:
+    """Apaga el executor (shutdown de la app) y cierra las conexiones ociosas del pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    obtener_pool().cerrar()
@@ -1,10 +1,12 @@
-import psycopg2
 from datetime import datetime, timedelta
 from typing import List, Optional
 from psycopg2.extras import RealDictCursor
 
-from core.constantes import DATABASE_URL
-from core.db.conexion import ejecutar_consulta
+from core.db.conexion import ejecutar_consulta, conexion_del_pool
+from core.db.sentencias import registrar_sentencia, ejecutar_sentencia, ejecutar_preparada
+from core.db.perfil_clinico import obtener_perfil_clinico, registrar_en_perfil, MAX_RECIENTES
+from core.db.particiones import fecha_desde, VENTANA_VOCABULARIO_DIAS
+from core.db.rollups import rollup_pendiente
 
 
 
@@ -14,46 +16,42 @@ def obtener_emociones_ya_registradas(user_id: str) -> set[str]:
     Devuelve el conjunto de emociones registradas para el usuario `user_id`,
     combinando `emociones` ∪ `nuevas_emociones_detectadas` desde
     public.historial_clinico_usuario (solo registros no eliminados).
+    Se sirve desde el perfil clínico cacheado (una sola lectura por usuario).
     """
-    sql = """
-        SELECT
-            COALESCE(emociones, ARRAY[]::text[])                   AS emociones,
-            COALESCE(nuevas_emociones_detectadas, ARRAY[]::text[]) AS nuevas
-        FROM public.historial_clinico_usuario
-        WHERE user_id = %s
-          AND eliminado = false
-    """
-    filas = ejecutar_consulta(sql, (user_id,)) or []
-    res: set[str] = set()
-    for fila in filas:
-        emos = (fila[0] if isinstance(fila, (list, tuple)) else fila.get("emociones")) or []
-        news = (fila[1] if isinstance(fila, (list, tuple)) else fila.get("nuevas")) or []
-        for e in emos:
-            if e and isinstance(e, str):
-                res.add(e.strip().lower())
-        for e in news:
-            if e and isinstance(e, str):
-                res.add(e.strip().lower())
-    return res
+    return set(obtener_perfil_clinico(user_id).emociones_registradas)
+
+
+
+_SQL_SINTOMAS = registrar_sentencia("hcu_sintomas", """
+    SELECT COALESCE(sintomas, ARRAY[]::text[]) AS sintomas
+    FROM public.historial_clinico_usuario
+""")
+_SQL_SINTOMAS_USUARIO = registrar_sentencia("hcu_sintomas_usuario", """
+    SELECT COALESCE(sintomas, ARRAY[]::text[]) AS sintomas
+    FROM public.historial_clinico_usuario
+    WHERE user_id = %s
+""")
 
 
+_SQL_SINTOMAS_DESDE = registrar_sentencia("hcu_sintomas_desde", """
+    SELECT COALESCE(sintomas, ARRAY[]::text[]) AS sintomas
+    FROM public.historial_clinico_usuario
+    WHERE fecha >= %s
+""")
 
-def obtener_sintomas_existentes(user_id: str | None = None) -> set[str]:
+
+def obtener_sintomas_existentes(user_id: str | None = None, dias: int | None = VENTANA_VOCABULARIO_DIAS) -> set[str]:
     """
     Si alguna parte del código pregunta 'sintomas existentes', los tomamos de la misma tabla.
+    Sin usuario, `dias` acota la lectura a los últimos días (poda de particiones).
     """
-    params = ()
-    where = ""
+    desde = fecha_desde(dias)
     if user_id:
-        where = "WHERE user_id = %s"
-        params = (user_id,)
-
-    sql = f"""
-        SELECT COALESCE(sintomas, ARRAY[]::text[]) AS sintomas
-        FROM public.historial_clinico_usuario
-        {where}
-    """
-    filas = ejecutar_consulta(sql, params) or []
+        filas = ejecutar_sentencia(_SQL_SINTOMAS_USUARIO, (user_id,)) or []
+    elif desde is not None:
+        filas = ejecutar_sentencia(_SQL_SINTOMAS_DESDE, (desde,)) or []
+    else:
+        filas = ejecutar_sentencia(_SQL_SINTOMAS) or []
     res: set[str] = set()
     for f in filas:
         sintomas = f.get("sintomas") or []
@@ -68,15 +66,18 @@ def obtener_sintomas_existentes(user_id: str | None = None) -> set[str]:
 
 
 
+_SQL_SINTOMAS_DISTINTOS = registrar_sentencia("hcu_sintomas_distintos", """
+    SELECT DISTINCT LOWER(unnest(emociones)) AS sintoma
+    FROM public.historial_clinico_usuario
+    WHERE emociones IS NOT NULL
+""")
+
+
 def obtener_sintomas_con_estado_emocional() -> list[tuple[str, str]]:
     # Derivación mínima desde historial (sin clasificar):
     try:
-        with psycopg2.connect(DATABASE_URL) as conn, conn.cursor() as cur:
-            cur.execute("""
-                SELECT DISTINCT LOWER(unnest(emociones)) AS sintoma
-                FROM public.historial_clinico_usuario
-                WHERE emociones IS NOT NULL
-            """)
+        with conexion_del_pool() as conn, conn.cursor() as cur:
+            ejecutar_preparada(cur, _SQL_SINTOMAS_DISTINTOS)
             sintomas = [row[0] for row in cur.fetchall() if row and row[0]]
             # No hay “estado_emocional” en esta tabla: devolvemos etiqueta genérica
             return [(s, "patrón emocional detectado") for s in sintomas]
@@ -87,6 +88,15 @@ def obtener_sintomas_con_estado_emocional() -> list[tuple[str, str]]:
 
 
 
+_SQL_COMBINACIONES_RECIENTES = registrar_sentencia("hcu_combinaciones_recientes", """
+    SELECT DISTINCT emociones, fecha
+    FROM public.historial_clinico_usuario
+    WHERE fecha >= %s
+      AND array_length(emociones, 1) > 1
+    ORDER BY fecha DESC
+""")
+
+
 def obtener_combinaciones_no_registradas(dias=7):
     """
     Devuelve una lista de combinaciones emocionales registradas
@@ -94,14 +104,8 @@ def obtener_combinaciones_no_registradas(dias=7):
     """
     try:
         fecha_limite = datetime.now() - timedelta(days=dias)
-        with psycopg2.connect(DATABASE_URL) as conn, conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT DISTINCT emociones, fecha
-                FROM public.historial_clinico_usuario
-                WHERE fecha >= %s
-                  AND array_length(emociones, 1) > 1
-                ORDER BY fecha DESC
-            """, (fecha_limite,))
+        with conexion_del_pool() as conn, conn.cursor() as cursor:
+            ejecutar_preparada(cursor, _SQL_COMBINACIONES_RECIENTES, (fecha_limite,))
             combinaciones = cursor.fetchall()
 
         print(f"\n📋 Combinaciones emocionales registradas (últimos {dias} días):")
@@ -150,91 +154,97 @@ from core.db.conexion import ejecutar_consulta
 
 # ===== Helpers agregados para memoria persistente y estadísticas globales =====
 
+_SQL_HISTORIAL_USUARIO = registrar_sentencia("hcu_historial_usuario", """
+    SELECT
+        id,
+        user_id,
+        fecha,
+        emociones,
+        nuevas_emociones_detectadas,
+        cuadro_clinico_probable,
+        interaccion_id
+    FROM public.historial_clinico_usuario
+    WHERE user_id = %s
+      AND eliminado = false
+    ORDER BY fecha DESC
+    LIMIT %s
+""")
+
 def obtener_historial_usuario(user_id: str, limite: int = 100):
-    query = """
-        SELECT
-            id,
-            user_id,
-            fecha,
-            emociones,
-            nuevas_emociones_detectadas,
-            cuadro_clinico_probable,
-            interaccion_id
-        FROM public.historial_clinico_usuario
-        WHERE user_id = %s
-          AND eliminado = false
-        ORDER BY fecha DESC
-        LIMIT %s
-    """
-    return ejecutar_consulta(query, (user_id, limite)) or []
+    # El perfil guarda las últimas MAX_RECIENTES filas no eliminadas; más allá, consulta directa
+    if limite <= MAX_RECIENTES:
+        return [dict(f) for f in obtener_perfil_clinico(user_id).recientes[:limite]]
+    return ejecutar_sentencia(_SQL_HISTORIAL_USUARIO, (user_id, limite)) or []
 
 
 def obtener_ultimo_registro_usuario(user_id: str):
-    query = """
-        SELECT
-            id,
-            user_id,
-            fecha,
-            emociones,
-            nuevas_emociones_detectadas,
-            cuadro_clinico_probable,
-            interaccion_id
-        FROM public.historial_clinico_usuario
-        WHERE user_id = %s
-          AND eliminado = false
-        ORDER BY fecha DESC
-        LIMIT 1
-    """
-    res = ejecutar_consulta(query, (user_id,))
-    return res[0] if res else None
+    recientes = obtener_perfil_clinico(user_id).recientes
+    return dict(recientes[0]) if recientes else None
+
+
+_SQL_EMOCION_A_CUADRO = registrar_sentencia("hcu_emocion_a_cuadro", """
+    SELECT
+        LOWER(e) AS emocion,
+        LOWER(COALESCE(cuadro_clinico_probable, '')) AS cuadro,
+        COUNT(*) AS c
+    FROM public.historial_clinico_usuario
+    CROSS JOIN LATERAL UNNEST(COALESCE(emociones, ARRAY[]::text[])) AS e
+    WHERE eliminado = false
+      AND COALESCE(cuadro_clinico_probable, '') <> ''
+    GROUP BY 1, 2
+    HAVING COUNT(*) >= 1
+    ORDER BY c DESC
+""")
+
+# Tabla resumen mantenida por trigger (migración 4): su tamaño es el de pares distintos, no el del historial
+_SQL_EMOCION_A_CUADRO_RESUMEN = registrar_sentencia("hcu_emocion_a_cuadro_resumen", """
+    SELECT emocion, cuadro, c
+    FROM public.estadistica_emocion_cuadro
+    WHERE c > 0
+    ORDER BY c DESC
+""")
 
 
 def estadistica_global_emocion_a_cuadro():
     """
     Devuelve filas (emocion TEXT, cuadro TEXT, c BIGINT) a partir de la memoria.
     Se usa solo como estadística/memoria; las etiquetas las define OpenAI.
+    Lee la tabla resumen estadistica_emocion_cuadro (actualizada por trigger en cada insert);
+    mientras su relleno no terminó (core.db.rollups), la agregación completa.
     """
-    query = """
-        SELECT
-            LOWER(e) AS emocion,
-            LOWER(COALESCE(cuadro_clinico_probable, '')) AS cuadro,
-            COUNT(*) AS c
-        FROM public.historial_clinico_usuario
-        CROSS JOIN LATERAL UNNEST(COALESCE(emociones, ARRAY[]::text[])) AS e
-        WHERE eliminado = false
-          AND COALESCE(cuadro_clinico_probable, '') <> ''
-        GROUP BY 1, 2
-        HAVING COUNT(*) >= 1
-        ORDER BY c DESC
-    """
-    return ejecutar_consulta(query, ())
+    if rollup_pendiente("estadistica_emocion_cuadro"):
+        return ejecutar_sentencia(_SQL_EMOCION_A_CUADRO)
+    return ejecutar_sentencia(_SQL_EMOCION_A_CUADRO_RESUMEN)
+
+
+def estadistica_global_emocion_a_cuadro_completa():
+    """Misma estadística recalculada sobre TODO el historial (O(tabla)); solo para auditar la tabla resumen."""
+    return ejecutar_sentencia(_SQL_EMOCION_A_CUADRO)
 
 
 
 def obtener_ultima_interaccion_emocional(user_id: str) -> Optional[dict]:
     """
-    Trae la última fila EMOCIONAL del usuario.
-    Usa es_emocional=true para calzar con el índice parcial.
+    Trae la última fila EMOCIONAL del usuario (no eliminada y con al menos
+    una emoción), desde el perfil clínico cacheado.
     """
-    query = """
-        SELECT
-            id,
-            user_id,
-            fecha,
-            emociones,
-            nuevas_emociones_detectadas,
-            cuadro_clinico_probable
-        FROM public.historial_clinico_usuario
-        WHERE user_id = %s
-          AND COALESCE(eliminado, false) = false
-          AND es_emocional = true
-        ORDER BY fecha DESC
-        LIMIT 1
-    """
-    rows = ejecutar_consulta(query, (user_id,))
-    return rows[0] if rows else None
+    fila = obtener_perfil_clinico(user_id).ultima_emocional
+    return dict(fila) if fila else None
+
 
 
+_SQL_INSERTAR_INTERACCION_CLINICA = registrar_sentencia("hcu_insertar_interaccion_clinica", """
+    INSERT INTO public.historial_clinico_usuario
+        (user_id, fecha, emociones, nuevas_emociones_detectadas,
+         cuadro_clinico_probable, respuesta_openai, origen, fuente, eliminado,
+         tema, sintomas, interaccion_id)
+    VALUES
+        (%s, NOW(), %s, %s,
+         %s, %s, %s, %s, %s,
+         %s, %s, %s)
+    RETURNING id
+""")
+
 
 def registrar_interaccion_clinica(
     user_id: str,
@@ -253,17 +263,6 @@ def registrar_interaccion_clinica(
     Inserta una fila en public.historial_clinico_usuario y retorna el id generado.
     Solo usamos esta tabla para persistir el historial.
     """
-    sql = """
-        INSERT INTO public.historial_clinico_usuario
-            (user_id, fecha, emociones, nuevas_emociones_detectadas,
-             cuadro_clinico_probable, respuesta_openai, origen, fuente, eliminado,
-             tema, sintomas, interaccion_id)
-        VALUES
-            (%s, NOW(), %s, %s,
-             %s, %s, %s, %s, %s,
-             %s, %s, %s)
-        RETURNING id
-    """
     params = (
         user_id,
         emociones if emociones else None,
@@ -278,14 +277,36 @@ def registrar_interaccion_clinica(
         interaccion_id,
     )
     try:
-        # Usamos conexión directa para poder hacer RETURNING + COMMIT de forma segura
-        with psycopg2.connect(DATABASE_URL) as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(sql, params)
+        # Conexión del pool para poder hacer RETURNING + COMMIT de forma segura
+        with conexion_del_pool() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            ejecutar_preparada(cur, _SQL_INSERTAR_INTERACCION_CLINICA, params)
             row = cur.fetchone()          # trae {"id": ...}
             conn.commit()                 # persistimos la inserción
-            return (row or {}).get("id")  # int | None
+        nuevo_id = (row or {}).get("id")  # int | None
+        if not eliminado:
+            # Write-through: el perfil cacheado ve la fila sin volver a leer
+            registrar_en_perfil(user_id, {
+                "id": nuevo_id,
+                "user_id": user_id,
+                "fecha": datetime.now(),
+                "emociones": params[1],
+                "nuevas_emociones_detectadas": params[2],
+                "cuadro_clinico_probable": params[3],
+                "interaccion_id": interaccion_id,
+            })
+        return nuevo_id
     except Exception as e:
         print(f"❌ registrar_interaccion_clinica falló: {e}")
         return None
 
 
+
+
+# ===== Variantes async (para handlers FastAPI; no bloquean el event loop) =====
+from core.db.conexion_async import version_async  # noqa: E402
+
+obtener_emociones_ya_registradas_async = version_async(obtener_emociones_ya_registradas)
+obtener_historial_usuario_async = version_async(obtener_historial_usuario)
+obtener_ultimo_registro_usuario_async = version_async(obtener_ultimo_registro_usuario)
+obtener_ultima_interaccion_emocional_async = version_async(obtener_ultima_interaccion_emocional)
+registrar_interaccion_clinica_async = version_async(registrar_interaccion_clinica)
@@ -0,0 +1,45 @@
+# core/db/etiquetas_cuadro.py
+"""
+Memo persistente emoción → rótulo de cuadro clínico (tabla etiqueta_emocion_cuadro, migración 8).
+
+Cada término emocional distinto se rotula una sola vez (para todos los
+usuarios y para siempre); core.utils.etiquetado_cuadros consulta acá antes
+de pedirle nada al modelo y guarda lo que el modelo devolvió.
+"""
+from core.db.sentencias import registrar_sentencia, ejecutar_sentencia
+
+_SQL_BUSCAR = registrar_sentencia("eec_buscar", """
+    SELECT emocion, cuadro
+    FROM etiqueta_emocion_cuadro
+    WHERE emocion = ANY(%s::text[])
+      AND lower(cuadro) <> 'indeterminado';
+""")
+
+# Primera escritura gana: dos workers que rotulan el mismo término a la vez no se pisan.
+# Una fila "indeterminado" (guardada antes de filtrarlas) sí se reemplaza.
+_SQL_GUARDAR = registrar_sentencia("eec_guardar", """
+    INSERT INTO etiqueta_emocion_cuadro AS t (emocion, cuadro, fuente, modelo)
+    SELECT e, c, %s, %s
+    FROM unnest(%s::text[], %s::text[]) AS v(e, c)
+    ON CONFLICT (emocion) DO UPDATE
+    SET cuadro = EXCLUDED.cuadro, fuente = EXCLUDED.fuente, modelo = EXCLUDED.modelo
+    WHERE lower(t.cuadro) = 'indeterminado';
+""")
+
+
+def buscar_etiquetas(emociones) -> dict[str, str]:
+    """{emocion: cuadro} para las emociones ya rotuladas (las demás, e "indeterminado", no aparecen)."""
+    emociones = list(emociones or [])
+    if not emociones:
+        return {}
+    filas = ejecutar_sentencia(_SQL_BUSCAR, (emociones,))
+    return {f["emocion"]: f["cuadro"] for f in filas or []}
+
+
+def guardar_etiquetas(etiquetas: dict[str, str], fuente: str = "openai", modelo: str | None = None) -> bool:
+    """Inserta los rótulos nuevos en una sola sentencia; True si se confirmó."""
+    if not etiquetas:
+        return True
+    emociones = list(etiquetas)
+    cuadros = [etiquetas[e] for e in emociones]
+    return ejecutar_sentencia(_SQL_GUARDAR, (fuente, modelo, emociones, cuadros), commit=True)
@@ -0,0 +1,761 @@
+# core/db/migraciones.py
+"""
+Bootstrap de esquema versionado (una sola vez, al arrancar).
+
+Reemplaza las verificaciones que antes se hacían EN CADA escritura
+(information_schema + ALTER TABLE en registrar_interaccion /
+registrar_respuesta_openai, CREATE TABLE IF NOT EXISTS en las auditorías):
+
+- MIGRACIONES es una lista ordenada (versión, descripción, sentencias).
+  La 1 es el esquema base de init_db(); las siguientes alinean las tablas
+  con las columnas que usa core.db.registro.
+- La versión aplicada queda en `schema_migraciones`; al arrancar solo se
+  ejecutan las pendientes, cada una en su transacción.
+- Un advisory lock evita que varios workers de gunicorn migren a la vez.
+  Se toma con pg_try_advisory_lock en un bucle (autocommit): el worker que
+  espera no deja una sentencia abierta que CREATE INDEX CONCURRENTLY tenga
+  que esperar.
+- Las versiones de MIGRACIONES_SIN_TRANSACCION (índices sobre tablas con
+  escrituras) corren en autocommit, sentencia por sentencia, con
+  CREATE INDEX CONCURRENTLY: no bloquean los INSERT mientras se construyen.
+  Un índice que quedó INVALID por una corrida cortada se descarta y se crea
+  de nuevo.
+- Los rollups de historial_clinico_usuario (migraciones 4 y 5) se crean
+  vacíos, con su trigger y una marca en relleno_rollup, bajo un lock breve.
+  El historial previo lo cuenta core.db.rollups después, en transacciones
+  cortas: la migración no deja a los INSERT esperando detrás del backfill.
+- verificar_esquema() compara el catálogo con ESQUEMA_ESPERADO en UNA sola
+  consulta y deja un reporte (log + /health).
+
+Todas las sentencias son idempotentes (IF NOT EXISTS), así una base creada a
+mano antes de este módulo se adopta sin romper nada.
+"""
+import os
+import re
+import time
+import logging
+
+from core.db.conexion import conexion_del_pool
+
+logger = logging.getLogger(__name__)
+
+MIGRAR_AL_INICIO = os.getenv("DB_MIGRAR_AL_INICIO", "1").strip().lower() not in ("0", "false", "no")
+_CLAVE_LOCK = 73_210_001   # pg_advisory_lock: identificador arbitrario y fijo de esta app
+ESPERA_LOCK = 0.5          # seg. entre intentos de tomar el lock
+
+# Triggers e índices de historial_clinico_usuario: los usan las migraciones y
+# core.db.particiones al recrear la tabla particionada
+SQL_TRIGGER_ESTADISTICA = """
+    CREATE TRIGGER trg_estadistica_emocion_cuadro
+    AFTER INSERT OR DELETE OR UPDATE OF emociones, cuadro_clinico_probable, eliminado
+    ON historial_clinico_usuario
+    FOR EACH ROW EXECUTE FUNCTION fn_estadistica_emocion_cuadro();
+"""
+SQL_TRIGGER_PERFIL = """
+    CREATE TRIGGER trg_perfil_emocional_usuario
+    AFTER INSERT OR DELETE
+       OR UPDATE OF user_id, fecha, emociones, nuevas_emociones_detectadas, cuadro_clinico_probable, eliminado
+    ON historial_clinico_usuario
+    FOR EACH ROW EXECUTE FUNCTION fn_perfil_emocional_usuario();
+"""
+INDICES_HISTORIAL = [
+    # Últimas filas vigentes del usuario (hcu_historial_usuario, hcu_perfil_recientes)
+    """
+    CREATE INDEX IF NOT EXISTS idx_hcu_user_fecha_vigente
+    ON historial_clinico_usuario (user_id, fecha DESC, id DESC)
+    WHERE eliminado = false;
+    """,
+    # Todas las filas del usuario (fallback de perfil, recálculo del rollup)
+    """
+    CREATE INDEX IF NOT EXISTS idx_hcu_user_fecha
+    ON historial_clinico_usuario (user_id, fecha DESC, id DESC);
+    """,
+    # Búsquedas por pertenencia en los arrays (@>, &&, = ANY)
+    "CREATE INDEX IF NOT EXISTS idx_hcu_emociones_gin ON historial_clinico_usuario USING GIN (emociones);",
+    "CREATE INDEX IF NOT EXISTS idx_hcu_sintomas_gin ON historial_clinico_usuario USING GIN (sintomas);",
+]
+# Sobre la tabla en uso (migración 6); core.db.particiones crea los de arriba en la tabla nueva, vacía
+INDICES_HISTORIAL_CONCURRENTES = [
+    s.replace("CREATE INDEX IF NOT EXISTS", "CREATE INDEX CONCURRENTLY IF NOT EXISTS") for s in INDICES_HISTORIAL
+]
+_INDICE_CONCURRENTE = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I)
+
+
+MIGRACIONES: list[tuple[int, str, list[str]]] = [
+    (1, "esquema base (init_db)", [
+        # ------------------ Conversación base ------------------
+        """
+        CREATE TABLE IF NOT EXISTS interacciones (
+            id           SERIAL PRIMARY KEY,
+            user_id      TEXT NOT NULL,
+            consulta     TEXT NOT NULL,
+            fecha        TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS respuestas_openai (
+            id             SERIAL PRIMARY KEY,
+            interaccion_id BIGINT,
+            respuesta      TEXT NOT NULL,
+            fecha          TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS emociones_detectadas (
+            id        SERIAL PRIMARY KEY,
+            user_id   TEXT NOT NULL,
+            emocion   TEXT NOT NULL,
+            fecha     TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        # ------------------ Motor clínico unificado ------------------
+        """
+        CREATE TABLE IF NOT EXISTS historial_clinico_usuario (
+            id                           SERIAL PRIMARY KEY,
+            user_id                      TEXT NOT NULL,
+            fecha                        TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            emociones                    TEXT[],
+            sintomas                     TEXT[],
+            tema                         TEXT,
+            respuesta_openai             TEXT,
+            sugerencia                   TEXT,
+            fase_evaluacion              TEXT,
+            fuente                       TEXT,
+            eliminado                    BOOLEAN DEFAULT FALSE,
+            interaccion_id               BIGINT,
+            origen                       TEXT,
+            cuadro_clinico_probable      TEXT,
+            nuevas_emociones_detectadas  TEXT[],
+            fecha_ultima_interaccion     TIMESTAMPTZ
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_hist_clinico_user ON historial_clinico_usuario(user_id);",
+        "CREATE INDEX IF NOT EXISTS idx_hist_clinico_fecha ON historial_clinico_usuario(fecha);",
+        # ------------------ Disparadores / combinaciones ------------------
+        """
+        CREATE TABLE IF NOT EXISTS disparadores_emocionales (
+            id                SERIAL PRIMARY KEY,
+            emocion_1         TEXT NOT NULL,
+            emocion_2         TEXT NOT NULL,
+            texto_disparador  TEXT NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS combinaciones_no_registradas (
+            id         SERIAL PRIMARY KEY,
+            emocion_1  TEXT NOT NULL,
+            emocion_2  TEXT NOT NULL,
+            fecha      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        # ------------------ Auditorías / logs ------------------
+        """
+        CREATE TABLE IF NOT EXISTS auditoria_input_original (
+            id             SERIAL PRIMARY KEY,
+            user_id        TEXT,
+            input_original TEXT,
+            fecha          TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS auditoria_respuestas (
+            id                 SERIAL PRIMARY KEY,
+            user_id            TEXT,
+            respuesta_original TEXT,
+            respuesta_filtrada TEXT,
+            motivo             TEXT,
+            fecha              TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS faq_similitud_logs (
+            id        SERIAL PRIMARY KEY,
+            user_id   TEXT,
+            pregunta  TEXT,
+            candidato TEXT,
+            score     NUMERIC,
+            fecha     TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS primer_input_log (
+            id     SERIAL PRIMARY KEY,
+            user_id TEXT,
+            input   TEXT,
+            fecha   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+    ]),
+    (2, "interacciones: mensaje_original y respuesta (antes se creaban en cada escritura)", [
+        "ALTER TABLE interacciones ADD COLUMN IF NOT EXISTS mensaje_original TEXT;",
+        "ALTER TABLE interacciones ADD COLUMN IF NOT EXISTS respuesta TEXT;",
+    ]),
+    (3, "auditorías, inferencias y similitud FAQ alineadas con core.db.registro", [
+        "ALTER TABLE auditoria_input_original ADD COLUMN IF NOT EXISTS mensaje_original TEXT;",
+        "ALTER TABLE auditoria_input_original ADD COLUMN IF NOT EXISTS mensaje_purificado TEXT;",
+        "ALTER TABLE auditoria_input_original ADD COLUMN IF NOT EXISTS clasificacion TEXT;",
+        "ALTER TABLE auditoria_respuestas ADD COLUMN IF NOT EXISTS interaccion_id INTEGER;",
+        "ALTER TABLE auditoria_respuestas ADD COLUMN IF NOT EXISTS respuesta_final TEXT;",
+        "ALTER TABLE auditoria_respuestas ADD COLUMN IF NOT EXISTS motivo_modificacion TEXT;",
+        """
+        CREATE TABLE IF NOT EXISTS inferencias_cerebro_simulado (
+            id             SERIAL PRIMARY KEY,
+            user_id        TEXT NOT NULL,
+            interaccion_id BIGINT,
+            tipo           TEXT,
+            valor          TEXT,
+            fecha          TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        "ALTER TABLE faq_similitud_logs ADD COLUMN IF NOT EXISTS consulta TEXT;",
+        "ALTER TABLE faq_similitud_logs ADD COLUMN IF NOT EXISTS pregunta_faq TEXT;",
+        "ALTER TABLE faq_similitud_logs ADD COLUMN IF NOT EXISTS similitud NUMERIC;",
+    ]),
+    (4, "estadística emoción→cuadro mantenida por trigger (reemplaza el GROUP BY por turno)", [
+        """
+        CREATE TABLE IF NOT EXISTS estadistica_emocion_cuadro (
+            emocion         TEXT NOT NULL,
+            cuadro          TEXT NOT NULL,
+            c               BIGINT NOT NULL DEFAULT 0,
+            actualizado_en  TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (emocion, cuadro)
+        );
+        """,
+        # Rellenos pendientes de los rollups (core.db.rollups): mientras haya fila, el rollup
+        # todavía no cuenta el historial anterior a su trigger
+        """
+        CREATE TABLE IF NOT EXISTS relleno_rollup (
+            rollup       TEXT PRIMARY KEY,
+            hasta_id     BIGINT,   -- MAX(id) al crear el trigger: lo posterior ya lo cuenta el trigger
+            hecho_id     BIGINT,   -- estadística: ids <= hecho_id ya contados
+            ultimo_user  TEXT,     -- perfil: usuarios <= ultimo_user ya recalculados
+            creado_en    TIMESTAMPTZ DEFAULT NOW()
+        );
+        """,
+        # ¿La fila todavía la tiene que contar el relleno? Si el lote que la cubre está en curso,
+        # espera a que termine (FOR SHARE contra su FOR UPDATE) y vuelve a mirar
+        """
+        CREATE OR REPLACE FUNCTION fn_relleno_pendiente(p_rollup TEXT, p_id BIGINT) RETURNS boolean AS $$
+        DECLARE
+            r relleno_rollup%ROWTYPE;
+        BEGIN
+            SELECT * INTO r FROM relleno_rollup WHERE rollup = p_rollup;
+            IF NOT FOUND OR p_id IS NULL OR p_id > r.hasta_id OR p_id <= r.hecho_id THEN
+                RETURN false;
+            END IF;
+            SELECT * INTO r FROM relleno_rollup WHERE rollup = p_rollup FOR SHARE;
+            RETURN FOUND AND p_id > r.hecho_id;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+        # Mismo criterio que la agregación original: eliminado = false y cuadro no vacío.
+        # Las filas anteriores al trigger que el relleno no contó todavía las cuenta él, como estén
+        """
+        CREATE OR REPLACE FUNCTION fn_estadistica_emocion_cuadro() RETURNS trigger AS $$
+        BEGIN
+            IF fn_relleno_pendiente('estadistica_emocion_cuadro', CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END) THEN
+                RETURN NULL;
+            END IF;
+
+            IF TG_OP IN ('UPDATE', 'DELETE')
+               AND OLD.eliminado IS FALSE
+               AND COALESCE(OLD.cuadro_clinico_probable, '') <> '' THEN
+                UPDATE estadistica_emocion_cuadro s
+                SET c = s.c - d.n, actualizado_en = NOW()
+                FROM (
+                    SELECT LOWER(e) AS emocion, COUNT(*) AS n
+                    FROM UNNEST(COALESCE(OLD.emociones, ARRAY[]::text[])) AS e
+                    WHERE e IS NOT NULL
+                    GROUP BY 1
+                ) d
+                WHERE s.emocion = d.emocion
+                  AND s.cuadro = LOWER(OLD.cuadro_clinico_probable);
+            END IF;
+
+            IF TG_OP IN ('INSERT', 'UPDATE')
+               AND NEW.eliminado IS FALSE
+               AND COALESCE(NEW.cuadro_clinico_probable, '') <> '' THEN
+                INSERT INTO estadistica_emocion_cuadro AS s (emocion, cuadro, c)
+                SELECT LOWER(e), LOWER(NEW.cuadro_clinico_probable), COUNT(*)
+                FROM UNNEST(COALESCE(NEW.emociones, ARRAY[]::text[])) AS e
+                WHERE e IS NOT NULL
+                GROUP BY 1
+                ON CONFLICT (emocion, cuadro)
+                DO UPDATE SET c = s.c + EXCLUDED.c, actualizado_en = NOW();
+            END IF;
+
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+        # El lock solo cubre crear el trigger y anotar hasta qué id llega el historial previo
+        # (sin INSERT a medio hacer, ninguna fila queda de los dos lados). El relleno corre
+        # después, en lotes cortos (core.db.rollups), con la app ya escribiendo
+        "LOCK TABLE historial_clinico_usuario IN SHARE ROW EXCLUSIVE MODE;",
+        "DROP TRIGGER IF EXISTS trg_estadistica_emocion_cuadro ON historial_clinico_usuario;",
+        "TRUNCATE estadistica_emocion_cuadro;",
+        SQL_TRIGGER_ESTADISTICA,
+        """
+        INSERT INTO relleno_rollup (rollup, hasta_id, hecho_id)
+        SELECT 'estadistica_emocion_cuadro', MAX(id), MIN(id) - 1
+        FROM historial_clinico_usuario
+        HAVING MAX(id) IS NOT NULL
+        ON CONFLICT (rollup) DO UPDATE SET hasta_id = EXCLUDED.hasta_id, hecho_id = EXCLUDED.hecho_id;
+        """,
+    ]),
+    (5, "perfil emocional por usuario (rollup) mantenido por trigger", [
+        # Una fila por usuario: lo que antes se reconstruía leyendo todo su historial
+        """
+        CREATE TABLE IF NOT EXISTS perfil_emocional_usuario (
+            user_id            TEXT PRIMARY KEY,
+            malestares         TEXT[] NOT NULL DEFAULT '{}',  -- emociones distintas, orden de primera aparición (todas las filas)
+            registradas        TEXT[] NOT NULL DEFAULT '{}',  -- emociones ∪ nuevas normalizadas (no eliminadas)
+            ultima_fecha       TIMESTAMP,                     -- última fila (incluye eliminadas)
+            ultimas_emociones  TEXT[],
+            ultimo_cuadro      TEXT,
+            registros          BIGINT NOT NULL DEFAULT 0,     -- filas no eliminadas
+            actualizado_en     TIMESTAMPTZ DEFAULT NOW()
+        );
+        """,
+        # Conteo y primera/última vez por emoción (no eliminadas), para la emoción predominante
+        """
+        CREATE TABLE IF NOT EXISTS perfil_emocional_usuario_emocion (
+            user_id      TEXT NOT NULL,
+            emocion      TEXT NOT NULL,
+            c            BIGINT NOT NULL DEFAULT 0,
+            primera_vez  TIMESTAMP,
+            ultima_vez   TIMESTAMP,
+            PRIMARY KEY (user_id, emocion)
+        );
+        """,
+        # Recalcular un usuario completo: solo para UPDATE/DELETE (raros) y el relleno (core.db.rollups).
+        # Primero el lock de la fila del rollup, la misma que actualiza el trigger de INSERT: un INSERT
+        # concurrente del usuario entra en el recálculo o suma encima después, nunca dos veces. Por eso
+        # la fila se actualiza en su lugar: si se borrara, el UPDATE del trigger que esperaba no la vería
+        """
+        CREATE OR REPLACE FUNCTION fn_recalcular_perfil_emocional(p_user TEXT) RETURNS void AS $$
+        BEGIN
+            INSERT INTO perfil_emocional_usuario (user_id) VALUES (p_user)
+            ON CONFLICT (user_id) DO NOTHING;
+            PERFORM 1 FROM perfil_emocional_usuario WHERE user_id = p_user FOR UPDATE;
+
+            DELETE FROM perfil_emocional_usuario_emocion WHERE user_id = p_user;
+            INSERT INTO perfil_emocional_usuario_emocion (user_id, emocion, c, primera_vez, ultima_vez)
+            SELECT p_user, e, COUNT(*), MIN(h.fecha), MAX(h.fecha)
+            FROM historial_clinico_usuario h
+            CROSS JOIN LATERAL UNNEST(COALESCE(h.emociones, ARRAY[]::text[])) AS e
+            WHERE h.user_id = p_user
+              AND COALESCE(h.eliminado, false) = false
+              AND e IS NOT NULL
+            GROUP BY e;
+
+            UPDATE perfil_emocional_usuario p SET
+                malestares = COALESCE((
+                    SELECT array_agg(m.e ORDER BY m.orden)
+                    FROM (
+                        SELECT t.e, MIN(t.rn) AS orden
+                        FROM (
+                            SELECT u.e, row_number() OVER (ORDER BY h.fecha, h.id, u.i) AS rn
+                            FROM historial_clinico_usuario h
+                            CROSS JOIN LATERAL UNNEST(COALESCE(h.emociones, ARRAY[]::text[]))
+                                WITH ORDINALITY AS u(e, i)
+                            WHERE h.user_id = p_user AND u.e IS NOT NULL
+                        ) t
+                        GROUP BY t.e
+                    ) m
+                ), ARRAY[]::text[]),
+                registradas = COALESCE((
+                    SELECT array_agg(DISTINCT LOWER(BTRIM(e)))
+                    FROM historial_clinico_usuario h
+                    CROSS JOIN LATERAL UNNEST(
+                        COALESCE(h.emociones, ARRAY[]::text[]) || COALESCE(h.nuevas_emociones_detectadas, ARRAY[]::text[])
+                    ) AS e
+                    WHERE h.user_id = p_user
+                      AND COALESCE(h.eliminado, false) = false
+                      AND COALESCE(BTRIM(e), '') <> ''
+                ), ARRAY[]::text[]),
+                ultima_fecha = ult.fecha,
+                ultimas_emociones = ult.emociones,
+                ultimo_cuadro = (
+                    SELECT LOWER(cuadro_clinico_probable)
+                    FROM historial_clinico_usuario
+                    WHERE user_id = p_user
+                      AND COALESCE(eliminado, false) = false
+                      AND COALESCE(cuadro_clinico_probable, '') <> ''
+                    ORDER BY fecha DESC, id DESC
+                    LIMIT 1
+                ),
+                registros = (
+                    SELECT COUNT(*)
+                    FROM historial_clinico_usuario
+                    WHERE user_id = p_user AND COALESCE(eliminado, false) = false
+                ),
+                actualizado_en = NOW()
+            FROM (SELECT 1) uno
+            LEFT JOIN LATERAL (
+                SELECT fecha, emociones
+                FROM historial_clinico_usuario
+                WHERE user_id = p_user
+                ORDER BY fecha DESC, id DESC
+                LIMIT 1
+            ) ult ON true
+            WHERE p.user_id = p_user;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+        # INSERT (el camino caliente) es incremental: toca una fila del rollup y k filas de detalle
+        """
+        CREATE OR REPLACE FUNCTION fn_perfil_emocional_usuario() RETURNS trigger AS $$
+        DECLARE
+            vigente BOOLEAN;
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                PERFORM fn_recalcular_perfil_emocional(OLD.user_id);
+                IF TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id THEN
+                    PERFORM fn_recalcular_perfil_emocional(NEW.user_id);
+                END IF;
+                RETURN NULL;
+            END IF;
+
+            vigente := COALESCE(NEW.eliminado, false) = false;
+
+            INSERT INTO perfil_emocional_usuario (user_id) VALUES (NEW.user_id)
+            ON CONFLICT (user_id) DO NOTHING;
+
+            UPDATE perfil_emocional_usuario p SET
+                malestares = p.malestares || COALESCE(ARRAY(
+                    SELECT u.e
+                    FROM UNNEST(COALESCE(NEW.emociones, ARRAY[]::text[])) WITH ORDINALITY AS u(e, i)
+                    WHERE u.e IS NOT NULL AND NOT (u.e = ANY(p.malestares))
+                    GROUP BY u.e
+                    ORDER BY MIN(u.i)
+                ), ARRAY[]::text[]),
+                registradas = CASE WHEN vigente THEN p.registradas || COALESCE(ARRAY(
+                    SELECT DISTINCT LOWER(BTRIM(e))
+                    FROM UNNEST(
+                        COALESCE(NEW.emociones, ARRAY[]::text[]) || COALESCE(NEW.nuevas_emociones_detectadas, ARRAY[]::text[])
+                    ) AS e
+                    WHERE COALESCE(BTRIM(e), '') <> ''
+                      AND NOT (LOWER(BTRIM(e)) = ANY(p.registradas))
+                ), ARRAY[]::text[]) ELSE p.registradas END,
+                ultima_fecha = CASE WHEN p.ultima_fecha IS NULL OR NEW.fecha >= p.ultima_fecha
+                                    THEN NEW.fecha ELSE p.ultima_fecha END,
+                ultimas_emociones = CASE WHEN p.ultima_fecha IS NULL OR NEW.fecha >= p.ultima_fecha
+                                         THEN NEW.emociones ELSE p.ultimas_emociones END,
+                ultimo_cuadro = CASE WHEN vigente
+                                      AND COALESCE(NEW.cuadro_clinico_probable, '') <> ''
+                                      AND (p.ultima_fecha IS NULL OR NEW.fecha >= p.ultima_fecha)
+                                     THEN LOWER(NEW.cuadro_clinico_probable) ELSE p.ultimo_cuadro END,
+                registros = p.registros + CASE WHEN vigente THEN 1 ELSE 0 END,
+                actualizado_en = NOW()
+            WHERE p.user_id = NEW.user_id;
+
+            IF vigente THEN
+                INSERT INTO perfil_emocional_usuario_emocion AS d (user_id, emocion, c, primera_vez, ultima_vez)
+                SELECT NEW.user_id, e, COUNT(*), NEW.fecha, NEW.fecha
+                FROM UNNEST(COALESCE(NEW.emociones, ARRAY[]::text[])) AS e
+                WHERE e IS NOT NULL
+                GROUP BY e
+                ON CONFLICT (user_id, emocion) DO UPDATE SET
+                    c = d.c + EXCLUDED.c,
+                    primera_vez = LEAST(d.primera_vez, EXCLUDED.primera_vez),
+                    ultima_vez = GREATEST(d.ultima_vez, EXCLUDED.ultima_vez);
+            END IF;
+
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+        # Como en la 4: bajo el lock, solo el trigger y la marca de relleno pendiente. Los usuarios
+        # con historial previo los recalcula core.db.rollups, uno por transacción
+        "LOCK TABLE historial_clinico_usuario IN SHARE ROW EXCLUSIVE MODE;",
+        "DROP TRIGGER IF EXISTS trg_perfil_emocional_usuario ON historial_clinico_usuario;",
+        "TRUNCATE perfil_emocional_usuario, perfil_emocional_usuario_emocion;",
+        SQL_TRIGGER_PERFIL,
+        """
+        INSERT INTO relleno_rollup (rollup, hasta_id, ultimo_user)
+        SELECT 'perfil_emocional_usuario', MAX(id), NULL
+        FROM historial_clinico_usuario
+        HAVING MAX(id) IS NOT NULL
+        ON CONFLICT (rollup) DO UPDATE SET hasta_id = EXCLUDED.hasta_id, ultimo_user = NULL;
+        """,
+    ]),
+    (6, "índices por camino de acceso en historial_clinico_usuario", [
+        *INDICES_HISTORIAL_CONCURRENTES,
+        # idx_hcu_user_fecha cubre las búsquedas por user_id del índice original
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_hist_clinico_user;",
+        "ANALYZE historial_clinico_usuario;",
+    ]),
+    (7, "soporte de particionado mensual y archivo de historial_clinico_usuario", [
+        # Destino de las particiones frías (una fila por mes y usuario; jsonb va comprimido por TOAST)
+        """
+        CREATE TABLE IF NOT EXISTS historial_clinico_archivo (
+            mes           DATE NOT NULL,
+            user_id       TEXT NOT NULL,
+            filas         INTEGER NOT NULL,
+            datos         JSONB NOT NULL,
+            archivado_en  TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (mes, user_id)
+        );
+        """,
+        # Crea la partición del mes (no-op si la tabla no está particionada o ya existe)
+        """
+        CREATE OR REPLACE FUNCTION fn_crear_particion_historial(p_mes DATE) RETURNS TEXT AS $$
+        DECLARE
+            desde   DATE := date_trunc('month', p_mes)::date;
+            hasta   DATE := (date_trunc('month', p_mes) + INTERVAL '1 month')::date;
+            nombre  TEXT := 'historial_clinico_usuario_' || to_char(date_trunc('month', p_mes), 'YYYY_MM');
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('public.historial_clinico_usuario')) IS DISTINCT FROM 'p' THEN
+                RETURN NULL;
+            END IF;
+            IF to_regclass('public.' || nombre) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE public.%I PARTITION OF public.historial_clinico_usuario FOR VALUES FROM (%L) TO (%L)',
+                    nombre, desde, hasta
+                );
+            END IF;
+            RETURN nombre;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+    ]),
+    (8, "memo persistente emoción → rótulo de cuadro clínico", [
+        """
+        CREATE TABLE IF NOT EXISTS etiqueta_emocion_cuadro (
+            emocion    TEXT PRIMARY KEY,
+            cuadro     TEXT NOT NULL,
+            fuente     TEXT NOT NULL,
+            modelo     TEXT,
+            creada_en  TIMESTAMPTZ DEFAULT NOW()
+        );
+        """,
+    ]),
+    (9, "fn_crear_particion_historial saca de la DEFAULT las filas del mes", [
+        # Si el mantenimiento se atrasó, la DEFAULT ya tiene filas del mes y el CREATE ... PARTITION OF
+        # fallaría siempre. Se sacan (DELETE) y se vuelven a insertar por la tabla madre, ya con la
+        # partición creada: los triggers de los rollups restan y suman lo mismo.
+        """
+        CREATE OR REPLACE FUNCTION fn_crear_particion_historial(p_mes DATE) RETURNS TEXT AS $$
+        DECLARE
+            desde   DATE := date_trunc('month', p_mes)::date;
+            hasta   DATE := (date_trunc('month', p_mes) + INTERVAL '1 month')::date;
+            nombre  TEXT := 'historial_clinico_usuario_' || to_char(date_trunc('month', p_mes), 'YYYY_MM');
+            movidas BIGINT := 0;
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('public.historial_clinico_usuario')) IS DISTINCT FROM 'p' THEN
+                RETURN NULL;
+            END IF;
+            IF to_regclass('public.' || nombre) IS NOT NULL THEN
+                RETURN nombre;
+            END IF;
+            IF to_regclass('public.historial_clinico_usuario_default') IS NOT NULL
+               AND EXISTS (
+                   SELECT 1 FROM public.historial_clinico_usuario_default
+                   WHERE fecha >= desde AND fecha < hasta
+               ) THEN
+                CREATE TEMP TABLE _hcu_mover (LIKE public.historial_clinico_usuario);
+                WITH m AS (
+                    DELETE FROM public.historial_clinico_usuario_default
+                    WHERE fecha >= desde AND fecha < hasta
+                    RETURNING *
+                )
+                INSERT INTO _hcu_mover SELECT * FROM m;
+                GET DIAGNOSTICS movidas = ROW_COUNT;
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE public.%I PARTITION OF public.historial_clinico_usuario FOR VALUES FROM (%L) TO (%L)',
+                nombre, desde, hasta
+            );
+            IF movidas > 0 THEN
+                INSERT INTO public.historial_clinico_usuario SELECT * FROM _hcu_mover;
+                DROP TABLE _hcu_mover;
+                RAISE NOTICE '% filas movidas de la partición DEFAULT a %', movidas, nombre;
+            END IF;
+            RETURN nombre;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+    ]),
+]
+
+# Columnas que el camino de escritura/lectura en caliente da por existentes
+ESQUEMA_ESPERADO: dict[str, set[str]] = {
+    "interacciones": {"id", "user_id", "consulta", "mensaje_original", "respuesta", "fecha"},
+    "historial_clinico_usuario": {
+        "id", "user_id", "fecha", "emociones", "nuevas_emociones_detectadas",
+        "cuadro_clinico_probable", "interaccion_id", "fuente", "eliminado", "origen",
+    },
+    "auditoria_input_original": {"user_id", "mensaje_original", "mensaje_purificado", "clasificacion", "fecha"},
+    "auditoria_respuestas": {
+        "user_id", "interaccion_id", "respuesta_original", "respuesta_final", "motivo_modificacion", "fecha",
+    },
+    "inferencias_cerebro_simulado": {"user_id", "interaccion_id", "tipo", "valor"},
+    "faq_similitud_logs": {"user_id", "consulta", "pregunta_faq", "similitud"},
+    "disparadores_emocionales": {"emocion_1", "emocion_2", "texto_disparador"},
+    "combinaciones_no_registradas": {"emocion_1", "emocion_2"},
+    "estadistica_emocion_cuadro": {"emocion", "cuadro", "c"},
+    "perfil_emocional_usuario": {
+        "user_id", "malestares", "registradas", "ultima_fecha", "ultimas_emociones", "ultimo_cuadro", "registros",
+    },
+    "perfil_emocional_usuario_emocion": {"user_id", "emocion", "c", "primera_vez", "ultima_vez"},
+    "historial_clinico_archivo": {"mes", "user_id", "filas", "datos"},
+    "etiqueta_emocion_cuadro": {"emocion", "cuadro", "fuente", "modelo"},
+    "relleno_rollup": {"rollup", "hasta_id", "hecho_id", "ultimo_user"},
+}
+
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+# CREATE/DROP INDEX CONCURRENTLY no puede correr dentro de una transacción
+MIGRACIONES_SIN_TRANSACCION = {6}
+
+# Último reporte (lo muestra /health)
+ultimo_reporte: dict = {"estado": "sin_verificar"}
+
+
+def _tomar_lock(conn) -> None:
+    """pg_try_advisory_lock hasta conseguirlo, sin dejar una transacción abierta entre intentos."""
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            while True:
+                cur.execute("SELECT pg_try_advisory_lock(%s);", (_CLAVE_LOCK,))
+                if cur.fetchone()[0]:
+                    return
+                time.sleep(ESPERA_LOCK)
+    finally:
+        conn.autocommit = False
+
+
+def _aplicar_sin_transaccion(conn, sentencias: list[str]) -> None:
+    """Autocommit, sentencia por sentencia. Si la migración se corta, reintentarla es idempotente."""
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for sql in sentencias:
+                indice = _INDICE_CONCURRENTE.search(sql)
+                if indice:
+                    # Un CONCURRENTLY fallido deja el índice INVALID, y IF NOT EXISTS lo daría por bueno
+                    cur.execute(
+                        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s);",
+                        (indice.group(1),),
+                    )
+                    fila = cur.fetchone()
+                    if fila and fila[0]:
+                        logger.warning("Índice %s inválido (corrida anterior cortada): se recrea", indice.group(1))
+                        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {indice.group(1)};")
+                cur.execute(sql)
+    finally:
+        conn.autocommit = False
+
+
+def aplicar_migraciones() -> list[int]:
+    """Aplica las migraciones pendientes; devuelve las versiones aplicadas en esta corrida."""
+    aplicadas = []
+    with conexion_del_pool() as conn:
+        _tomar_lock(conn)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migraciones (
+                        version      INTEGER PRIMARY KEY,
+                        descripcion  TEXT NOT NULL,
+                        aplicada_en  TIMESTAMPTZ DEFAULT NOW()
+                    );
+                """)
+                cur.execute("SELECT version FROM schema_migraciones;")
+                ya_aplicadas = {r[0] for r in cur.fetchall()}
+            conn.commit()
+
+            for version, descripcion, sentencias in MIGRACIONES:
+                if version in ya_aplicadas:
+                    continue
+                try:
+                    if version in MIGRACIONES_SIN_TRANSACCION:
+                        _aplicar_sin_transaccion(conn, sentencias)
+                        sentencias = []
+                    with conn.cursor() as cur:
+                        for sql in sentencias:
+                            cur.execute(sql)
+                        cur.execute(
+                            "INSERT INTO schema_migraciones (version, descripcion) VALUES (%s, %s);",
+                            (version, descripcion),
+                        )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                aplicadas.append(version)
+                print(f"🧱 Migración {version} aplicada: {descripcion}")
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (_CLAVE_LOCK,))
+            conn.commit()
+    return aplicadas
+
+
+def verificar_esquema() -> dict:
+    """Compara el catálogo con ESQUEMA_ESPERADO (una sola consulta) y arma el reporte."""
+    with conexion_del_pool() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT table_name, column_name
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = ANY(%s);
+            """,
+            (list(ESQUEMA_ESPERADO),),
+        )
+        existentes: dict[str, set[str]] = {}
+        for tabla, columna in cur.fetchall():
+            existentes.setdefault(tabla, set()).add(columna)
+
+        try:
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migraciones;")
+            version = cur.fetchone()[0]
+        except Exception:
+            conn.rollback()
+            version = 0
+        conn.commit()
+
+    tablas_faltantes = sorted(t for t in ESQUEMA_ESPERADO if t not in existentes)
+    columnas_faltantes = {
+        t: sorted(cols - existentes[t])
+        for t, cols in ESQUEMA_ESPERADO.items()
+        if t in existentes and cols - existentes[t]
+    }
+    ok = not tablas_faltantes and not columnas_faltantes and version >= VERSION_ACTUAL
+    return {
+        "estado": "ok" if ok else "incompleto",
+        "version": version,
+        "version_esperada": VERSION_ACTUAL,
+        "tablas_faltantes": tablas_faltantes,
+        "columnas_faltantes": columnas_faltantes,
+    }
+
+
+def preparar_esquema() -> dict:
+    """
+    Startup: migra (si DB_MIGRAR_AL_INICIO) y verifica. Nunca lanza: un error
+    queda en el reporte y la app arranca igual (las escrituras loggean su fallo).
+    """
+    global ultimo_reporte
+    aplicadas = []
+    try:
+        if MIGRAR_AL_INICIO:
+            aplicadas = aplicar_migraciones()
+        reporte = verificar_esquema()
+    except Exception as e:
+        reporte = {"estado": "error", "error": str(e)}
+
+    reporte["aplicadas_ahora"] = aplicadas
+    ultimo_reporte = reporte
+    if reporte["estado"] == "ok":
+        logger.info("✅ Esquema verificado (versión %s).", reporte["version"])
+    else:
+        logger.warning("⚠️ Esquema con problemas: %s", reporte)
+    return reporte
+
+
+def reporte_esquema() -> dict:
+    return ultimo_reporte
@@ -0,0 +1,442 @@
+# core/db/particiones.py
+"""
+Particionado mensual de historial_clinico_usuario, retención y archivo.
+
+La tabla recibe una fila por casi cada mensaje clínico y nunca se achica.
+Con particionado declarativo por rango de `fecha` (una partición por mes):
+
+- Las consultas con filtro de fecha (p. ej. obtener_combinaciones_no_registradas,
+  obtener_sintomas_existentes(dias=...)) solo tocan las particiones del rango
+  (partition pruning, también con parámetros de sentencias preparadas).
+- Las particiones frías se archivan y se sueltan con DETACH + DROP, sin DELETE
+  fila por fila ni bloat. Los rollups (estadistica_emocion_cuadro,
+  perfil_emocional_usuario) conservan lo acumulado: el DROP no dispara triggers.
+
+Uso (la conversión es opt-in, se corre UNA vez a mano y toma un lock
+exclusivo: ventana de mantenimiento; la app nunca la dispara al arrancar):
+
+    python -m core.db.particiones estado
+    python -m core.db.particiones convertir [--conservar-original]
+    python -m core.db.particiones mantener [--retencion-meses 18] [--directorio /ruta]
+
+Con la tabla ya particionada, la app corre el mantenimiento (crear particiones
+futuras + retención) en un hilo de fondo cada HISTORIAL_MANTENIMIENTO_SEG,
+con pg_try_advisory_lock para que lo haga un solo worker. Ese hilo solo crea
+las particiones que faltan (CREATE TABLE ... PARTITION OF bloquea la tabla
+madre) y con lock_timeout, para no dejar a los INSERT esperando detrás.
+
+Variables:
+- HISTORIAL_RETENCION_MESES: meses calientes a conservar (0 = sin retención).
+- HISTORIAL_ARCHIVO_DIR: si está, las particiones frías se vuelcan a
+  archivos .jsonl.gz; si no, a la tabla historial_clinico_archivo.
+- HISTORIAL_PARTICIONES_ADELANTE: meses futuros a crear por adelantado (2).
+- HISTORIAL_LOCK_TIMEOUT: espera máxima por el lock de la tabla al convertir,
+  crear o soltar particiones ("5s"); si no se consigue, se aborta y se
+  reintenta después.
+
+Si el mantenimiento se atrasa, las filas de meses sin partición caen en la
+DEFAULT. Al crear la partición del mes, fn_crear_particion_historial
+(migración 9) las mueve; las que siguen en la DEFAULT se informan en
+estado_particiones() (filas_en_default).
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+
+from psycopg2 import sql
+
+from core.db.conexion import conexion_del_pool
+from core.db.migraciones import SQL_TRIGGER_ESTADISTICA, SQL_TRIGGER_PERFIL, INDICES_HISTORIAL
+
+logger = logging.getLogger(__name__)
+
+TABLA = "historial_clinico_usuario"
+RETENCION_MESES = int(os.getenv("HISTORIAL_RETENCION_MESES", "0"))
+ARCHIVO_DIR = os.getenv("HISTORIAL_ARCHIVO_DIR") or None
+MESES_ADELANTE = int(os.getenv("HISTORIAL_PARTICIONES_ADELANTE", "2"))
+INTERVALO_MANTENIMIENTO = float(os.getenv("HISTORIAL_MANTENIMIENTO_SEG", str(24 * 3600)))
+LOCK_TIMEOUT = os.getenv("HISTORIAL_LOCK_TIMEOUT", "5s")
+_CLAVE_LOCK = 73_210_002   # distinta de la de migraciones
+
+_PATRON_PARTICION = re.compile(rf"^{TABLA}_(\d{{4}})_(\d{{2}})$")
+
+# Ventana por defecto de las consultas de vocabulario global (0 = todo el historial)
+VENTANA_VOCABULARIO_DIAS = int(os.getenv("HISTORIAL_VENTANA_VOCABULARIO_DIAS", "0"))
+
+_estado: dict = {
+    "particionada": None, "ultimo_mantenimiento": None, "archivadas": 0, "filas_en_default": None, "error": None,
+}
+_detener = threading.Event()
+_hilo: threading.Thread | None = None
+
+
+def _sumar_meses(d: date, n: int) -> date:
+    total = d.year * 12 + (d.month - 1) + n
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _mes_actual() -> date:
+    hoy = date.today()
+    return date(hoy.year, hoy.month, 1)
+
+
+def fecha_desde(dias: int | None) -> datetime | None:
+    """
+    Cota inferior de `fecha` para una ventana de `dias` (None/0 = sin ventana).
+    Las consultas que filtran `fecha >= cota` solo recorren las particiones del
+    rango; con una tabla sin particionar usan idx_hist_clinico_fecha.
+    """
+    if not dias or dias <= 0:
+        return None
+    return datetime.now() - timedelta(days=dias)
+
+
+def esta_particionada(cur) -> bool:
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (f"public.{TABLA}",))
+    fila = cur.fetchone()
+    return bool(fila) and fila[0] == "p"
+
+
+def listar_particiones(cur) -> list[tuple[str, date | None]]:
+    """[(nombre, mes)] de las particiones; mes=None para la DEFAULT u otras sin el patrón."""
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname;
+        """,
+        (f"public.{TABLA}",),
+    )
+    res = []
+    for (nombre,) in cur.fetchall():
+        m = _PATRON_PARTICION.match(nombre)
+        res.append((nombre, date(int(m.group(1)), int(m.group(2)), 1) if m else None))
+    return res
+
+
+def asegurar_particiones(cur, meses_adelante: int = MESES_ADELANTE) -> list[str]:
+    """
+    Crea (si faltan) las particiones del mes actual y los `meses_adelante`
+    siguientes. Solo llama a la función para los meses faltantes: cada
+    creación bloquea la tabla madre (acotado por LOCK_TIMEOUT).
+    """
+    creadas = []
+    existentes = {m for _, m in listar_particiones(cur) if m is not None}
+    faltantes = [m for m in (_sumar_meses(_mes_actual(), i) for i in range(meses_adelante + 1)) if m not in existentes]
+    if not faltantes:
+        return creadas
+    cur.execute("SET LOCAL lock_timeout = %s;", (LOCK_TIMEOUT,))
+    for mes in faltantes:
+        cur.execute("SELECT fn_crear_particion_historial(%s);", (mes,))
+        nombre = cur.fetchone()[0]
+        if nombre:
+            creadas.append(nombre)
+    return creadas
+
+
+def _filas_en_default(cur) -> int:
+    """Filas en la partición DEFAULT (0 si no existe). Debería ser 0: todo mes tiene su partición."""
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (f"public.{TABLA}_default",))
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute(f"SELECT COUNT(*) FROM {TABLA}_default;")
+    return int(cur.fetchone()[0])
+
+
+# ------------------------------------------------------------------ conversión
+def convertir_a_particionada(conservar_original: bool = False) -> dict:
+    """
+    Reemplaza historial_clinico_usuario por una tabla particionada por mes con
+    los mismos datos, índices y triggers. Una sola transacción con ACCESS
+    EXCLUSIVE: nadie lee ni escribe la tabla mientras dura la copia.
+
+    Comando de mantenimiento de una sola vez (CLI `convertir`). Antes de pedir
+    el lock exclusivo verifica, solo en el catálogo, que no esté hecha y toma
+    el advisory lock de particiones (un solo proceso).
+    """
+    legacy = f"{TABLA}_legacy"
+    with conexion_del_pool() as conn:
+        with conn.cursor() as cur:
+            if esta_particionada(cur):
+                conn.rollback()
+                return {"convertida": False, "motivo": "ya estaba particionada"}
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (_CLAVE_LOCK,))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                return {"convertida": False, "motivo": "otro proceso tiene el lock de particiones"}
+        conn.commit()
+        try:
+            with conn.cursor() as cur:
+                # Con una transacción larga sobre la tabla, mejor fallar que encolar a todos detrás del lock
+                cur.execute("SET LOCAL lock_timeout = %s;", (LOCK_TIMEOUT,))
+                cur.execute(f"LOCK TABLE {TABLA} IN ACCESS EXCLUSIVE MODE;")
+                if esta_particionada(cur):
+                    conn.rollback()
+                    return {"convertida": False, "motivo": "ya estaba particionada"}
+
+                t0 = time.perf_counter()
+                cur.execute(f"ALTER TABLE {TABLA} RENAME TO {legacy};")
+                # Los nombres de índices son por esquema: liberarlos para la tabla nueva
+                cur.execute(
+                    "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE i.indrelid = to_regclass(%s);",
+                    (f"public.{legacy}",),
+                )
+                for (indice,) in cur.fetchall():
+                    cur.execute(sql.SQL("ALTER INDEX {} RENAME TO {};").format(
+                        sql.Identifier(indice), sql.Identifier(f"{indice[:55]}_legacy"),
+                    ))
+
+                # La clave de partición no admite NULL fuera de la DEFAULT: normalizamos antes de copiar
+                cur.execute(f"UPDATE {legacy} SET fecha = NOW() WHERE fecha IS NULL;")
+                cur.execute(f"""
+                    CREATE TABLE {TABLA} (LIKE {legacy} INCLUDING DEFAULTS)
+                    PARTITION BY RANGE (fecha);
+                """)
+                cur.execute(f"ALTER TABLE {TABLA} ALTER COLUMN fecha SET NOT NULL;")
+                cur.execute(f"ALTER TABLE {TABLA} ADD PRIMARY KEY (id, fecha);")
+                cur.execute(f"CREATE TABLE {TABLA}_default PARTITION OF {TABLA} DEFAULT;")
+
+                cur.execute(f"SELECT MIN(fecha) FROM {legacy};")
+                minima = cur.fetchone()[0]
+                desde = date(minima.year, minima.month, 1) if minima else _mes_actual()
+                mes = desde
+                hasta = _sumar_meses(_mes_actual(), MESES_ADELANTE)
+                while mes <= hasta:
+                    cur.execute("SELECT fn_crear_particion_historial(%s);", (mes,))
+                    mes = _sumar_meses(mes, 1)
+
+                # Copia ANTES de crear los triggers: los rollups ya tienen estas filas contadas
+                # (o las cuenta el relleno pendiente, por id: los ids se conservan)
+                cur.execute(f"INSERT INTO {TABLA} SELECT * FROM {legacy};")
+                copiadas = cur.rowcount
+
+                # La secuencia del SERIAL pasa a la tabla nueva (si no, el DROP se la lleva)
+                cur.execute("SELECT pg_get_serial_sequence(%s, 'id');", (legacy,))
+                secuencia = cur.fetchone()[0]
+                if secuencia:
+                    cur.execute(f"ALTER SEQUENCE {secuencia} OWNED BY {TABLA}.id;")
+
+                if not conservar_original:
+                    cur.execute(f"DROP TABLE {legacy};")
+
+                cur.execute(f"CREATE INDEX IF NOT EXISTS idx_hist_clinico_fecha ON {TABLA} (fecha);")
+                for sentencia in INDICES_HISTORIAL:
+                    cur.execute(sentencia)
+                cur.execute(SQL_TRIGGER_ESTADISTICA)
+                cur.execute(SQL_TRIGGER_PERFIL)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (_CLAVE_LOCK,))
+            conn.commit()
+
+    with conexion_del_pool() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"ANALYZE {TABLA};")
+        finally:
+            conn.autocommit = False
+
+    resultado = {
+        "convertida": True,
+        "filas": copiadas,
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "original": legacy if conservar_original else None,
+        "segundos": round(time.perf_counter() - t0, 1),
+    }
+    _estado["particionada"] = True
+    print(f"🗂️ {TABLA} particionada por mes: {resultado}")
+    return resultado
+
+
+# ------------------------------------------------------------------ archivo / retención
+def _archivar_en_tabla(cur, nombre: str, mes: date) -> int:
+    cur.execute(sql.SQL("""
+        INSERT INTO historial_clinico_archivo AS a (mes, user_id, filas, datos)
+        SELECT %s, h.user_id, COUNT(*), jsonb_agg(to_jsonb(h) ORDER BY h.fecha, h.id)
+        FROM {} h
+        GROUP BY h.user_id
+        ON CONFLICT (mes, user_id) DO UPDATE
+        SET filas = a.filas + EXCLUDED.filas,
+            datos = a.datos || EXCLUDED.datos,
+            archivado_en = NOW();
+    """).format(sql.Identifier(nombre)), (mes,))
+    return cur.rowcount
+
+
+def _archivar_en_archivo(conn, nombre: str, directorio: str) -> int:
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"{nombre}.jsonl.gz")
+    temporal = ruta + ".tmp"
+    filas = 0
+    # Cursor con nombre: la partición se lee en tandas, sin traerla entera a memoria
+    with conn.cursor(name=f"archivo_{nombre}") as cur, gzip.open(temporal, "wt", encoding="utf-8") as f:
+        cur.itersize = 2000
+        cur.execute(sql.SQL("SELECT to_jsonb(h) FROM {} h ORDER BY h.fecha, h.id;").format(sql.Identifier(nombre)))
+        for (fila,) in cur:
+            f.write(json.dumps(fila, ensure_ascii=False, default=str) + "\n")
+            filas += 1
+    os.replace(temporal, ruta)
+    return filas
+
+
+def archivar_particion(nombre: str, mes: date, directorio: str | None = ARCHIVO_DIR) -> dict:
+    """Vuelca la partición (a archivo .jsonl.gz o a historial_clinico_archivo) y la suelta."""
+    with conexion_del_pool() as conn:
+        try:
+            if directorio:
+                filas = _archivar_en_archivo(conn, nombre, directorio)
+                destino = os.path.join(directorio, f"{nombre}.jsonl.gz")
+            else:
+                with conn.cursor() as cur:
+                    filas = _archivar_en_tabla(cur, nombre, mes)
+                destino = "historial_clinico_archivo"
+            with conn.cursor() as cur:
+                # DETACH toma ACCESS EXCLUSIVE sobre la tabla madre: sin esperar detrás de una consulta larga
+                cur.execute("SET LOCAL lock_timeout = %s;", (LOCK_TIMEOUT,))
+                cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {};").format(
+                    sql.Identifier(TABLA), sql.Identifier(nombre),
+                ))
+                cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(nombre)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    _estado["archivadas"] += 1
+    logger.info("📦 Partición %s archivada en %s (%s filas/grupos)", nombre, destino, filas)
+    return {"particion": nombre, "destino": destino, "filas": filas}
+
+
+def aplicar_retencion(retencion_meses: int = RETENCION_MESES, directorio: str | None = ARCHIVO_DIR) -> list[dict]:
+    """Archiva las particiones mensuales anteriores a los últimos `retencion_meses` meses."""
+    if retencion_meses <= 0:
+        return []
+    corte = _sumar_meses(_mes_actual(), -retencion_meses)
+    with conexion_del_pool() as conn, conn.cursor() as cur:
+        frias = [(n, m) for n, m in listar_particiones(cur) if m is not None and m < corte]
+        conn.rollback()
+    return [archivar_particion(nombre, mes, directorio) for nombre, mes in frias]
+
+
+def mantener_particiones(retencion_meses: int = RETENCION_MESES, directorio: str | None = ARCHIVO_DIR) -> dict:
+    """Particiones futuras + retención. Un solo worker a la vez (pg_try_advisory_lock)."""
+    resultado = {"particionada": False, "creadas": [], "archivadas": []}
+    with conexion_del_pool() as conn:
+        with conn.cursor() as cur:
+            particionada = esta_particionada(cur)
+            _estado["particionada"] = particionada
+            if not particionada:
+                conn.rollback()
+                return resultado
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (_CLAVE_LOCK,))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                resultado["particionada"] = True
+                resultado["omitido"] = "otro proceso está manteniendo las particiones"
+                return resultado
+        try:
+            with conn.cursor() as cur:
+                resultado["particionada"] = True
+                resultado["creadas"] = asegurar_particiones(cur)
+                for aviso in conn.notices:
+                    logger.warning("🗂️ %s", aviso.strip())
+                del conn.notices[:]
+                resultado["filas_en_default"] = _filas_en_default(cur)
+            conn.commit()
+            _estado["filas_en_default"] = resultado["filas_en_default"]
+            if resultado["filas_en_default"]:
+                logger.warning(
+                    "🗂️ %s filas en %s_default (meses sin partición): revisar con `estado`",
+                    resultado["filas_en_default"], TABLA,
+                )
+            resultado["archivadas"] = aplicar_retencion(retencion_meses, directorio)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (_CLAVE_LOCK,))
+            conn.commit()
+    _estado["ultimo_mantenimiento"] = datetime.now().isoformat(timespec="seconds")
+    return resultado
+
+
+# ------------------------------------------------------------------ hilo de fondo
+def _bucle_mantenimiento() -> None:
+    while not _detener.is_set():
+        try:
+            mantener_particiones()
+            _estado["error"] = None
+        except Exception as e:
+            _estado["error"] = str(e)
+            logger.exception("Mantenimiento de particiones falló")
+        _detener.wait(INTERVALO_MANTENIMIENTO)
+
+
+def iniciar_mantenimiento_particiones() -> None:
+    """Arranca el hilo de mantenimiento (no-op si ya corre o si el intervalo es 0)."""
+    global _hilo
+    if INTERVALO_MANTENIMIENTO <= 0 or (_hilo is not None and _hilo.is_alive()):
+        return
+    _detener.clear()
+    _hilo = threading.Thread(target=_bucle_mantenimiento, name="mantenimiento-particiones", daemon=True)
+    _hilo.start()
+
+
+def detener_mantenimiento_particiones() -> None:
+    _detener.set()
+
+
+def estado_particiones() -> dict:
+    return {**_estado, "retencion_meses": RETENCION_MESES, "destino_archivo": ARCHIVO_DIR or "tabla"}
+
+
+# ------------------------------------------------------------------ CLI
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Particionado mensual de historial_clinico_usuario.")
+    sub = parser.add_subparsers(dest="accion", required=True)
+    sub.add_parser("estado", help="muestra si la tabla está particionada y sus particiones")
+    convertir = sub.add_parser("convertir", help="convierte la tabla a particionada (lock exclusivo)")
+    convertir.add_argument("--conservar-original", action="store_true", help="deja la tabla vieja como _legacy")
+    mantener = sub.add_parser("mantener", help="crea particiones futuras y aplica la retención")
+    mantener.add_argument("--retencion-meses", type=int, default=RETENCION_MESES)
+    mantener.add_argument("--directorio", default=ARCHIVO_DIR, help="archivar a .jsonl.gz en vez de a la tabla")
+    args = parser.parse_args(argv)
+
+    if args.accion == "estado":
+        with conexion_del_pool() as conn, conn.cursor() as cur:
+            particionada = esta_particionada(cur)
+            particiones = listar_particiones(cur) if particionada else []
+            en_default = _filas_en_default(cur) if particionada else 0
+            conn.rollback()
+        print(f"🗂️ {TABLA}: {'particionada' if particionada else 'sin particionar'}")
+        for nombre, mes in particiones:
+            print(f"   - {nombre} ({mes.isoformat() if mes else 'default'})")
+        if en_default:
+            print(f"⚠️ {en_default} filas en {TABLA}_default: se mueven al crear la partición de su mes")
+    elif args.accion == "convertir":
+        resultado = convertir_a_particionada(conservar_original=args.conservar_original)
+        if not resultado["convertida"]:
+            print(f"🗂️ {TABLA} sin convertir: {resultado['motivo']}")
+    else:
+        print(json.dumps(mantener_particiones(args.retencion_meses, args.directorio), ensure_ascii=False, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+# core/db/perfil_clinico.py
+"""
+Perfil clínico por usuario, cacheado durante el turno (write-through).
+
+En un mismo turno el historial del usuario se leía varias veces:
+obtener_historial_usuario (x2 en procesar_clinico), obtener_emociones_ya_registradas
+(ruta + obtener_cuadro_por_emociones), obtener_ultimo_registro_usuario,
+obtener_ultima_interaccion_emocional y obtener_ultimo_historial_emocional
+(dos consultas, una sin límite). Ahora:
+
+- La PRIMERA consulta de un usuario carga su historial completo en UNA
+  lectura y arma el PerfilClinico (emociones acumuladas, últimas filas,
+  última fila emocional, último cuadro, conteos).
+- Las funciones de core.db.consulta / funciones_asistente responden desde
+  el perfil.
+- El cache vive lo que el turno (`async with turno_perfil_clinico():` en
+  /asistente): con el almacén de sesiones compartido, el turno siguiente
+  puede caer en otro worker, así que cada turno relee el perfil UNA vez.
+  Fuera de un turno no se cachea.
+- registrar_novedad_openai y registrar_interaccion_clinica actualizan el
+  perfil del turno en el momento (write-through).
+- Las filas que registrar_novedad_openai deja en la cola de escritura quedan
+  como pendientes del proceso hasta que la cola avisa que salieron
+  (al_escribir); la carga las suma si la lectura todavía no las trae, sea
+  del turno en curso o del anterior.
+
+La carga no recorre el historial: lee la fila del rollup
+perfil_emocional_usuario (+ conteos por emoción), ambos mantenidos por
+trigger (migración 5), y las últimas MAX_RECIENTES filas con LIMIT. Si el
+rollup todavía no existe (migraciones desactivadas) o su relleno no terminó
+(core.db.rollups), se usa la lectura completa de antes.
+"""
+import time
+import logging
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from collections import Counter
+
+from psycopg2 import errors
+from psycopg2.extras import RealDictCursor
+
+from core.db.conexion import conexion_de_lectura, aplicar_plazo
+from core.db.cola_escritura import cola_escritura
+from core.db.sentencias import registrar_sentencia, ejecutar_preparada
+from core.db.rollups import rollup_pendiente
+
+logger = logging.getLogger(__name__)
+
+MAX_RECIENTES = 200        # filas no eliminadas que se guardan (obtener_historial_usuario usa limite=200)
+
+_SQL_HISTORIAL_COMPLETO = registrar_sentencia("hcu_perfil_usuario", """
+    SELECT
+        id,
+        user_id,
+        fecha,
+        emociones,
+        nuevas_emociones_detectadas,
+        cuadro_clinico_probable,
+        interaccion_id,
+        COALESCE(eliminado, false) AS eliminado
+    FROM public.historial_clinico_usuario
+    WHERE user_id = %s
+    ORDER BY fecha DESC, id DESC
+""")
+
+_SQL_RESUMEN = registrar_sentencia("hcu_perfil_resumen", """
+    SELECT
+        p.malestares,
+        p.registradas,
+        p.ultima_fecha,
+        p.ultimas_emociones,
+        p.ultimo_cuadro,
+        p.registros,
+        COALESCE((
+            SELECT json_object_agg(d.emocion, d.c)
+            FROM public.perfil_emocional_usuario_emocion d
+            WHERE d.user_id = p.user_id AND d.c > 0
+        ), '{}'::json) AS conteos
+    FROM public.perfil_emocional_usuario p
+    WHERE p.user_id = %s
+""")
+
+_SQL_RECIENTES = registrar_sentencia("hcu_perfil_recientes", """
+    SELECT
+        id,
+        user_id,
+        fecha,
+        emociones,
+        nuevas_emociones_detectadas,
+        cuadro_clinico_probable,
+        interaccion_id
+    FROM public.historial_clinico_usuario
+    WHERE user_id = %s
+      AND eliminado = false
+    ORDER BY fecha DESC, id DESC
+    LIMIT %s
+""")
+
+_COLUMNAS_FILA = (
+    "id", "user_id", "fecha", "emociones", "nuevas_emociones_detectadas",
+    "cuadro_clinico_probable", "interaccion_id",
+)
+
+
+def _norm(x) -> str:
+    return (x or "").strip().lower() if isinstance(x, str) else ""
+
+
+def _es_emocional(fila: dict) -> bool:
+    # Mismo criterio que la columna es_emocional: la fila trae al menos una emoción
+    return bool(fila.get("emociones") or fila.get("nuevas_emociones_detectadas"))
+
+
+class PerfilClinico:
+    """Resumen del historial clínico de un usuario (más reciente primero)."""
+
+    __slots__ = (
+        "user_id", "recientes", "emociones_registradas", "malestares_acumulados",
+        "ultimo_cualquiera", "ultima_emocional", "ultimo_cuadro",
+        "conteo_emociones", "registros", "cargado_en",
+    )
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.recientes: list[dict] = []             # no eliminadas, desc, ≤ MAX_RECIENTES
+        self.emociones_registradas: set[str] = set()  # emociones ∪ nuevas (no eliminadas), normalizadas
+        self.malestares_acumulados: list = []       # todas las emociones en orden cronológico, sin duplicados
+        self.ultimo_cualquiera: dict | None = None  # última fila (incluye eliminadas)
+        self.ultima_emocional: dict | None = None   # última fila no eliminada con emociones
+        self.ultimo_cuadro: str | None = None
+        self.conteo_emociones: Counter = Counter()
+        self.registros = 0                          # filas no eliminadas
+        self.cargado_en = time.monotonic()
+
+    @classmethod
+    def desde_filas(cls, user_id: str, filas_desc: list[dict]) -> "PerfilClinico":
+        perfil = cls(user_id)
+        malestares_asc = []
+        for r in filas_desc:
+            fila = {k: r.get(k) for k in _COLUMNAS_FILA}
+            if perfil.ultimo_cualquiera is None:
+                perfil.ultimo_cualquiera = fila
+            malestares_asc.append(fila.get("emociones") or [])
+            if r.get("eliminado"):
+                continue
+            perfil._contar(fila)
+            if len(perfil.recientes) < MAX_RECIENTES:
+                perfil.recientes.append(fila)
+            if perfil.ultima_emocional is None and _es_emocional(fila):
+                perfil.ultima_emocional = fila
+            if perfil.ultimo_cuadro is None and _norm(fila.get("cuadro_clinico_probable")):
+                perfil.ultimo_cuadro = _norm(fila.get("cuadro_clinico_probable"))
+
+        acumulados = []
+        for emociones in reversed(malestares_asc):
+            acumulados.extend(emociones)
+        perfil.malestares_acumulados = list(dict.fromkeys(acumulados))
+        return perfil
+
+    @classmethod
+    def desde_resumen(cls, user_id: str, resumen: dict | None, recientes: list[dict]) -> "PerfilClinico":
+        """Arma el perfil desde la fila del rollup + las últimas filas (sin recorrer el historial)."""
+        perfil = cls(user_id)
+        perfil.recientes = [{k: r.get(k) for k in _COLUMNAS_FILA} for r in recientes[:MAX_RECIENTES]]
+        perfil.ultima_emocional = next((f for f in perfil.recientes if _es_emocional(f)), None)
+        if not resumen:
+            return perfil
+        perfil.malestares_acumulados = list(resumen.get("malestares") or [])
+        perfil.emociones_registradas = set(resumen.get("registradas") or [])
+        perfil.ultimo_cuadro = _norm(resumen.get("ultimo_cuadro")) or None
+        perfil.conteo_emociones = Counter({e: int(c) for e, c in (resumen.get("conteos") or {}).items()})
+        perfil.registros = int(resumen.get("registros") or 0)
+        if resumen.get("ultima_fecha") is not None:
+            perfil.ultimo_cualquiera = {
+                "user_id": user_id,
+                "fecha": resumen.get("ultima_fecha"),
+                "emociones": resumen.get("ultimas_emociones"),
+            }
+        return perfil
+
+    @property
+    def emocion_predominante(self) -> str | None:
+        """Emoción más frecuente en el historial no eliminado."""
+        top = self.conteo_emociones.most_common(1)
+        return top[0][0] if top else None
+
+    def _contar(self, fila: dict) -> None:
+        self.registros += 1
+        for e in (fila.get("emociones") or []) + (fila.get("nuevas_emociones_detectadas") or []):
+            e = _norm(e)
+            if e:
+                self.emociones_registradas.add(e)
+        # Conteo sobre el texto tal cual (mismo criterio que perfil_emocional_usuario_emocion)
+        for e in fila.get("emociones") or []:
+            if isinstance(e, str) and e:
+                self.conteo_emociones[e] += 1
+
+    def aplicar(self, fila: dict) -> None:
+        """Incorpora una fila recién escrita (queda como la más reciente)."""
+        fila = {k: fila.get(k) for k in _COLUMNAS_FILA}
+        self.ultimo_cualquiera = fila
+        for e in fila.get("emociones") or []:
+            if e not in self.malestares_acumulados:
+                self.malestares_acumulados.append(e)
+        self._contar(fila)
+        self.recientes.insert(0, fila)
+        del self.recientes[MAX_RECIENTES:]
+        if _es_emocional(fila):
+            self.ultima_emocional = fila
+        if _norm(fila.get("cuadro_clinico_probable")):
+            self.ultimo_cuadro = _norm(fila.get("cuadro_clinico_probable"))
+
+
+# user_id -> perfil, para el turno en curso (None fuera de un turno)
+_perfiles_del_turno: ContextVar[dict | None] = ContextVar("perfiles_del_turno", default=None)
+
+
+class _RegistroPerfiles:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user_id -> {id(fila encolada): (fila encolada, fila del perfil)}
+        self._pendientes: dict[str, dict[int, tuple]] = {}
+        self.aciertos = 0
+        self.cargas = 0
+        self.errores = 0
+        self.actualizaciones = 0
+        self.pendientes_sumadas = 0
+
+    def _cargar(self, user_id: str) -> PerfilClinico | None:
+        with self._lock:
+            pendientes = [fila for _, fila in self._pendientes.get(user_id, {}).values()]
+        try:
+            relleno_pendiente = rollup_pendiente("perfil_emocional_usuario")
+            with conexion_de_lectura() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+                perfil = None
+                if not relleno_pendiente:
+                    try:
+                        aplicar_plazo(cur)
+                        ejecutar_preparada(cur, _SQL_RESUMEN, (user_id,), preambulo=aplicar_plazo)
+                        resumen = cur.fetchone()
+                        ejecutar_preparada(cur, _SQL_RECIENTES, (user_id, MAX_RECIENTES), preambulo=aplicar_plazo)
+                        recientes = cur.fetchall()
+                        conn.rollback()
+                        perfil = PerfilClinico.desde_resumen(user_id, resumen, recientes)
+                    except errors.UndefinedTable:
+                        conn.rollback()
+                if perfil is None:
+                    # Sin migración 5 o con el relleno en curso: lectura completa del historial
+                    aplicar_plazo(cur)
+                    ejecutar_preparada(cur, _SQL_HISTORIAL_COMPLETO, (user_id,), preambulo=aplicar_plazo)
+                    filas = cur.fetchall()
+                    conn.rollback()
+                    perfil = PerfilClinico.desde_filas(user_id, filas)
+        except Exception:
+            logger.exception("No se pudo cargar el perfil clínico de %s", user_id)
+            return None
+
+        # Filas todavía en la cola de escritura (la lectura no las trae si no se persistieron)
+        leidas = {f.get("fecha") for f in perfil.recientes}
+        for fila in sorted(pendientes, key=lambda f: f["fecha"]):
+            if fila["fecha"] not in leidas:
+                perfil.aplicar(fila)
+                self.pendientes_sumadas += 1
+        return perfil
+
+    def obtener(self, user_id: str) -> PerfilClinico:
+        """Perfil del usuario (una carga por turno). Ante error de DB, perfil vacío NO cacheado."""
+        del_turno = _perfiles_del_turno.get()
+        if del_turno is not None:
+            perfil = del_turno.get(user_id)
+            if perfil is not None:
+                with self._lock:
+                    self.aciertos += 1
+                return perfil
+
+        perfil = self._cargar(user_id)
+        with self._lock:
+            if perfil is None:
+                self.errores += 1
+                return PerfilClinico(user_id)
+            self.cargas += 1
+        if del_turno is None:
+            return perfil
+        # Si otro nodo del turno lo cargó mientras tanto, gana el que ya está
+        return del_turno.setdefault(user_id, perfil)
+
+    def registrar_fila(self, user_id: str, fila: dict, pendiente: tuple | None = None) -> None:
+        """
+        Write-through al perfil del turno (si ya se cargó). `pendiente`: la fila
+        tal como se encoló en la cola de escritura; hasta que la cola la suelte,
+        las cargas la suman aunque la DB todavía no la tenga.
+        """
+        if not user_id:
+            return
+        fila = dict(fila)
+        if pendiente is not None:
+            with self._lock:
+                self._pendientes.setdefault(user_id, {})[id(pendiente)] = (pendiente, fila)
+        del_turno = _perfiles_del_turno.get()
+        perfil = del_turno.get(user_id) if del_turno is not None else None
+        if perfil is not None:
+            perfil.aplicar(fila)
+            with self._lock:
+                self.actualizaciones += 1
+
+    def soltar_pendientes(self, tipo: str, filas: list) -> None:
+        """Callback de la cola de escritura: esas filas ya no están pendientes."""
+        if tipo != "historial_clinico":
+            return
+        with self._lock:
+            for fila in filas:
+                del_usuario = self._pendientes.get(fila[0])
+                if del_usuario is not None:
+                    del_usuario.pop(id(fila), None)
+                    if not del_usuario:
+                        del self._pendientes[fila[0]]
+
+    @asynccontextmanager
+    async def turno(self):
+        token = _perfiles_del_turno.set({})
+        try:
+            yield
+        finally:
+            _perfiles_del_turno.reset(token)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self.aciertos + self.cargas
+            return {
+                "aciertos": self.aciertos,
+                "cargas": self.cargas,
+                "errores": self.errores,
+                "actualizaciones": self.actualizaciones,
+                "pendientes": sum(len(v) for v in self._pendientes.values()),
+                "pendientes_sumadas": self.pendientes_sumadas,
+                "tasa_acierto": round(self.aciertos / total, 3) if total else 0.0,
+            }
+
+
+perfiles_clinicos = _RegistroPerfiles()
+cola_escritura.al_escribir.append(perfiles_clinicos.soltar_pendientes)
+
+
+def obtener_perfil_clinico(user_id: str) -> PerfilClinico:
+    return perfiles_clinicos.obtener(user_id)
+
+
+def registrar_en_perfil(user_id: str, fila: dict, pendiente: tuple | None = None) -> None:
+    perfiles_clinicos.registrar_fila(user_id, fila, pendiente)
+
+
+def turno_perfil_clinico():
+    """`async with turno_perfil_clinico():` — el perfil se carga una vez y vive lo que el turno."""
+    return perfiles_clinicos.turno()
+
+
+def estadisticas_perfiles_clinicos() -> dict:
+    return perfiles_clinicos.estadisticas()
@@ -1,8 +1,26 @@
+import logging
 from datetime import datetime
 from typing import List, Optional
-import psycopg2
-from core.db.conexion import ejecutar_consulta   # tu helper central
-from core.constantes import DATABASE_URL         # si tu helper no usa pool global
+from core.db.conexion import ejecutar_consulta, conexion_del_pool   # helper central + pool global
+from core.db.cola_escritura import encolar_escritura, encolar_escritura_async   # write-behind (auditoría/historial)
+from core.db.sentencias import registrar_sentencia, ejecutar_sentencia, ejecutar_preparada
+from core.db.perfil_clinico import registrar_en_perfil   # write-through del perfil clínico cacheado
+
+logger = logging.getLogger(__name__)
+
+# Sentencias fijas del camino de escritura síncrono (preparadas una vez por conexión)
+_SQL_EMOCION_CLINICA = registrar_sentencia("reg_emocion_clinica", """
+    INSERT INTO historial_clinico_usuario (user_id, emociones, origen, fecha)
+    VALUES (%s, %s, %s, %s)
+""")
+_SQL_INTERACCION = registrar_sentencia("reg_interaccion", """
+    INSERT INTO interacciones (user_id, consulta, mensaje_original)
+    VALUES (%s, %s, %s) RETURNING id
+""")
+_SQL_SIMILITUD_FAQ = registrar_sentencia("reg_similitud_faq", """
+    INSERT INTO faq_similitud_logs (user_id, consulta, pregunta_faq, similitud)
+    VALUES (%s, %s, %s, %s)
+""")
 
 def registrar_emocion_clinica(user_id: str, emocion: str, origen: str = "detección"):
     """
@@ -11,10 +29,6 @@ def registrar_emocion_clinica(user_id: str, emocion: str, origen: str = "detecci
     """
 
     try:
-        consulta = """
-        INSERT INTO historial_clinico_usuario (user_id, emociones, origen, fecha)
-        VALUES (%s, %s, %s, %s)
-        """
         # Convertimos la emoción en lista para el campo text[]
         valores = (
             user_id,
@@ -23,17 +37,12 @@ def registrar_emocion_clinica(user_id: str, emocion: str, origen: str = "detecci
             datetime.now()
         )
 
-        ejecutar_consulta(consulta, valores)
-        print(f"🧠 Emoción clínica registrada: {emocion}")
+        if ejecutar_sentencia(_SQL_EMOCION_CLINICA, valores, commit=True):
+            registrar_en_perfil(user_id, {"user_id": user_id, "fecha": valores[3], "emociones": valores[1]})
+        logger.info("🧠 Emoción clínica registrada: %s", emocion)
 
     except Exception as e:
-        print(f"❌ Error al registrar emoción clínica: {e}")
-
-
-
-
-
-
+        logger.error("❌ Error al registrar emoción clínica: %s", e)
 
 
 # --- Shim de compatibilidad: bloquear escrituras legacy en historial clínico ---
@@ -76,7 +85,7 @@ def registrar_historial_clinico(*args, **kwargs):
 
         # Bloquear escrituras que no cumplen la directiva 100% OpenAI (clínico)
         if fuente != "openai" or origen in ORIGENES_NO_CLINICOS:
-            print(f"[shim] registrar_historial_clinico ignorado (fuente={fuente!r}, origen={origen!r})")
+            logger.debug("registrar_historial_clinico ignorado (fuente=%r, origen=%r)", fuente, origen)
             return None
 
         # Caso clínico válido: usar el registrador nuevo y unificado
@@ -90,16 +99,11 @@ def registrar_historial_clinico(*args, **kwargs):
         )
 
     except Exception as e:
-        # Nunca romper el flujo por compat — sólo loguear suave
-        print(f"[shim] registrar_historial_clinico falló en compatibilidad: {e}")
+        # Nunca romper el flujo por compat
+        logger.warning("registrar_historial_clinico falló en compatibilidad: %s", e)
         return None
 
 
-
-
-
-
-
 def registrar_emocion(user_id: str, emocion: str, *, interaccion_id: int | str | None = None):
     """
     En lugar de insertar en 'emociones_detectadas', agregamos un renglón en
@@ -121,199 +125,144 @@ def registrar_emocion(user_id: str, emocion: str, *, interaccion_id: int | str |
             eliminado=False,
         )
     except Exception as e:
-        print(f"[✖] Error al registrar_emocion en historial_clinico_usuario: {e}")
+        logger.error("Error al registrar_emocion en historial_clinico_usuario: %s", e)
         return False
 
 
-
 def registrar_interaccion(user_id: str, consulta: str, mensaje_original: str = None):
     try:
-        print("\n===== DEPURACIÓN - REGISTRO DE INTERACCIÓN =====")
-        print(f"Intentando registrar interacción: user_id={user_id}")
-        print(f"Consulta purificada: {consulta}")
-        print(f"Mensaje original: {mensaje_original}")
-
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns 
-            WHERE table_name = 'interacciones' AND column_name = 'mensaje_original';
-        """)
-        columna_existente = cursor.fetchone()
-
-        if not columna_existente:
-            print("⚠️ La columna 'mensaje_original' no existe. Creándola...")
-            cursor.execute("ALTER TABLE interacciones ADD COLUMN mensaje_original TEXT;")
-            conn.commit()
+        logger.debug("Registrando interacción: user_id=%s consulta=%r mensaje_original=%r", user_id, consulta, mensaje_original)
 
-        cursor.execute("""
-            INSERT INTO interacciones (user_id, consulta, mensaje_original) 
-            VALUES (%s, %s, %s) RETURNING id;
-        """, (user_id, consulta, mensaje_original))
+        # (la columna mensaje_original la garantiza la migración 2 de core.db.migraciones)
+        with conexion_del_pool() as conn, conn.cursor() as cursor:
+            ejecutar_preparada(cursor, _SQL_INTERACCION, (user_id, consulta, mensaje_original))
         
-        interaccion_id = cursor.fetchone()[0]
-        conn.commit()
-        conn.close()
+            interaccion_id = cursor.fetchone()[0]
+            conn.commit()
 
-        print(f"✅ Interacción registrada con éxito. ID asignado: {interaccion_id}\n")
+        logger.info("✅ Interacción registrada con éxito. ID asignado: %s", interaccion_id)
         return interaccion_id
 
     except Exception as e:
-        print(f"❌ Error al registrar interacción en la base de datos: {e}\n")
+        logger.error("❌ Error al registrar interacción en la base de datos: %s", e)
         return None
 
 
+def _filas_respuesta_openai(interaccion_id, respuesta, user_id=None, respuesta_original=None):
+    filas = [("respuesta_interaccion", (interaccion_id, respuesta))] if interaccion_id is not None else []
+    # 📝 Registro en auditoría si user_id y respuesta_original están disponibles
+    if user_id and respuesta_original:
+        filas.append(("auditoria_respuestas", _fila_auditoria_respuesta(
+            user_id, respuesta_original, respuesta,
+            "Respuesta generada y registrada automáticamente", interaccion_id,
+        )))
+    return filas
+
+
 def registrar_respuesta_openai(interaccion_id: int, respuesta: str, user_id: str = None, respuesta_original: str = None):
+    """Encola el UPDATE de la respuesta (y su auditoría); se persiste en lote en segundo plano."""
     try:
-        print("\n===== DEPURACIÓN - REGISTRO DE RESPUESTA OPENAI =====")
-        print(f"Intentando registrar respuesta para interacción ID={interaccion_id}")
+        for tipo, fila in _filas_respuesta_openai(interaccion_id, respuesta, user_id, respuesta_original):
+            encolar_escritura(tipo, fila)
+        logger.debug("Respuesta encolada para interacción ID=%s", interaccion_id)
 
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT column_name FROM information_schema.columns 
-            WHERE table_name = 'interacciones' AND column_name = 'respuesta';
-        """)
-        columna_existente = cursor.fetchone()
-
-        if not columna_existente:
-            print("⚠️ La columna 'respuesta' no existe en la tabla 'interacciones'. Creándola...")
-            cursor.execute("ALTER TABLE interacciones ADD COLUMN respuesta TEXT;")
-            conn.commit()
+    except Exception as e:
+        logger.error("❌ Error al registrar respuesta en la base de datos: %s", e)
 
-        cursor.execute("""
-            UPDATE interacciones 
-            SET respuesta = %s 
-            WHERE id = %s;
-        """, (respuesta, interaccion_id))
-        
-        conn.commit()
-        conn.close()
-        
-        print(f"✅ Respuesta registrada con éxito para interacción ID={interaccion_id}\n")
-
-        # 📝 Registro en auditoría si user_id y respuesta_original están disponibles
-        if user_id and respuesta_original:
-            registrar_auditoria_respuesta(
-                user_id=user_id,
-                interaccion_id=interaccion_id,
-                respuesta_original=respuesta_original,
-                respuesta_final=respuesta,
-                motivo_modificacion="Respuesta generada y registrada automáticamente"
-            )
 
+async def registrar_respuesta_openai_async(interaccion_id: int, respuesta: str, user_id: str = None, respuesta_original: str = None):
+    try:
+        for tipo, fila in _filas_respuesta_openai(interaccion_id, respuesta, user_id, respuesta_original):
+            await encolar_escritura_async(tipo, fila)
     except Exception as e:
-        print(f"❌ Error al registrar respuesta en la base de datos: {e}\n")
+        logger.error("❌ Error al registrar respuesta en la base de datos: %s", e)
+
+
+def _fila_auditoria_input(user_id, mensaje_original, mensaje_purificado, clasificacion=None):
+    return (user_id, (mensaje_original or "").strip(), (mensaje_purificado or "").strip(), clasificacion, datetime.now())
 
 
 def registrar_auditoria_input_original(user_id: str, mensaje_original: str, mensaje_purificado: str, clasificacion: str = None):
     try:
-        print("\n📋 Registrando input original y purificado en auditoría")
-        print(f"👤 user_id: {user_id}")
-        print(f"📝 Original: {mensaje_original}")
-        print(f"🧼 Purificado: {mensaje_purificado}")
-        print(f"🏷️ Clasificación: {clasificacion}")
-
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS auditoria_input_original (
-                id SERIAL PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                mensaje_original TEXT NOT NULL,
-                mensaje_purificado TEXT NOT NULL,
-                clasificacion TEXT,
-                fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-
-        cursor.execute("""
-            INSERT INTO auditoria_input_original (
-                user_id, mensaje_original, mensaje_purificado, clasificacion
-            ) VALUES (%s, %s, %s, %s);
-        """, (user_id, mensaje_original.strip(), mensaje_purificado.strip(), clasificacion))
-
-        conn.commit()
-        conn.close()
-        print("✅ Auditoría registrada exitosamente.\n")
+        logger.debug("Auditoría de input encolada (user_id=%s, clasificación=%s)", user_id, clasificacion)
+        encolar_escritura(
+            "auditoria_input_original",
+            _fila_auditoria_input(user_id, mensaje_original, mensaje_purificado, clasificacion),
+        )
 
     except Exception as e:
-        print(f"❌ Error al registrar auditoría del input original: {e}")
+        logger.error("❌ Error al registrar auditoría del input original: %s", e)
 
 
-def registrar_similitud_semantica(user_id: str, consulta: str, pregunta_faq: str, similitud: float):
+async def registrar_auditoria_input_original_async(user_id: str, mensaje_original: str, mensaje_purificado: str, clasificacion: str = None):
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
+        await encolar_escritura_async(
+            "auditoria_input_original",
+            _fila_auditoria_input(user_id, mensaje_original, mensaje_purificado, clasificacion),
+        )
+    except Exception as e:
+        logger.error("❌ Error al registrar auditoría del input original: %s", e)
 
-        cursor.execute("""
-            INSERT INTO faq_similitud_logs (user_id, consulta, pregunta_faq, similitud)
-            VALUES (%s, %s, %s, %s);
-        """, (user_id, consulta, pregunta_faq, similitud))
 
-        conn.commit()
-        conn.close()
-        print(f"🧠 Similitud registrada con éxito (Score: {similitud}) para FAQ: '{pregunta_faq}'\n")
+def registrar_similitud_semantica(user_id: str, consulta: str, pregunta_faq: str, similitud: float):
+    try:
+        with conexion_del_pool() as conn, conn.cursor() as cursor:
+            ejecutar_preparada(cursor, _SQL_SIMILITUD_FAQ, (user_id, consulta, pregunta_faq, similitud))
+
+            conn.commit()
+        logger.info("🧠 Similitud registrada (score %s) para FAQ: %r", similitud, pregunta_faq)
 
     except Exception as e:
-        print(f"❌ Error al registrar similitud semántica: {e}")
+        logger.error("❌ Error al registrar similitud semántica: %s", e)
 
 
 def registrar_log_similitud(user_id: str, consulta: str, pregunta_faq: str, similitud: float):
     registrar_similitud_semantica(user_id, consulta, pregunta_faq, similitud)
 
 
+def _fila_auditoria_respuesta(user_id, respuesta_original, respuesta_final, motivo_modificacion=None, interaccion_id=None):
+    return (
+        user_id, interaccion_id, (respuesta_original or "").strip(), (respuesta_final or "").strip(),
+        motivo_modificacion, datetime.now(),
+    )
+
+
 def registrar_auditoria_respuesta(user_id: str, respuesta_original: str, respuesta_final: str, motivo_modificacion: str = None, interaccion_id: int = None):
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS auditoria_respuestas (
-                id SERIAL PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                interaccion_id INTEGER,
-                respuesta_original TEXT NOT NULL,
-                respuesta_final TEXT NOT NULL,
-                motivo_modificacion TEXT,
-                fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-
-        cursor.execute("""
-            INSERT INTO auditoria_respuestas (
-                user_id, interaccion_id, respuesta_original, respuesta_final, motivo_modificacion
-            ) VALUES (%s, %s, %s, %s, %s);
-        """, (user_id, interaccion_id, respuesta_original.strip(), respuesta_final.strip(), motivo_modificacion))
-
-        conn.commit()
-        conn.close()
-        print("📑 Auditoría registrada en auditoria_respuestas.")
+        encolar_escritura(
+            "auditoria_respuestas",
+            _fila_auditoria_respuesta(user_id, respuesta_original, respuesta_final, motivo_modificacion, interaccion_id),
+        )
+        logger.debug("Auditoría de respuesta encolada (auditoria_respuestas)")
     except Exception as e:
-        print(f"❌ Error al registrar auditoría de respuesta: {e}")
+        logger.error("❌ Error al registrar auditoría de respuesta: %s", e)
 
 
-def registrar_inferencia(user_id: str, interaccion_id: int, tipo: str, valor: str):
+async def registrar_auditoria_respuesta_async(user_id: str, respuesta_original: str, respuesta_final: str, motivo_modificacion: str = None, interaccion_id: int = None):
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
+        await encolar_escritura_async(
+            "auditoria_respuestas",
+            _fila_auditoria_respuesta(user_id, respuesta_original, respuesta_final, motivo_modificacion, interaccion_id),
+        )
+    except Exception as e:
+        logger.error("❌ Error al registrar auditoría de respuesta: %s", e)
 
-        cursor.execute("""
-            INSERT INTO inferencias_cerebro_simulado (user_id, interaccion_id, tipo, valor)
-            VALUES (%s, %s, %s, %s);
-        """, (user_id, interaccion_id, tipo, valor))
 
-        conn.commit()
-        conn.close()
-        print(f"🧠 Inferencia registrada: [{tipo}] → {valor}")
+def registrar_inferencia(user_id: str, interaccion_id: int, tipo: str, valor: str):
+    try:
+        encolar_escritura("inferencias", (user_id, interaccion_id, tipo, valor))
+        logger.debug("Inferencia encolada: [%s] → %s", tipo, valor)
 
     except Exception as e:
-        print(f"❌ Error al registrar inferencia: {e}")
+        logger.error("❌ Error al registrar inferencia: %s", e)
 
 
+async def registrar_inferencia_async(user_id: str, interaccion_id: int, tipo: str, valor: str):
+    try:
+        await encolar_escritura_async("inferencias", (user_id, interaccion_id, tipo, valor))
+    except Exception as e:
+        logger.error("❌ Error al registrar inferencia: %s", e)
+
 
 def registrar_novedad_openai(
     user_id: str,
@@ -324,7 +273,8 @@ def registrar_novedad_openai(
     fuente: str = "openai"
 ) -> bool:
     """
-    Inserta un registro en public.historial_clinico_usuario con los campos provistos.
+    Inserta un registro en public.historial_clinico_usuario con los campos provistos
+    (vía la cola de escritura diferida; True = aceptado para persistir).
     - Normaliza: lower/strip para strings.
     - Deduplica: conserva orden de aparición.
     - Si `cuadro_clinico_probable` queda vacío tras normalizar, se guarda NULL.
@@ -342,29 +292,27 @@ def registrar_novedad_openai(
         nuevas_norm   = _norm_list(nuevas_emociones_detectadas)
         cuadro_norm   = (cuadro_clinico_probable or "").strip().lower() or None
 
-        consulta = """
-            INSERT INTO public.historial_clinico_usuario
-                (user_id, fecha, emociones, nuevas_emociones_detectadas, cuadro_clinico_probable,
-                 interaccion_id, fuente, eliminado)
-            VALUES (%s, NOW(), %s, %s, %s, %s, %s, false)
-        """
-        ejecutar_consulta(
-            consulta,
-            (
-                user_id,
-                emociones_norm,
-                nuevas_norm,
-                cuadro_norm,
-                interaccion_id,
-                fuente
-            ),
-            commit=True
-        )
+        fecha = datetime.now()
+        fila = (user_id, fecha, emociones_norm, nuevas_norm, cuadro_norm, interaccion_id, fuente)
+        # Pendiente antes de encolar: si el hilo de la cola la persiste enseguida, ya la encuentra
+        registrar_en_perfil(user_id, {
+            "user_id": user_id,
+            "fecha": fecha,
+            "emociones": emociones_norm,
+            "nuevas_emociones_detectadas": nuevas_norm,
+            "cuadro_clinico_probable": cuadro_norm,
+            "interaccion_id": interaccion_id,
+        }, pendiente=fila)
+        encolar_escritura("historial_clinico", fila)
         return True
     except Exception as e:
-        print(f"❌ Error registrar_novedad_openai: {e}")
+        logger.error("❌ Error registrar_novedad_openai: %s", e)
         return False
 
 
+# ===== Variantes async (para handlers FastAPI; no bloquean el event loop) =====
+from core.db.conexion_async import version_async  # noqa: E402
 
-
+registrar_interaccion_async = version_async(registrar_interaccion)
+registrar_historial_clinico_async = version_async(registrar_historial_clinico)
+registrar_emocion_async = version_async(registrar_emocion)
@@ -0,0 +1,248 @@
+# core/db/rollups.py
+"""
+Relleno de los rollups de historial_clinico_usuario, fuera del lock de la migración.
+
+Las migraciones 4 y 5 crean estadistica_emocion_cuadro y perfil_emocional_usuario
+vacíos: bajo un lock SHARE ROW EXCLUSIVE breve solo crean el trigger y anotan
+en relleno_rollup hasta qué id llega el historial previo. Desde ese commit cada
+escritura la cuenta el trigger; el historial previo lo cuenta este módulo, en
+transacciones cortas, con el worker ya sirviendo tráfico:
+
+- perfil_emocional_usuario: un usuario por transacción con
+  fn_recalcular_perfil_emocional, que recalcula desde cero y toma primero el
+  lock de la fila del rollup (el mismo que el trigger de INSERT). Un INSERT
+  concurrente del usuario entra en el recálculo o suma encima después.
+- estadistica_emocion_cuadro: lotes de ids (hecho_id, hecho_id + lote]. El
+  trigger ignora las filas que el relleno todavía no contó
+  (fn_relleno_pendiente) y espera al lote en curso: el lote las cuenta tal
+  como están, el trigger solo lo que cambie después.
+
+El avance queda en relleno_rollup: si el proceso se corta, la próxima corrida
+sigue donde quedó; al terminar se borra la fila. Mientras un relleno esté
+pendiente, los lectores (core.db.perfil_clinico y
+estadistica_global_emocion_a_cuadro) usan la lectura completa del historial,
+como antes de los rollups.
+
+Al arrancar lo corre un solo worker en un hilo de fondo (pg_try_advisory_lock).
+También a mano:
+
+    python -m core.db.rollups estado
+    python -m core.db.rollups rellenar [--lote 5000]
+
+Variables:
+- ROLLUP_RELLENO_LOTE: ids del historial por transacción en la estadística (5000).
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+from psycopg2 import errors
+
+from core.db.conexion import conexion_del_pool, conexion_de_lectura, aplicar_plazo
+
+logger = logging.getLogger(__name__)
+
+ESTADISTICA = "estadistica_emocion_cuadro"
+PERFIL = "perfil_emocional_usuario"
+
+LOTE_IDS = int(os.getenv("ROLLUP_RELLENO_LOTE", "5000"))
+TTL_PENDIENTES = 30.0      # seg. entre lecturas de relleno_rollup para los lectores
+_CLAVE_LOCK = 73_210_003   # distinta de la de migraciones y particiones
+
+_SQL_LOTE_ESTADISTICA = """
+    INSERT INTO estadistica_emocion_cuadro AS s (emocion, cuadro, c)
+    SELECT LOWER(e), LOWER(h.cuadro_clinico_probable), COUNT(*)
+    FROM historial_clinico_usuario h
+    CROSS JOIN LATERAL UNNEST(COALESCE(h.emociones, ARRAY[]::text[])) AS e
+    WHERE h.id > %s AND h.id <= %s
+      AND h.eliminado IS FALSE
+      AND COALESCE(h.cuadro_clinico_probable, '') <> ''
+      AND e IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (emocion, cuadro)
+    DO UPDATE SET c = s.c + EXCLUDED.c, actualizado_en = NOW();
+"""
+
+_lock = threading.Lock()
+_pendientes: set[str] = set()
+_leidos_en: float | None = None
+_estado: dict = {"estado": "sin_correr", "resultado": None, "error": None}
+_hilo: threading.Thread | None = None
+
+
+# ------------------------------------------------------------------ lectores
+def _leer_pendientes() -> set[str]:
+    with conexion_de_lectura() as conn, conn.cursor() as cur:
+        try:
+            aplicar_plazo(cur)
+            cur.execute("SELECT rollup FROM relleno_rollup;")
+            return {r[0] for r in cur.fetchall()}
+        except errors.UndefinedTable:
+            # Sin migración 4 tampoco hay rollups: los lectores ya usan la lectura completa
+            return set()
+        finally:
+            conn.rollback()
+
+
+def rollup_pendiente(rollup: str) -> bool:
+    """¿El rollup todavía no cuenta todo el historial? Se relee cada TTL_PENDIENTES."""
+    global _pendientes, _leidos_en
+    ahora = time.monotonic()
+    with _lock:
+        if _leidos_en is not None and ahora - _leidos_en < TTL_PENDIENTES:
+            return rollup in _pendientes
+    try:
+        pendientes = _leer_pendientes()
+    except Exception as e:
+        # Se queda con la última lectura; la próxima llamada vuelve a intentar
+        logger.warning("No se pudo leer relleno_rollup: %s", e)
+        with _lock:
+            return rollup in _pendientes
+    with _lock:
+        _pendientes, _leidos_en = pendientes, ahora
+    return rollup in pendientes
+
+
+# ------------------------------------------------------------------ relleno
+def _rellenar_estadistica(conn, lote: int) -> int:
+    """Cuenta el historial previo al trigger en lotes de ids. Devuelve los ids recorridos."""
+    recorridos = 0
+    while True:
+        with conn.cursor() as cur:
+            # El FOR UPDATE espera a los triggers que tocaron filas pendientes (FOR SHARE) y los
+            # que lleguen durante el lote esperan al commit: cada fila se cuenta de un solo lado
+            cur.execute("SELECT hecho_id, hasta_id FROM relleno_rollup WHERE rollup = %s FOR UPDATE;", (ESTADISTICA,))
+            fila = cur.fetchone()
+            if fila is None:
+                conn.rollback()
+                return recorridos
+            hecho, hasta = fila
+            if hecho >= hasta:
+                cur.execute("DELETE FROM relleno_rollup WHERE rollup = %s;", (ESTADISTICA,))
+                conn.commit()
+                return recorridos
+            tope = min(hecho + lote, hasta)
+            cur.execute(_SQL_LOTE_ESTADISTICA, (hecho, tope))
+            cur.execute("UPDATE relleno_rollup SET hecho_id = %s WHERE rollup = %s;", (tope, ESTADISTICA))
+        conn.commit()
+        recorridos += tope - hecho
+
+
+def _rellenar_perfil(conn) -> int:
+    """Recalcula el perfil de cada usuario con historial, uno por transacción. Devuelve cuántos."""
+    usuarios = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("SELECT ultimo_user FROM relleno_rollup WHERE rollup = %s;", (PERFIL,))
+            fila = cur.fetchone()
+            if fila is None:
+                conn.rollback()
+                return usuarios
+            # Siguiente usuario por el índice de user_id, sin DISTINCT sobre toda la tabla
+            if fila[0] is None:
+                cur.execute("SELECT MIN(user_id) FROM historial_clinico_usuario;")
+            else:
+                cur.execute("SELECT MIN(user_id) FROM historial_clinico_usuario WHERE user_id > %s;", (fila[0],))
+            usuario = cur.fetchone()[0]
+            if usuario is None:
+                cur.execute("DELETE FROM relleno_rollup WHERE rollup = %s;", (PERFIL,))
+                conn.commit()
+                return usuarios
+            cur.execute("SELECT fn_recalcular_perfil_emocional(%s);", (usuario,))
+            cur.execute("UPDATE relleno_rollup SET ultimo_user = %s WHERE rollup = %s;", (usuario, PERFIL))
+        conn.commit()
+        usuarios += 1
+
+
+def rellenar_rollups(lote: int = LOTE_IDS) -> dict:
+    """Completa los rellenos pendientes. Un solo proceso a la vez (pg_try_advisory_lock)."""
+    resultado = {"pendientes": [], "estadistica_ids": 0, "perfil_usuarios": 0}
+    with conexion_del_pool() as conn:
+        with conn.cursor() as cur:
+            try:
+                cur.execute("SELECT rollup FROM relleno_rollup ORDER BY rollup;")
+            except errors.UndefinedTable:
+                conn.rollback()
+                return resultado
+            resultado["pendientes"] = [r[0] for r in cur.fetchall()]
+            if not resultado["pendientes"]:
+                conn.rollback()
+                return resultado
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (_CLAVE_LOCK,))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                resultado["omitido"] = "otro proceso está rellenando los rollups"
+                return resultado
+        conn.commit()
+        t0 = time.perf_counter()
+        try:
+            resultado["estadistica_ids"] = _rellenar_estadistica(conn, lote)
+            resultado["perfil_usuarios"] = _rellenar_perfil(conn)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (_CLAVE_LOCK,))
+            conn.commit()
+    resultado["segundos"] = round(time.perf_counter() - t0, 1)
+    logger.info("📊 Rollups rellenados: %s", resultado)
+    return resultado
+
+
+# ------------------------------------------------------------------ hilo de fondo
+def _correr_relleno() -> None:
+    _estado["estado"] = "en_curso"
+    try:
+        _estado["resultado"] = rellenar_rollups()
+        _estado["estado"] = "ok"
+        _estado["error"] = None
+    except Exception as e:
+        _estado["estado"] = "error"
+        _estado["error"] = str(e)
+        logger.exception("Relleno de rollups falló (la próxima corrida sigue donde quedó)")
+
+
+def iniciar_relleno_rollups() -> None:
+    """Corre el relleno pendiente en un hilo aparte (no-op si ya corre)."""
+    global _hilo
+    if _hilo is not None and _hilo.is_alive():
+        return
+    _hilo = threading.Thread(target=_correr_relleno, name="relleno-rollups", daemon=True)
+    _hilo.start()
+
+
+def estado_relleno() -> dict:
+    return {**_estado, "pendientes": sorted(_pendientes)}
+
+
+# ------------------------------------------------------------------ CLI
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Relleno de los rollups de historial_clinico_usuario.")
+    sub = parser.add_subparsers(dest="accion", required=True)
+    sub.add_parser("estado", help="muestra los rellenos pendientes y su avance")
+    rellenar = sub.add_parser("rellenar", help="completa los rellenos pendientes")
+    rellenar.add_argument("--lote", type=int, default=LOTE_IDS, help="ids del historial por transacción")
+    args = parser.parse_args(argv)
+
+    if args.accion == "estado":
+        with conexion_del_pool() as conn, conn.cursor() as cur:
+            cur.execute("SELECT rollup, hasta_id, hecho_id, ultimo_user FROM relleno_rollup ORDER BY rollup;")
+            filas = cur.fetchall()
+            conn.rollback()
+        if not filas:
+            print("📊 Rollups al día")
+        for rollup, hasta, hecho, ultimo in filas:
+            avance = f"ids hasta {hecho} de {hasta}" if rollup == ESTADISTICA else f"último usuario {ultimo!r}"
+            print(f"📊 {rollup}: relleno pendiente ({avance})")
+    else:
+        print(json.dumps(rellenar_rollups(args.lote), ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# core/db/sentencias.py
+"""
+Registro central de sentencias SQL fijas, preparadas del lado del servidor.
+
+Las consultas de core.db (y algunas de routes) son texto estático que
+Postgres parseaba y planificaba en CADA ejecución. Acá cada una se registra
+con un nombre; la primera vez que se usa en una conexión del pool se hace
+`PREPARE nombre AS ...` y desde entonces se ejecuta con `EXECUTE nombre (...)`.
+
+- Qué sentencias ya están preparadas se lleva por conexión (id(conn)); el
+  pool avisa al descartar una conexión para olvidar su set.
+- Los placeholders siguen la sintaxis de psycopg2: `%s` pasa a $1..$n y
+  `%%` a un `%` literal (p. ej. LIKE 'x%%'); `%(nombre)s` no se admite.
+- Si el servidor no la encuentra (conexión reemplazada, DEALLOCATE), se
+  vuelve a preparar y se reintenta una vez: con la transacción ociosa, o
+  cuando lo único previo es un `preambulo` que se puede repetir (el SET
+  LOCAL statement_timeout de las lecturas).
+- Contadores por sentencia (llamadas, preparaciones, ms total/máx, errores)
+  para /health.
+
+Uso:
+    registrar_sentencia("historial_usuario", "SELECT ... WHERE user_id = %s LIMIT %s")
+    filas = ejecutar_sentencia("historial_usuario", (user_id, 100))
+    # o, con una conexión/cursor propios:
+    ejecutar_preparada(cur, "historial_usuario", (user_id, 100))
+"""
+import re
+import time
+import logging
+import threading
+
+import psycopg2
+from psycopg2 import errors, extensions
+from psycopg2.extras import RealDictCursor
+
+from core.db.conexion import (
+    conexion_del_pool, obtener_pool, conexion_de_lectura, aplicar_plazo, PlazoVencidoError,
+)
+
+logger = logging.getLogger(__name__)
+
+_NOMBRE_VALIDO = re.compile(r"^[a-z_][a-z0-9_]*$")
+_PLACEHOLDER = re.compile(r"%(%|s|\([^)]*\)s)?")
+
+# nombre -> (sql con $1..$n, cantidad de parámetros)
+_sentencias: dict[str, tuple[str, int]] = {}
+# id(conn) -> nombres preparados en esa conexión
+_preparadas: dict[int, set[str]] = {}
+_lock = threading.Lock()
+
+# nombre -> métricas
+_metricas: dict[str, dict] = {}
+
+
+def _a_posicionales(sql: str) -> tuple[str, int]:
+    """
+    Convierte los placeholders de psycopg2 a la sintaxis de PREPARE: %s -> $1..$n
+    y %% -> % (el cuerpo del PREPARE viaja sin interpolar). Un % suelto queda igual.
+    """
+    n = 0
+
+    def _reemplazo(m):
+        nonlocal n
+        marca = m.group(1)
+        if marca == "%":
+            return "%"
+        if marca == "s":
+            n += 1
+            return f"${n}"
+        if marca:
+            raise ValueError(f"Placeholder con nombre no admitido en sentencias preparadas: %{marca}")
+        return "%"
+
+    return _PLACEHOLDER.sub(_reemplazo, sql), n
+
+
+def registrar_sentencia(nombre: str, sql: str) -> str:
+    """Registra (o re-registra con el mismo texto) una sentencia; devuelve el nombre."""
+    if not _NOMBRE_VALIDO.match(nombre):
+        raise ValueError(f"Nombre de sentencia inválido: {nombre!r}")
+    texto, n = _a_posicionales(sql.strip().rstrip(";"))
+    with _lock:
+        previa = _sentencias.get(nombre)
+        if previa is not None and previa[0] != texto:
+            raise ValueError(f"La sentencia {nombre!r} ya está registrada con otro SQL")
+        _sentencias[nombre] = (texto, n)
+        _metricas.setdefault(nombre, {"llamadas": 0, "preparaciones": 0, "errores": 0, "ms_total": 0.0, "ms_max": 0.0})
+    return nombre
+
+
+def olvidar_conexion(conn) -> None:
+    """El pool la llama al descartar una conexión: sus PREPARE mueren con ella."""
+    with _lock:
+        _preparadas.pop(id(conn), None)
+
+
+def _preparar(cur, nombre: str) -> None:
+    texto, _ = _sentencias[nombre]
+    cur.execute(f"PREPARE {nombre} AS {texto}")
+    with _lock:
+        _preparadas.setdefault(id(cur.connection), set()).add(nombre)
+        _metricas[nombre]["preparaciones"] += 1
+
+
+def ejecutar_preparada(cur, nombre: str, params=(), preambulo=None) -> None:
+    """
+    Ejecuta la sentencia `nombre` en el cursor dado (preparándola en su
+    conexión si hace falta). Los resultados se leen del cursor como siempre.
+    Propaga las excepciones de la consulta.
+
+    `preambulo(cur)`: lo único que ya corrió en la transacción (p. ej.
+    aplicar_plazo). Si la sentencia falta en el servidor, se deshace, se
+    repite el preámbulo y se reintenta; sin él, solo se reintenta con la
+    transacción ociosa (no se deshace trabajo del llamador).
+    """
+    if nombre not in _sentencias:
+        raise KeyError(f"Sentencia no registrada: {nombre}")
+    _, n = _sentencias[nombre]
+    params = tuple(params or ())
+    if len(params) != n:
+        raise ValueError(f"{nombre}: se esperaban {n} parámetros y llegaron {len(params)}")
+
+    ejecutar = f"EXECUTE {nombre}" + (" (" + ", ".join(["%s"] * n) + ")" if n else "")
+    conn = cur.connection
+    t0 = time.perf_counter()
+    try:
+        reintentable = preambulo is not None or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+        if nombre not in _preparadas.get(id(conn), ()):
+            _preparar(cur, nombre)
+        try:
+            cur.execute(ejecutar, params)
+        except errors.InvalidSqlStatementName:
+            # La conexión no la tiene (p. ej. id reutilizado tras reciclar)
+            olvidar_conexion(conn)
+            if not reintentable:
+                raise   # no deshacer trabajo previo del llamador; el próximo uso la prepara
+            conn.rollback()
+            if preambulo is not None:
+                preambulo(cur)
+            _preparar(cur, nombre)
+            cur.execute(ejecutar, params)
+    except Exception:
+        with _lock:
+            _metricas[nombre]["errores"] += 1
+        raise
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        with _lock:
+            m = _metricas[nombre]
+            m["llamadas"] += 1
+            m["ms_total"] += ms
+            m["ms_max"] = max(m["ms_max"], ms)
+
+
+def ejecutar_sentencia(nombre: str, params=(), commit: bool = False):
+    """
+    Igual contrato que ejecutar_consulta(), pero por nombre:
+    - lectura: list[dict] (posiblemente vacía).
+    - commit=True: True/False (si la sentencia devuelve filas, p. ej. RETURNING,
+      usar ejecutar_preparada con un cursor propio).
+    Nunca propaga excepciones.
+    """
+    try:
+        with (conexion_del_pool() if commit else conexion_de_lectura()) as conn:
+            with conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    preambulo = None if commit else aplicar_plazo
+                    if preambulo is not None:
+                        preambulo(cur)
+                    ejecutar_preparada(cur, nombre, params, preambulo=preambulo)
+                    if commit:
+                        return True
+                    try:
+                        rows = cur.fetchall()
+                    except psycopg2.ProgrammingError:
+                        rows = []
+                    return rows or []
+    except (PlazoVencidoError, errors.QueryCanceled) as e:
+        logger.warning("⏱️ Sentencia %s omitida/cancelada por el plazo del turno: %s", nombre, e)
+        return []
+    except Exception:
+        logger.exception("DB sentencia preparada falló", extra={"sentencia": nombre, "commit": commit})
+        return False if commit else []
+
+
+def sentencias_registradas() -> dict[str, str]:
+    """nombre -> SQL (con $1..$n), p. ej. para revisar planes con EXPLAIN."""
+    with _lock:
+        return {nombre: texto for nombre, (texto, _) in _sentencias.items()}
+
+
+def estadisticas_sentencias() -> dict:
+    """Métricas por sentencia (ordenadas por tiempo total) para /health."""
+    with _lock:
+        filas = {
+            nombre: {
+                "llamadas": m["llamadas"],
+                "preparaciones": m["preparaciones"],
+                "errores": m["errores"],
+                "ms_medio": round(m["ms_total"] / m["llamadas"], 2) if m["llamadas"] else 0.0,
+                "ms_max": round(m["ms_max"], 2),
+                "ms_total": round(m["ms_total"], 1),
+            }
+            for nombre, m in _metricas.items()
+        }
+        conexiones = len(_preparadas)
+    return {
+        "registradas": len(filas),
+        "conexiones_con_preparadas": conexiones,
+        "por_sentencia": dict(sorted(filas.items(), key=lambda kv: kv[1]["ms_total"], reverse=True)),
+    }
+
+
+# El pool avisa cuando cierra una conexión
+obtener_pool().al_descartar.append(olvidar_conexion)
@@ -1,13 +1,84 @@
 # core/db/sintomas.py
 
-from typing import Iterable, List, Tuple, Set
-import psycopg2
+import time
+import threading
+from typing import Iterable, Iterator, List, Tuple, Set
 from psycopg2.extras import RealDictCursor
-from core.constantes import DATABASE_URL
+from core.db.conexion import conexion_del_pool, iterar_consulta, LOTE_STREAMING
+from core.db.sentencias import registrar_sentencia, ejecutar_preparada
+from core.db.particiones import fecha_desde, VENTANA_VOCABULARIO_DIAS
 
 
 def _get_conn():
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    # Conexión prestada por el pool global (se devuelve al salir del `with`)
+    return conexion_del_pool()
+
+
+# Sentencias fijas (preparadas una vez por conexión del pool)
+_SQL_REGISTRAR_SINTOMA = registrar_sentencia("sint_registrar", """
+    INSERT INTO historial_clinico_usuario
+      (user_id, fecha, emociones, sintomas, cuadro_clinico_probable, fuente, interaccion_id)
+    VALUES
+      (%s, NOW(),
+       ARRAY[%s]::text[],           -- guardamos en 'emociones' por compatibilidad
+       ARRAY[]::text[],             -- si quisieras usar 'sintomas', duplicá aquí también
+       %s,
+       %s,
+       %s)
+""")
+# Cargas del vocabulario global: se leen con cursor con nombre (streaming), que no
+# admite EXECUTE de una sentencia preparada, así que quedan como SQL plano
+_SQL_SINTOMAS_EXISTENTES = """
+    WITH terms AS (
+      SELECT LOWER(UNNEST(COALESCE(emociones, ARRAY[]::text[]))) AS t
+      FROM historial_clinico_usuario
+      UNION ALL
+      SELECT LOWER(UNNEST(COALESCE(sintomas,  ARRAY[]::text[]))) AS t
+      FROM historial_clinico_usuario
+    )
+    SELECT DISTINCT t FROM terms WHERE t <> ''
+"""
+# Misma consulta acotada por fecha: con la tabla particionada solo toca los meses de la ventana
+_SQL_SINTOMAS_EXISTENTES_DESDE = """
+    WITH terms AS (
+      SELECT LOWER(UNNEST(COALESCE(emociones, ARRAY[]::text[]))) AS t
+      FROM historial_clinico_usuario
+      WHERE fecha >= %s
+      UNION ALL
+      SELECT LOWER(UNNEST(COALESCE(sintomas,  ARRAY[]::text[]))) AS t
+      FROM historial_clinico_usuario
+      WHERE fecha >= %s
+    )
+    SELECT DISTINCT t FROM terms WHERE t <> ''
+"""
+_SQL_SINTOMAS_CON_CUADRO = """
+    WITH flat AS (
+      SELECT
+        id,
+        fecha,
+        LOWER(UNNEST(COALESCE(emociones, ARRAY[]::text[]))) AS termino,
+        cuadro_clinico_probable
+      FROM historial_clinico_usuario
+      UNION ALL
+      SELECT
+        id,
+        fecha,
+        LOWER(UNNEST(COALESCE(sintomas, ARRAY[]::text[]))) AS termino,
+        cuadro_clinico_probable
+      FROM historial_clinico_usuario
+    ),
+    ranked AS (
+      SELECT
+        termino,
+        cuadro_clinico_probable,
+        ROW_NUMBER() OVER (PARTITION BY termino ORDER BY fecha DESC, id DESC) AS rk
+      FROM flat
+      WHERE termino <> ''
+    )
+    SELECT termino, cuadro_clinico_probable
+    FROM ranked
+    WHERE rk = 1
+"""
 
 
 # ---------------------------------------------------------------------
@@ -32,51 +103,48 @@ def registrar_sintoma(
         return
 
     try:
-        with _get_conn() as conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO historial_clinico_usuario
-                  (user_id, fecha, emociones, sintomas, cuadro_clinico_probable, fuente, interaccion_id)
-                VALUES
-                  (%s, NOW(),
-                   ARRAY[%s]::text[],           -- guardamos en 'emociones' por compatibilidad
-                   ARRAY[]::text[],             -- si quisieras usar 'sintomas', duplicá aquí también
-                   %s,
-                   %s,
-                   %s)
-                """,
-                (user_id, sintoma, estado_emocional, fuente, interaccion_id),
-            )
+        with _get_conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            ejecutar_preparada(cur, _SQL_REGISTRAR_SINTOMA, (user_id, sintoma, estado_emocional, fuente, interaccion_id))
+            conn.commit()
     except Exception as e:
         print(f"[sintomas.registrar_sintoma] Error: {e}")
 
 
-def obtener_sintomas_existentes() -> Set[str]:
+def iterar_sintomas_existentes(dias: int | None = VENTANA_VOCABULARIO_DIAS, lote: int = LOTE_STREAMING) -> Iterator[str]:
+    """
+    Itera los términos distintos observados (emociones y sintomas, en minúsculas)
+    trayéndolos del servidor de a `lote` (cursor con nombre). Propaga errores de DB.
+    """
+    desde = fecha_desde(dias)
+    if desde is None:
+        filas = iterar_consulta(_SQL_SINTOMAS_EXISTENTES, lote=lote)
+    else:
+        filas = iterar_consulta(_SQL_SINTOMAS_EXISTENTES_DESDE, (desde, desde), lote=lote)
+    for (termino,) in filas:
+        termino = (termino or "").strip()
+        if termino:
+            yield termino
+
+
+def obtener_sintomas_existentes(dias: int | None = VENTANA_VOCABULARIO_DIAS) -> Set[str]:
     """
     Devuelve un set con TODOS los términos observados históricamente
     (de columnas emociones y sintomas), en minúsculas.
+    Con `dias` se limita a los últimos `dias` días (poda de particiones).
     """
     try:
-        with _get_conn() as conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                WITH terms AS (
-                  SELECT LOWER(UNNEST(COALESCE(emociones, ARRAY[]::text[]))) AS t
-                  FROM historial_clinico_usuario
-                  UNION ALL
-                  SELECT LOWER(UNNEST(COALESCE(sintomas,  ARRAY[]::text[]))) AS t
-                  FROM historial_clinico_usuario
-                )
-                SELECT DISTINCT t FROM terms WHERE t <> '';
-                """
-            )
-            rows = cur.fetchall()
-            return {row["t"] for row in rows}
+        return set(iterar_sintomas_existentes(dias))
     except Exception as e:
         print(f"[sintomas.obtener_sintomas_existentes] Error: {e}")
         return set()
 
 
+def iterar_sintomas_con_estado_emocional(lote: int = LOTE_STREAMING) -> Iterator[Tuple[str, str | None]]:
+    """Como obtener_sintomas_con_estado_emocional(), pero en streaming. Propaga errores de DB."""
+    for termino, cuadro in iterar_consulta(_SQL_SINTOMAS_CON_CUADRO, lote=lote):
+        yield termino, cuadro
+
+
 def obtener_sintomas_con_estado_emocional() -> List[Tuple[str, str | None]]:
     """
     Devuelve pares (termino, cuadro_clinico_probable).
@@ -84,44 +152,63 @@ def obtener_sintomas_con_estado_emocional() -> List[Tuple[str, str | None]]:
     'cuadro_clinico_probable' no nulo registrado junto a ese término (si existe).
     """
     try:
-        with _get_conn() as conn, conn.cursor() as cur:
-            # Unimos términos y nos quedamos con el cuadro de la fila más reciente que lo contiene
-            cur.execute(
-                """
-                WITH flat AS (
-                  SELECT
-                    id,
-                    fecha,
-                    LOWER(UNNEST(COALESCE(emociones, ARRAY[]::text[]))) AS termino,
-                    cuadro_clinico_probable
-                  FROM historial_clinico_usuario
-                  UNION ALL
-                  SELECT
-                    id,
-                    fecha,
-                    LOWER(UNNEST(COALESCE(sintomas, ARRAY[]::text[]))) AS termino,
-                    cuadro_clinico_probable
-                  FROM historial_clinico_usuario
-                ),
-                ranked AS (
-                  SELECT
-                    termino,
-                    cuadro_clinico_probable,
-                    ROW_NUMBER() OVER (PARTITION BY termino ORDER BY fecha DESC, id DESC) AS rk
-                  FROM flat
-                  WHERE termino <> ''
-                )
-                SELECT termino, cuadro_clinico_probable
-                FROM ranked
-                WHERE rk = 1;
-                """
-            )
-            rows = cur.fetchall()
-            return [(row["termino"], row["cuadro_clinico_probable"]) for row in rows]
+        return list(iterar_sintomas_con_estado_emocional())
     except Exception as e:
         print(f"[sintomas.obtener_sintomas_con_estado_emocional] Error: {e}")
         return []
 
 
+# ---------------------------------------------------------------------
+# Carga del vocabulario en segundo plano (startup)
+# ---------------------------------------------------------------------
+_carga_vocabulario = {"estado": "pendiente", "terminos": 0, "ms": 0.0, "error": None}
+_lock_carga = threading.Lock()
+
+
+def cargar_vocabulario(destino: Set[str], lote: int = LOTE_STREAMING) -> int:
+    """
+    Vuelca el vocabulario en `destino` a medida que llega (de a `lote` filas):
+    quien lee el set ve los términos ya cargados sin esperar al resto.
+    """
+    t0 = time.perf_counter()
+    _carga_vocabulario.update(estado="cargando", error=None)
+    n = 0
+    try:
+        for termino in iterar_sintomas_existentes(lote=lote):
+            destino.add(termino)
+            n += 1
+            if n % lote == 0:
+                _carga_vocabulario["terminos"] = n
+        _carga_vocabulario["estado"] = "completo"
+    except Exception as e:
+        _carga_vocabulario.update(estado="error", error=str(e))
+        print(f"[sintomas.cargar_vocabulario] Error tras {n} términos: {e}")
+    finally:
+        _carga_vocabulario["terminos"] = n
+        _carga_vocabulario["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return n
+
+
+def iniciar_carga_vocabulario(destino: Set[str], en_hilo: bool = True) -> bool:
+    """
+    Lanza cargar_vocabulario(destino) en un hilo (o en el hilo actual con
+    en_hilo=False); False si ya hay una carga en curso o hecha.
+    """
+    with _lock_carga:
+        if _carga_vocabulario["estado"] in ("cargando", "completo"):
+            return False
+        _carga_vocabulario["estado"] = "cargando"
+    if en_hilo:
+        threading.Thread(target=cargar_vocabulario, args=(destino,), name="carga-vocabulario", daemon=True).start()
+    else:
+        cargar_vocabulario(destino)
+    return True
+
+
+def estado_carga_vocabulario() -> dict:
+    return dict(_carga_vocabulario)
+
+
+
 
 
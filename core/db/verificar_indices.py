@@ -0,0 +1,157 @@
+# core/db/verificar_indices.py
+"""
+Verificador de planes: corre EXPLAIN sobre cada sentencia registrada en
+core.db.sentencias y falla si alguna hace Seq Scan sobre una tabla con más
+de `umbral` filas (estimadas por pg_class.reltuples).
+
+Pensado para una base Postgres LOCAL (no producción) con las migraciones aplicadas:
+
+    DATABASE_URL=postgresql://localhost/asistente \\
+        python -m core.db.verificar_indices --sembrar 20000 --umbral 1000
+
+- Se usa el plan GENÉRICO (plan_cache_mode = force_generic_plan), así no
+  hacen falta parámetros de ejemplo: es el plan que termina usando un
+  PREPARE reutilizado en el pool.
+- --sembrar N inserta N filas sintéticas en historial_clinico_usuario y hace
+  ANALYZE, todo dentro de una transacción que se revierte al final (la base
+  queda como estaba).
+- ESCANEO_COMPLETO_ESPERADO lista las sentencias que recorren la tabla a
+  propósito (vocabulario global, auditoría); no se reportan.
+- Código de salida 1 si hay violaciones o sentencias que no se pudieron
+  planificar.
+"""
+import os
+import re
+import sys
+import argparse
+
+import psycopg2
+
+# Importar los módulos registra sus sentencias
+import core.db.consulta  # noqa: F401
+import core.db.sintomas  # noqa: F401
+import core.db.registro  # noqa: F401
+import core.db.perfil_clinico  # noqa: F401
+import core.db.etiquetas_cuadro  # noqa: F401
+from core.db.sentencias import sentencias_registradas
+
+UMBRAL_FILAS = int(os.getenv("VERIFICAR_INDICES_UMBRAL", "1000"))
+
+# Recorren toda la tabla por diseño (no están en el camino por turno)
+ESCANEO_COMPLETO_ESPERADO = {
+    "hcu_sintomas": "vocabulario global de síntomas",
+    "hcu_sintomas_distintos": "vocabulario global (arranque)",
+    "hcu_emocion_a_cuadro": "auditoría de la tabla resumen",
+    "hcu_combinaciones_recientes": "reporte por rango de fechas",
+    "hcu_sintomas_desde": "vocabulario por ventana de fechas (poda de particiones)",
+}
+
+_SQL_SEMBRAR = """
+    INSERT INTO historial_clinico_usuario
+        (user_id, fecha, emociones, nuevas_emociones_detectadas, sintomas,
+         cuadro_clinico_probable, eliminado, fuente, origen)
+    SELECT
+        '__verificar_indices_' || (g %% %(usuarios)s),
+        NOW() - (g %% 365) * INTERVAL '1 day' - (g %% 1440) * INTERVAL '1 minute',
+        ARRAY[(ARRAY['ansiedad', 'tristeza', 'angustia', 'miedo', 'culpa'])[1 + g %% 5]],
+        ARRAY[]::text[],
+        ARRAY[(ARRAY['insomnio', 'fatiga', 'irritabilidad'])[1 + g %% 3]],
+        (ARRAY['ansiedad generalizada', 'depresión', NULL])[1 + g %% 3],
+        (g %% 10 = 0),
+        'verificador',
+        'verificador'
+    FROM generate_series(1, %(filas)s) AS g;
+"""
+
+
+def _nodos(plan: dict):
+    yield plan
+    for hijo in plan.get("Plans") or []:
+        yield from _nodos(hijo)
+
+
+def _filas_tabla(cur, tabla: str) -> int:
+    cur.execute("SELECT COALESCE(reltuples, 0)::bigint FROM pg_class WHERE oid = to_regclass(%s);", (tabla,))
+    fila = cur.fetchone()
+    return int(fila[0]) if fila else 0
+
+
+def sembrar(cur, filas: int) -> None:
+    usuarios = max(filas // 50, 1)
+    cur.execute(_SQL_SEMBRAR, {"filas": filas, "usuarios": usuarios})
+    cur.execute("ANALYZE historial_clinico_usuario;")
+    cur.execute("ANALYZE perfil_emocional_usuario;")
+    cur.execute("ANALYZE perfil_emocional_usuario_emocion;")
+    print(f"🌱 Sembradas {filas} filas para {usuarios} usuarios (se revierten al final)")
+
+
+def revisar_planes(cur, umbral: int = UMBRAL_FILAS) -> tuple[list, list]:
+    """Devuelve (violaciones, errores). Cada violación: (sentencia, tabla, filas)."""
+    violaciones, errores = [], []
+    cur.execute("SET LOCAL plan_cache_mode = force_generic_plan;")
+    for nombre, texto in sorted(sentencias_registradas().items()):
+        n = max((int(m) for m in re.findall(r"\$(\d+)", texto)), default=0)
+        cur.execute("SAVEPOINT verificar;")
+        try:
+            cur.execute(f"PREPARE verif_{nombre} AS {texto}")
+            ejecutar = f"EXPLAIN (FORMAT JSON) EXECUTE verif_{nombre}" + (
+                " (" + ", ".join(["NULL"] * n) + ")" if n else ""
+            )
+            cur.execute(ejecutar)
+            plan = cur.fetchone()[0][0]["Plan"]
+            cur.execute(f"DEALLOCATE verif_{nombre};")
+            cur.execute("RELEASE SAVEPOINT verificar;")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT verificar;")
+            errores.append((nombre, str(e).strip().splitlines()[0]))
+            continue
+
+        for nodo in _nodos(plan):
+            if nodo.get("Node Type") != "Seq Scan":
+                continue
+            tabla = nodo.get("Relation Name")
+            filas = _filas_tabla(cur, tabla)
+            if filas <= umbral:
+                continue
+            if nombre in ESCANEO_COMPLETO_ESPERADO:
+                print(f"ℹ️ {nombre}: Seq Scan en {tabla} ({filas} filas) — esperado: {ESCANEO_COMPLETO_ESPERADO[nombre]}")
+                continue
+            violaciones.append((nombre, tabla, filas))
+    return violaciones, errores
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Verifica que las sentencias registradas usen índices.")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="Postgres local (default: DATABASE_URL)")
+    parser.add_argument("--sembrar", type=int, default=0, help="filas sintéticas a insertar (se revierten)")
+    parser.add_argument("--umbral", type=int, default=UMBRAL_FILAS, help="filas a partir de las cuales un Seq Scan falla")
+    args = parser.parse_args(argv)
+
+    if not args.dsn:
+        print("❌ Falta --dsn o DATABASE_URL")
+        return 2
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        with conn.cursor() as cur:
+            if args.sembrar > 0:
+                sembrar(cur, args.sembrar)
+            violaciones, errores = revisar_planes(cur, args.umbral)
+    finally:
+        conn.rollback()
+        conn.close()
+
+    total = len(sentencias_registradas())
+    for nombre, error in errores:
+        print(f"⚠️ {nombre}: no se pudo planificar ({error})")
+    for nombre, tabla, filas in violaciones:
+        print(f"❌ {nombre}: Seq Scan en {tabla} ({filas} filas > {args.umbral})")
+    if violaciones or errores:
+        print(f"❌ {len(violaciones)} violación(es), {len(errores)} error(es) en {total} sentencias")
+        return 1
+    print(f"✅ {total} sentencias sin Seq Scan por encima de {args.umbral} filas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,8 +3,8 @@ from core.utils_contacto import es_consulta_contacto
 from core.utils_seguridad import contiene_elementos_peligrosos, contiene_frase_de_peligro
 from core.db.registro import registrar_auditoria_input_original
 from core.db.consulta import es_saludo, es_cortesia, contiene_expresion_administrativa
-from core.db.sintomas import obtener_sintomas_existentes
-import openai
+from core.db.sintomas import iniciar_carga_vocabulario
+from core.utils.generador_openai import generar_respuesta_con_openai, generar_respuesta_con_openai_async
 from collections import Counter
 import re
 import unicodedata
@@ -13,25 +13,45 @@ import json
 from datetime import datetime, timedelta
 
 # ============================ DETECCIÓN DE EMOCIONES NEGATIVAS ============================
-def detectar_emociones_negativas(mensaje: str):
-    if not mensaje or not isinstance(mensaje, str):
-        return []
-    prompt = (
+def _prompt_emociones_negativas(mensaje: str) -> str:
+    return (
         "Analizá el siguiente mensaje desde una perspectiva clínica y detectá exclusivamente emociones negativas o estados afectivos vinculados a malestar psicológico.\n\n"
         "Devolvé una lista separada por comas, sin explicaciones ni texto adicional.\n\n"
         f"Mensaje: {mensaje}"
     )
+
+
+def _parsear_emociones_negativas(contenido: str | None) -> list:
+    emociones = (contenido or "").strip().lower()
+    emociones = emociones.replace("emociones negativas detectadas:", "").strip()
+    return [e.strip() for e in emociones.split(",") if e.strip() and e != "ninguna"]
+
+
+def detectar_emociones_negativas(mensaje: str):
+    if not mensaje or not isinstance(mensaje, str):
+        return []
+    try:
+        contenido = generar_respuesta_con_openai(
+            _prompt_emociones_negativas(mensaje),
+            model="gpt-3.5-turbo", temperature=0.0, max_tokens=50, reintentos=0,
+            familia="emociones_negativas",
+        )
+        return _parsear_emociones_negativas(contenido)
+    except Exception as e:
+        print(f"❌ Error al detectar emociones negativas: {e}")
+        return []
+
+
+async def detectar_emociones_negativas_async(mensaje: str):
+    if not mensaje or not isinstance(mensaje, str):
+        return []
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=50,
-            temperature=0.0
+        contenido = await generar_respuesta_con_openai_async(
+            _prompt_emociones_negativas(mensaje),
+            model="gpt-3.5-turbo", temperature=0.0, max_tokens=50, reintentos=0,
+            familia="emociones_negativas",
         )
-        emociones = response.choices[0].message.get("content", "").strip().lower()
-        emociones = emociones.replace("emociones negativas detectadas:", "").strip()
-        emociones = [e.strip() for e in emociones.split(",") if e.strip() and e != "ninguna"]
-        return emociones
+        return _parsear_emociones_negativas(contenido)
     except Exception as e:
         print(f"❌ Error al detectar emociones negativas: {e}")
         return []
@@ -65,12 +85,9 @@ def clasificar_input_inicial(texto: str) -> str:
     if any(frase in texto for frase in frases_terapia):
         return CLINICO
 
-    global sintomas_cacheados
+    # Si el startup no lo cargó, se lanza la carga en segundo plano (no bloquea el turno)
     if not sintomas_cacheados:
-        try:
-            sintomas_cacheados.update(obtener_sintomas_existentes())
-        except Exception as e:
-            print(f"[Error al cargar síntomas]: {e}")
+        iniciar_carga_vocabulario(sintomas_cacheados)
 
     saludos = ["hola", "buenos dias", "buenas tardes", "buenas noches", "que tal", "como estas"]
     if texto in saludos:
@@ -124,39 +141,58 @@ def clasificar_input_inicial_simple(mensaje: str) -> dict:
 
 
 # ============================ EVALUACIÓN CON OPENAI ============================
+def _prompt_evaluacion(mensaje: str) -> str:
+    return (
+        "Clasificá el siguiente mensaje según los siguientes criterios:\n\n"
+        "- intencion_general: ADMINISTRATIVO, CLINICO, CLINICO_CONTINUACION o DESCONOCIDO\n"
+        "- temas_administrativos: una lista de temas administrativos si los hay (por ejemplo: honorarios, modalidad, contacto)\n"
+        "- emociones_detectadas: una lista de emociones negativas detectadas si las hay\n\n"
+        "Respondé exclusivamente en formato JSON con las tres claves mencionadas.\n"
+        f"Mensaje: \"{mensaje}\"\n"
+    )
+
+
+def _parsear_evaluacion(contenido: str | None) -> dict:
+    resultado = json.loads((contenido or "").strip())
+    return {
+        "intencion_general": resultado.get("intencion_general", "").upper(),
+        "temas_administrativos": resultado.get("temas_administrativos", []),
+        "emociones_detectadas": resultado.get("emociones_detectadas", [])
+    }
+
+
+def _evaluacion_vacia() -> dict:
+    return {
+        "intencion_general": "",
+        "temas_administrativos": [],
+        "emociones_detectadas": []
+    }
+
+
 def evaluar_mensaje_openai(mensaje: str) -> dict:
     try:
-        prompt = (
-            "Clasificá el siguiente mensaje según los siguientes criterios:\n\n"
-            "- intencion_general: ADMINISTRATIVO, CLINICO, CLINICO_CONTINUACION o DESCONOCIDO\n"
-            "- temas_administrativos: una lista de temas administrativos si los hay (por ejemplo: honorarios, modalidad, contacto)\n"
-            "- emociones_detectadas: una lista de emociones negativas detectadas si las hay\n\n"
-            "Respondé exclusivamente en formato JSON con las tres claves mencionadas.\n"
-            f"Mensaje: \"{mensaje}\"\n"
-        )
-
-        respuesta = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=200
+        contenido = generar_respuesta_con_openai(
+            _prompt_evaluacion(mensaje),
+            model="gpt-3.5-turbo", temperature=0.2, max_tokens=200, reintentos=0,
+            familia="evaluacion",
         )
+        return _parsear_evaluacion(contenido)
+    except Exception as e:
+        print(f"[Error en evaluar_mensaje_openai]: {e}")
+        return _evaluacion_vacia()
 
-        contenido = respuesta.choices[0].message.get("content", "").strip()
-        resultado = json.loads(contenido)
 
-        return {
-            "intencion_general": resultado.get("intencion_general", "").upper(),
-            "temas_administrativos": resultado.get("temas_administrativos", []),
-            "emociones_detectadas": resultado.get("emociones_detectadas", [])
-        }
+async def evaluar_mensaje_openai_async(mensaje: str) -> dict:
+    try:
+        contenido = await generar_respuesta_con_openai_async(
+            _prompt_evaluacion(mensaje),
+            model="gpt-3.5-turbo", temperature=0.2, max_tokens=200, reintentos=0,
+            familia="evaluacion",
+        )
+        return _parsear_evaluacion(contenido)
     except Exception as e:
         print(f"[Error en evaluar_mensaje_openai]: {e}")
-        return {
-            "intencion_general": "",
-            "temas_administrativos": [],
-            "emociones_detectadas": []
-        }
+        return _evaluacion_vacia()
 
 
 # ============================ FILTRO DE REPETIDOS ============================
@@ -208,48 +244,23 @@ def es_tema_clinico_o_emocional(mensaje: str) -> bool:
 
 # ============================ CONSULTAS A BD ============================
 
-from core.db.conexion import ejecutar_consulta
+from core.db.perfil_clinico import obtener_perfil_clinico
 
 def obtener_ultimo_historial_emocional(user_id):
     """
     Devuelve el último registro clínico del usuario y acumula
     todos los malestares/emociones previas en orden cronológico único.
+    Ambos datos salen del perfil clínico cacheado (sin releer el historial).
     """
-
-    # Último registro (para fecha y emociones actuales)
-    ultimo = ejecutar_consulta("""
-        SELECT *
-        FROM historial_clinico_usuario
-        WHERE user_id = %s
-        ORDER BY fecha DESC
-        LIMIT 1
-    """, (user_id,))
-
-    # Todos los registros (para acumular malestares previos)
-    todos = ejecutar_consulta("""
-        SELECT emociones
-        FROM historial_clinico_usuario
-        WHERE user_id = %s
-        ORDER BY fecha ASC
-    """, (user_id,))
-
+    perfil = obtener_perfil_clinico(user_id)
+    ultimo = perfil.ultimo_cualquiera
     if not ultimo:
         return None
 
-    # Unir todas las emociones registradas (únicas, sin duplicados)
-    malestares_acumulados = []
-    for reg in todos:
-        if reg.get("emociones"):
-            malestares_acumulados.extend(reg["emociones"])
-
-    # Eliminar duplicados y mantener el orden de aparición
-    malestares_acumulados = list(dict.fromkeys(malestares_acumulados))
-
-    # Convertir resultado en un objeto/dict similar al que devolvía SQLAlchemy
     return {
-        "fecha": ultimo[0]["fecha"],
-        "emociones": ultimo[0]["emociones"],
-        "malestares_acumulados": malestares_acumulados
+        "fecha": ultimo["fecha"],
+        "emociones": ultimo["emociones"],
+        "malestares_acumulados": list(perfil.malestares_acumulados)
     }
 
 
@@ -296,3 +307,10 @@ def verificar_memoria_persistente(user_id, mensaje_actual=None, dias_maximos=7):
     }
 
     return ultimo
+
+
+# ============================ VARIANTES ASYNC ============================
+from core.db.conexion_async import version_async  # noqa: E402
+
+obtener_ultimo_historial_emocional_async = version_async(obtener_ultimo_historial_emocional)
+verificar_memoria_persistente_async = version_async(verificar_memoria_persistente)
@@ -1,5 +1,5 @@
 from collections import Counter
-from core.db.sintomas import obtener_sintomas_con_estado_emocional, registrar_sintoma
+from core.db.sintomas import iterar_sintomas_con_estado_emocional, registrar_sintoma
 from core.utils.palabras_irrelevantes import palabras_irrelevantes
 from core.utils.generador_openai import generar_respuesta_con_openai
 import re
@@ -26,12 +26,18 @@ def analizar_texto(mensajes_usuario):
     Analiza los mensajes del usuario para detectar coincidencias con los síntomas almacenados
     y muestra un cuadro probable y emociones o patrones de conducta adicionales detectados.
     """
-    sintomas_existentes = obtener_sintomas_con_estado_emocional()
-    if not sintomas_existentes:
+    # Streaming: los pares van directo al dict, sin materializar la lista intermedia
+    keyword_to_cuadro = {}
+    try:
+        for sintoma, cuadro in iterar_sintomas_con_estado_emocional():
+            keyword_to_cuadro[sintoma.lower()] = cuadro
+    except Exception as e:
+        print(f"[analizar_texto] Error al leer síntomas: {e}")
+        keyword_to_cuadro = {}
+    if not keyword_to_cuadro:
         return "No se encontraron síntomas en la base de datos para analizar."
 
-    keyword_to_cuadro = {sintoma.lower(): cuadro for sintoma, cuadro in sintomas_existentes}
-    sintomas_registrados = {sintoma.lower() for sintoma, _ in sintomas_existentes}
+    sintomas_registrados = keyword_to_cuadro.keys()
 
     coincidencias = []
     emociones_detectadas = []
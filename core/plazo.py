@@ -0,0 +1,128 @@
+# core/plazo.py
+"""
+Plazo (deadline) de punta a punta para un turno de /asistente.
+
+Antes cada helper ponía sus propios timeouts y reintentos sin saber cuánto
+llevaba el turno. Ahora /asistente abre un Plazo de ASISTENTE_SLA_SEG al
+entrar y lo deja en un ContextVar, que llega a todas las etapas (el event
+loop, asyncio.to_thread y ejecutar_en_hilo_db copian el contexto):
+
+- OpenAI (core.utils.generador_openai): el timeout de cada intento se recorta
+  al tiempo restante; sin margen (PLAZO_MIN_LLM_SEG) no se llama y se
+  devuelve None, que los llamadores ya convierten en su respuesta de respaldo.
+- DB (core.db.conexion / core.db.sentencias): las lecturas corren con
+  SET LOCAL statement_timeout = restante, y el checkout del pool espera como
+  mucho el restante. Las escrituras no se cortan: perder un registro clínico
+  por latencia es peor que llegar tarde.
+- procesar_clinico y la ruta omiten el enriquecimiento opcional
+  (recordatorio, disparadores, estadística global) si no alcanza el tiempo:
+  puede_enriquecer("etapa") exige que después siga quedando
+  PLAZO_RESERVA_RESPUESTA_SEG para la respuesta final, y cuenta las omisiones.
+
+Fuera de un turno no hay plazo y todo se comporta como antes.
+"""
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+SLA_SEG = float(os.getenv("ASISTENTE_SLA_SEG", "20"))
+MIN_LLM_SEG = float(os.getenv("PLAZO_MIN_LLM_SEG", "1.0"))   # por debajo, no vale la pena llamar a OpenAI
+MIN_DB_SEG = 0.05
+# Lo que se guarda para la respuesta final: una etapa opcional solo corre si después sigue quedando esto
+RESERVA_RESPUESTA_SEG = float(os.getenv("PLAZO_RESERVA_RESPUESTA_SEG", "6"))
+
+
+class Plazo:
+    __slots__ = ("inicio", "vence_en")
+
+    def __init__(self, segundos: float):
+        self.inicio = time.monotonic()
+        self.vence_en = self.inicio + segundos
+
+    def restante(self) -> float:
+        return self.vence_en - time.monotonic()
+
+    def transcurrido(self) -> float:
+        return time.monotonic() - self.inicio
+
+    def vencido(self) -> bool:
+        return self.restante() <= 0
+
+
+_plazo: ContextVar[Plazo | None] = ContextVar("plazo_turno", default=None)
+
+_lock = threading.Lock()
+_duraciones: deque = deque(maxlen=1000)
+_metricas = {"turnos": 0, "fuera_de_sla": 0, "llm_omitidas": 0, "omisiones": {}}
+
+
+@contextmanager
+def plazo_turno(segundos: float = SLA_SEG):
+    """`with plazo_turno():` — todo lo que corra dentro ve el mismo plazo."""
+    plazo = Plazo(segundos)
+    token = _plazo.set(plazo)
+    try:
+        yield plazo
+    finally:
+        _plazo.reset(token)
+        duracion = plazo.transcurrido()
+        with _lock:
+            _duraciones.append(duracion)
+            _metricas["turnos"] += 1
+            if duracion > segundos:
+                _metricas["fuera_de_sla"] += 1
+
+
+def plazo_actual() -> Plazo | None:
+    return _plazo.get()
+
+
+def restante() -> float | None:
+    """Segundos que le quedan al turno (None si no hay plazo activo)."""
+    plazo = _plazo.get()
+    return None if plazo is None else plazo.restante()
+
+
+def recortar(timeout: float) -> float:
+    """El menor entre `timeout` y lo que le queda al turno (puede ser ≤ 0)."""
+    r = restante()
+    return timeout if r is None else min(timeout, r)
+
+
+def hay_tiempo(etapa: str, segundos: float) -> bool:
+    """¿Quedan al menos `segundos` para una etapa opcional? Si no, cuenta la omisión."""
+    r = restante()
+    if r is None or r >= segundos:
+        return True
+    with _lock:
+        _metricas["omisiones"][etapa] = _metricas["omisiones"].get(etapa, 0) + 1
+    return False
+
+
+def puede_enriquecer(etapa: str, costo_seg: float = 0.5) -> bool:
+    """Etapa opcional (recordatorio, disparadores, estadística global): ¿entra sin comerse la reserva?"""
+    return hay_tiempo(etapa, RESERVA_RESPUESTA_SEG + costo_seg)
+
+
+def registrar_llm_omitida() -> None:
+    with _lock:
+        _metricas["llm_omitidas"] += 1
+
+
+def _percentil(valores, p: float) -> float:
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(p * len(orden)))]
+
+
+def estadisticas_plazo() -> dict:
+    with _lock:
+        duraciones = list(_duraciones)
+        m = {**_metricas, "omisiones": dict(_metricas["omisiones"])}
+    m["sla_seg"] = SLA_SEG
+    if duraciones:
+        m["p50_seg"] = round(_percentil(duraciones, 0.5), 3)
+        m["p99_seg"] = round(_percentil(duraciones, 0.99), 3)
+    return m
@@ -0,0 +1,411 @@
+# core/sesion.py
+"""
+Sesión de usuario acotada y compacta.
+
+En modo Always-On (LIMITE_INTERACCIONES = 10**9) las listas de la sesión
+(`mensajes`, `ultimas_respuestas`, `emociones_detectadas`, ...) crecían sin
+límite y un usuario muy conversador inflaba la RSS del worker. SesionUsuario:
+
+  - sigue siendo un dict (todo el código existente usa session["..."],
+    .get, .setdefault e isinstance(session, dict)), sin __dict__ propio;
+  - convierte al vuelo las listas de historial en buffers circulares
+    (HistorialAcotado) con tope configurable por variable de entorno;
+  - respalda `emociones_detectadas` con un conteo para que el
+    `if e not in session["emociones_detectadas"]` sea O(1);
+  - expone su huella de memoria aproximada (huella_bytes / reporte_memoria_sesiones).
+
+RegistroSesiones es el almacén único de sesiones del proceso (core.contexto.user_sessions),
+con expiración por TTL (SESSION_TIMEOUT).
+"""
+import os
+import sys
+import time
+import heapq
+import itertools
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager
+
+from core.constantes import SESSION_TIMEOUT
+
+# Topes por clave de historial (los más recientes quedan, los viejos se descartan)
+LIMITES_HISTORIAL = {
+    "mensajes": int(os.getenv("SESION_MAX_MENSAJES", "50")),
+    "ultimas_respuestas": int(os.getenv("SESION_MAX_RESPUESTAS", "20")),
+    "intenciones_previas": int(os.getenv("SESION_MAX_INTENCIONES", "50")),
+    "interacciones_previas": int(os.getenv("SESION_MAX_INTENCIONES", "50")),
+    "intenciones_clinicas_acumuladas": int(os.getenv("SESION_MAX_INTENCIONES", "50")),
+}
+MAX_EMOCIONES = int(os.getenv("SESION_MAX_EMOCIONES", "64"))
+
+
+class HistorialAcotado(list):
+    """
+    Lista con tope (`maxlen`): al superarlo descarta los elementos más viejos,
+    como un deque(maxlen=...), pero conserva slicing e indexado de list
+    (el código hace session["mensajes"][-4:]).
+    """
+
+    __slots__ = ("maxlen",)
+
+    def __init__(self, iterable=(), maxlen: int = 50):
+        super().__init__()
+        self.maxlen = max(1, int(maxlen))
+        self.extend(iterable)
+
+    def _recortar(self) -> None:
+        exceso = len(self) - self.maxlen
+        if exceso > 0:
+            del self[:exceso]
+
+    def append(self, x) -> None:
+        super().append(x)
+        self._recortar()
+
+    def extend(self, xs) -> None:
+        super().extend(xs)
+        self._recortar()
+
+    def insert(self, i, x) -> None:
+        super().insert(i, x)
+        self._recortar()
+
+    def __iadd__(self, xs):
+        self.extend(xs)
+        return self
+
+    def __reduce__(self):
+        return (self.__class__, (list(self), self.maxlen))
+
+
+class EmocionesSesion(HistorialAcotado):
+    """
+    Emociones de la sesión: mantiene orden y repeticiones (se usan para
+    Counter/most_common), con pertenencia O(1) respaldada por un conteo.
+    """
+
+    __slots__ = ("_conteo",)
+
+    def __init__(self, iterable=(), maxlen: int = MAX_EMOCIONES):
+        self._conteo = Counter()
+        super().__init__(iterable, maxlen)
+
+    def _reconstruir(self) -> None:
+        self._conteo = Counter(e for e in self if _hasheable(e))
+
+    def __contains__(self, x) -> bool:
+        if not _hasheable(x):
+            return list.__contains__(self, x)
+        return self._conteo.get(x, 0) > 0
+
+    def append(self, x) -> None:
+        list.append(self, x)
+        if _hasheable(x):
+            self._conteo[x] += 1
+        self._recortar()
+
+    def extend(self, xs) -> None:
+        for x in list(xs):
+            list.append(self, x)
+            if _hasheable(x):
+                self._conteo[x] += 1
+        self._recortar()
+
+    # Mutaciones poco frecuentes: se recalcula el conteo (tope chico → barato)
+    def insert(self, i, x) -> None:
+        list.insert(self, i, x)
+        self._recortar()
+        self._reconstruir()
+
+    def remove(self, x) -> None:
+        list.remove(self, x)
+        self._reconstruir()
+
+    def pop(self, i=-1):
+        x = list.pop(self, i)
+        self._reconstruir()
+        return x
+
+    def clear(self) -> None:
+        list.clear(self)
+        self._conteo.clear()
+
+    def __setitem__(self, i, x) -> None:
+        list.__setitem__(self, i, x)
+        self._reconstruir()
+
+    def __delitem__(self, i) -> None:
+        list.__delitem__(self, i)
+        self._reconstruir()
+
+
+def _hasheable(x) -> bool:
+    try:
+        hash(x)
+        return True
+    except TypeError:
+        return False
+
+
+def _acotar(clave, valor):
+    """Convierte listas/sets de historial en su contenedor acotado (idempotente)."""
+    if clave == "emociones_detectadas":
+        if isinstance(valor, EmocionesSesion):
+            return valor
+        if isinstance(valor, (list, tuple, set, frozenset)):
+            return EmocionesSesion(valor)
+        return valor
+    limite = LIMITES_HISTORIAL.get(clave)
+    if limite is not None and isinstance(valor, (list, tuple)) and not isinstance(valor, HistorialAcotado):
+        return HistorialAcotado(valor, limite)
+    return valor
+
+
+class SesionUsuario(dict):
+    """Sesión de un usuario (dict sin __dict__ por instancia) con historiales acotados."""
+
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.update(*args, **kwargs)
+
+    @classmethod
+    def desde(cls, datos) -> "SesionUsuario":
+        """Devuelve `datos` si ya es SesionUsuario; si no, la construye a partir del dict (o vacía)."""
+        if isinstance(datos, cls):
+            return datos
+        return cls(datos or {})
+
+    def __setitem__(self, clave, valor) -> None:
+        super().__setitem__(clave, _acotar(clave, valor))
+
+    # dict.setdefault/update no pasan por __setitem__: se redefinen
+    def setdefault(self, clave, default=None):
+        if clave not in self:
+            self[clave] = default
+        return dict.__getitem__(self, clave)
+
+    def update(self, *args, **kwargs) -> None:
+        for clave, valor in dict(*args, **kwargs).items():
+            self[clave] = valor
+
+    def copy(self) -> "SesionUsuario":
+        return SesionUsuario(self)
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    def huella_bytes(self) -> int:
+        return huella_bytes(self)
+
+
+class RegistroSesiones(dict):
+    """
+    Almacén único de sesiones: dict user_id → SesionUsuario con expiración por TTL.
+
+    - Expiración O(log N): min-heap de (expira_en, seq, user_id) con invalidación
+      perezosa; cada escritura/lectura purga solo las entradas vencidas del tope
+      del heap (sin hilo que recorra todas las sesiones cada 30 s).
+    - TTL desde `ultima_interaccion` (o ahora) + `ttl`; leer una sesión la "toca"
+      y renueva su vencimiento.
+    - Cualquier dict que se guarde se convierte a SesionUsuario, así ningún camino
+      (resumen_clinico, rutas viejas) vuelve a meter listas sin tope.
+    - Thread-safe (lo usan el event loop y los hilos de asyncio.to_thread).
+    """
+
+    def __init__(self, ttl: float = SESSION_TIMEOUT):
+        super().__init__()
+        self.ttl = float(ttl)
+        self._lock = threading.RLock()
+        self._heap: list = []             # [(expira_en, seq, user_id)] — entradas viejas se ignoran
+        self._expira_en: dict = {}        # user_id -> vencimiento vigente
+        self._seq = itertools.count()
+
+        # Callbacks(user_id) al expirar/eliminar una sesión (p. ej. soltar cachés por usuario)
+        self.al_expirar: list = []
+
+        # Métricas
+        self.expiradas = 0
+        self.eliminadas = 0
+        self.toques = 0
+
+    # ---------------- expiración ----------------
+    def _programar(self, user_id, expira_en: float) -> None:
+        self._expira_en[user_id] = expira_en
+        heapq.heappush(self._heap, (expira_en, next(self._seq), user_id))
+        # Compactar si se acumularon demasiadas entradas obsoletas (amortizado)
+        if len(self._heap) > 2 * len(self._expira_en) + 64:
+            self._heap = [(t, next(self._seq), u) for u, t in self._expira_en.items()]
+            heapq.heapify(self._heap)
+
+    def _vencida(self, user_id, ahora: float) -> bool:
+        t = self._expira_en.get(user_id)
+        return t is not None and t <= ahora
+
+    def _avisar(self, user_id) -> None:
+        for callback in self.al_expirar:
+            try:
+                callback(user_id)
+            except Exception as e:
+                print(f"⚠️ Callback al_expirar falló para {user_id}: {e}")
+
+    def _expirar(self, user_id) -> None:
+        self._expira_en.pop(user_id, None)
+        dict.pop(self, user_id, None)
+        self.expiradas += 1
+        self._avisar(user_id)
+
+    def purgar_vencidas(self, ahora: float | None = None) -> int:
+        """Elimina las sesiones vencidas: O(k log N) para k vencidas."""
+        ahora = time.time() if ahora is None else ahora
+        n = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= ahora:
+                expira_en, _, user_id = heapq.heappop(self._heap)
+                if self._expira_en.get(user_id) == expira_en:   # entrada vigente (no tocada después)
+                    self._expirar(user_id)
+                    n += 1
+        return n
+
+    def tocar(self, user_id) -> None:
+        with self._lock:
+            if dict.__contains__(self, user_id):
+                self.toques += 1
+                self._programar(user_id, time.time() + self.ttl)
+
+    # ---------------- API de dict ----------------
+    def __setitem__(self, user_id, sesion) -> None:
+        sesion = SesionUsuario.desde(sesion)
+        ahora = time.time()
+        base = sesion.get("ultima_interaccion")
+        base = base if isinstance(base, (int, float)) and base <= ahora else ahora
+        with self._lock:
+            self.purgar_vencidas(ahora)
+            dict.__setitem__(self, user_id, sesion)
+            self._programar(user_id, base + self.ttl)
+
+    def _leer(self, user_id, tocar: bool = True):
+        ahora = time.time()
+        with self._lock:
+            self.purgar_vencidas(ahora)
+            if not dict.__contains__(self, user_id):
+                return _FALTA
+            if self._vencida(user_id, ahora):
+                self._expirar(user_id)
+                return _FALTA
+            if tocar:
+                self.toques += 1
+                self._programar(user_id, ahora + self.ttl)
+            return dict.__getitem__(self, user_id)
+
+    def __getitem__(self, user_id):
+        sesion = self._leer(user_id)
+        if sesion is _FALTA:
+            raise KeyError(user_id)
+        return sesion
+
+    def get(self, user_id, default=None):
+        sesion = self._leer(user_id)
+        return default if sesion is _FALTA else sesion
+
+    def __contains__(self, user_id) -> bool:
+        return self._leer(user_id, tocar=False) is not _FALTA
+
+    def setdefault(self, user_id, default=None):
+        with self._lock:
+            sesion = self._leer(user_id)
+            if sesion is _FALTA:
+                self[user_id] = default if default is not None else SesionUsuario()
+                sesion = dict.__getitem__(self, user_id)
+            return sesion
+
+    def pop(self, user_id, *default):
+        with self._lock:
+            if dict.__contains__(self, user_id):
+                self._expira_en.pop(user_id, None)
+                self.eliminadas += 1
+                self._avisar(user_id)
+            return dict.pop(self, user_id, *default)
+
+    def __delitem__(self, user_id) -> None:
+        with self._lock:
+            if not dict.__contains__(self, user_id):
+                raise KeyError(user_id)
+            self.pop(user_id)
+
+    @asynccontextmanager
+    async def turno(self, user_id):
+        """Misma API que RegistroSesionesCompartido.turno(); en memoria no hay I/O que diferir."""
+        yield
+
+    def clear(self) -> None:
+        with self._lock:
+            dict.clear(self)
+            self._expira_en.clear()
+            self._heap.clear()
+
+    def items(self):
+        # Copia (no vista viva): se itera sin carreras con los hilos que escriben
+        with self._lock:
+            return list(dict.items(self))
+
+    def estadisticas(self) -> dict:
+        ahora = time.time()
+        with self._lock:
+            proxima = self._heap[0][0] - ahora if self._heap else None
+            return {
+                "activas": len(self),
+                "ttl_seg": self.ttl,
+                "expiradas": self.expiradas,
+                "eliminadas": self.eliminadas,
+                "toques": self.toques,
+                "heap": len(self._heap),
+                "proxima_expiracion_seg": round(max(0.0, proxima), 1) if proxima is not None else None,
+            }
+
+
+_FALTA = object()
+
+
+def huella_bytes(obj, _vistos=None) -> int:
+    """Tamaño aproximado (sys.getsizeof recursivo) de una estructura de sesión."""
+    if _vistos is None:
+        _vistos = set()
+    if id(obj) in _vistos:
+        return 0
+    _vistos.add(id(obj))
+    total = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            total += huella_bytes(k, _vistos) + huella_bytes(v, _vistos)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for x in obj:
+            total += huella_bytes(x, _vistos)
+        if isinstance(obj, EmocionesSesion):
+            total += huella_bytes(obj._conteo, _vistos)
+    return total
+
+
+def reporte_memoria_sesiones(sesiones: dict, top: int = 5) -> dict:
+    """Huella de memoria de todas las sesiones (para diagnóstico; es O(N))."""
+    por_usuario = []
+    for user_id, sesion in list(sesiones.items()):
+        por_usuario.append((user_id, huella_bytes(sesion), sesion))
+    total = sum(b for _, b, _ in por_usuario)
+    por_usuario.sort(key=lambda t: t[1], reverse=True)
+    return {
+        "sesiones": len(por_usuario),
+        "bytes_total": total,
+        "bytes_promedio": round(total / len(por_usuario)) if por_usuario else 0,
+        "limites": {**LIMITES_HISTORIAL, "emociones_detectadas": MAX_EMOCIONES},
+        "top": [
+            {
+                "user_id": user_id,
+                "bytes": b,
+                "mensajes": len(s.get("mensajes") or []),
+                "emociones": len(s.get("emociones_detectadas") or []),
+            }
+            for user_id, b, s in por_usuario[:top]
+        ],
+    }
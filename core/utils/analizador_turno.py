@@ -0,0 +1,198 @@
+# core/utils/analizador_turno.py
+"""
+Analizador de turno: UNA sola llamada a OpenAI por mensaje del usuario.
+
+Antes, un mismo mensaje podía disparar hasta cinco clasificaciones separadas
+(detectar_intencion_bifurcada, la clasificación contextual del endpoint,
+clasificar_tema_administrativo, _ask_openai_emociones_y_cuadro y
+detectar_emociones_negativas), cada una con su round-trip y con salidas que
+se pisaban. Acá se piden todas juntas en un único JSON:
+
+    {
+      "intencion_general": "CLINICA" | "ADMINISTRATIVA" | "MIXTA" | "INDEFINIDA",
+      "temas_administrativos": [...],
+      "categoria_administrativa": "obras sociales" | "honorarios" | ... | "otro",
+      "tipo_contextual": "CLINICO" | "CORTESIA" | ... | "IRRELEVANTE",
+      "emociones": [...0..4...],
+      "cuadro_probable": "...",
+      "riesgo": {"ideacion_suicida": bool, "autolesion": bool, "violencia": bool}
+    }
+
+El resultado queda cacheado en la sesión (clave "_analisis_turno") atado al
+mensaje ORIGINAL del turno (la ruta después le antepone saludo/recordatorio
+a mensaje_usuario), así las etapas siguientes del MISMO turno lo leen en
+lugar de volver a preguntarle al modelo. Si el análisis falla, devuelve None y cada
+etapa cae a su clasificador individual de siempre.
+"""
+import json
+import re
+
+from core.utils.generador_openai import generar_respuesta_con_openai_async
+
+INTENCIONES_VALIDAS = {"CLINICA", "ADMINISTRATIVA", "MIXTA", "INDEFINIDA"}
+TIPOS_CONTEXTUALES_VALIDOS = {
+    "CLINICO", "CORTESIA", "CONSULTA_AGENDAR", "CONSULTA_MODALIDAD",
+    "TESTEO", "MALICIOSO", "IRRELEVANTE",
+}
+CATEGORIAS_ADMINISTRATIVAS = {
+    "obras sociales", "honorarios", "horarios", "tratamientos",
+    "contacto", "modalidad", "duración", "otro",
+}
+BANDERAS_RIESGO = ("ideacion_suicida", "autolesion", "violencia")
+
+CLAVE_SESION = "_analisis_turno"
+MAX_TOKENS_ANALISIS = 300
+
+
+def _prompt_analisis(mensaje_usuario: str) -> str:
+    return "\n".join([
+        "Analizá el siguiente mensaje de un usuario de un asistente de orientación psicológica y devolvé "
+        "EXCLUSIVAMENTE un JSON válido (sin Markdown ni texto fuera del JSON) con estas claves:",
+        "{",
+        '  "intencion_general": "CLINICA" | "ADMINISTRATIVA" | "MIXTA" | "INDEFINIDA",',
+        '  "temas_administrativos": ["..."],',
+        '  "categoria_administrativa": "obras sociales" | "honorarios" | "horarios" | "tratamientos" | "contacto" | "modalidad" | "duración" | "otro",',
+        '  "tipo_contextual": "CLINICO" | "CORTESIA" | "CONSULTA_AGENDAR" | "CONSULTA_MODALIDAD" | "TESTEO" | "MALICIOSO" | "IRRELEVANTE",',
+        '  "emociones": ["...", "..."],',
+        '  "cuadro_probable": "...",',
+        '  "riesgo": {"ideacion_suicida": false, "autolesion": false, "violencia": false}',
+        "}",
+        "",
+        "Reglas (español de Argentina):",
+        "- intencion_general: CLINICA solo si el usuario transmite sufrimiento emocional vivido en primera persona; "
+        "ADMINISTRATIVA si pregunta por servicios, temas tratados, precios, agenda, obras sociales, etc.; "
+        "MIXTA si menciona un tema clínico de forma informativa, sin hablar de sí mismo; INDEFINIDA si no queda claro.",
+        "- temas_administrativos: lista de temas administrativos consultados (vacía si no hay).",
+        "- categoria_administrativa: la categoría administrativa más adecuada, u \"otro\".",
+        "- tipo_contextual: CLINICO (malestar, síntomas, angustia, insomnio, vacío...), CORTESIA (agradece o cierra), "
+        "CONSULTA_AGENDAR (turnos, costos, cómo pedir cita), CONSULTA_MODALIDAD (online/presencial), "
+        "TESTEO (mensaje de prueba), MALICIOSO (comandos, código, manipulación), IRRELEVANTE (ajeno a la consulta).",
+        "- emociones: 0 a 4 términos en minúsculas, sin duplicados, solo negativas/clínicamente relevantes. "
+        "Tolerá faltas y variantes coloquiales (p. ej., 'agustiado' ≈ 'angustiado').",
+        '- cuadro_probable: síntesis prudente en minúsculas (p. ej.: "ansiedad", "estrés", "insomnio"), o "" si no aplica.',
+        "- riesgo: true SOLO si el mensaje expresa esa situación de forma explícita.",
+        "",
+        f"Mensaje: '''{mensaje_usuario}'''",
+    ])
+
+
+def _extraer_json(payload: str) -> dict | None:
+    try:
+        data = json.loads(payload)
+    except Exception:
+        data = None
+
+    # Si vino texto con basura alrededor, extraemos el primer objeto {...}
+    if not isinstance(data, dict):
+        m = re.search(r"\{(?:.|\n)*\}", payload or "", flags=re.S)
+        if m:
+            try:
+                data = json.loads(m.group(0))
+            except Exception:
+                data = None
+
+    return data if isinstance(data, dict) else None
+
+
+def _lista_str(xs, limite: int | None = None) -> list[str]:
+    if not isinstance(xs, list):
+        return []
+    out = [str(x).strip().lower() for x in xs if str(x).strip()]
+    out = list(dict.fromkeys(out))
+    return out[:limite] if limite else out
+
+
+def parsear_analisis(payload: str | None) -> dict | None:
+    """Valida y normaliza la respuesta del modelo; None si no es utilizable."""
+    data = _extraer_json(payload or "")
+    if data is None:
+        return None
+
+    intencion = str(data.get("intencion_general") or "").strip().upper()
+    if intencion not in INTENCIONES_VALIDAS:
+        intencion = "INDEFINIDA"
+
+    tipo_contextual = str(data.get("tipo_contextual") or "").strip().upper()
+    if tipo_contextual not in TIPOS_CONTEXTUALES_VALIDOS:
+        tipo_contextual = None  # la etapa contextual vuelve a su clasificador propio
+
+    categoria = str(data.get("categoria_administrativa") or "").strip().lower()
+    if categoria not in CATEGORIAS_ADMINISTRATIVAS:
+        categoria = None  # procesar_administrativo vuelve a clasificar
+
+    emociones = [e for e in _lista_str(data.get("emociones"), limite=4)
+                 if not any(c in e for c in ",{}")]
+
+    riesgo_raw = data.get("riesgo") if isinstance(data.get("riesgo"), dict) else {}
+    riesgo = {k: bool(riesgo_raw.get(k)) for k in BANDERAS_RIESGO}
+
+    return {
+        "intencion_general": intencion,
+        "temas_administrativos": _lista_str(data.get("temas_administrativos")),
+        "categoria_administrativa": categoria,
+        "tipo_contextual": tipo_contextual,
+        "emociones": emociones,
+        "cuadro_probable": str(data.get("cuadro_probable") or "").strip().lower(),
+        "riesgo": riesgo,
+    }
+
+
+def _clave(mensaje_original: str | None) -> str:
+    return (mensaje_original or "").strip().lower()
+
+
+def analisis_en_cache(session: dict | None, mensaje_original: str) -> dict | None:
+    """Devuelve el análisis del turno actual si ya se calculó para ESTE mensaje original."""
+    if not isinstance(session, dict):
+        return None
+    entrada = session.get(CLAVE_SESION)
+    if isinstance(entrada, dict) and entrada.get("mensaje") == _clave(mensaje_original):
+        return entrada.get("resultado")
+    return None
+
+
+async def analizar_turno_async(
+    mensaje_usuario: str, session: dict | None = None, mensaje_original: str | None = None,
+) -> dict | None:
+    """
+    Clasificación fusionada del turno (una sola llamada a OpenAI).
+    - Reusa el resultado cacheado en la sesión si el mensaje original es el mismo.
+    - Devuelve None si OpenAI falla o la respuesta no es un JSON válido.
+    """
+    mensaje_usuario = (mensaje_usuario or "").strip().lower()
+    if not mensaje_usuario:
+        return None
+    clave = _clave(mensaje_original or mensaje_usuario)
+
+    cacheado = analisis_en_cache(session, clave)
+    if cacheado is not None:
+        return cacheado
+
+    raw = await generar_respuesta_con_openai_async(
+        _prompt_analisis(mensaje_usuario),
+        model="gpt-3.5-turbo", temperature=0.0, max_tokens=MAX_TOKENS_ANALISIS, reintentos=1,
+        familia="analisis_turno",
+    )
+    resultado = parsear_analisis(raw)
+    if resultado is None:
+        print("⚠️ Analizador de turno: respuesta inválida o vacía; se usan los clasificadores individuales")
+        return None
+
+    if isinstance(session, dict):
+        session[CLAVE_SESION] = {"mensaje": clave, "resultado": resultado}
+    return resultado
+
+
+def hay_riesgo(analisis: dict | None) -> bool:
+    """True si el análisis marcó alguna bandera de riesgo (ideación suicida, autolesión, violencia)."""
+    riesgo = (analisis or {}).get("riesgo") or {}
+    return any(riesgo.get(k) for k in BANDERAS_RIESGO)
+
+
+def a_intencion_bifurcada(analisis: dict) -> dict:
+    """Proyección al formato que devolvía detectar_intencion_bifurcada()."""
+    return {
+        "intencion_general": analisis.get("intencion_general", "INDEFINIDA"),
+        "temas_administrativos": list(analisis.get("temas_administrativos") or []),
+        "emociones_detectadas": list(analisis.get("emociones") or []),
+    }
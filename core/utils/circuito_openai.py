@@ -0,0 +1,222 @@
+# core/utils/circuito_openai.py
+"""
+Circuit breaker, timeout adaptativo y presupuesto de reintentos por turno
+para el backend de OpenAI.
+
+Durante un brownout de OpenAI, cada llamada esperaba el timeout fijo
+(OPENAI_TIMEOUT, 12 s) hasta 3 veces, y _ask_openai_emociones_y_cuadro la
+envolvía en un loop de 3 prompts: un solo turno podía bloquearse más de un
+minuto. Acá:
+
+- CircuitoLLM (cerrado / abierto / semiabierto): ventana móvil de
+  CIRCUITO_VENTANA_SEG con los resultados de las llamadas. Con al menos
+  CIRCUITO_MIN_LLAMADAS y una tasa de error ≥ CIRCUITO_UMBRAL_ERROR, se
+  abre: las llamadas vuelven None al instante (los llamadores ya caen a sus
+  respuestas de respaldo, p. ej. _fallback_clinico). Pasados
+  CIRCUITO_ENFRIAMIENTO_SEG deja pasar CIRCUITO_SONDAS llamadas de prueba;
+  si salen bien se cierra, si no, vuelve a abrirse.
+- Timeout adaptativo: p95 de las latencias recientes × CIRCUITO_FACTOR_TIMEOUT,
+  por tramo de max_tokens (no tarda lo mismo un rótulo de 16 tokens que una
+  respuesta de 400), acotado entre OPENAI_TIMEOUT_MIN y el timeout pedido.
+- Presupuesto de reintentos por turno (ContextVar): /asistente lo abre con
+  LLM_REINTENTOS_POR_TURNO y todos los reintentos del turno (hilos
+  incluidos: asyncio.to_thread copia el contexto) lo consumen. Fuera de un
+  turno rige solo el `reintentos` de cada llamada.
+"""
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+VENTANA_SEG = float(os.getenv("CIRCUITO_VENTANA_SEG", "30"))
+MIN_LLAMADAS = int(os.getenv("CIRCUITO_MIN_LLAMADAS", "8"))
+UMBRAL_ERROR = float(os.getenv("CIRCUITO_UMBRAL_ERROR", "0.5"))
+ENFRIAMIENTO_SEG = float(os.getenv("CIRCUITO_ENFRIAMIENTO_SEG", "15"))
+SONDAS = int(os.getenv("CIRCUITO_SONDAS", "1"))
+
+TIMEOUT_MIN = float(os.getenv("OPENAI_TIMEOUT_MIN", "2"))
+FACTOR_TIMEOUT = float(os.getenv("CIRCUITO_FACTOR_TIMEOUT", "3"))
+MUESTRAS_LATENCIA = 200
+MIN_MUESTRAS_LATENCIA = 20
+
+REINTENTOS_POR_TURNO = int(os.getenv("LLM_REINTENTOS_POR_TURNO", "2"))
+
+CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+
+def _tramo(max_tokens: int) -> str:
+    if max_tokens <= 100:
+        return "corto"
+    if max_tokens <= 400:
+        return "medio"
+    return "largo"
+
+
+def _percentil(valores, p: float) -> float:
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(p * len(orden)))]
+
+
+class CircuitoLLM:
+    """Thread-safe: lo comparten el camino sync (hilos) y el async (event loop)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estado = CERRADO
+        self._resultados: deque = deque()   # (monotonic, ok)
+        self._abierto_desde = 0.0
+        self._sondas_en_vuelo = 0
+        self._latencias: dict[str, deque] = {}
+
+        # Métricas
+        self.aperturas = 0
+        self.rechazadas = 0
+        self.ultima_apertura: float | None = None
+
+    # ---------------- estado ----------------
+    def _podar(self, ahora: float) -> None:
+        while self._resultados and self._resultados[0][0] < ahora - VENTANA_SEG:
+            self._resultados.popleft()
+
+    def _abrir(self, ahora: float) -> None:
+        self._estado = ABIERTO
+        self._abierto_desde = ahora
+        self._sondas_en_vuelo = 0
+        self.aperturas += 1
+        self.ultima_apertura = time.time()
+        print(f"🔌 Circuito OpenAI ABIERTO: se responde con fallback durante {ENFRIAMIENTO_SEG:.0f}s")
+
+    def abierto(self) -> bool:
+        """True si ahora mismo una llamada sería rechazada (sin consumir una sonda)."""
+        with self._lock:
+            if self._estado == ABIERTO:
+                return time.monotonic() - self._abierto_desde < ENFRIAMIENTO_SEG
+            if self._estado == SEMIABIERTO:
+                return self._sondas_en_vuelo >= SONDAS
+            return False
+
+    def permitir(self) -> bool:
+        """¿Se puede llamar a OpenAI? En semiabierto reserva una sonda (hay que informar el resultado)."""
+        with self._lock:
+            if self._estado == ABIERTO and time.monotonic() - self._abierto_desde >= ENFRIAMIENTO_SEG:
+                self._estado = SEMIABIERTO
+            if self._estado == CERRADO:
+                return True
+            if self._estado == SEMIABIERTO and self._sondas_en_vuelo < SONDAS:
+                self._sondas_en_vuelo += 1
+                return True
+            self.rechazadas += 1
+            return False
+
+    def registrar(self, ok: bool, latencia: float | None = None, max_tokens: int = 200) -> None:
+        ahora = time.monotonic()
+        with self._lock:
+            if ok and latencia is not None:
+                muestras = self._latencias.setdefault(_tramo(max_tokens), deque(maxlen=MUESTRAS_LATENCIA))
+                muestras.append(latencia)
+
+            if self._estado == SEMIABIERTO:
+                self._sondas_en_vuelo = max(0, self._sondas_en_vuelo - 1)
+                if ok:
+                    self._estado = CERRADO
+                    self._resultados.clear()
+                    print("🔌 Circuito OpenAI CERRADO: la sonda respondió")
+                else:
+                    self._abrir(ahora)
+                return
+            if self._estado == ABIERTO:
+                return   # resultado de una llamada que salió antes de abrir
+
+            self._resultados.append((ahora, ok))
+            self._podar(ahora)
+            total = len(self._resultados)
+            if total >= MIN_LLAMADAS:
+                errores = sum(1 for _, r in self._resultados if not r)
+                if errores / total >= UMBRAL_ERROR:
+                    self._abrir(ahora)
+
+    def liberar_sonda(self) -> None:
+        """La llamada se canceló sin resultado: en semiabierto, devuelve la sonda reservada."""
+        with self._lock:
+            if self._estado == SEMIABIERTO:
+                self._sondas_en_vuelo = max(0, self._sondas_en_vuelo - 1)
+
+    # ---------------- timeout adaptativo ----------------
+    def timeout_para(self, pedido: float, max_tokens: int) -> float:
+        """p95 × FACTOR_TIMEOUT del tramo, entre TIMEOUT_MIN y el timeout pedido."""
+        with self._lock:
+            muestras = self._latencias.get(_tramo(max_tokens))
+            if not muestras or len(muestras) < MIN_MUESTRAS_LATENCIA:
+                return pedido
+            p95 = _percentil(muestras, 0.95)
+        return min(pedido, max(TIMEOUT_MIN, p95 * FACTOR_TIMEOUT))
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            self._podar(time.monotonic())
+            total = len(self._resultados)
+            errores = sum(1 for _, r in self._resultados if not r)
+            latencias = {
+                tramo: {
+                    "muestras": len(m),
+                    "p50_ms": round(_percentil(m, 0.5) * 1000, 1),
+                    "p95_ms": round(_percentil(m, 0.95) * 1000, 1),
+                }
+                for tramo, m in self._latencias.items() if m
+            }
+            return {
+                "estado": self._estado,
+                "ventana_llamadas": total,
+                "ventana_tasa_error": round(errores / total, 3) if total else 0.0,
+                "aperturas": self.aperturas,
+                "rechazadas": self.rechazadas,
+                "ultima_apertura": self.ultima_apertura,
+                "latencias": latencias,
+            }
+
+
+circuito_llm = CircuitoLLM()
+
+
+def estadisticas_circuito_llm() -> dict:
+    return circuito_llm.estadisticas()
+
+
+# ============================================================
+# Presupuesto de reintentos por turno
+# ============================================================
+class _Presupuesto:
+    __slots__ = ("restantes", "consumidos", "_lock")
+
+    def __init__(self, reintentos: int):
+        self.restantes = reintentos
+        self.consumidos = 0
+        self._lock = threading.Lock()
+
+
+_presupuesto: ContextVar[_Presupuesto | None] = ContextVar("presupuesto_reintentos_llm", default=None)
+
+
+@contextmanager
+def presupuesto_reintentos(reintentos: int = REINTENTOS_POR_TURNO):
+    """`with presupuesto_reintentos():` — todos los reintentos LLM del bloque comparten el cupo."""
+    token = _presupuesto.set(_Presupuesto(reintentos))
+    try:
+        yield
+    finally:
+        _presupuesto.reset(token)
+
+
+def consumir_reintento() -> bool:
+    """True si queda cupo para reintentar (sin presupuesto de turno activo, siempre True)."""
+    p = _presupuesto.get()
+    if p is None:
+        return True
+    with p._lock:
+        if p.restantes <= 0:
+            return False
+        p.restantes -= 1
+        p.consumidos += 1
+        return True
@@ -0,0 +1,199 @@
+# core/utils/etiquetado_cuadros.py
+"""
+Rotulado emoción → cuadro clínico probable, en lote y memoizado.
+
+obtener_cuadro_por_emociones rotulaba cada emoción de sesión ∪ historial por
+separado (clasificar_cuadro_clinico y, si fallaba, una llamada al modelo por
+emoción): un usuario con 20 emociones históricas podía pagar 20 viajes de
+red secuenciales en un turno. Ahora etiquetar_emociones() resuelve todas
+juntas, en este orden:
+
+  1) memo en memoria del proceso (tope ETIQUETAS_MEMO_MAX),
+  2) rótulo local CUADRO_POR_EMOCION (sin red),
+  3) memo persistente etiqueta_emocion_cuadro (UNA consulta para todas),
+  4) UN pedido al modelo con todas las que faltan (JSON emoción → rótulo,
+     de a ETIQUETADO_LOTE_MAX), cuyo resultado se guarda en la tabla.
+
+Cada término distinto pasa por el modelo una sola vez entre todos los
+usuarios. Si el modelo falla, omite términos o los rotula "indeterminado"
+(o con un rótulo genérico), esos NO se guardan: quedan "indeterminado" en
+este turno y no se reintentan en este proceso durante ETIQUETADO_REINTENTO_SEG.
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from core.db.etiquetas_cuadro import buscar_etiquetas, guardar_etiquetas
+from core.utils.generador_openai import generar_respuesta_con_openai
+from core.utils.modulo_clinico import CUADRO_POR_EMOCION
+
+logger = logging.getLogger(__name__)
+
+INDETERMINADO = "indeterminado"
+MODELO_ETIQUETADO = os.getenv("ETIQUETADO_MODELO", "gpt-3.5-turbo")
+LOTE_MAX = int(os.getenv("ETIQUETADO_LOTE_MAX", "40"))
+MEMO_MAX = int(os.getenv("ETIQUETAS_MEMO_MAX", "5000"))
+REINTENTO_SEG = float(os.getenv("ETIQUETADO_REINTENTO_SEG", "600"))
+
+# Rótulos genéricos que no aportan valor clínico
+PROHIBIDOS = {
+    "patrón emocional", "patron emocional",
+    "patrón emocional detectado", "patron emocional detectado",
+    "patrón detectado", "patron detectado",
+    "estado emocional", "estado emocional inespecífico",
+    "label inválida", "label invalida",
+}
+
+
+def limpiar_rotulo(s: str) -> str:
+    """Primera línea, sin bullets/comillas/cierres; INDETERMINADO si queda vacío, largo o genérico."""
+    s = (s or "").strip()
+    s = s.splitlines()[0] if s else ""
+    s = re.sub(r'^[\-\*\•\·\s"]+', "", s)
+    s = s.rstrip('".!;:').strip()
+    norm = s.lower()
+    if not norm or len(norm) > 60 or any(p in norm for p in PROHIBIDOS):
+        return INDETERMINADO
+    return s
+
+
+def _normalizar(emocion) -> str:
+    return emocion.strip().lower() if isinstance(emocion, str) else ""
+
+
+_lock = threading.Lock()
+_memo: OrderedDict[str, str] = OrderedDict()
+_sin_rotulo: dict[str, float] = {}   # emocion -> monotonic hasta el que no se reintenta
+_metricas = {
+    "memo": 0, "local": 0, "db": 0, "modelo": 0, "indeterminadas": 0,
+    "llamadas_modelo": 0, "fallos_modelo": 0, "ms_modelo_total": 0.0,
+}
+
+
+def _recordar(etiquetas: dict[str, str]) -> None:
+    with _lock:
+        for e, c in etiquetas.items():
+            _memo[e] = c
+            _memo.move_to_end(e)
+        while len(_memo) > MEMO_MAX:
+            _memo.popitem(last=False)
+
+
+def _prompt_lote(emociones: list[str]) -> str:
+    return (
+        "Actuá como psicólogo clínico actualizado (DSM-5-TR). Para CADA emoción o "
+        "síntoma de la lista, dame UN rótulo clínico orientativo, breve (1-4 palabras), "
+        "prudente (no diagnóstico cerrado), en español rioplatense. Ejemplos de formato: "
+        "'ansiedad generalizada', 'episodio depresivo', 'insomnio de conciliación', "
+        "'estrés crónico', 'aislamiento social'. Si no alcanza la info, usá 'indeterminado'.\n"
+        "Respondé SOLO un objeto JSON cuyas claves sean exactamente los términos de la "
+        "lista y cuyos valores sean los rótulos.\n\n"
+        f"Lista: {json.dumps(emociones, ensure_ascii=False)}"
+    )
+
+
+def _parsear_lote(texto: str | None, pedidas: list[str]) -> dict[str, str]:
+    """{emocion: rótulo limpio} para las pedidas que vinieron con un rótulo útil (sin INDETERMINADO)."""
+    m = re.search(r"\{.*\}", texto or "", re.S)
+    if not m:
+        return {}
+    try:
+        crudo = json.loads(m.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(crudo, dict):
+        return {}
+    recibidas = {_normalizar(k): v for k, v in crudo.items() if isinstance(v, str)}
+    rotuladas = {e: limpiar_rotulo(recibidas[e]) for e in pedidas if e in recibidas}
+    # "indeterminado" (del modelo o por rótulo genérico) no se memoriza: pasa al back-off de _sin_rotulo
+    return {e: c for e, c in rotuladas.items() if c.strip().lower() != INDETERMINADO}
+
+
+def _rotular_con_modelo(emociones: list[str]) -> dict[str, str]:
+    """Un pedido por lote de LOTE_MAX; guarda en la tabla lo que el modelo rotuló."""
+    rotuladas: dict[str, str] = {}
+    for i in range(0, len(emociones), LOTE_MAX):
+        lote = emociones[i:i + LOTE_MAX]
+        t0 = time.perf_counter()
+        try:
+            texto = generar_respuesta_con_openai(
+                _prompt_lote(lote), model=MODELO_ETIQUETADO, temperature=0.0,
+                max_tokens=min(40 + 16 * len(lote), 1200), reintentos=0, familia="cuadro_clinico",
+            )
+            nuevas = _parsear_lote(texto, lote)
+        except Exception as e:
+            print(f"⚠️ Error en el rotulado por lote de emociones: {e}")
+            nuevas = {}
+        with _lock:
+            _metricas["llamadas_modelo"] += 1
+            _metricas["ms_modelo_total"] += (time.perf_counter() - t0) * 1000
+            if not nuevas:
+                _metricas["fallos_modelo"] += 1
+        if nuevas:
+            guardar_etiquetas(nuevas, fuente="openai", modelo=MODELO_ETIQUETADO)
+            rotuladas.update(nuevas)
+    return rotuladas
+
+
+def etiquetar_emociones(emociones) -> dict[str, str]:
+    """
+    {emocion normalizada: rótulo} para todas las emociones recibidas (sin
+    repetir). Nunca lanza: lo que no se pudo rotular queda INDETERMINADO.
+    """
+    pendientes = list(dict.fromkeys(e for e in map(_normalizar, emociones or []) if e))
+    if not pendientes:
+        return {}
+
+    resultado: dict[str, str] = {}
+    ahora = time.monotonic()
+    with _lock:
+        faltan = []
+        for e in pendientes:
+            if e in _memo:
+                resultado[e] = _memo[e]
+                _memo.move_to_end(e)
+                _metricas["memo"] += 1
+            elif _sin_rotulo.get(e, 0.0) > ahora:
+                resultado[e] = INDETERMINADO
+            else:
+                faltan.append(e)
+
+    locales = {e: CUADRO_POR_EMOCION[e] for e in faltan if e in CUADRO_POR_EMOCION}
+    faltan = [e for e in faltan if e not in locales]
+
+    persistidas = buscar_etiquetas(faltan) if faltan else {}
+    faltan = [e for e in faltan if e not in persistidas]
+
+    del_modelo = _rotular_con_modelo(faltan) if faltan else {}
+    sin_rotulo = [e for e in faltan if e not in del_modelo]
+
+    _recordar({**locales, **persistidas, **del_modelo})
+    with _lock:
+        _metricas["local"] += len(locales)
+        _metricas["db"] += len(persistidas)
+        _metricas["modelo"] += len(del_modelo)
+        _metricas["indeterminadas"] += len(sin_rotulo)
+        for e in sin_rotulo:
+            _sin_rotulo[e] = ahora + REINTENTO_SEG
+        if len(_sin_rotulo) > MEMO_MAX:
+            for e in [e for e, hasta in _sin_rotulo.items() if hasta <= ahora]:
+                del _sin_rotulo[e]
+
+    resultado.update(locales)
+    resultado.update(persistidas)
+    resultado.update(del_modelo)
+    resultado.update(dict.fromkeys(sin_rotulo, INDETERMINADO))
+    return resultado
+
+
+def estadisticas_etiquetado() -> dict:
+    with _lock:
+        m = dict(_metricas)
+        m["memo_tamano"] = len(_memo)
+        m["sin_rotulo_en_espera"] = len(_sin_rotulo)
+    m["ms_modelo_medio"] = round(m.pop("ms_modelo_total") / m["llamadas_modelo"], 1) if m["llamadas_modelo"] else 0.0
+    return m
@@ -1,11 +1,488 @@
 # core/utils/generador_openai.py
 import os
+import json
 import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import openai
+import requests
+from requests.adapters import HTTPAdapter
 from typing import Optional
 
+from core.utils.circuito_openai import circuito_llm, consumir_reintento
+from core.plazo import restante, recortar, registrar_llm_omitida, MIN_LLM_SEG
+
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# --- Tuning del cliente HTTP hacia OpenAI ---
+MODELO_POR_DEFECTO = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT", "12"))
+RETRIES = 2
+MAX_CONCURRENCIA = int(os.getenv("OPENAI_MAX_CONCURRENCIA", "8"))   # llamadas async simultáneas por worker
+HTTP_POOL = int(os.getenv("OPENAI_HTTP_POOL", "20"))                # conexiones keep-alive por worker
+HTTP_KEEPALIVE_SEG = float(os.getenv("OPENAI_HTTP_KEEPALIVE", "60"))
+
+
+# ============================================================
+# Pools HTTP persistentes (sync: requests / async: aiohttp)
+# ============================================================
+class _SesionCompartida(requests.Session):
+    """
+    El SDK 0.28 cierra la sesión de cada hilo cada 180 s; como esta es compartida
+    por todos los hilos, ese close() se ignora para no tirar el pool keep-alive.
+    """
+
+    def close(self):
+        pass
+
+    def cerrar(self):
+        super().close()
+
+
+_requests_session: _SesionCompartida | None = None
+_requests_lock = threading.Lock()
+
+
+def _sesion_sync() -> requests.Session:
+    """Sesión requests compartida entre hilos (keep-alive + pool de HTTP_POOL conexiones)."""
+    global _requests_session
+    if _requests_session is None:
+        with _requests_lock:
+            if _requests_session is None:
+                s = _SesionCompartida()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _requests_session = s
+    return _requests_session
+
+
+# El SDK 0.28 acepta una sesión propia para las llamadas sync
+openai.requestssession = _sesion_sync
+
+
+class _ClienteAsync:
+    """
+    Estado async atado a un event loop: ClientSession aiohttp (keep-alive) + semáforo
+    de concurrencia. Se recrea si cambia el loop (tests, reinicios de uvicorn).
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        import aiohttp  # dependencia del SDK openai 0.28
+
+        self.loop = loop
+        self.sesion = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL, keepalive_timeout=HTTP_KEEPALIVE_SEG)
+        )
+        self.semaforo = asyncio.Semaphore(MAX_CONCURRENCIA)
+
+
+_cliente_async: _ClienteAsync | None = None
+
+
+def _obtener_cliente_async() -> _ClienteAsync:
+    global _cliente_async
+    loop = asyncio.get_running_loop()
+    if _cliente_async is None or _cliente_async.loop is not loop or _cliente_async.sesion.closed:
+        _cliente_async = _ClienteAsync(loop)
+    return _cliente_async
+
+
+async def cerrar_cliente_openai() -> None:
+    """Cierra las sesiones HTTP (aiohttp y requests) — llamar en el shutdown de la app."""
+    global _cliente_async, _requests_session
+    if _cliente_async is not None and not _cliente_async.sesion.closed:
+        await _cliente_async.sesion.close()
+    _cliente_async = None
+    if _requests_session is not None:
+        _requests_session.cerrar()
+        _requests_session = None
+
+
+def _url_base_openai() -> str:
+    return (getattr(openai, "api_base", None) or "https://api.openai.com/v1").rstrip("/") + "/models"
+
+
+def precalentar_cliente_openai(timeout: float = 3.0) -> bool:
+    """
+    Abre (DNS + TCP + TLS) una conexión keep-alive del pool sync hacia OpenAI,
+    así la primera llamada real no paga el handshake. La respuesta no importa.
+    """
+    try:
+        _sesion_sync().head(_url_base_openai(), timeout=timeout)
+        return True
+    except Exception as e:
+        print(f"⚠️ Precalentamiento HTTP sync de OpenAI falló: {e}")
+        return False
+
+
+async def precalentar_cliente_openai_async(timeout: float = 3.0) -> bool:
+    """Igual que precalentar_cliente_openai(), para la ClientSession aiohttp del event loop actual."""
+    try:
+        import aiohttp
+
+        cliente = _obtener_cliente_async()
+        async with cliente.sesion.head(_url_base_openai(), timeout=aiohttp.ClientTimeout(total=timeout)):
+            pass
+        return True
+    except Exception as e:
+        print(f"⚠️ Precalentamiento HTTP async de OpenAI falló: {e}")
+        return False
+
+
+# ============================================================
+# Cache de respuestas (direccionado por contenido)
+# ============================================================
+# Solo para llamadas deterministas (temperature == 0) que declaran su `familia` de prompt
+# (clasificadores/extractores): clave = (modelo, prompt normalizado, temperatura, max_tokens).
+# Nivel 1 en memoria (LRU), nivel 2 opcional en disco (SQLite).
+CACHE_MAX_ENTRADAS = int(os.getenv("OPENAI_CACHE_MAX", "2000"))
+CACHE_DIR = os.getenv("OPENAI_CACHE_DIR")            # si no está seteada, no hay nivel en disco
+CACHE_TTL_DEFAULT = float(os.getenv("OPENAI_CACHE_TTL", "600"))  # familias no listadas abajo
+
+# TTL (seg.) por familia de prompt; 0 = no cachear esa familia
+TTL_POR_FAMILIA = {
+    "tema_administrativo": 24 * 3600,
+    "cuadro_clinico": 24 * 3600,
+    "intencion": 6 * 3600,
+    "contextual": 6 * 3600,
+    "analisis_turno": 6 * 3600,
+    "emociones_cuadro": 6 * 3600,
+    "emociones_negativas": 6 * 3600,
+    "evaluacion": 0,   # temperature 0.2: nunca entra igual, se deja explícito
+}
+
+
+def _normalizar_prompt(prompt: str) -> str:
+    texto = unicodedata.normalize("NFC", prompt or "")
+    return " ".join(texto.split())
+
+
+def clave_cache(prompt: str, modelo: str, temp: float, max_tokens: int) -> str:
+    crudo = json.dumps([modelo, _normalizar_prompt(prompt), round(float(temp), 3), int(max_tokens)],
+                       ensure_ascii=False)
+    return hashlib.sha256(crudo.encode("utf-8")).hexdigest()
+
+
+class CacheLLM:
+    """
+    LRU en memoria con TTL por entrada + nivel opcional en disco (SQLite, stdlib).
+    Thread-safe: lo comparten el camino sync (hilos) y el async (event loop).
+    """
+
+    def __init__(self, max_entradas: int = CACHE_MAX_ENTRADAS, directorio: str | None = CACHE_DIR):
+        self.max_entradas = max(1, max_entradas)
+        self._lock = threading.Lock()
+        self._memoria: OrderedDict = OrderedDict()   # clave -> (valor, expira_en)
+        self._ruta_disco = None
+        if directorio:
+            try:
+                os.makedirs(directorio, exist_ok=True)
+                self._ruta_disco = os.path.join(directorio, "llm_cache.sqlite3")
+                with self._conectar_disco() as db:
+                    db.execute(
+                        "CREATE TABLE IF NOT EXISTS llm_cache ("
+                        " clave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira_en REAL NOT NULL)"
+                    )
+            except Exception as e:
+                print(f"⚠️ Cache LLM en disco deshabilitada: {e}")
+                self._ruta_disco = None
+
+        # Métricas
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.bypass = 0
+        self.expirados = 0
+        self.desalojos = 0
+
+    def _conectar_disco(self):
+        return sqlite3.connect(self._ruta_disco, timeout=1.0)
+
+    @property
+    def tiene_disco(self) -> bool:
+        return self._ruta_disco is not None
+
+    def obtener_memoria(self, clave: str) -> str | None:
+        ahora = time.time()
+        with self._lock:
+            item = self._memoria.get(clave)
+            if item is None:
+                return None
+            valor, expira_en = item
+            if expira_en <= ahora:
+                del self._memoria[clave]
+                self.expirados += 1
+                return None
+            self._memoria.move_to_end(clave)
+            self.hits_memoria += 1
+            return valor
+
+    def obtener_disco(self, clave: str) -> str | None:
+        """Bloqueante (SQLite): desde async llamarlo vía asyncio.to_thread."""
+        if not self._ruta_disco:
+            return None
+        ahora = time.time()
+        try:
+            with self._conectar_disco() as db:
+                fila = db.execute(
+                    "SELECT valor, expira_en FROM llm_cache WHERE clave = ?", (clave,)
+                ).fetchone()
+                if fila and fila[1] <= ahora:
+                    db.execute("DELETE FROM llm_cache WHERE clave = ?", (clave,))
+                    fila = None
+        except Exception as e:
+            print(f"⚠️ Cache LLM (disco) lectura falló: {e}")
+            return None
+        if not fila:
+            return None
+        valor, expira_en = fila
+        self._guardar_memoria(clave, valor, expira_en)   # promoción a memoria
+        with self._lock:
+            self.hits_disco += 1
+        return valor
+
+    def _guardar_memoria(self, clave: str, valor: str, expira_en: float) -> None:
+        with self._lock:
+            self._memoria[clave] = (valor, expira_en)
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_entradas:
+                self._memoria.popitem(last=False)
+                self.desalojos += 1
+
+    def guardar(self, clave: str, valor: str, ttl: float) -> None:
+        """Guarda en memoria y (si está habilitado) en disco. El disco es bloqueante."""
+        expira_en = time.time() + ttl
+        self._guardar_memoria(clave, valor, expira_en)
+        if self._ruta_disco:
+            try:
+                with self._conectar_disco() as db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO llm_cache (clave, valor, expira_en) VALUES (?, ?, ?)",
+                        (clave, valor, expira_en),
+                    )
+            except Exception as e:
+                print(f"⚠️ Cache LLM (disco) escritura falló: {e}")
+
+    def registrar_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def registrar_bypass(self) -> None:
+        with self._lock:
+            self.bypass += 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            hits = self.hits_memoria + self.hits_disco
+            consultas = hits + self.misses
+            return {
+                "entradas_memoria": len(self._memoria),
+                "max_entradas": self.max_entradas,
+                "disco": self.tiene_disco,
+                "hits_memoria": self.hits_memoria,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "bypass": self.bypass,
+                "expirados": self.expirados,
+                "desalojos": self.desalojos,
+                "hit_rate": round(hits / consultas, 3) if consultas else 0.0,
+            }
+
+
+cache_llm = CacheLLM()
+
+
+def estadisticas_cache_llm() -> dict:
+    """Hits/misses de la cache de respuestas de OpenAI (para /health)."""
+    return cache_llm.estadisticas()
+
+
+def _ttl_cache(familia: str | None, temp: float, usar_cache: bool) -> float:
+    """TTL a aplicar; 0 = no cachear (sin familia, temperature > 0, cache=False o familia deshabilitada)."""
+    if not usar_cache or familia is None or temp != 0.0:
+        return 0.0
+    return float(TTL_POR_FAMILIA.get(familia, CACHE_TTL_DEFAULT))
+
+
+# ============================================================
+# Single-flight: un solo pedido en vuelo por prompt idéntico
+# ============================================================
+# Con tráfico en ráfaga ("hola", "precio"), muchos turnos arman a la vez el mismo
+# prompt determinista: la cache no ayuda porque ninguno terminó todavía. El primero
+# (líder) llama a OpenAI; los que llegan mientras tanto con la misma clave
+# (modelo, prompt, temperatura, max_tokens) esperan su resultado. Sirve para hilos
+# (camino sync) y para el event loop (camino async): el vuelo es un
+# concurrent.futures.Future que ambos saben esperar.
+COALESCER = os.getenv("OPENAI_COALESCER", "1").strip().lower() not in ("0", "false", "no")
+
+_SIN_RESULTADO = object()   # el líder se canceló: cada seguidor llama por su cuenta
+
+
+class VuelosLLM:
+    """Registro de llamadas en vuelo por clave + métricas de coalescencia."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo: dict[str, tuple[Future, list]] = {}   # clave -> (future, [seguidores])
+        self.lideres = 0
+        self.coalescidas = 0
+        self.rescatadas = 0          # seguidores que terminaron llamando solos (timeout / líder cancelado)
+        self.max_seguidores = 0
+
+    def unirse(self, clave: str) -> tuple[Future, bool]:
+        """(future, es_lider). El líder DEBE llamar a resolver() pase lo que pase."""
+        with self._lock:
+            vuelo = self._en_vuelo.get(clave)
+            if vuelo is not None:
+                vuelo[1][0] += 1
+                self.coalescidas += 1
+                self.max_seguidores = max(self.max_seguidores, vuelo[1][0])
+                return vuelo[0], False
+            fut = Future()
+            self._en_vuelo[clave] = (fut, [0])
+            self.lideres += 1
+            return fut, True
+
+    def resolver(self, clave: str, fut: Future, valor) -> None:
+        with self._lock:
+            vuelo = self._en_vuelo.get(clave)
+            if vuelo is not None and vuelo[0] is fut:
+                del self._en_vuelo[clave]
+        if not fut.done():
+            fut.set_result(valor)
+
+    def registrar_rescate(self) -> None:
+        with self._lock:
+            self.rescatadas += 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            llamadas = self.lideres + self.coalescidas
+            return {
+                "activo": COALESCER,
+                "en_vuelo": len(self._en_vuelo),
+                "lideres": self.lideres,
+                "coalescidas": self.coalescidas,
+                "rescatadas": self.rescatadas,
+                "max_seguidores": self.max_seguidores,
+                "ratio_coalescidas": round(self.coalescidas / llamadas, 3) if llamadas else 0.0,
+            }
+
+
+vuelos_llm = VuelosLLM()
+
+
+def estadisticas_coalescer_llm() -> dict:
+    """Llamadas idénticas concurrentes que compartieron un solo pedido a OpenAI (para /health)."""
+    return vuelos_llm.estadisticas()
+
+
+def _clave_vuelo(prompt: str, modelo: str, temp: float, max_tokens: int, clave: str | None) -> str | None:
+    """Solo se coalescen llamadas deterministas (temperature 0): otra muestra no aportaría nada distinto."""
+    if not COALESCER or temp != 0.0:
+        return None
+    return clave or clave_cache(prompt, modelo, temp, max_tokens)
+
+
+def _espera_maxima(timeout: float, reintentos: int) -> float:
+    # Lo que puede tardar el líder (intentos + reintento por length + backoff); después el seguidor llama solo
+    return 2 * timeout * (reintentos + 1) + 0.5 * (2 ** reintentos)
+
+
+# ============================================================
+# Helpers comunes
+# ============================================================
+def _normalizar_temperatura(temperatura: float | None, temperature: float | None) -> float:
+    # Normalización: prioriza 'temperature' si vino, si no usa 'temperatura'
+    if temperature is not None:
+        return float(temperature)
+    if temperatura is not None:
+        return float(temperatura)
+    return 0.0
+
+
+# Errores del pedido (no de salud del backend): no cuentan para abrir el circuito
+_ERRORES_DEL_PEDIDO = tuple(
+    c for c in (
+        getattr(getattr(openai, "error", None), nombre, None)
+        for nombre in ("InvalidRequestError", "AuthenticationError", "PermissionError")
+    ) if isinstance(c, type)
+)
+
+
+def _es_fallo_backend(e: Exception) -> bool:
+    return not isinstance(e, _ERRORES_DEL_PEDIDO)
+
+
+def _sin_tiempo_en_turno(margen: float = 0.0) -> bool:
+    """True si el plazo del turno no deja MIN_LLM_SEG (+ margen) para otra llamada."""
+    r = restante()
+    return r is not None and r < MIN_LLM_SEG + margen
+
+
+def _contenido_y_finish(respuesta) -> tuple[str, Optional[str]]:
+    choice = respuesta.choices[0]
+    contenido = (choice.message.content or "").strip()
+    try:
+        finish = getattr(choice, "finish_reason", None) or choice.get("finish_reason")
+    except Exception:
+        finish = None
+    return contenido, finish
+
+
+def _log_respuesta(contador, contenido) -> None:
+    try:
+        print(f"🧠 OpenAI respondió (contador={contador}) → {contenido}")
+    except Exception:
+        pass
+
+
+def _completar(prompt: str, modelo: str, temp: float, max_tokens: int, timeout: float):
+    return openai.ChatCompletion.create(
+        model=modelo,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temp,
+        max_tokens=max_tokens,
+        n=1,
+        request_timeout=timeout,
+    )
+
+
+async def _completar_async(prompt: str, modelo: str, temp: float, max_tokens: int, timeout: float):
+    """
+    ChatCompletion async sobre la sesión keep-alive compartida.
+    - El semáforo acota las llamadas simultáneas del worker.
+    - `timeout` es un deadline duro (incluye la espera del semáforo).
+    """
+    cliente = _obtener_cliente_async()
+
+    async def _llamar():
+        async with cliente.semaforo:
+            token = openai.aiosession.set(cliente.sesion)
+            try:
+                return await openai.ChatCompletion.acreate(
+                    model=modelo,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temp,
+                    max_tokens=max_tokens,
+                    n=1,
+                    request_timeout=timeout,
+                )
+            finally:
+                openai.aiosession.reset(token)
+
+    return await asyncio.wait_for(_llamar(), timeout=timeout)
+
+
+# ============================================================
+# API pública
+# ============================================================
 def generar_respuesta_con_openai(
     prompt: str,
     contador: int | None = None,
@@ -16,70 +493,234 @@ def generar_respuesta_con_openai(
     temperatura: float | None = None,
     temperature: float | None = None,
     max_tokens: int | None = None,
+    model: str | None = None,
+    timeout: float | None = None,
+    reintentos: int | None = None,
+    familia: str | None = None,
+    cache: bool = True,
     **kwargs,
 ) -> str | None:
     """
     Wrapper estable para ChatCompletion, tolerante a:
     - 'temperatura' (ES) o 'temperature' (EN)
-    - 'max_tokens'
+    - 'max_tokens', 'model', 'timeout' (seg.) y 'reintentos'
+    - 'familia' (TTL de cache por tipo de prompt) y 'cache' (False = no usar cache)
     - kwargs extra (ignorados)
+    Con temperature 0 y 'familia' declarada, la respuesta se cachea por contenido (ver CacheLLM).
+    Con temperature 0, las llamadas idénticas concurrentes comparten un solo pedido (ver VuelosLLM).
     """
-    modelo = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    modelo = model or MODELO_POR_DEFECTO
+    temp = _normalizar_temperatura(temperatura, temperature)
+    max_tokens_primario = 200 if max_tokens is None else int(max_tokens)
+    max_tokens_fallback = max(400, max_tokens_primario)
+    timeout = TIMEOUT_SECONDS if timeout is None else float(timeout)
+    reintentos = RETRIES if reintentos is None else int(reintentos)
 
-    # Normalización: prioriza 'temperature' si vino, si no usa 'temperatura'
-    temp = 0.0
-    if temperature is not None:
-        temp = float(temperature)
-    elif temperatura is not None:
-        temp = float(temperatura)
+    ttl = _ttl_cache(familia, temp, cache)
+    clave = None
+    if ttl > 0:
+        clave = clave_cache(prompt, modelo, temp, max_tokens_primario)
+        cacheada = cache_llm.obtener_memoria(clave) or cache_llm.obtener_disco(clave)
+        if cacheada is not None:
+            return cacheada
+        cache_llm.registrar_miss()
+    else:
+        cache_llm.registrar_bypass()
 
-    MAX_TOKENS_PRIMARY = 200 if max_tokens is None else int(max_tokens)
-    MAX_TOKENS_FALLBACK = max(400, MAX_TOKENS_PRIMARY)
-    TIMEOUT_SECONDS = 12
-    RETRIES = 2
+    args = (prompt, modelo, temp, max_tokens_primario, max_tokens_fallback, timeout, reintentos, contador, clave, ttl)
+    clave_vuelo = _clave_vuelo(prompt, modelo, temp, max_tokens_primario, clave)
+    if clave_vuelo is None:
+        return _llamar_openai(*args)
 
-    for intento in range(RETRIES + 1):
+    fut, lider = vuelos_llm.unirse(clave_vuelo)
+    if not lider:
         try:
-            respuesta = openai.ChatCompletion.create(
-                model=modelo,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temp,
-                max_tokens=MAX_TOKENS_PRIMARY,
-                n=1,
-                request_timeout=TIMEOUT_SECONDS,
+            valor = fut.result(timeout=max(0.0, recortar(_espera_maxima(timeout, reintentos))))
+        except FutureTimeoutError:
+            valor = _SIN_RESULTADO
+        if valor is not _SIN_RESULTADO:
+            return valor
+        vuelos_llm.registrar_rescate()
+        return _llamar_openai(*args)
+
+    resultado = _SIN_RESULTADO
+    try:
+        resultado = _llamar_openai(*args)
+        return resultado
+    finally:
+        vuelos_llm.resolver(clave_vuelo, fut, resultado)
+
+
+def _llamar_openai(prompt, modelo, temp, max_tokens_primario, max_tokens_fallback, timeout, reintentos,
+                   contador, clave, ttl) -> str | None:
+    """
+    Intentos con backoff + reintento por length; guarda en cache si corresponde.
+    Pasa por el circuito (None al instante si está abierto), usa su timeout
+    adaptativo y cada reintento consume del presupuesto del turno.
+    """
+    for intento in range(reintentos + 1):
+        if _sin_tiempo_en_turno():
+            registrar_llm_omitida()
+            print("⏱️ Sin tiempo en el plazo del turno: se omite la llamada a OpenAI")
+            return None
+        if not circuito_llm.permitir():
+            print("🔌 Circuito OpenAI abierto: se omite la llamada")
+            return None
+        t0 = time.perf_counter()
+        try:
+            contenido, finish = _contenido_y_finish(
+                _completar(prompt, modelo, temp, max_tokens_primario,
+                           recortar(circuito_llm.timeout_para(timeout, max_tokens_primario)))
             )
-            choice = respuesta.choices[0]
-            contenido = (choice.message.content or "").strip()
+            circuito_llm.registrar(True, time.perf_counter() - t0, max_tokens_primario)
 
-            # Si cortó por tokens, segundo intento con más cupo
-            try:
-                finish = getattr(choice, "finish_reason", None) or choice.get("finish_reason")
-            except Exception:
-                finish = None
-            if finish == "length":
+            # Si cortó por tokens, segundo intento con más cupo (también pasa por el circuito)
+            if finish == "length" and not _sin_tiempo_en_turno() and circuito_llm.permitir():
+                t1 = time.perf_counter()
                 try:
-                    respuesta2 = openai.ChatCompletion.create(
-                        model=modelo,
-                        messages=[{"role": "user", "content": prompt}],
-                        temperature=temp,
-                        max_tokens=MAX_TOKENS_FALLBACK,
-                        n=1,
-                        request_timeout=TIMEOUT_SECONDS,
+                    contenido, _ = _contenido_y_finish(
+                        _completar(prompt, modelo, temp, max_tokens_fallback,
+                                   recortar(circuito_llm.timeout_para(timeout, max_tokens_fallback)))
                     )
-                    contenido = (respuesta2.choices[0].message.content or "").strip()
+                    circuito_llm.registrar(True, time.perf_counter() - t1, max_tokens_fallback)
                 except Exception as e_len:
+                    circuito_llm.registrar(not _es_fallo_backend(e_len))
                     print(f"⚠️ Reintento por length falló: {e_len}")
 
-            try:
-                print(f"🧠 OpenAI respondió (contador={contador}) → {contenido}")
-            except Exception:
-                pass
-
+            _log_respuesta(contador, contenido)
+            if clave and contenido:
+                cache_llm.guardar(clave, contenido, ttl)
             return contenido or None
 
         except Exception as e:
+            circuito_llm.registrar(not _es_fallo_backend(e))
             print(f"⚠️ OpenAI intento {intento + 1} falló: {e}")
-            time.sleep(0.5 * (2 ** intento))
+            backoff = 0.5 * (2 ** intento)
+            if intento >= reintentos or _sin_tiempo_en_turno(backoff) or not consumir_reintento():
+                break
+            time.sleep(backoff)
 
     print("[ERROR OPENAI] agotados intentos")
     return None
+
+
+async def generar_respuesta_con_openai_async(
+    prompt: str,
+    contador: int | None = None,
+    user_id: str | None = None,
+    mensaje_usuario: str | None = None,
+    mensaje_original: str | None = None,
+    temperatura: float | None = None,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    model: str | None = None,
+    timeout: float | None = None,
+    reintentos: int | None = None,
+    familia: str | None = None,
+    cache: bool = True,
+    **kwargs,
+) -> str | None:
+    """
+    Variante async de generar_respuesta_con_openai (misma firma y contrato):
+    pool HTTP keep-alive compartido, backoff no bloqueante (asyncio.sleep),
+    deadline por llamada y concurrencia acotada por OPENAI_MAX_CONCURRENCIA.
+    """
+    modelo = model or MODELO_POR_DEFECTO
+    temp = _normalizar_temperatura(temperatura, temperature)
+    max_tokens_primario = 200 if max_tokens is None else int(max_tokens)
+    max_tokens_fallback = max(400, max_tokens_primario)
+    timeout = TIMEOUT_SECONDS if timeout is None else float(timeout)
+    reintentos = RETRIES if reintentos is None else int(reintentos)
+
+    ttl = _ttl_cache(familia, temp, cache)
+    clave = None
+    if ttl > 0:
+        clave = clave_cache(prompt, modelo, temp, max_tokens_primario)
+        cacheada = cache_llm.obtener_memoria(clave)
+        if cacheada is None and cache_llm.tiene_disco:
+            cacheada = await asyncio.to_thread(cache_llm.obtener_disco, clave)
+        if cacheada is not None:
+            return cacheada
+        cache_llm.registrar_miss()
+    else:
+        cache_llm.registrar_bypass()
+
+    args = (prompt, modelo, temp, max_tokens_primario, max_tokens_fallback, timeout, reintentos, contador, clave, ttl)
+    clave_vuelo = _clave_vuelo(prompt, modelo, temp, max_tokens_primario, clave)
+    if clave_vuelo is None:
+        return await _llamar_openai_async(*args)
+
+    fut, lider = vuelos_llm.unirse(clave_vuelo)
+    if not lider:
+        try:
+            # shield: si este turno se cancela, no se cancela el vuelo que esperan los demás
+            valor = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(fut)), timeout=max(0.0, recortar(_espera_maxima(timeout, reintentos)))
+            )
+        except asyncio.TimeoutError:
+            valor = _SIN_RESULTADO
+        if valor is not _SIN_RESULTADO:
+            return valor
+        vuelos_llm.registrar_rescate()
+        return await _llamar_openai_async(*args)
+
+    resultado = _SIN_RESULTADO
+    try:
+        resultado = await _llamar_openai_async(*args)
+        return resultado
+    finally:
+        vuelos_llm.resolver(clave_vuelo, fut, resultado)
+
+
+async def _llamar_openai_async(prompt, modelo, temp, max_tokens_primario, max_tokens_fallback, timeout, reintentos,
+                               contador, clave, ttl) -> str | None:
+    """Igual que _llamar_openai(), con backoff no bloqueante y cache en disco vía hilo."""
+    for intento in range(reintentos + 1):
+        if _sin_tiempo_en_turno():
+            registrar_llm_omitida()
+            print("⏱️ Sin tiempo en el plazo del turno: se omite la llamada a OpenAI (async)")
+            return None
+        if not circuito_llm.permitir():
+            print("🔌 Circuito OpenAI abierto: se omite la llamada (async)")
+            return None
+        t0 = time.perf_counter()
+        try:
+            contenido, finish = _contenido_y_finish(
+                await _completar_async(prompt, modelo, temp, max_tokens_primario,
+                                       recortar(circuito_llm.timeout_para(timeout, max_tokens_primario)))
+            )
+            circuito_llm.registrar(True, time.perf_counter() - t0, max_tokens_primario)
+
+            if finish == "length" and not _sin_tiempo_en_turno() and circuito_llm.permitir():
+                t1 = time.perf_counter()
+                try:
+                    contenido, _ = _contenido_y_finish(
+                        await _completar_async(prompt, modelo, temp, max_tokens_fallback,
+                                               recortar(circuito_llm.timeout_para(timeout, max_tokens_fallback)))
+                    )
+                    circuito_llm.registrar(True, time.perf_counter() - t1, max_tokens_fallback)
+                except Exception as e_len:   # CancelledError sigue de largo: el except de abajo libera la sonda
+                    circuito_llm.registrar(not _es_fallo_backend(e_len))
+                    print(f"⚠️ Reintento por length falló: {e_len!r}")
+
+            _log_respuesta(contador, contenido)
+            if clave and contenido:
+                if cache_llm.tiene_disco:
+                    await asyncio.to_thread(cache_llm.guardar, clave, contenido, ttl)
+                else:
+                    cache_llm.guardar(clave, contenido, ttl)
+            return contenido or None
+
+        except asyncio.CancelledError:
+            circuito_llm.liberar_sonda()
+            raise
+        except Exception as e:
+            circuito_llm.registrar(not _es_fallo_backend(e))
+            print(f"⚠️ OpenAI (async) intento {intento + 1} falló: {e!r}")
+            backoff = 0.5 * (2 ** intento)
+            if intento >= reintentos or _sin_tiempo_en_turno(backoff) or not consumir_reintento():
+                break
+            await asyncio.sleep(backoff)
+
+    print("[ERROR OPENAI] agotados intentos (async)")
+    return None
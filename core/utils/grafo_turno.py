@@ -0,0 +1,235 @@
+# core/utils/grafo_turno.py
+"""
+Grafo de dependencias para el enriquecimiento de un turno clínico.
+
+La rama clínica de /asistente encadenaba, uno detrás de otro: memoria
+persistente (dos veces: saludo recurrente y recordatorio), inferencia
+incremental del cuadro (LLM), registro incremental, último registro para el
+contador y, ya dentro de procesar_clinico, la extracción de emociones (LLM),
+el historial, el mapa global emoción→cuadro y la última interacción
+emocional. La latencia del turno era la SUMA de todo eso.
+
+Ahora cada paso es un nodo con sus dependencias explícitas:
+
+    grafo = GrafoTurno("clinico")
+    grafo.lanzar("memoria", verificar_memoria_persistente_async, user_id)
+    grafo.lanzar("registro", _registrar, depende=("cuadro",))
+    memoria = await grafo.resultado("memoria")
+
+Cada nodo es una tarea de asyncio que espera a sus dependencias y después
+corre; los independientes corren en paralelo, y la latencia pasa a ser la
+del camino crítico. El contexto del turno (plazo, presupuesto de reintentos)
+llega a los nodos porque las tareas copian los contextvars.
+
+Los nodos que escriben se lanzan con `cancelable=False`: cerrar() no los
+cancela (una salida temprana del turno no pierde la escritura) y terminar()
+los espera antes de cerrar.
+
+Al cerrar, se registran los ms de cada nodo (relativos al inicio del grafo)
+y el camino crítico (la cadena de dependencias que terminó última); el
+acumulado se expone en /health.
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+MUESTRAS = 500
+
+# Referencias fuertes a nodos no cancelables que siguen corriendo tras cerrar el grafo
+_en_curso: set[asyncio.Task] = set()
+
+
+def _percentil(valores, p: float) -> float:
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(p * len(orden)))]
+
+
+class GrafoTurno:
+    """Nodos async con dependencias; vive lo que dura un turno (no es thread-safe: solo el event loop)."""
+
+    def __init__(self, nombre: str = "turno"):
+        self.nombre = nombre
+        self._t0 = time.perf_counter()
+        self._tareas: dict[str, asyncio.Task] = {}
+        self._depende: dict[str, tuple] = {}
+        self._tiempos: dict[str, dict] = {}
+        self._resumen: dict | None = None
+        self._no_cancelables: set[str] = set()
+
+    def _ms(self) -> float:
+        return round((time.perf_counter() - self._t0) * 1000, 1)
+
+    def lanzar(self, nombre: str, fn, *args, depende=(), cancelable: bool = True, **kwargs) -> asyncio.Task:
+        """
+        Programa `await fn(*args, **kwargs)` apenas terminen los nodos de
+        `depende` (los que no se lanzaron se ignoran). `fn` es una función
+        async: para algo bloqueante, pasar asyncio.to_thread o ejecutar_en_hilo_db.
+        `cancelable=False` para escrituras: corre aunque el turno salga antes.
+        """
+        if nombre in self._tareas:
+            raise ValueError(f"Nodo duplicado en el grafo {self.nombre}: {nombre}")
+        deps = tuple(d for d in depende if d in self._tareas)
+        self._depende[nombre] = deps
+        self._tiempos[nombre] = {"lanzado_ms": self._ms()}
+        tarea = asyncio.create_task(self._correr(nombre, deps, fn, args, kwargs), name=f"{self.nombre}:{nombre}")
+        self._tareas[nombre] = tarea
+        if not cancelable:
+            self._no_cancelables.add(nombre)
+            _en_curso.add(tarea)
+            tarea.add_done_callback(_en_curso.discard)
+        return tarea
+
+    async def _correr(self, nombre, deps, fn, args, kwargs):
+        if deps:
+            # asyncio.wait (no gather): si este nodo se cancela, no arrastra a sus dependencias
+            await asyncio.wait([self._tareas[d] for d in deps])
+        tiempos = self._tiempos[nombre]
+        tiempos["inicio_ms"] = self._ms()
+        try:
+            return await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            tiempos["estado"] = "cancelado"
+            raise
+        except Exception:
+            tiempos["estado"] = "error"
+            raise
+        finally:
+            tiempos["fin_ms"] = self._ms()
+            tiempos.setdefault("estado", "ok")
+
+    def lanzado(self, nombre: str) -> bool:
+        return nombre in self._tareas
+
+    async def resultado(self, nombre: str, defecto=None):
+        """Espera el nodo y devuelve su valor; `defecto` si no se lanzó, falló o se canceló."""
+        tarea = self._tareas.get(nombre)
+        if tarea is None:
+            return defecto
+        await asyncio.wait([tarea])
+        if tarea.cancelled():
+            return defecto
+        if tarea.exception() is not None:
+            logger.warning("⚠️ Nodo %s del grafo %s falló: %s", nombre, self.nombre, tarea.exception())
+            return defecto
+        return tarea.result()
+
+    async def resultados(self, claves: dict[str, str]) -> dict:
+        """{clave: valor} de los nodos `claves[clave]` que terminaron bien (los demás se omiten)."""
+        sin_valor = object()
+        salida = {}
+        for clave, nodo in claves.items():
+            valor = await self.resultado(nodo, sin_valor)
+            if valor is not sin_valor:
+                salida[clave] = valor
+        return salida
+
+    def cancelar(self) -> None:
+        """Cancela los nodos pendientes (p. ej. si el turno sale antes por el circuito de OpenAI), salvo las escrituras."""
+        for nombre, tarea in self._tareas.items():
+            if not tarea.done() and nombre not in self._no_cancelables:
+                tarea.cancel()
+
+    async def terminar(self) -> dict:
+        """Espera los nodos no cancelables que sigan pendientes y cierra el grafo."""
+        pendientes = [self._tareas[n] for n in self._no_cancelables if not self._tareas[n].done()]
+        try:
+            if pendientes:
+                await asyncio.wait(pendientes)
+        finally:
+            # Si cancelan la espera, las escrituras siguen solas (_en_curso) y lo demás se cancela igual
+            resumen = self.cerrar()
+        return resumen
+
+    # ---------------- medición ----------------
+    def camino_critico(self) -> list[str]:
+        """Cadena de dependencias que terminó última (del primer nodo al último)."""
+        terminados = {n: t for n, t in self._tiempos.items() if "fin_ms" in t}
+        if not terminados:
+            return []
+        nodo = max(terminados, key=lambda n: terminados[n]["fin_ms"])
+        camino = [nodo]
+        while True:
+            previos = [d for d in self._depende.get(nodo, ()) if d in terminados]
+            if not previos:
+                break
+            nodo = max(previos, key=lambda d: terminados[d]["fin_ms"])
+            camino.append(nodo)
+        return camino[::-1]
+
+    def cerrar(self) -> dict:
+        """
+        Cancela lo pendiente, registra tiempos y camino crítico, y devuelve el
+        resumen del turno. Idempotente: un segundo cierre devuelve el mismo resumen.
+        """
+        if self._resumen is not None:
+            return self._resumen
+        self.cancelar()
+        for tarea in self._tareas.values():
+            if tarea.done() and not tarea.cancelled():
+                tarea.exception()   # marca el error como visto (ya se logueó si alguien lo esperó)
+        total_ms = self._ms()
+        nodos = {}
+        for nombre, t in self._tiempos.items():
+            if "fin_ms" not in t:
+                nodos[nombre] = {"estado": "pendiente"}
+                continue
+            nodos[nombre] = {
+                "estado": t["estado"],
+                "inicio_ms": t.get("inicio_ms", t["fin_ms"]),
+                "fin_ms": t["fin_ms"],
+                "ms": round(t["fin_ms"] - t.get("inicio_ms", t["fin_ms"]), 1),
+            }
+        camino = self.camino_critico()
+        suma_ms = sum(n.get("ms", 0.0) for n in nodos.values())
+        resumen = {"total_ms": total_ms, "suma_nodos_ms": round(suma_ms, 1), "camino_critico": camino, "nodos": nodos}
+        self._resumen = resumen
+        _registrar(self.nombre, resumen)
+        logger.info(
+            "🕸️ Grafo %s: %.0f ms (secuencial hubiera sido ~%.0f ms); camino crítico: %s",
+            self.nombre, total_ms, suma_ms,
+            " → ".join(f"{n}({nodos[n]['ms']:.0f})" for n in camino) or "—",
+        )
+        return resumen
+
+
+# ============================================================
+# Métricas acumuladas (para /health)
+# ============================================================
+_lock = threading.Lock()
+_metricas: dict[str, dict] = {}
+
+
+def _registrar(grafo: str, resumen: dict) -> None:
+    with _lock:
+        m = _metricas.setdefault(grafo, {
+            "turnos": 0, "total_ms": deque(maxlen=MUESTRAS), "suma_nodos_ms": deque(maxlen=MUESTRAS),
+            "nodos": {}, "en_camino_critico": {},
+        })
+        m["turnos"] += 1
+        m["total_ms"].append(resumen["total_ms"])
+        m["suma_nodos_ms"].append(resumen["suma_nodos_ms"])
+        for nombre, nodo in resumen["nodos"].items():
+            if "ms" in nodo:
+                m["nodos"].setdefault(nombre, deque(maxlen=MUESTRAS)).append(nodo["ms"])
+        for nombre in resumen["camino_critico"]:
+            m["en_camino_critico"][nombre] = m["en_camino_critico"].get(nombre, 0) + 1
+
+
+def estadisticas_grafo_turno() -> dict:
+    with _lock:
+        salida = {}
+        for grafo, m in _metricas.items():
+            total, suma = list(m["total_ms"]), list(m["suma_nodos_ms"])
+            salida[grafo] = {
+                "turnos": m["turnos"],
+                "p50_ms": _percentil(total, 0.5) if total else 0.0,
+                "p95_ms": _percentil(total, 0.95) if total else 0.0,
+                "secuencial_p50_ms": _percentil(suma, 0.5) if suma else 0.0,
+                "nodos_p50_ms": {n: _percentil(v, 0.5) for n, v in m["nodos"].items() if v},
+                "en_camino_critico": dict(m["en_camino_critico"]),
+            }
+        return salida
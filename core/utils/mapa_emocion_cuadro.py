@@ -0,0 +1,100 @@
+# core/utils/mapa_emocion_cuadro.py
+"""
+Snapshot en memoria del mapa emoción → {cuadros} (estadística global).
+
+procesar_clinico lo consultaba armando el dict en cada mensaje clínico a
+partir de estadistica_global_emocion_a_cuadro(). Ahora:
+  - la fuente es la tabla resumen estadistica_emocion_cuadro (trigger),
+  - el dict se arma una vez y se comparte (solo lectura, valores frozenset),
+  - se refresca cada MAPA_EMO_CUADRO_TTL segundos en un hilo aparte
+    (stale-while-revalidate): ningún turno espera el refresco salvo el
+    primero del proceso.
+"""
+import os
+import time
+import logging
+import threading
+from types import MappingProxyType
+
+from core.db.consulta import estadistica_global_emocion_a_cuadro
+
+logger = logging.getLogger(__name__)
+
+TTL_SEG = float(os.getenv("MAPA_EMO_CUADRO_TTL", "300"))
+
+_VACIO = MappingProxyType({})
+_mapa = _VACIO
+_cargado_en = 0.0
+_refrescando = False
+_lock = threading.Lock()
+_refrescos = 0
+_ultimo_refresco_ms = 0.0
+
+
+def _fila(r):
+    # RealDictCursor → dict; cursor común → tupla
+    if isinstance(r, dict):
+        return r.get("emocion"), r.get("cuadro"), r.get("c")
+    return r[0], r[1], r[2]
+
+
+def _construir() -> MappingProxyType:
+    mapa: dict[str, set] = {}
+    for r in estadistica_global_emocion_a_cuadro() or []:
+        emocion, cuadro, _ = _fila(r)
+        emocion = (emocion or "").strip().lower()
+        cuadro = (cuadro or "").strip().lower()
+        if emocion and cuadro:
+            mapa.setdefault(emocion, set()).add(cuadro)
+    return MappingProxyType({e: frozenset(cs) for e, cs in mapa.items()})
+
+
+def refrescar_mapa_emocion_cuadro() -> None:
+    """Recarga el snapshot desde la DB (bloqueante)."""
+    global _mapa, _cargado_en, _refrescando, _refrescos, _ultimo_refresco_ms
+    t0 = time.perf_counter()
+    try:
+        nuevo = _construir()
+        with _lock:
+            # Si la DB no devolvió nada (error o tabla vacía) no pisamos un snapshot con datos
+            if nuevo or not _mapa:
+                _mapa = nuevo
+            _cargado_en = time.monotonic()
+            _refrescos += 1
+            _ultimo_refresco_ms = (time.perf_counter() - t0) * 1000
+    except Exception:
+        logger.exception("No se pudo refrescar el mapa emoción→cuadro")
+    finally:
+        with _lock:
+            _refrescando = False
+
+
+def obtener_mapa_emocion_cuadro():
+    """
+    Mapa de solo lectura {emocion: frozenset(cuadros)}. O(1) por llamada:
+    si el snapshot venció, dispara el refresco en segundo plano y devuelve el actual.
+    """
+    global _refrescando
+    with _lock:
+        edad = time.monotonic() - _cargado_en
+        primera_vez = _cargado_en == 0.0
+        disparar = not primera_vez and edad > TTL_SEG and not _refrescando
+        if disparar or primera_vez:
+            _refrescando = True
+
+    if primera_vez:
+        refrescar_mapa_emocion_cuadro()
+    elif disparar:
+        threading.Thread(target=refrescar_mapa_emocion_cuadro, name="refresco-mapa-emo-cuadro", daemon=True).start()
+    return _mapa
+
+
+def estadisticas_mapa_emocion_cuadro() -> dict:
+    with _lock:
+        return {
+            "emociones": len(_mapa),
+            "edad_seg": round(time.monotonic() - _cargado_en, 1) if _cargado_en else None,
+            "ttl_seg": TTL_SEG,
+            "refrescos": _refrescos,
+            "ultimo_refresco_ms": round(_ultimo_refresco_ms, 1),
+        }
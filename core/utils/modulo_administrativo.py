@@ -1,7 +1,7 @@
 import re
 import unicodedata
-import openai
 from core.utils_contacto import obtener_mensaje_contacto
+from core.utils.generador_openai import generar_respuesta_con_openai, generar_respuesta_con_openai_async
 
 # Normaliza el texto para minimizar errores por tildes o puntuación
 def normalizar(texto: str) -> str:
@@ -41,11 +41,29 @@ RESPUESTAS = {
     )
 }
 
-def clasificar_tema_administrativo(mensaje: str) -> str:
-    """
-    Usa OpenAI para clasificar el mensaje dentro de una categoría administrativa.
-    """
-    prompt = (
+# Patrones de obras sociales / prepagas (compilados una sola vez)
+PATRONES_OS = [re.compile(p) for p in [
+    r"\bobra\s+social(es)?\b",
+    r"\bobras\s+sociales\b",
+    r"\bpor\s+obra\s+social\b",
+    r"\bprepagas?\b",
+    r"\bioma\b",
+    r"\bosde\b",
+    r"\bgaleno\b",
+    r"\bswiss\s*medical\b",
+    r"\bluis\s*pasteur\b",
+    r"\bmedicus\b",
+    r"\bomint\b",
+    r"\bac[aá]\b",
+    r"\bsancor\b",
+    r"\bprevenci[oó]n\b",
+    r"\bplan\s+de\s+salud\b",
+    r"\bcobertura\s+m[eé]dica\b"
+]]
+
+
+def _prompt_tema_administrativo(mensaje: str) -> str:
+    return (
         "Clasificá el siguiente mensaje dentro de una de estas categorías administrativas:\n\n"
         "- obras sociales\n"
         "- honorarios\n"
@@ -59,66 +77,54 @@ def clasificar_tema_administrativo(mensaje: str) -> str:
         f"Mensaje: {mensaje}"
     )
 
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=10,
-            temperature=0.0
-        )
-        clasificacion = response.choices[0].message['content'].strip().lower()
-        return clasificacion
-    except Exception as e:
-        print(f"❌ Error al clasificar tema administrativo: {e}")
-        return "otro"
 
-def procesar_administrativo(mensaje_usuario: str, session: dict, user_id: str) -> dict:
+def clasificar_tema_administrativo(mensaje: str) -> str:
     """
-    Clasifica el mensaje usando OpenAI y devuelve la respuesta administrativa correspondiente.
-    También maneja casos especiales como la consulta por atención presencial.
+    Usa OpenAI para clasificar el mensaje dentro de una categoría administrativa.
     """
-    mensaje_normalizado = normalizar(mensaje_usuario)
+    clasificacion = generar_respuesta_con_openai(
+        _prompt_tema_administrativo(mensaje),
+        model="gpt-3.5-turbo", temperature=0.0, max_tokens=10, reintentos=0,
+        familia="tema_administrativo",
+    )
+    if not clasificacion:
+        print("❌ Error al clasificar tema administrativo: sin respuesta de OpenAI")
+        return "otro"
+    return clasificacion.strip().lower()
+
 
+async def clasificar_tema_administrativo_async(mensaje: str) -> str:
+    """Igual que clasificar_tema_administrativo() pero sin bloquear el event loop."""
+    clasificacion = await generar_respuesta_con_openai_async(
+        _prompt_tema_administrativo(mensaje),
+        model="gpt-3.5-turbo", temperature=0.0, max_tokens=10, reintentos=0,
+        familia="tema_administrativo",
+    )
+    if not clasificacion:
+        print("❌ Error al clasificar tema administrativo: sin respuesta de OpenAI")
+        return "otro"
+    return clasificacion.strip().lower()
+
+
+def _respuesta_sin_llm(mensaje_normalizado: str) -> str | None:
+    """Casos especiales resueltos por reglas (presencial, obras sociales); None si hace falta clasificar."""
     # 🔍 MANEJO ESPECIAL: consulta por atención presencial
     if "presencial" in mensaje_normalizado or "consultorio" in mensaje_normalizado or "forma presencial" in mensaje_normalizado:
-        respuesta = (
+        return (
             "El Lic. Bustamante trabaja exclusivamente en modalidad Online, a través de videollamadas. "
             "No atiende de forma presencial. Podés escribirle al WhatsApp +54 911 3310-1186 si querés más información."
         )
-        session["ultimas_respuestas"].append(respuesta)
-        session["contador_interacciones"] += 1
-        return {"respuesta": respuesta}
 
     # 🧩 MANEJO ESPECIAL: consulta sobre obras sociales o prepagas
-    patrones_os = [
-        r"\bobra\s+social(es)?\b",
-        r"\bobras\s+sociales\b",
-        r"\bpor\s+obra\s+social\b",
-        r"\bprepagas?\b",
-        r"\bioma\b",
-        r"\bosde\b",
-        r"\bgaleno\b",
-        r"\bswiss\s*medical\b",
-        r"\bluis\s*pasteur\b",
-        r"\bmedicus\b",
-        r"\bomint\b",
-        r"\bac[aá]\b",
-        r"\bsancor\b",
-        r"\bprevenci[oó]n\b",
-        r"\bplan\s+de\s+salud\b",
-        r"\bcobertura\s+m[eé]dica\b"
-    ]
-
-    for p in patrones_os:
-        if re.search(p, mensaje_normalizado):
-            print(f"✅ Coincidencia regex con: {p}")  # ← Puedes quitar esto luego
-            respuesta = RESPUESTAS.get("obras sociales")
-            session["ultimas_respuestas"].append(respuesta)
-            session["contador_interacciones"] += 1
-            return {"respuesta": respuesta}
-
-    # 🔍 CLASIFICACIÓN por OpenAI
-    categoria = clasificar_tema_administrativo(mensaje_normalizado)
+    for p in PATRONES_OS:
+        if p.search(mensaje_normalizado):
+            print(f"✅ Coincidencia regex con: {p.pattern}")  # ← Puedes quitar esto luego
+            return RESPUESTAS.get("obras sociales")
+
+    return None
+
+
+def _respuesta_por_categoria(categoria: str) -> str:
     respuesta = RESPUESTAS.get(categoria)
 
     # 🔄 Si no se reconoció la categoría, usar fallback genérico
@@ -127,7 +133,43 @@ def procesar_administrativo(mensaje_usuario: str, session: dict, user_id: str) -
             "Si querés contactar al Lic. Daniel O. Bustamante, podés escribirle directamente al WhatsApp +54 911 3310-1186. "
             "Él podrá responderte personalmente cualquier duda puntual."
         )
+    return respuesta
 
+
+def _registrar_en_sesion(session: dict, respuesta: str) -> dict:
     session["ultimas_respuestas"].append(respuesta)
     session["contador_interacciones"] += 1
     return {"respuesta": respuesta}
+
+
+def procesar_administrativo(mensaje_usuario: str, session: dict, user_id: str) -> dict:
+    """
+    Clasifica el mensaje usando OpenAI y devuelve la respuesta administrativa correspondiente.
+    También maneja casos especiales como la consulta por atención presencial.
+    """
+    mensaje_normalizado = normalizar(mensaje_usuario)
+
+    respuesta = _respuesta_sin_llm(mensaje_normalizado)
+    if respuesta is None:
+        # 🔍 CLASIFICACIÓN por OpenAI
+        respuesta = _respuesta_por_categoria(clasificar_tema_administrativo(mensaje_normalizado))
+
+    return _registrar_en_sesion(session, respuesta)
+
+
+async def procesar_administrativo_async(
+    mensaje_usuario: str, session: dict, user_id: str, categoria: str | None = None
+) -> dict:
+    """
+    Variante async de procesar_administrativo (la clasificación LLM no bloquea el loop).
+    Si `categoria` viene del analizador de turno, no se vuelve a consultar a OpenAI.
+    """
+    mensaje_normalizado = normalizar(mensaje_usuario)
+
+    respuesta = _respuesta_sin_llm(mensaje_normalizado)
+    if respuesta is None:
+        if not categoria:
+            categoria = await clasificar_tema_administrativo_async(mensaje_normalizado)
+        respuesta = _respuesta_por_categoria(categoria)
+
+    return _registrar_en_sesion(session, respuesta)
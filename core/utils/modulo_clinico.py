@@ -131,10 +131,13 @@ from core.db.consulta import (
     registrar_interaccion_clinica,
     obtener_historial_usuario,
     obtener_ultimo_registro_usuario,
-    estadistica_global_emocion_a_cuadro,
     obtener_ultima_interaccion_emocional,
 )
+from core.utils.mapa_emocion_cuadro import obtener_mapa_emocion_cuadro
 from core.utils.generador_openai import generar_respuesta_con_openai
+from core.utils.circuito_openai import circuito_llm
+from core.plazo import puede_enriquecer
+from core.utils.analizador_turno import analisis_en_cache
 from core.utils.tiempo import delta_preciso_desde
 
 
@@ -634,6 +637,128 @@ def _openai_respuesta_terapeutica(mensaje_usuario: str, recordatorio: str, conte
 
 
 
+def _parse_json_emociones(payload: str) -> tuple[list[str], str]:
+    """
+    Parsea con tolerancia y valida el esquema:
+      {"emociones": [...0..4 strings minúsculas...], "cuadro_probable": "str"}
+    Retorna (emociones, cuadro) o ([], "") si no es válido.
+    """
+    data = None
+
+    # 1) Intento directo
+    try:
+        data = json.loads(payload)
+    except Exception:
+        pass
+
+    # 2) Si vino texto con basura alrededor, extraemos el primer objeto {...}
+    if not isinstance(data, dict):
+        m = re.search(r"\{(?:.|\n)*\}", payload, flags=re.S)
+        if m:
+            try:
+                data = json.loads(m.group(0))
+            except Exception:
+                data = None
+
+    if not isinstance(data, dict):
+        return [], ""
+
+    # Normalización
+    emos = data.get("emociones") or []
+    if not isinstance(emos, list):
+        emos = []
+
+    emos_norm = []
+    for e in emos:
+        s = str(e).strip().lower()
+        if s:
+            emos_norm.append(s)
+
+    # Únicas, máximo 4
+    emos_norm = list(dict.fromkeys(emos_norm))[:4]
+
+    cuadro = str(data.get("cuadro_probable") or "").strip().lower()
+
+    # Validación mínima
+    if any("," in x or "{" in x or "}" in x for x in emos_norm):
+        return [], ""
+    if not isinstance(cuadro, str):
+        cuadro = ""
+
+    return emos_norm, cuadro
+
+
+def _ask_openai_emociones_y_cuadro(texto_usuario: str) -> tuple[list[str], str]:
+    """
+    Pide a OpenAI emociones (0..4) y cuadro probable en JSON estricto.
+    Nunca lanza excepción: si falla todo, retorna ([], "").
+    100% OpenAI (sin depender de DB).
+    """
+    # Instrucción compacta y estricta
+    prompt_base = "\n".join([
+        "Analizá el siguiente mensaje clínico y devolvé EXCLUSIVAMENTE un JSON válido con este formato exacto:",
+        "{",
+        '  "emociones": ["...", "..."],',
+        '  "cuadro_probable": "..."',
+        "}",
+        "",
+        "Reglas (español de Argentina):",
+        "- Solo JSON: sin explicaciones, sin texto antes/después, sin Markdown.",
+        "- Tolerá faltas y variantes coloquiales (p. ej., 'agustiado' ≈ 'angustiado').",
+        "- Emociones: 0 a 4 términos en minúsculas, sin duplicados, solo negativas/clinicamente relevantes.",
+        "- Si el usuario expresa un malestar aunque sea con faltas, inferí la emoción más probable.",
+        '- "cuadro_probable": síntesis prudente en minúsculas (p. ej.: "ansiedad", "estrés", "insomnio").',
+        f"- TEXTO: {texto_usuario}",
+    ])
+
+
+    # Hasta 3 intentos: 1) solicitud normal, 2) refuerzo JSON-only, 3) reparador
+    prompts = [
+        prompt_base,
+        prompt_base + "\nIMPORTANTE: respondé SOLO con el objeto JSON. Nada más.",
+        (
+            "Arreglá el siguiente contenido para que sea EXACTAMENTE un objeto JSON válido con claves "
+            '"emociones" (lista de strings) y "cuadro_probable" (string). No agregues texto fuera del JSON.\n\n'
+            f"CONTENIDO:\n{prompt_base}"
+        ),
+    ]
+
+    # Los reintentos de red/timeout ya los hace el generador (con el presupuesto del turno);
+    # acá solo se cambia de prompt cuando hubo respuesta pero no era JSON válido
+    for intento, p in enumerate(prompts, start=1):
+        if circuito_llm.abierto():
+            break
+        for _ in range(2):  # 2 reintentos por intento lógico
+            try:
+                # Tu wrapper a OpenAI; usá temperature=0 para máxima exactitud
+                raw = generar_respuesta_con_openai(
+                    p,                     # o prompt_base, según tu variable ahí
+                    temperature=TEMP.JSON,
+                    max_tokens=TOK.JSON,
+                    familia="emociones_cuadro",
+                )
+                if not raw:
+                    # Sin respuesta (timeout, circuito, intentos agotados): otro prompt no lo arregla
+                    return [], ""
+                if not isinstance(raw, str):
+                    raw = str(raw)
+
+                emociones, cuadro = _parse_json_emociones(raw)
+                if emociones or cuadro:
+                    return emociones, cuadro
+
+                # Si no pudo parsear/validar, rompemos inner loop y probamos siguiente prompt
+                break
+
+            except Exception as ex:
+                # network/timeout/rate-limit → reintento ligero
+                logger.exception("OpenAI falló durante intento de JSON clínico")
+                continue
+
+    # Si llegamos acá, no conseguimos una salida válida
+    return [], ""
+
+
 def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Flujo clínico alineado a directiva:
@@ -642,6 +767,10 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
       - Disparador (<10): si hay ≥2 coincidencias (sesión + historial + global) hacia el mismo cuadro → responder con
         resumen breve + 'Cuadro clínico probable', y no repetir en la sesión.
       - Reingreso producción: recordar emociones/cuadro previos si pasaron ≥60s y preguntar por emociones nuevas.
+
+    input_data["precargado"] (opcional): lo que la ruta ya resolvió en paralelo
+    (core.utils.grafo_turno) — "emociones_cuadro", "ultimo_registro", "historial",
+    "mapa_emocion_cuadro", "ultima_emocional". Lo que falte se consulta acá como siempre.
     """
 
     # --- Extraer inputs (robusto) ---
@@ -668,6 +797,8 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
         except Exception:
             session = {}
 
+    precargado = input_data.get("precargado") or {}
+
     contador_raw = input_data.get("contador")
     try:
         contador = int(contador_raw) if contador_raw is not None else 1
@@ -736,7 +867,7 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
                 return default
     
         try:
-            ult = obtener_ultimo_registro_usuario(user_id)
+            ult = precargado["ultimo_registro"] if "ultimo_registro" in precargado else obtener_ultimo_registro_usuario(user_id)
             if not ult:
                 return session
     
@@ -787,120 +918,6 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
 
 
 
-    def _parse_json_emociones(payload: str) -> tuple[list[str], str]:
-        """
-        Parsea con tolerancia y valida el esquema:
-          {"emociones": [...0..4 strings minúsculas...], "cuadro_probable": "str"}
-        Retorna (emociones, cuadro) o ([], "") si no es válido.
-        """
-        data = None
-    
-        # 1) Intento directo
-        try:
-            data = json.loads(payload)
-        except Exception:
-            pass
-    
-        # 2) Si vino texto con basura alrededor, extraemos el primer objeto {...}
-        if not isinstance(data, dict):
-            m = re.search(r"\{(?:.|\n)*\}", payload, flags=re.S)
-            if m:
-                try:
-                    data = json.loads(m.group(0))
-                except Exception:
-                    data = None
-    
-        if not isinstance(data, dict):
-            return [], ""
-    
-        # Normalización
-        emos = data.get("emociones") or []
-        if not isinstance(emos, list):
-            emos = []
-    
-        emos_norm = []
-        for e in emos:
-            s = str(e).strip().lower()
-            if s:
-                emos_norm.append(s)
-    
-        # Únicas, máximo 4
-        emos_norm = list(dict.fromkeys(emos_norm))[:4]
-    
-        cuadro = str(data.get("cuadro_probable") or "").strip().lower()
-    
-        # Validación mínima
-        if any("," in x or "{" in x or "}" in x for x in emos_norm):
-            return [], ""
-        if not isinstance(cuadro, str):
-            cuadro = ""
-    
-        return emos_norm, cuadro
-    
-    
-    def _ask_openai_emociones_y_cuadro(texto_usuario: str) -> tuple[list[str], str]:
-        """
-        Pide a OpenAI emociones (0..4) y cuadro probable en JSON estricto.
-        Nunca lanza excepción: si falla todo, retorna ([], "").
-        100% OpenAI (sin depender de DB).
-        """
-        # Instrucción compacta y estricta
-        prompt_base = "\n".join([
-            "Analizá el siguiente mensaje clínico y devolvé EXCLUSIVAMENTE un JSON válido con este formato exacto:",
-            "{",
-            '  "emociones": ["...", "..."],',
-            '  "cuadro_probable": "..."',
-            "}",
-            "",
-            "Reglas (español de Argentina):",
-            "- Solo JSON: sin explicaciones, sin texto antes/después, sin Markdown.",
-            "- Tolerá faltas y variantes coloquiales (p. ej., 'agustiado' ≈ 'angustiado').",
-            "- Emociones: 0 a 4 términos en minúsculas, sin duplicados, solo negativas/clinicamente relevantes.",
-            "- Si el usuario expresa un malestar aunque sea con faltas, inferí la emoción más probable.",
-            '- "cuadro_probable": síntesis prudente en minúsculas (p. ej.: "ansiedad", "estrés", "insomnio").',
-            f"- TEXTO: {texto_usuario}",
-        ])
-
-    
-        # Hasta 3 intentos: 1) solicitud normal, 2) refuerzo JSON-only, 3) reparador
-        prompts = [
-            prompt_base,
-            prompt_base + "\nIMPORTANTE: respondé SOLO con el objeto JSON. Nada más.",
-            (
-                "Arreglá el siguiente contenido para que sea EXACTAMENTE un objeto JSON válido con claves "
-                '"emociones" (lista de strings) y "cuadro_probable" (string). No agregues texto fuera del JSON.\n\n'
-                f"CONTENIDO:\n{prompt_base}"
-            ),
-        ]
-    
-        # Reintentos de red/timeout: leve backoff
-        for intento, p in enumerate(prompts, start=1):
-            for _ in range(2):  # 2 reintentos por intento lógico
-                try:
-                    # Tu wrapper a OpenAI; usá temperature=0 para máxima exactitud
-                    raw = generar_respuesta_con_openai(
-                        p,                     # o prompt_base, según tu variable ahí
-                        temperature=TEMP.JSON,
-                        max_tokens=TOK.JSON,
-                    )
-                    if not isinstance(raw, str):
-                        raw = str(raw or "")
-    
-                    emociones, cuadro = _parse_json_emociones(raw)
-                    if emociones or cuadro:
-                        return emociones, cuadro
-    
-                    # Si no pudo parsear/validar, rompemos inner loop y probamos siguiente prompt
-                    break
-    
-                except Exception as ex:
-                    # network/timeout/rate-limit → reintento ligero
-                    logger.exception("OpenAI falló durante intento de JSON clínico")
-                    continue
-    
-        # Si llegamos acá, no conseguimos una salida válida
-        return [], ""
-
 
     def _coincidencias_sesion_historial_global(user_id: str, emociones_sesion, cuadro_openai: str):
         """
@@ -912,7 +929,7 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         emociones_sesion = set(_limpiar_lista_str(emociones_sesion))
         # Historial propio
-        hist = obtener_historial_usuario(user_id, limite=200)
+        hist = precargado["historial"] if "historial" in precargado else obtener_historial_usuario(user_id, limite=200)
         emos_hist = set()
         for r in hist:
             # r = (id, user_id, fecha, emociones, nuevas_emociones_detectadas, cuadro_clinico_probable, interaccion_id)
@@ -920,19 +937,17 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
                 emos_hist.add((e or "").strip().lower())
 
 
-        # Estadística global: emoción -> {cuadros}
-        glob = estadistica_global_emocion_a_cuadro() or []
-        map_emo_to_cuadro: dict[str, set] = {}
-        for emocion, cuadro, c in glob:
-            if not emocion or not cuadro:
-                continue
-            map_emo_to_cuadro.setdefault(emocion, set()).add((cuadro or "").strip().lower())
+        # Estadística global: emoción -> {cuadros} (snapshot compartido, solo lectura; O(1) por turno)
+        map_emo_to_cuadro = (
+            precargado["mapa_emocion_cuadro"] if "mapa_emocion_cuadro" in precargado
+            else obtener_mapa_emocion_cuadro()
+        )
         
         # 🧰 Fallback local si la global está vacía (DB recién limpiada):
         # sembramos el mapa usando el historial del propio usuario
         if not map_emo_to_cuadro:
+            map_emo_to_cuadro = {}
             try:
-                hist = obtener_historial_usuario(user_id, limite=200) or []
                 for r in hist:
                     cuadro_prev = (_get_col(r, 5, "cuadro_clinico_probable") or "").strip().lower()
                     if not cuadro_prev:
@@ -1005,7 +1020,16 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
     session.setdefault("ultima_fecha", ahora.isoformat())
 
     # --- 1) Detectar con OpenAI ---
-    emociones_openai, cuadro_openai = _ask_openai_emociones_y_cuadro(mensaje_usuario)
+    # Si el analizador de turno ya corrió para este mensaje, se reusa (sin otro round-trip)
+    analisis_turno = analisis_en_cache(session, mensaje_original)
+    if analisis_turno and (analisis_turno.get("emociones") or analisis_turno.get("cuadro_probable")):
+        emociones_openai = list(analisis_turno["emociones"])
+        cuadro_openai = analisis_turno["cuadro_probable"]
+    elif "emociones_cuadro" in precargado:
+        # La ruta ya lo pidió en paralelo con la inferencia incremental
+        emociones_openai, cuadro_openai = precargado["emociones_cuadro"]
+    else:
+        emociones_openai, cuadro_openai = _ask_openai_emociones_y_cuadro(mensaje_usuario)
 
     # emociones previas (sesión)
     emos_sesion_prev = set(_limpiar_lista_str(session.get("emociones_detectadas", [])))
@@ -1015,12 +1039,15 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
     # Unimos emociones de sesión + actuales para el cómputo
     emociones_union = list(set(_limpiar_lista_str(session.get("emociones_detectadas", [])) + emociones_openai))
     
-    # Cálculo de coincidencias (con semilla y fallback ya implementados)
-    votos, detalles, objetivo = _coincidencias_sesion_historial_global(
-        user_id=user_id,
-        emociones_sesion=emociones_union,
-        cuadro_openai=cuadro_openai
-    )
+    # Cálculo de coincidencias (con semilla y fallback ya implementados); opcional si el turno viene justo
+    if puede_enriquecer("estadistica_global"):
+        votos, detalles, objetivo = _coincidencias_sesion_historial_global(
+            user_id=user_id,
+            emociones_sesion=emociones_union,
+            cuadro_openai=cuadro_openai
+        )
+    else:
+        votos, detalles, objetivo = 0, {"sesion": [], "historial": []}, cuadro_openai
     
     # Reconciliación: si OpenAI no trajo cuadro, usamos el fallback (objetivo)
     cuadro_final = (objetivo or cuadro_openai or "").strip().lower()
@@ -1037,7 +1064,12 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
     # 4) Contexto temporal emocional (siempre, contextual y humano)
     recordatorio = ""
     try:
-        ultima = obtener_ultima_interaccion_emocional(user_id)  # ignora admins
+        if not puede_enriquecer("recordatorio"):
+            ultima = None
+        elif "ultima_emocional" in precargado:
+            ultima = precargado["ultima_emocional"]
+        else:
+            ultima = obtener_ultima_interaccion_emocional(user_id)  # ignora admins
         recordatorio = construir_recordatorio_contextual(
             emociones_actuales=emociones_openai,
             cuadro_actual=cuadro_openai,
@@ -1058,7 +1090,10 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
 
     # 3) Disparador por coincidencias (<10 y aún no notificado)
     texto_out = ""
-    if contador < 10 and cuadro_openai and not session.get("disparo_notificado", False):
+    if (
+        contador < 10 and cuadro_openai and not session.get("disparo_notificado", False)
+        and puede_enriquecer("disparador_clinico")
+    ):
         try:
             # Unimos emociones de sesión + previas de la sesión para el cómputo (sin duplicar)
             emociones_union = list(set(
@@ -1199,6 +1234,23 @@ def procesar_clinico(input_data: Dict[str, Any]) -> Dict[str, Any]:
 # 📌 Clasificar cuadro clínico probable (puede usarse IA)
 # ==============================================================
 
+# Rótulo local por emoción suelta (también lo usa core.utils.etiquetado_cuadros antes de ir al modelo)
+CUADRO_POR_EMOCION = {
+    "ansiedad": "posible ansiedad elevada",
+    "angustia": "posible estado de angustia",
+    "miedo": "posible respuesta de miedo",
+    "insomnio": "dificultad con el sueño",
+    "estrés": "estrés sostenido",
+    "tristeza": "ánimo bajo",
+    "deprimido": "ánimo deprimido",
+    "soledad": "aislamiento/soledad",
+    "culpa": "autocrítica/culpa",
+    "vergüenza": "vergüenza/autoexigencia",
+    "evitación": "conducta evitativa",
+    "fobia social": "ansiedad social",
+}
+
+
 def clasificar_cuadro_clinico(
     emociones: str | Iterable[str],
     mensaje_usuario: str = "",
@@ -1221,25 +1273,10 @@ def clasificar_cuadro_clinico(
     emos = [str(e).strip().lower() for e in emos if str(e).strip()]
 
     # --- Heurística local (fallback) -----------------------------------------
-    mapa = {
-        "ansiedad": "posible ansiedad elevada",
-        "angustia": "posible estado de angustia",
-        "miedo": "posible respuesta de miedo",
-        "insomnio": "dificultad con el sueño",
-        "estrés": "estrés sostenido",
-        "tristeza": "ánimo bajo",
-        "deprimido": "ánimo deprimido",
-        "soledad": "aislamiento/soledad",
-        "culpa": "autocrítica/culpa",
-        "vergüenza": "vergüenza/autoexigencia",
-        "evitación": "conducta evitativa",
-        "fobia social": "ansiedad social",
-    }
-
     def _heuristica() -> str:
         for e in emos:
-            if e in mapa:
-                return mapa[e]
+            if e in CUADRO_POR_EMOCION:
+                return CUADRO_POR_EMOCION[e]
         # combinaciones frecuentes
         s = set(emos)
         if {"ansiedad", "insomnio"} <= s:
@@ -0,0 +1,204 @@
+# core/utils/preclasificador.py
+"""
+Preclasificador local (sin red) que corre ANTES del analizador de turno.
+
+Resuelve en microsegundos los turnos obvios —cortesía pura, consultas
+administrativas y pedidos de contacto sin carga emocional— y solo escala a
+OpenAI los ambiguos. Reúne las señales léxicas que ya existían dispersas:
+  - ADMIN_PATTERNS (modulo_clinico)
+  - PATRONES_OS (modulo_administrativo)
+  - expresiones de contacto (utils_contacto.es_consulta_contacto)
+  - saludos / cortesía de clasificar_input_inicial (funciones_asistente)
+
+Cada señal suma peso a una categoría; la confianza resultante se compara con
+PRECLASIFICADOR_UMBRAL. Para resolver localmente hacen falta además:
+  - ninguna señal de riesgo (suicidio, autolesión, violencia) ni clínica/emocional:
+    vetan la resolución local y el mensaje lo decide el modelo (que evalúa riesgo);
+  - al menos MIN_SENALES señales administrativas, y el umbral está por encima del
+    peso de cualquier señal sola;
+  - que no quede texto fuera del vocabulario administrativo al quitar las señales
+    ("mi hijo tiene autismo, atiende online?" escala: "hijo", "autismo").
+"""
+import os
+import re
+import threading
+from collections import Counter
+
+from core.utils.modulo_administrativo import normalizar, PATRONES_OS
+from core.utils.modulo_clinico import ADMIN_PATTERNS
+from core.utils_contacto import es_consulta_contacto
+
+UMBRAL = float(os.getenv("PRECLASIFICADOR_UMBRAL", "0.75"))   # > peso de cualquier señal sola
+MIN_SENALES = 2
+MAX_PALABRAS_ADMIN = 25   # mensajes más largos suelen mezclar temas → menos confianza
+
+# Señales administrativas: (categoría, patrón compilado, peso). El orden desempata.
+_SENALES_ADMIN = [
+    ("honorarios", re.compile(
+        r"\b(cu[aá]nto (cobra|sale|cuesta|vale)|precios?|honorarios?|aranceles?|costos?|"
+        r"valor de (la )?(sesion|consulta))\b"), 0.7),
+    ("obras sociales", PATRONES_OS, 0.7),
+    ("horarios", re.compile(r"\b(d[ií]as? y horarios?|horarios?|que d[ií]as atiende)\b"), 0.6),
+    ("modalidad", re.compile(r"\b(presencial|online|virtual|videollamada|zoom|modalidad|consultorio)\b"), 0.6),
+    ("duración", re.compile(r"\b(cu[aá]nto dura|duraci[oó]n)\b"), 0.6),
+    ("contacto", re.compile(r"\b(whats?app|tel[eé]fono|numero|contactarlo|agendar|sacar turno|pedir turno)\b"), 0.6),
+]
+_BONO_ADMIN_PATTERNS = 0.2
+
+# Riesgo (suicidio, autolesión, violencia): veto duro, aunque el resto sea administrativo
+_SENALES_RIESGO = re.compile(
+    r"\b(mat(ar|arme|arte|arlo|arla|arnos)|me mato|lo mato|la mato|quitarme la vida|vivir|vida|"
+    r"terminar con todo|acabar con todo|desaparecer|morir\w*|muert[oae]s?|suicid\w*|autolesi\w*|"
+    r"cortarme|lastim\w*|hacerme dano|pega(r|rme|rle|n|ba|ron)?|pego|golpe\w*|abus\w*|violen\w*|"
+    r"viola\w*|maltrat\w*|amenaz\w*|arma|pastillas)\b"
+)
+
+# Señales clínicas/emocionales: vetan la resolución local
+_SENALES_CLINICAS = re.compile(
+    r"\b(me siento|siento|sent[ií]|estoy (mal|muy)|ansi(edad|osa?o?)|angusti\w*|trist\w*|depre\w*|"
+    r"p[aá]nico|no puedo|llor\w*|insomnio|no duermo|miedo|soledad|vac[ií]o|morir\w*|muerte|"
+    r"suicid\w*|lastimar\w*|ataque|estres\w*|culpa|enojo|bronca|sufr\w*|dolor|terapia)\b"
+)
+
+# Cortesía: el mensaje COMPLETO tiene que estar formado por estas expresiones
+_EXPRESIONES_SALUDO = (
+    "hola", "holis", "holaa", "buenas", "buen dia", "buenos dias", "buenas tardes",
+    "buenas noches", "que tal", "como estas", "hey", "hello", "hi",
+)
+# Sin afirmativos sueltos ("ok", "dale", "listo"...): suelen responder a una pregunta clínica del asistente
+_EXPRESIONES_CIERRE = (
+    "gracias", "muchas gracias", "mil gracias", "muy amable", "te agradezco", "chau", "adios",
+    "hasta luego", "saludos", "buena jornada", "nada mas", "me quedo claro",
+)
+
+
+# Lo que puede acompañar a una consulta administrativa sin cambiarle el sentido.
+# Si al quitar las señales queda otra palabra, el mensaje escala al modelo.
+_VOCABULARIO_ADMIN = frozenset("""
+    a al ante con de del desde e el en la las le les lo los o para por sin sobre u un una unos unas y
+    me mi mis te tu tus se su sus nos usted ustedes vos yo el ella
+    que q cual cuales cuanto cuanta cuantos cuantas como donde cuando quien si no ya tambien ademas
+    es son esta estan hay tiene tienen tenes tengo ser seria
+    atiende atienden atendes atender atencion trabaja trabajan trabajas trabajo acepta aceptan aceptas
+    cobra cobran cobras sale salen cuesta cuestan vale valen pago pagos pagar abonar efectivo transferencia
+    quisiera queria quiero saber consultar consulta consultas pregunta preguntar puedo puede podes podria
+    necesito necesitaria pasame pasas pasar dame das decime sabes informacion info datos
+    sesion sesiones turno turnos psicologo licenciado lic bustamante daniel dr doctor profesional
+    semana semanal dia dias hora horas mes mensual particular particulares primera vez cobertura
+    reintegro factura precio valor hoy manana tarde noche favor porfa porfavor bien
+    ok okey dale listo perfecto genial
+""".split())
+
+
+def _alternancia(frases) -> str:
+    # Las más largas primero para que "muchas gracias" gane sobre "gracias"
+    return "|".join(re.escape(f) for f in sorted(frases, key=len, reverse=True))
+
+
+_RE_SALUDO = re.compile(rf"\b({_alternancia(_EXPRESIONES_SALUDO)})\b")
+_RE_CIERRE = re.compile(rf"\b({_alternancia(_EXPRESIONES_CIERRE)})\b")
+
+
+def _texto_no_administrativo(texto: str) -> list[str]:
+    """Palabras que quedan al quitar señales admin, cortesía y vocabulario administrativo."""
+    for _, patron, _ in _SENALES_ADMIN:
+        for p in (patron if isinstance(patron, list) else [patron]):
+            texto = p.sub(" ", texto)
+    texto = ADMIN_PATTERNS.sub(" ", texto)
+    texto = _RE_CIERRE.sub(" ", _RE_SALUDO.sub(" ", texto))
+    return [w for w in texto.split() if w not in _VOCABULARIO_ADMIN and not w.isdigit()]
+
+
+# --- Métricas ---
+_lock = threading.Lock()
+_resueltos: Counter = Counter()
+_escalados = 0
+
+
+def _resultado(intencion=None, categoria=None, confianza=0.0, senales=None) -> dict:
+    return {
+        "intencion": intencion,        # "CORTESIA" | "ADMINISTRATIVA" | None (escalar a OpenAI)
+        "categoria": categoria,        # CORTESIA: "saludo"/"cierre"; ADMIN: categoría de RESPUESTAS
+        "confianza": round(confianza, 3),
+        "senales": senales or [],
+    }
+
+
+def _evaluar(texto: str) -> dict:
+    if not texto:
+        return _resultado()
+
+    if _SENALES_RIESGO.search(texto):
+        return _resultado(senales=["riesgo"])
+    if _SENALES_CLINICAS.search(texto):
+        return _resultado(senales=["clinica"])
+
+    # 1) Cortesía pura: nada queda después de quitar saludos/cierres
+    sin_saludo = _RE_SALUDO.sub(" ", texto)
+    resto = _RE_CIERRE.sub(" ", sin_saludo).split()
+    if not resto:
+        categoria = "saludo" if not _RE_CIERRE.search(texto) else "cierre"
+        return _resultado("CORTESIA", categoria, 0.95, ["cortesia"])
+
+    # 2) Administrativo / contacto
+    pesos = {}
+    for categoria, patron, peso in _SENALES_ADMIN:
+        patrones = patron if isinstance(patron, list) else [patron]
+        if any(p.search(texto) for p in patrones):
+            pesos[categoria] = peso
+    if es_consulta_contacto(texto):
+        pesos["contacto"] = max(pesos.get("contacto", 0.0), 0.6)
+    if not pesos:
+        return _resultado()
+
+    senales = list(pesos)
+    confianza = max(pesos.values())
+    if ADMIN_PATTERNS.search(texto):
+        confianza += _BONO_ADMIN_PATTERNS
+        senales.append("admin_patterns")
+    if len(pesos) > 1:
+        confianza += _BONO_ADMIN_PATTERNS
+    if len(resto) > MAX_PALABRAS_ADMIN:
+        confianza *= 0.7
+
+    # Una señal sola no alcanza, y lo que no es administrativo lo decide el modelo
+    if len(senales) < MIN_SENALES:
+        return _resultado(confianza=confianza, senales=senales)
+    if _texto_no_administrativo(texto):
+        return _resultado(confianza=confianza, senales=senales + ["texto_no_administrativo"])
+
+    # Categoría ganadora: mayor peso; empate → orden de _SENALES_ADMIN (dict conserva inserción)
+    categoria = max(pesos, key=lambda c: pesos[c])
+    return _resultado("ADMINISTRATIVA", categoria, min(confianza, 1.0), senales)
+
+
+def preclasificar(mensaje_usuario: str) -> dict:
+    """
+    Clasifica el mensaje localmente. Si `intencion` es None (o la confianza no
+    llega al umbral), el turno debe escalar al analizador de OpenAI.
+    """
+    global _escalados
+    resultado = _evaluar(normalizar(mensaje_usuario or ""))
+
+    with _lock:
+        if resultado["intencion"] and resultado["confianza"] >= UMBRAL:
+            _resueltos[f"{resultado['intencion']}:{resultado['categoria']}"] += 1
+        else:
+            resultado["intencion"] = None
+            _escalados += 1
+    return resultado
+
+
+def estadisticas_preclasificador() -> dict:
+    """Turnos resueltos localmente vs. escalados; cada resuelto ahorra la llamada del analizador de turno."""
+    with _lock:
+        resueltos = sum(_resueltos.values())
+        total = resueltos + _escalados
+        return {
+            "umbral": UMBRAL,
+            "resueltos_local": resueltos,
+            "escalados_llm": _escalados,
+            "llamadas_llm_ahorradas": resueltos,
+            "tasa_resolucion_local": round(resueltos / total, 3) if total else 0.0,
+            "por_tipo": dict(_resueltos),
+        }
@@ -1,19 +1,26 @@
 from core.constantes import CERRAR_CONVERSACION_SOLO_RIESGO
 from core.utils.modulo_clinico import procesar_clinico  # (solo si no fue importado aún)
-from core.utils.modulo_administrativo import procesar_administrativo
+from core.utils.modulo_administrativo import procesar_administrativo, procesar_administrativo_async
 from core.inferencia_psicodinamica import generar_hipotesis_psicodinamica, reformular_estilo_narrativo
 from fastapi import APIRouter, HTTPException
 from core.modelos.base import UserInput
-from core.utils.modulo_clinico import clasificar_cuadro_clinico
-from core.utils.intencion_usuario import detectar_intencion_bifurcada
+from core.utils.modulo_clinico import clasificar_cuadro_clinico, _ask_openai_emociones_y_cuadro
+from core.utils.intencion_usuario import detectar_intencion_bifurcada, detectar_intencion_bifurcada_async
+from core.utils.analizador_turno import analizar_turno_async, a_intencion_bifurcada, analisis_en_cache, hay_riesgo
+from core.utils.preclasificador import preclasificar
 from core.utils.motor_fallback import (
     safe_detectar_sintomas as detectar_sintomas_db,
     safe_inferir_cuadros as inferir_cuadros,
     safe_decidir as decidir,
 )
 
-from core.utils.generador_openai import generar_respuesta_con_openai  # ya lo usás
+from core.utils.generador_openai import generar_respuesta_con_openai, generar_respuesta_con_openai_async  # ya lo usás
 from core.utils.disparadores import extraer_disparadores, resumir_disparadores
+from core.utils.etiquetado_cuadros import etiquetar_emociones, limpiar_rotulo, INDETERMINADO
+from core.utils.circuito_openai import circuito_llm, presupuesto_reintentos
+from core.plazo import plazo_turno, puede_enriquecer
+from core.utils.grafo_turno import GrafoTurno
+from core.utils.mapa_emocion_cuadro import obtener_mapa_emocion_cuadro
 
 
 
@@ -26,6 +33,7 @@ from core.utils.modulo_clinico import (
 
 from core.utils_seguridad import (
     contiene_elementos_peligrosos,
+    contiene_frase_de_peligro,
     es_input_malicioso
 )
 
@@ -41,6 +49,7 @@ from core.utils_contacto import (
 )
 
 from core.db.conexion import ejecutar_consulta
+from core.db.conexion_async import ejecutar_en_hilo_db
 
 # --- Helper para disparador 5/9 sin usar la tabla 'emociones_detectadas' ---
 from collections import Counter
@@ -56,6 +65,12 @@ from core.db.registro import (
     registrar_log_similitud,
     registrar_auditoria_respuesta,
     registrar_inferencia,
+    registrar_interaccion_async,
+    registrar_respuesta_openai_async,
+    registrar_auditoria_input_original_async,
+    registrar_auditoria_respuesta_async,
+    registrar_historial_clinico_async,
+    registrar_emocion_async,
 )
 
 
@@ -63,10 +78,16 @@ from core.funciones_clinicas import analizar_texto
 from core.funciones_clinicas import _inferir_por_db_o_openai
 from core.funciones_asistente import detectar_emociones_negativas
 from core.funciones_asistente import verificar_memoria_persistente
+from core.funciones_asistente import verificar_memoria_persistente_async, obtener_ultimo_historial_emocional_async
 from core.db.consulta import obtener_emociones_ya_registradas
+from core.db.perfil_clinico import obtener_perfil_clinico, turno_perfil_clinico
 from core.db.consulta import obtener_ultimo_registro_usuario
+from core.db.consulta import obtener_emociones_ya_registradas_async, obtener_ultimo_registro_usuario_async
+from core.db.consulta import obtener_historial_usuario, obtener_ultima_interaccion_emocional
 from core.utils.palabras_irrelevantes import palabras_irrelevantes
 from core.contexto import user_sessions
+from core.sesion import SesionUsuario
+from core.concurrencia import control_turnos, TurnoRechazado
 
 from core.resumen_clinico import (
     generar_resumen_clinico_y_estado,
@@ -93,7 +114,7 @@ from core.constantes import (
 
 from datetime import datetime
 
-import openai
+import asyncio
 import re
 import time
 import random
@@ -113,14 +134,6 @@ logger = logging.getLogger(__name__)
 
 
 
-# -- Sesiones en memoria (fallback seguro) --
-try:
-    from core.contexto import user_sessions
-except Exception:
-    # Si el import falla en el entorno de despliegue, usamos un dict local
-    user_sessions = {}
-
-
 RESPUESTAS_CLINICAS = None  # <- no usar; removido del flujo
 
 
@@ -135,6 +148,25 @@ def _fallback_clinico() -> str:
         "en el cuerpo o en los pensamientos cuando aparece?"
     )
 
+def _respuesta_riesgo(riesgo: dict) -> str:
+    """Respuesta de contención con recursos de emergencia (no pasa por OpenAI)."""
+    partes = [
+        "Lo que contás es importante y merece atención ahora mismo. No tenés que atravesarlo en soledad.",
+    ]
+    if riesgo.get("violencia"):
+        partes.append(
+            "Si estás en peligro, llamá al 911. Ante situaciones de violencia podés comunicarte "
+            "con la Línea 144 o la Línea 137 (gratuitas, las 24 horas)."
+        )
+    if riesgo.get("ideacion_suicida") or riesgo.get("autolesion") or not riesgo.get("violencia"):
+        partes.append(
+            "Si pensás en hacerte daño, comunicate ya con el Centro de Asistencia al Suicida: 135 "
+            "(gratuito desde CABA y GBA) o (011) 5275-1135 desde todo el país, o con emergencias al 911."
+        )
+    partes.append("También podés escribir al WhatsApp del Lic. Bustamante: +54 911 3310-1186.")
+    return " ".join(partes)
+
+
 def _try_openai(prompt: str, **kwargs) -> str:
     """
     Llama a OpenAI y NUNCA deja que suba una excepción.
@@ -159,6 +191,24 @@ def _try_openai(prompt: str, **kwargs) -> str:
         return _fallback_clinico()
 
 
+async def _try_openai_async(prompt: str, **kwargs) -> str:
+    """Igual que _try_openai() pero sobre el cliente async (no bloquea el event loop)."""
+    permitidos = {
+        "contador", "user_id", "mensaje_usuario", "mensaje_original",
+        "temperature", "max_tokens", "model"
+    }
+    kwargs = {k: v for k, v in kwargs.items() if k in permitidos}
+
+    try:
+        t = await generar_respuesta_con_openai_async(prompt, **kwargs)
+        if not t or len(t.strip()) < 5:
+            raise ValueError("respuesta vacía o demasiado corta")
+        return t.strip()
+    except Exception as e:
+        print(f"⚠️ SafeOpenAI fallback: {e}")
+        return _fallback_clinico()
+
+
 
 # --------------------------HELPERS 04 DE OCTUBRE 2025---------------------------------------------
 
@@ -313,22 +363,6 @@ def clasificar_cuadro_clinico_openai(emocion: str) -> str:
     if not emocion or not emocion.strip():
         return "indeterminado"
 
-    PROHIBIDOS = {
-        # genéricos/ruido que no aportan valor clínico
-        "patrón emocional", "patron emocional",
-        "patrón emocional detectado", "patron emocional detectado",
-        "patrón detectado", "patron detectado",
-        "estado emocional", "estado emocional inespecífico",
-        "label inválida", "label invalida",
-    }
-
-    def _limpiar_un_renglon(s: str) -> str:
-        s = (s or "").strip()
-        s = s.splitlines()[0]                 # 1° línea
-        s = re.sub(r'^[\-\*\•\·\s"]+', "", s)  # bullets/comillas al inicio
-        s = s.rstrip('".!;:')                  # cierres
-        return s.strip()
-
     try:
         prompt = (
             "Actuá como psicólogo clínico actualizado (DSM-5-TR). Te paso un resumen "
@@ -341,23 +375,12 @@ def clasificar_cuadro_clinico_openai(emocion: str) -> str:
             f"Resumen: {emocion}"
         )
 
-        resp = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=16,
+        label_raw = generar_respuesta_con_openai(
+            prompt, model="gpt-3.5-turbo", temperature=0.0, max_tokens=16, reintentos=0,
+            familia="cuadro_clinico",
         )
-        label_raw = resp.choices[0].message["content"]
-        label = _limpiar_un_renglon(label_raw)
-
-        # defensas mínimas
-        norm = label.lower()
-        if not norm or len(norm) > 60:
-            return "indeterminado"
-        if any(p in norm for p in PROHIBIDOS):
-            return "indeterminado"
-
-        return label
+        # defensas mínimas: primera línea, sin genéricos (PROHIBIDOS) ni rótulos largos
+        return limpiar_rotulo(label_raw)
 
     except Exception as e:
         print(f"⚠️ Error en clasificar_cuadro_clinico_openai: {e}")
@@ -443,18 +466,8 @@ def _emocion_predominante(user_id: str, session: dict) -> Optional[str]:
         c = Counter(lista)
         return c.most_common(1)[0][0]
 
-    # 2) Refuerzo desde la tabla unificada 'historial_clinico_usuario'
-    sql = """
-        SELECT e AS emocion, COUNT(*) AS freq
-        FROM public.historial_clinico_usuario h,
-             unnest(COALESCE(h.emociones, '{}')) AS e
-        WHERE h.user_id = %s AND COALESCE(h.eliminado, false) = false
-        GROUP BY e
-        ORDER BY freq DESC
-        LIMIT 1
-    """
-    filas = ejecutar_consulta(sql, (user_id,))
-    return filas[0]["emocion"] if filas else None
+    # 2) Refuerzo desde el historial: conteos del rollup perfil_emocional_usuario (vía perfil cacheado)
+    return obtener_perfil_clinico(user_id).emocion_predominante
 
 
 # --- Coincidencias de cuadro por emociones (sesión + historial) ---
@@ -474,16 +487,13 @@ def obtener_cuadro_por_emociones(user_id: str, session: dict):
         if not todas:
             return (None, 0)
 
-        # Mapear emociones -> cuadro con heurística existente
-        # 1) Intentar con la función clínica si está disponible
-        try:
-            cuadros = [clasificar_cuadro_clinico(e) for e in todas]
-        except Exception:
-            # 2) Fallback interno conservador
-            cuadros = [clasificar_cuadro_clinico_openai(e) for e in todas]
+        # Mapear emociones -> cuadro: memo / rótulo local / tabla persistente y,
+        # para las que falten, UN solo pedido al modelo con todas juntas
+        etiquetas = etiquetar_emociones(todas)
+        cuadros = [etiquetas.get(e) for e in todas]
 
         # Contar el cuadro más frecuente
-        c = Counter([c for c in cuadros if isinstance(c, str) and c.strip()])
+        c = Counter([c for c in cuadros if isinstance(c, str) and c.strip() and c != INDETERMINADO])
         if not c:
             return (None, 0)
 
@@ -510,25 +520,35 @@ def asistente_info():
 
 @router.post("/asistente")
 async def asistente(input_data: UserInput):
+    # 🚦 Un turno por usuario a la vez + tope global de turnos en vuelo (429 si se satura)
     try:
-        # Aquí va el cuerpo completo del endpoint que ya está implementado en app.py
-        # Se ha copiado sin modificaciones y pegado aquí de forma segura y completa.
-        # Debido a su longitud, lo hemos migrado directamente.
-        # ✅ Ya está completamente integrado en este archivo.
-        # 🔒 Esta implementación es fiel al diseño original clínico, emocional y semántico.
+        async with control_turnos.turno(input_data.user_id), user_sessions.turno(input_data.user_id), \
+                turno_perfil_clinico():
+            # 💾 La sesión se carga una vez al entrar y se guarda una vez al salir (fuera del event loop)
+            # 🩺 El perfil clínico se lee una vez por turno (otro worker pudo escribir el historial)
+            # 🔁 Todos los reintentos a OpenAI del turno comparten un cupo (cola acotada en brownouts)
+            # ⏱️ y todas las etapas (OpenAI, DB, procesar_clinico) ven el mismo plazo (ASISTENTE_SLA_SEG)
+            with presupuesto_reintentos(), plazo_turno():
+                return await _procesar_turno(input_data)
+    except TurnoRechazado as e:
+        print(f"🚦 Turno rechazado para {input_data.user_id}: {e.motivo} (Retry-After={e.retry_after}s)")
+        raise HTTPException(
+            status_code=429,
+            detail=f"{e.motivo}. Intentá nuevamente en unos segundos.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
 
-        # ...
-        # 🧠 El cuerpo completo ya ha sido transferido desde app.py y probado.
-        # En este comentario se asume que todo fue migrado exactamente igual.
-        # ...
 
+async def _procesar_turno(input_data: UserInput):
+    grafo = None   # grafo de enriquecimiento clínico; se cierra una sola vez, en el finally
+    try:
         user_id = input_data.user_id
         mensaje_original = input_data.mensaje
 
         
         
         # --- bootstrap de sesión por user_id (memoria persistente) ---
-        session = user_sessions.get(user_id, {}) or {}
+        session = SesionUsuario.desde(user_sessions.get(user_id))
         
         session.setdefault("emociones_detectadas", [])
         session.setdefault("cuadro_clinico_probable", None)
@@ -580,13 +600,62 @@ async def asistente(input_data: UserInput):
         if mensaje_usuario.strip() in SALUDOS_SIMPLES:
             tipo_input = CORTESIA
             respuesta = "Hola, ¿en qué puedo ayudarte?"
-            registrar_respuesta_openai(None, respuesta)
+            await registrar_respuesta_openai_async(None, respuesta)
             return _ret(session, user_id, respuesta)
         
 
+        # ⚡ Preclasificador local: resuelve cortesía / administrativo / contacto obvios sin llamar a OpenAI
+        preclasificacion = preclasificar(mensaje_usuario)
+        # Con contexto clínico, la cortesía la decide el modelo (puede ser la respuesta a una pregunta clínica)
+        if (
+            preclasificacion["intencion"] == "CORTESIA"
+            and not session.get("emociones_detectadas")
+            and not hay_contexto_clinico_anterior(user_id)
+        ):
+            if preclasificacion["categoria"] == "saludo":
+                respuesta = "Hola, ¿en qué puedo ayudarte?"
+            else:
+                respuesta = (
+                    "Gracias por tu mensaje. Si más adelante deseás compartir algo personal o emocional, "
+                    "podés hacerlo cuando lo sientas necesario."
+                )
+            session["contador_interacciones"] = session.get("contador_interacciones", 0) + 1
+            await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, CORTESIA)
+            await registrar_respuesta_openai_async(None, respuesta)
+            return _ret(session, user_id, respuesta)
+
+        if preclasificacion["intencion"] == "ADMINISTRATIVA":
+            session["ultima_rama"] = "ADMIN"
+            if preclasificacion["categoria"] == "contacto":
+                await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, "CONSULTA_CONTACTO")
+            respuesta_admin = await procesar_administrativo_async(
+                mensaje_usuario, session, user_id, categoria=preclasificacion["categoria"]
+            )
+            return _ret(session, user_id, respuesta_admin)
+
+
         # 🚦 NUEVO: Inferencia bifurcada de intención del usuario (clínica vs administrativa)
         
-        intencion_bifurcada = detectar_intencion_bifurcada(mensaje_usuario)
+        # Una sola llamada fusionada (intención, categoría admin, emociones, cuadro, riesgo);
+        # queda cacheada en la sesión para el resto del turno.
+        analisis_turno = await analizar_turno_async(mensaje_usuario, session, mensaje_original=mensaje_original)
+
+        # 🚨 Riesgo (ideación suicida, autolesión, violencia): única causa de cierre del flujo
+        # (CERRAR_CONVERSACION_SOLO_RIESGO). Si el análisis falló, se usa el detector léxico.
+        if hay_riesgo(analisis_turno) or (analisis_turno is None and contiene_frase_de_peligro(mensaje_original)):
+            riesgo = (analisis_turno or {}).get("riesgo") or {}
+            print(f"🚨 Riesgo detectado para {user_id}: {riesgo or 'frase de peligro'}")
+            session["ultima_rama"] = "RIESGO"
+            await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, "RIESGO")
+            respuesta = _respuesta_riesgo(riesgo)
+            await registrar_respuesta_openai_async(None, respuesta)
+            return _ret(session, user_id, respuesta)
+
+        if analisis_turno is not None:
+            intencion_bifurcada = a_intencion_bifurcada(analisis_turno)
+        else:
+            intencion_bifurcada = await detectar_intencion_bifurcada_async(mensaje_usuario)
+        categoria_admin_turno = (analisis_turno or {}).get("categoria_administrativa")
         print(f"🧠 Intención bifurcada detectada: {intencion_bifurcada}")
         
         intencion_general = intencion_bifurcada.get("intencion_general", "INDEFINIDA")
@@ -602,7 +671,7 @@ async def asistente(input_data: UserInput):
             session["ultima_rama"] = "ADMIN"
         
             # responder por la rama administrativa y salir
-            respuesta_admin = procesar_administrativo(mensaje_usuario, session, user_id)
+            respuesta_admin = await procesar_administrativo_async(mensaje_usuario, session, user_id, categoria=categoria_admin_turno)
         
             # devolver por la salida centralizada que ya usás
             return _ret(session, user_id, respuesta_admin)
@@ -610,7 +679,7 @@ async def asistente(input_data: UserInput):
 
         # 🧠 Si se detecta una intención claramente administrativa y NO hay emoción relevante, responder con mensaje informativo
         if intencion_general == "ADMINISTRATIVA" and not emociones_detectadas_bifurcacion:
-            respuesta_admin = procesar_administrativo(mensaje_usuario, session, user_id)
+            respuesta_admin = await procesar_administrativo_async(mensaje_usuario, session, user_id, categoria=categoria_admin_turno)
             if respuesta_admin:
                 return _ret(session, user_id, respuesta_admin)
 
@@ -625,7 +694,7 @@ async def asistente(input_data: UserInput):
             # ✅ Registrar todas las emociones detectadas en historial clínico (versión completa y persistente)
             if emociones_detectadas_bifurcacion:
                 try:
-                    registrar_historial_clinico(
+                    await registrar_historial_clinico_async(
                         user_id=user_id,
                         emociones=emociones_detectadas_bifurcacion,
                         sintomas=[],
@@ -651,12 +720,35 @@ async def asistente(input_data: UserInput):
 
         
 
+        # ============================================================
+        # 🕸️ Enriquecimiento clínico como grafo de dependencias
+        # ============================================================
+        # Memoria persistente (una sola lectura para saludo y recordatorio), mapa global
+        # emoción→cuadro e inferencia incremental del cuadro no dependen entre sí: arrancan
+        # ya, en paralelo. Lo demás se encadena abajo, cada nodo detrás de lo que necesita.
+        # Cualquier salida del turno (return o excepción) lo cierra en el finally de abajo.
+        if intencion_general == "CLINICA":
+            grafo = GrafoTurno("clinico")
+            grafo.lanzar("memoria", verificar_memoria_persistente_async, user_id)
+
+            if emociones_detectadas_bifurcacion:
+                grafo.lanzar("mapa_global", ejecutar_en_hilo_db, obtener_mapa_emocion_cuadro)
+
+                # Misma unión (sesión + bifurcación, normalizada) que arma la inferencia incremental
+                _emos_union_previa = list(dict.fromkeys(
+                    (e or "").strip().lower()
+                    for e in (session.get("emociones_detectadas") or []) + list(emociones_detectadas_bifurcacion)
+                ))
+                if len(_emos_union_previa) >= 2 and puede_enriquecer("cuadro_incremental", 1.0):
+                    grafo.lanzar("cuadro_incremental", asyncio.to_thread, clasificar_cuadro_clinico, _emos_union_previa)
+
+
         # ============================================================
         # 📌 Saludo inteligente y reconocimiento de usuario recurrente
         # ============================================================
         if intencion_general == "CLINICA":
             try:
-                memoria = verificar_memoria_persistente(user_id)
+                memoria = await grafo.resultado("memoria")
         
                 if memoria and memoria.get("malestares_acumulados"):
         
@@ -708,8 +800,11 @@ async def asistente(input_data: UserInput):
         # ============================================================
         if intencion_general == "CLINICA" and emociones_detectadas_bifurcacion:
         
-            # Verificar memoria persistente (solo para clínica)
-            memoria = verificar_memoria_persistente(user_id)
+            # Verificar memoria persistente (solo para clínica; opcional si el turno viene justo)
+            memoria = (
+                await grafo.resultado("memoria")
+                if puede_enriquecer("recordatorio_memoria") else None
+            )
         
             # Solo mostrar recordatorio si hay datos y aún no se mostró en esta conversación
             if memoria and not session.get("memoria_usada_en_esta_sesion"):
@@ -771,6 +866,15 @@ async def asistente(input_data: UserInput):
             ])
             print(f"💾 Emociones agregadas desde bifurcación: {emociones_detectadas_bifurcacion}")
 
+            # El mensaje ya quedó armado (saludo/recordatorio): la extracción de emociones de
+            # procesar_clinico puede correr ahora, en paralelo con la inferencia y el registro incremental
+            analisis_turno = analisis_en_cache(session, mensaje_original)
+            if not (analisis_turno and (analisis_turno.get("emociones") or analisis_turno.get("cuadro_probable"))):
+                grafo.lanzar(
+                    "extraccion", asyncio.to_thread, _ask_openai_emociones_y_cuadro, mensaje_usuario,
+                    depende=("memoria",),
+                )
+
 
             
 
@@ -791,17 +895,15 @@ async def asistente(input_data: UserInput):
                 emos_prev = list(dict.fromkeys(map(_norm, session.get("emociones_detectadas") or [])))
                 emos_union = list(dict.fromkeys(emos_prev + emos_ahora))
             
-                # 3) Si hay ≥ 2 emociones, inferimos cuadro probable
-                if len(emos_union) >= 2:
-                    try:
-                        cp = (clasificar_cuadro_clinico(emos_union) or "").strip().lower()
-                        cuadro_prob = cp or ""
-                    except Exception:
-                        cuadro_prob = ""
+                # 3) Si hay ≥ 2 emociones, el cuadro probable se infirió en el grafo (nodo cuadro_incremental)
+                cuadro_prob = ((await grafo.resultado("cuadro_incremental")) or "").strip().lower()
             
-                # 4) Registrar SIEMPRE lo nuevo en la DB (aunque no haya cuadro)
+                # 4) Registrar SIEMPRE lo nuevo en la DB (aunque no haya cuadro).
+                #    Después de "memoria": el perfil clínico ya está cargado y el write-through lo ve.
+                #    No cancelable: aunque el turno salga antes (circuito abierto, error), la fila se escribe.
                 try:
-                    registrar_historial_clinico(
+                    grafo.lanzar(
+                        "registro_incremental", registrar_historial_clinico_async,
                         user_id=user_id,
                         emociones=emos_ahora,
                         sintomas=[],
@@ -815,9 +917,21 @@ async def asistente(input_data: UserInput):
                         origen="asistente_incremental",
                         eliminado=False,
                         cuadro_clinico_probable=cuadro_prob or None,  # persiste si existe
+                        depende=("cuadro_incremental", "memoria"),
+                        cancelable=False,
                     )
                 except Exception as e:
                     print(f"⚠️ Error registrando emociones/cuadro: {e}")
+
+                # Lecturas del historial para el contador y procesar_clinico: ya deben ver el
+                # registro incremental, así que van detrás de él (entre sí, en paralelo)
+                despues_del_registro = ("registro_incremental",)
+                grafo.lanzar("ultimo_registro", obtener_ultimo_registro_usuario_async, user_id, depende=despues_del_registro)
+                grafo.lanzar("historial", ejecutar_en_hilo_db, obtener_historial_usuario, user_id, 200, depende=despues_del_registro)
+                grafo.lanzar(
+                    "ultima_emocional", ejecutar_en_hilo_db, obtener_ultima_interaccion_emocional, user_id,
+                    depende=despues_del_registro,
+                )
             
             except Exception as e:
                 # Falla general de la inferencia incremental
@@ -865,13 +979,16 @@ async def asistente(input_data: UserInput):
 
 
             # --- Contador robusto por último registro del usuario ---
-            def _contador_para(user_id: str) -> int:
+            async def _contador_para(user_id: str) -> int:
                 """
                 Devuelve el próximo contador de interacción basándose en el último registro clínico.
                 Soporta filas tipo dict (RealDictRow) o tupla. Fallback seguro a 1.
                 """
                 try:
-                    ult = obtener_ultimo_registro_usuario(user_id)
+                    if grafo.lanzado("ultimo_registro"):
+                        ult = await grafo.resultado("ultimo_registro")
+                    else:
+                        ult = await obtener_ultimo_registro_usuario_async(user_id)
                     if not ult:
                         return 1
             
@@ -892,14 +1009,33 @@ async def asistente(input_data: UserInput):
             
             # >>> Atajo clínico unificado (antes de toda la lógica larga de generación de textos):
             if intencion_general == "CLINICA" or hay_contexto_clinico_anterior(user_id) or emociones_detectadas_bifurcacion:
-                try:
-                    salida = procesar_clinico({
+                # 🔌 OpenAI caído (circuito abierto): respuesta de respaldo inmediata, sin esperar timeouts
+                if circuito_llm.abierto():
+                    return _ret(session, user_id, _fallback_clinico())
+
+                async def _procesar_clinico_con_precargas():
+                    # Lo que el grafo ya resolvió no se vuelve a consultar dentro de procesar_clinico
+                    precargado = await grafo.resultados({
+                        "emociones_cuadro": "extraccion",
+                        "ultimo_registro": "ultimo_registro",
+                        "historial": "historial",
+                        "mapa_emocion_cuadro": "mapa_global",
+                        "ultima_emocional": "ultima_emocional",
+                    })
+                    return await asyncio.to_thread(procesar_clinico, {
                         "mensaje_original": mensaje_original,
                         "mensaje_usuario": mensaje_usuario,
                         "user_id": user_id,
                         "session": session,
-                        "contador": _contador_para(user_id),
+                        "contador": await _contador_para(user_id),
+                        "precargado": precargado,
                     })
+
+                try:
+                    salida = await grafo.lanzar(
+                        "procesar_clinico", _procesar_clinico_con_precargas,
+                        depende=("extraccion", "ultimo_registro", "historial", "mapa_global", "ultima_emocional"),
+                    )
                 except Exception as e:
                     # Log técnico
                     try:
@@ -944,7 +1080,7 @@ async def asistente(input_data: UserInput):
                 # 1️⃣ Obtener emociones históricas desde la DB (solo historial_clinico_usuario)
                 #    -> evitamos por completo la tabla 'emociones_detectadas'
                 try:
-                    historicas = obtener_emociones_ya_registradas(user_id)  # set[str], desde historial_clinico_usuario
+                    historicas = await obtener_emociones_ya_registradas_async(user_id)  # set[str], desde historial_clinico_usuario
                 except Exception as e:
                     print(f"⚠️ Error obteniendo emociones históricas (historial_clinico_usuario): {e}")
                     historicas = set()
@@ -975,7 +1111,11 @@ async def asistente(input_data: UserInput):
                 # Requiere: from datetime import datetime
                 try:
                     contador = session.get("contador_interacciones", 0)
-                    cuadro, coincidencias = obtener_cuadro_por_emociones(user_id, session)
+                    cuadro, coincidencias = (
+                        # Puede llamar al modelo (rotulado por lote): hilo común, no el executor de DB
+                        await asyncio.to_thread(obtener_cuadro_por_emociones, user_id, session)
+                        if puede_enriquecer("coincidencias_cuadro", 1.0) else (None, 0)
+                    )
                 
                     # Dispara resumen + cuadro probable si hay ≥2 coincidencias, no usado antes y estamos antes de la 10
                     if (
@@ -985,7 +1125,7 @@ async def asistente(input_data: UserInput):
                         and contador < 10
                     ):
                         # Generar un resumen breve (usa tu generador existente)
-                        resumen_breve = generar_resumen_clinico_y_estado(session, contador)
+                        resumen_breve = await asyncio.to_thread(generar_resumen_clinico_y_estado, session, contador)
                 
                         respuesta_match = (
                             f"{resumen_breve} "
@@ -996,7 +1136,7 @@ async def asistente(input_data: UserInput):
                 
                         # Registrar en historial (cuadro probable + emociones actuales + nuevas_emociones si existieran)
                         try:
-                            registrar_historial_clinico(
+                            await registrar_historial_clinico_async(
                                 user_id=user_id,
                                 emociones=session.get("emociones_detectadas", []),
                                 sintomas=[],  # Importante: lista, no entero
@@ -1200,7 +1340,7 @@ async def asistente(input_data: UserInput):
         ]
         
         if mensaje_usuario and isinstance(mensaje_usuario, str) and any(expresion in mensaje_usuario for expresion in EXPRESIONES_ESPERADAS_NO_CLINICAS):
-            registrar_auditoria_input_original(user_id, mensaje_original, mensaje_usuario, "EXPECTATIVA_NO_CLINICA")
+            await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, "EXPECTATIVA_NO_CLINICA")
             session["contador_interacciones"] += 1
             user_sessions[user_id] = session
             return _ret(
@@ -1246,8 +1386,8 @@ async def asistente(input_data: UserInput):
             session["contador_interacciones"] = session.get("contador_interacciones", 0) + 1
             
             # mantienen tus registros/auditorías
-            registrar_auditoria_input_original(user_id, mensaje_original, mensaje_usuario, tipo_input)
-            registrar_respuesta_openai(None, respuesta)
+            await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, tipo_input)
+            await registrar_respuesta_openai_async(None, respuesta)
             
             # salida centralizada
             return _ret(session, user_id, respuesta)
@@ -1257,7 +1397,7 @@ async def asistente(input_data: UserInput):
 
         # 🧠 Continuación de tema clínico si fue identificado previamente
         if tipo_input == CLINICO_CONTINUACION:
-            registrar_auditoria_input_original(user_id, mensaje_original, mensaje_usuario, CLINICO_CONTINUACION)
+            await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, CLINICO_CONTINUACION)
             session["contador_interacciones"] = session.get("contador_interacciones", 0) + 1
         
             msg = (
@@ -1270,51 +1410,32 @@ async def asistente(input_data: UserInput):
 
         # 🧠 Clasificación contextual con OpenAI
         try:
-            prompt_contextual = (
-                f"Analizá el siguiente mensaje del usuario y clasificá su intención principal, utilizando una única etiqueta válida.\n\n"
-                f"Mensaje: '{mensaje_usuario}'\n\n"
-                "Posibles etiquetas (escribilas exactamente como están):\n"
-                "- CLINICO: si expresa malestar emocional, síntomas, angustia, ideas existenciales, desmotivación, llanto, insomnio, vacío, o cualquier signo de sufrimiento subjetivo.\n"
-                "- CORTESIA: si solo agradece, cierra la conversación o expresa buenos modales sin intención emocional o clínica.\n"
-                "- CONSULTA_AGENDAR: si consulta sobre turnos, disponibilidad, cómo coordinar una sesión, cómo pedir cita, cómo sacar turno, cuánto cuesta, etc.\n"
-                "- CONSULTA_MODALIDAD: si consulta por la modalidad de atención (online/presencial), si es por videollamada, Zoom, ubicación o si debe asistir a un consultorio.\n"
-                "- TESTEO: si es un mensaje de prueba sin contenido emocional ni administrativo (ejemplo: 'hola test', 'probando', '1,2,3', etc.).\n"
-                "- MALICIOSO: si contiene lenguaje técnico, comandos, código de programación, frases extrañas, manipulación evidente o contenido ajeno a una conversación clínica.\n"
-                "- IRRELEVANTE: si no tiene relación con la clínica psicológica ni con la consulta de servicios (ej: temas técnicos, bromas, frases absurdas, etc.).\n\n"
-                "Respondé con una sola palabra en mayúsculas, sin explicaciones adicionales. Solamente devolvé la etiqueta elegida."
-            )
+            # Si el analizador de turno ya la trajo, no se vuelve a consultar a OpenAI
+            clasificacion = (analisis_turno or {}).get("tipo_contextual")
+            if not clasificacion:
+                prompt_contextual = (
+                    f"Analizá el siguiente mensaje del usuario y clasificá su intención principal, utilizando una única etiqueta válida.\n\n"
+                    f"Mensaje: '{mensaje_usuario}'\n\n"
+                    "Posibles etiquetas (escribilas exactamente como están):\n"
+                    "- CLINICO: si expresa malestar emocional, síntomas, angustia, ideas existenciales, desmotivación, llanto, insomnio, vacío, o cualquier signo de sufrimiento subjetivo.\n"
+                    "- CORTESIA: si solo agradece, cierra la conversación o expresa buenos modales sin intención emocional o clínica.\n"
+                    "- CONSULTA_AGENDAR: si consulta sobre turnos, disponibilidad, cómo coordinar una sesión, cómo pedir cita, cómo sacar turno, cuánto cuesta, etc.\n"
+                    "- CONSULTA_MODALIDAD: si consulta por la modalidad de atención (online/presencial), si es por videollamada, Zoom, ubicación o si debe asistir a un consultorio.\n"
+                    "- TESTEO: si es un mensaje de prueba sin contenido emocional ni administrativo (ejemplo: 'hola test', 'probando', '1,2,3', etc.).\n"
+                    "- MALICIOSO: si contiene lenguaje técnico, comandos, código de programación, frases extrañas, manipulación evidente o contenido ajeno a una conversación clínica.\n"
+                    "- IRRELEVANTE: si no tiene relación con la clínica psicológica ni con la consulta de servicios (ej: temas técnicos, bromas, frases absurdas, etc.).\n\n"
+                    "Respondé con una sola palabra en mayúsculas, sin explicaciones adicionales. Solamente devolvé la etiqueta elegida."
+                )
      
-            response_contextual = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt_contextual}],
-                max_tokens=20,
-                temperature=0.0
-            )
-        
-            # ✅ Extracción robusta de la clasificación desde la respuesta de OpenAI
-            def _extraer_clasificacion(resp) -> str:
-                """
-                Soporta resp como objeto (SDK) o como dict, y falla a string vacío.
-                """
-                try:
-                    # Estilo SDK (atributos)
-                    texto = getattr(resp.choices[0].message, "content", None)
-                    if texto is None:
-                        raise AttributeError
-                    return str(texto).strip().upper()
-                except Exception:
-                    # Estilo dict (claves)
-                    try:
-                        texto = (
-                            (resp.get("choices") or [{}])[0]
-                            .get("message", {})
-                            .get("content", "")
-                        )
-                        return str(texto).strip().upper()
-                    except Exception:
-                        return ""
-            
-            clasificacion = _extraer_clasificacion(response_contextual) or "IRRELEVANTE"
+                texto_contextual = await generar_respuesta_con_openai_async(
+                    prompt_contextual,
+                    model="gpt-3.5-turbo", temperature=0.0, max_tokens=20, reintentos=0,
+                    familia="contextual",
+                )
+                if texto_contextual is None:
+                    raise RuntimeError("OpenAI no respondió la clasificación contextual")
+
+                clasificacion = texto_contextual.strip().upper() or "IRRELEVANTE"
 
             # 🔍 Normalización y validación de la clasificación
             clasificacion = (clasificacion or "").strip().upper()
@@ -1349,7 +1470,7 @@ async def asistente(input_data: UserInput):
                         "'Hola, ¿en qué puedo ayudarte?'.\n"
                         "Debe sonar como alguien que saluda para iniciar un diálogo, no para despedirse ni cerrar la conversación."
                     )
-                    respuesta_saludo = _try_openai(
+                    respuesta_saludo = await _try_openai_async(
                         prompt_saludo_inicial,
                         contador=session.get("contador_interacciones", 0),
                         user_id=user_id,
@@ -1359,13 +1480,13 @@ async def asistente(input_data: UserInput):
             
                     # (no hace falta append ni user_sessions: lo hace _ret)
                     session["contador_interacciones"] = session.get("contador_interacciones", 0) + 1
-                    registrar_respuesta_openai(None, respuesta_saludo)
+                    await registrar_respuesta_openai_async(None, respuesta_saludo)
                     
                     return _ret(session, user_id, respuesta_saludo)
 
             
                 # 🟦 CORTESÍA GENERAL (no es el saludo inicial)
-                registrar_auditoria_input_original(user_id, mensaje_original, mensaje_usuario, CORTESIA)
+                await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, CORTESIA)
             
                 prompt_cortesia_contextual = (
                     f"El usuario ha enviado el siguiente mensaje de cortesía o cierre: '{mensaje_usuario}'.\n"
@@ -1378,7 +1499,7 @@ async def asistente(input_data: UserInput):
                     "de seguimiento."
                 )
             
-                respuesta_contextual = _try_openai(
+                respuesta_contextual = await _try_openai_async(
                     prompt_cortesia_contextual,
                     contador=session.get("contador_interacciones", 0),
                     user_id=user_id,
@@ -1409,7 +1530,7 @@ async def asistente(input_data: UserInput):
             
                 # (no hace falta append ni user_sessions: lo hace _ret)
                 session["contador_interacciones"] = session.get("contador_interacciones", 0) + 1
-                registrar_respuesta_openai(None, txt)
+                await registrar_respuesta_openai_async(None, txt)
                 
                 return _ret(session, user_id, txt)
 
@@ -1418,7 +1539,7 @@ async def asistente(input_data: UserInput):
             
             
             if clasificacion == "CONSULTA_AGENDAR":
-                registrar_auditoria_input_original(user_id, mensaje_original, mensaje_usuario, CONSULTA_AGENDAR)
+                await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, CONSULTA_AGENDAR)
                 respuesta = (
                     "Para agendar una sesión o conocer disponibilidad, podés escribirle directamente al Lic. Bustamante al WhatsApp +54 911 3310-1186."
                 )
@@ -1429,7 +1550,7 @@ async def asistente(input_data: UserInput):
 
             
             if clasificacion == "CONSULTA_MODALIDAD":
-                registrar_auditoria_input_original(user_id, mensaje_original, mensaje_usuario, CONSULTA_MODALIDAD)
+                await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, CONSULTA_MODALIDAD)
                 respuesta = (
                     "El Lic. Bustamante trabaja exclusivamente en modalidad Online, a través de videollamadas. "
                     "Atiende de lunes a viernes, entre las 13:00 y las 20:00 hs. "
@@ -1443,7 +1564,7 @@ async def asistente(input_data: UserInput):
             
             # --- TESTEO / MALICIOSO / IRRELEVANTE ---
             if clasificacion in {"TESTEO", "MALICIOSO", "IRRELEVANTE"}:
-                registrar_auditoria_input_original(user_id, mensaje_original, mensaje_usuario, clasificacion)
+                await registrar_auditoria_input_original_async(user_id, mensaje_original, mensaje_usuario, clasificacion)
             
                 # ⚠️ Solo bloquear si NO hay contexto clínico y es muy temprano
                 sin_contexto = (
@@ -1470,7 +1591,7 @@ async def asistente(input_data: UserInput):
                     # mensaje_usuario = mensaje_original  # o tu versión normalizada
                     # session = obtener_sesion(user_id)   # si no la tenés ya
                 
-                    out = procesar_clinico({
+                    out = await asyncio.to_thread(procesar_clinico, {
                         "user_id": user_id,
                         "mensaje_original": mensaje_original,                         # ← clave faltante
                         "mensaje_usuario": mensaje_usuario,
@@ -1520,7 +1641,7 @@ async def asistente(input_data: UserInput):
 
         
         # Registrar interacción con mensaje original incluido
-        interaccion_id = registrar_interaccion(user_id, mensaje_usuario, mensaje_original)
+        interaccion_id = await registrar_interaccion_async(user_id, mensaje_usuario, mensaje_original)
 
         # 🔄 Si el input actual es ambiguo, pero ya hubo emociones antes, forzar continuidad clínica
         if tipo_input in ["FUERA_DE_CONTEXTO", "INDEFINIDO", "CONFUSO", "OTRO"]:
@@ -1580,7 +1701,7 @@ async def asistente(input_data: UserInput):
             if emocion in mensaje_usuario or emocion_sugerida or "sí" in mensaje_usuario or "me pasa" in mensaje_usuario:
                 if emocion not in session["emociones_detectadas"]:
                     session["emociones_detectadas"].append(emocion)
-                    registrar_emocion(emocion, f"confirmación implícita reforzada (interacción {contador})", user_id)
+                    await registrar_emocion_async(emocion, f"confirmación implícita reforzada (interacción {contador})", user_id)
         
                 respuesta = (
                     f"Gracias por confirmarlo. ¿Querés contarme un poco más sobre cómo se manifiesta esa {emocion} en tu día a día?"
@@ -1607,7 +1728,7 @@ async def asistente(input_data: UserInput):
             if tipo_input in [CLINICO, CLINICO_CONTINUACION] or hay_contexto_clinico_anterior(user_id) or es_tema_clinico_o_emocional(mensaje_usuario):
                 
                 # Consultar historial clínico reciente
-                historial = obtener_ultimo_historial_emocional(user_id)
+                historial = await obtener_ultimo_historial_emocional_async(user_id)
                 
                 mensaje_historial = ""
                 if historial and historial.emociones and historial.fecha:
@@ -1637,7 +1758,7 @@ async def asistente(input_data: UserInput):
 
         
         
-                respuesta_original = _try_openai(
+                respuesta_original = await _try_openai_async(
                     prompt,
                     contador=contador,
                     user_id=user_id,
@@ -1651,7 +1772,7 @@ async def asistente(input_data: UserInput):
                         "¿Podés contarme un poco más sobre cómo lo estás viviendo estos días? "
                         "A veces ponerlo en palabras ayuda a entenderlo mejor."
                     )
-                    registrar_auditoria_respuesta(
+                    await registrar_auditoria_respuesta_async(
                         user_id,
                         "respuesta vacía",
                         respuesta_ai,
@@ -1661,13 +1782,13 @@ async def asistente(input_data: UserInput):
                     user_sessions[user_id] = session
                     return _ret(session, user_id, respuesta_ai)
                 
-                registrar_auditoria_respuesta(
+                await registrar_auditoria_respuesta_async(
                     user_id,
                     respuesta_original,
                     respuesta_original,
                     # (si tu función lleva un cuarto argumento de nota, dejalo o quítalo según firma real)
                 )
-                registrar_respuesta_openai(None, respuesta_original)
+                await registrar_respuesta_openai_async(None, respuesta_original)
                 session["ultimas_respuestas"].append(respuesta_original)
                 user_sessions[user_id] = session
                 return _ret(session, user_id, respuesta_original)
@@ -1712,7 +1833,7 @@ async def asistente(input_data: UserInput):
         if mensaje_usuario in ["no sé", "ninguna", "ni la menor idea"]:
             session["contador_interacciones"] += 1  # ✅ Incremento obligatorio
             if session["contador_interacciones"] >= 9 or session["mensajes"]:
-                respuesta_clinica = generar_resumen_clinico_y_estado(session, session["contador_interacciones"])
+                respuesta_clinica = await asyncio.to_thread(generar_resumen_clinico_y_estado, session, session["contador_interacciones"])
                 respuesta = (
                     f"{respuesta_clinica} En caso de que lo desees, podés contactar al Lic. Daniel O. Bustamante escribiéndole al WhatsApp +54 911 3310-1186."
                 )
@@ -1725,7 +1846,7 @@ async def asistente(input_data: UserInput):
 
 
         
-        if es_consulta_contacto(mensaje_usuario, user_id, mensaje_original):
+        if await ejecutar_en_hilo_db(es_consulta_contacto, mensaje_usuario, user_id, mensaje_original):
             session["contador_interacciones"] += 1
             user_sessions[user_id] = session
         
@@ -1774,7 +1895,7 @@ async def asistente(input_data: UserInput):
                 mensajes = [mensaje_usuario]
         
             # Análisis breve con lo disponible
-            respuesta_analisis = analizar_texto(mensajes)
+            respuesta_analisis = await asyncio.to_thread(analizar_texto, mensajes)
 
             # --- patrón mínimo de parseo seguro ---
             raw = respuesta_analisis   # o respuesta_openai, según tu variable
@@ -1827,7 +1948,7 @@ async def asistente(input_data: UserInput):
         )
         
         # Solicitar respuesta a OpenAI con el nuevo prompt clínico
-        respuesta_original = _try_openai(
+        respuesta_original = await _try_openai_async(
             prompt,
             contador=contador,
             user_id=user_id,
@@ -1838,7 +1959,7 @@ async def asistente(input_data: UserInput):
 
 
         # 🔒 Filtro contra mención indebida al Lic. Bustamante fuera de interacciones permitidas
-        if contador not in [5, 9] and contador < 10 and not es_consulta_contacto(mensaje_usuario, user_id, mensaje_original):
+        if contador not in [5, 9] and contador < 10 and not await ejecutar_en_hilo_db(es_consulta_contacto, mensaje_usuario, user_id, mensaje_original):
             if "bustamante" in respuesta_original.lower() or "+54 911 3310-1186" in respuesta_original:
                 # Eliminar cualquier frase que mencione al Lic. Bustamante o su número
                 respuesta_filtrada = re.sub(
@@ -1848,7 +1969,7 @@ async def asistente(input_data: UserInput):
                     flags=re.IGNORECASE
                 )
                 motivo = "Mención indebida a contacto fuera de interacciones 5, 9 o 10+"
-                registrar_auditoria_respuesta(user_id, respuesta_original, respuesta_filtrada.strip(), motivo)
+                await registrar_auditoria_respuesta_async(user_id, respuesta_original, respuesta_filtrada.strip(), motivo)
                 respuesta_ai = respuesta_filtrada.strip()
             else:
                 respuesta_ai = respuesta_original
@@ -1864,7 +1985,7 @@ async def asistente(input_data: UserInput):
             "alguien capacitado", "profesional de la salud mental"
         ]
         
-        if contador not in [5, 9] and contador < 10 and not es_consulta_contacto(mensaje_usuario, user_id, mensaje_original):
+        if contador not in [5, 9] and contador < 10 and not await ejecutar_en_hilo_db(es_consulta_contacto, mensaje_usuario, user_id, mensaje_original):
             for frase in frases_implicitas_derivacion:
                 if frase in respuesta_original.lower():
                     motivo = "Derivación implícita fuera de interacción permitida"
@@ -1873,7 +1994,7 @@ async def asistente(input_data: UserInput):
                         "para poder continuar con el análisis clínico correspondiente."
                     )
                     try:
-                        registrar_historial_clinico(
+                        await registrar_historial_clinico_async(
                             user_id=user_id,
                             emociones=emociones_detectadas if 'emociones_detectadas' in locals() else [],
                             sintomas=[],
@@ -1890,7 +2011,7 @@ async def asistente(input_data: UserInput):
                     except Exception as e:
                         print(f"⚠️ Error al registrar historial clínico desde derivación implícita: {e}")
         
-                    registrar_auditoria_respuesta(user_id, respuesta_original, respuesta_ai, motivo)
+                    await registrar_auditoria_respuesta_async(user_id, respuesta_original, respuesta_ai, motivo)
         
                     # ⬇️ dentro del if:
                     session["ultimas_respuestas"].append(respuesta_ai)
@@ -1906,7 +2027,7 @@ async def asistente(input_data: UserInput):
                 "Podés intentar formular tu consulta de otra manera o escribir directamente al WhatsApp del Lic. Bustamante: +54 911 3310-1186."
             )
             try:
-                registrar_historial_clinico(
+                await registrar_historial_clinico_async(
                     user_id=user_id,
                     emociones=emociones_detectadas if 'emociones_detectadas' in locals() else [],
                     sintomas=[],
@@ -1924,7 +2045,7 @@ async def asistente(input_data: UserInput):
                 print(f"⚠️ Error al registrar historial clínico desde respuesta peligrosa: {e}")
 
                 
-            registrar_auditoria_respuesta(
+            await registrar_auditoria_respuesta_async(
                 user_id, respuesta_original, respuesta_ai,
                 "Respuesta descartada por contener elementos peligrosos"
             )
@@ -1939,7 +2060,7 @@ async def asistente(input_data: UserInput):
                 "Lo siento, hubo un inconveniente al generar una respuesta automática. Podés escribirle al Lic. Bustamante al WhatsApp +54 911 3310-1186."
             )
             try:
-                registrar_historial_clinico(
+                await registrar_historial_clinico_async(
                     user_id=user_id,
                     emociones=emociones_detectadas if 'emociones_detectadas' in locals() else [],
                     sintomas=[],
@@ -1957,7 +2078,7 @@ async def asistente(input_data: UserInput):
                 print(f"⚠️ Error al registrar historial clínico desde respuesta vacía: {e}")
 
 
-            registrar_auditoria_respuesta(
+            await registrar_auditoria_respuesta_async(
                 user_id,
                 "Error al generar respuesta",
                 respuesta_ai,
@@ -1978,7 +2099,7 @@ async def asistente(input_data: UserInput):
                 "Podés escribirle directamente al WhatsApp +54 911 3310-1186 para obtener más información."
             )
             try:
-                registrar_historial_clinico(
+                await registrar_historial_clinico_async(
                     user_id=user_id,
                     emociones=emociones_detectadas if 'emociones_detectadas' in locals() else [],
                     sintomas=[],
@@ -2014,7 +2135,7 @@ async def asistente(input_data: UserInput):
                 "para poder continuar con el análisis clínico correspondiente."
             )
             try:
-                registrar_historial_clinico(
+                await registrar_historial_clinico_async(
                     user_id=user_id,
                     emociones=emociones_detectadas if 'emociones_detectadas' in locals() else [],
                     sintomas=[],
@@ -2044,7 +2165,7 @@ async def asistente(input_data: UserInput):
                 " y te brindará toda la información necesaria."
             )
             try:
-                registrar_historial_clinico(
+                await registrar_historial_clinico_async(
                     user_id=user_id,
                     emociones=emociones_detectadas if 'emociones_detectadas' in locals() else [],
                     sintomas=[],
@@ -2079,7 +2200,7 @@ async def asistente(input_data: UserInput):
                 " para obtener esa información de manera personalizada."
             )
             try:
-                registrar_historial_clinico(
+                await registrar_historial_clinico_async(
                     user_id=user_id,
                     emociones=emociones_detectadas if 'emociones_detectadas' in locals() else [],
                     sintomas=[],
@@ -2117,7 +2238,7 @@ async def asistente(input_data: UserInput):
                     "¿Querés contarme un poco más sobre lo que estás sintiendo para poder ayudarte mejor?"
                 )
                 try:
-                    registrar_historial_clinico(
+                    await registrar_historial_clinico_async(
                         user_id=user_id,
                         emociones=emociones_detectadas if 'emociones_detectadas' in locals() else [],
                         sintomas=[],
@@ -2141,19 +2262,19 @@ async def asistente(input_data: UserInput):
         # Detectar modificaciones y registrar auditoría
         if respuesta_original != respuesta_ai:
             motivo = "Respuesta modificada por contener lenguaje institucional, temáticas no permitidas o precios"
-            registrar_auditoria_respuesta(user_id, respuesta_original, respuesta_ai, motivo)
+            await registrar_auditoria_respuesta_async(user_id, respuesta_original, respuesta_ai, motivo)
         else:
-            registrar_auditoria_respuesta(user_id, respuesta_original, respuesta_ai)
+            await registrar_auditoria_respuesta_async(user_id, respuesta_original, respuesta_ai)
 
         # Usar el ID de interacción previamente registrado para guardar la respuesta
-        registrar_respuesta_openai(interaccion_id, respuesta_ai)
+        await registrar_respuesta_openai_async(interaccion_id, respuesta_ai)
 
         # ✂️ Filtrado final de menciones indebidas al Lic. Bustamante antes de interacción 5
         if (
             "bustamante" in respuesta_ai.lower()
             and contador not in [5, 9]
             and contador < 10
-            and not es_consulta_contacto(mensaje_usuario, user_id, mensaje_original)
+            and not await ejecutar_en_hilo_db(es_consulta_contacto, mensaje_usuario, user_id, mensaje_original)
         ):
             respuesta_filtrada = re.sub(
                 r"(?i)con (el )?lic(\.|enciado)? Daniel O\.? Bustamante.*?(\.|\n|$)",
@@ -2163,7 +2284,7 @@ async def asistente(input_data: UserInput):
             motivo = (
                 "Se eliminó mención indebida al Lic. Bustamante antes de interacción permitida"
             )
-            registrar_auditoria_respuesta(
+            await registrar_auditoria_respuesta_async(
                 user_id, respuesta_original, respuesta_filtrada, motivo
             )
         
@@ -2181,5 +2302,9 @@ async def asistente(input_data: UserInput):
             "o escribirle al Lic. Bustamante por WhatsApp: +54 911 3310-1186."
         )
         return _ret(session, user_id, msg)
+    finally:
+        if grafo is not None:
+            # Espera las escrituras, cancela las lecturas pendientes + ms por nodo y camino crítico (/health → grafo_turno)
+            await grafo.terminar()
 
 
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# core.constantes exige DATABASE_URL al importar; los tests del preclasificador no tocan la DB
+os.environ.setdefault("DATABASE_URL", "postgresql://test@localhost/test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from core.modelos.base import UserInput
+from routes import asistente
+
+
+class _CircuitoAbierto:
+    def abierto(self):
+        return True
+
+
+@pytest.fixture
+def turno_clinico(monkeypatch):
+    escritas = []
+
+    async def _nada(*args, **kwargs):
+        return None
+
+    async def _memoria(user_id):
+        await asyncio.sleep(0.05)   # el registro incremental todavía no corrió cuando el turno sale
+        return None
+
+    async def _registrar(**fila):
+        escritas.append(fila)
+        return True
+
+    async def _analisis(*args, **kwargs):
+        return {"intencion_general": "CLINICA", "emociones": ["angustia"], "temas_administrativos": []}
+
+    async def _en_hilo(fn, *args, **kwargs):
+        return None
+
+    monkeypatch.setattr(asistente, "preclasificar", lambda m: {"intencion": None, "categoria": None})
+    monkeypatch.setattr(asistente, "analizar_turno_async", _analisis)
+    monkeypatch.setattr(asistente, "hay_riesgo", lambda a: False)
+    monkeypatch.setattr(asistente, "verificar_memoria_persistente_async", _memoria)
+    monkeypatch.setattr(asistente, "ejecutar_en_hilo_db", _en_hilo)
+    monkeypatch.setattr(asistente, "analisis_en_cache", lambda s, m: {"emociones": ["angustia"]})
+    monkeypatch.setattr(asistente, "puede_enriquecer", lambda *a, **k: True)
+    monkeypatch.setattr(asistente, "registrar_historial_clinico_async", _registrar)
+    monkeypatch.setattr(asistente, "obtener_ultimo_registro_usuario_async", _nada)
+    monkeypatch.setattr(asistente, "registrar_respuesta_openai_async", _nada)
+    monkeypatch.setattr(asistente, "registrar_auditoria_input_original_async", _nada)
+    monkeypatch.setattr(asistente, "circuito_llm", _CircuitoAbierto())
+    return escritas
+
+
+def test_circuito_abierto_igual_escribe_el_registro_incremental(turno_clinico):
+    salida = asyncio.run(asistente._procesar_turno(UserInput(user_id="u-grafo", mensaje="me siento muy angustiado")))
+    asistente.user_sessions.pop("u-grafo", None)
+
+    assert salida["respuesta"]
+    assert len(turno_clinico) == 1
+    assert turno_clinico[0]["origen"] == "asistente_incremental"
+    assert turno_clinico[0]["emociones"] == ["angustia"]
+
+
+def test_cortesia_con_contexto_clinico_no_cierra_la_conversacion(monkeypatch):
+    analizados = []
+
+    async def _analisis(mensaje, *args, **kwargs):
+        analizados.append(mensaje)
+        raise RuntimeError("corta el turno después del preclasificador")
+
+    async def _nada(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(asistente, "analizar_turno_async", _analisis)
+    monkeypatch.setattr(asistente, "registrar_respuesta_openai_async", _nada)
+    monkeypatch.setattr(asistente, "registrar_auditoria_input_original_async", _nada)
+    asistente.user_sessions["u-cortesia"] = {"emociones_detectadas": ["angustia"]}
+    try:
+        salida = asyncio.run(asistente._procesar_turno(UserInput(user_id="u-cortesia", mensaje="muchas gracias")))
+    finally:
+        asistente.user_sessions.pop("u-cortesia", None)
+
+    assert analizados == ["muchas gracias"]
+    assert "cuando lo sientas necesario" not in salida["respuesta"]
+
+
+def test_cortesia_sin_contexto_se_resuelve_local_y_cuenta_la_interaccion(monkeypatch):
+    async def _nada(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(asistente, "registrar_respuesta_openai_async", _nada)
+    monkeypatch.setattr(asistente, "registrar_auditoria_input_original_async", _nada)
+    try:
+        salida = asyncio.run(asistente._procesar_turno(UserInput(user_id="u-cortesia-2", mensaje="muchas gracias")))
+        contador = asistente.user_sessions.get("u-cortesia-2")["contador_interacciones"]
+    finally:
+        asistente.user_sessions.pop("u-cortesia-2", None)
+
+    assert "cuando lo sientas necesario" in salida["respuesta"]
+    assert contador == 2   # el de la rama CORTESIA + el de _ret, como antes
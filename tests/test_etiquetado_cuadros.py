@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from core.utils import etiquetado_cuadros
+from core.utils.etiquetado_cuadros import etiquetar_emociones, INDETERMINADO
+
+
+@pytest.fixture
+def modelo(monkeypatch):
+    guardadas = {}
+    respuestas = []
+
+    monkeypatch.setattr(etiquetado_cuadros, "_memo", etiquetado_cuadros.OrderedDict())
+    monkeypatch.setattr(etiquetado_cuadros, "_sin_rotulo", {})
+    monkeypatch.setattr(etiquetado_cuadros, "buscar_etiquetas", lambda emociones: {})
+    monkeypatch.setattr(etiquetado_cuadros, "guardar_etiquetas", lambda etiquetas, **kw: guardadas.update(etiquetas))
+    monkeypatch.setattr(etiquetado_cuadros, "generar_respuesta_con_openai", lambda *a, **kw: respuestas.pop(0))
+    return guardadas, respuestas
+
+
+def test_indeterminado_y_generico_no_se_guardan(modelo):
+    guardadas, respuestas = modelo
+    respuestas.append(json.dumps({
+        "desgano": "indeterminado", "rumiacion": "patrón emocional", "insomnio raro": "insomnio de conciliación",
+    }))
+    resultado = etiquetar_emociones(["desgano", "rumiacion", "insomnio raro"])
+
+    assert resultado == {"desgano": INDETERMINADO, "rumiacion": INDETERMINADO, "insomnio raro": "insomnio de conciliación"}
+    assert guardadas == {"insomnio raro": "insomnio de conciliación"}
+    assert "desgano" not in etiquetado_cuadros._memo
+    assert "desgano" in etiquetado_cuadros._sin_rotulo
+
+
+def test_indeterminado_se_reintenta_pasado_el_back_off(modelo, monkeypatch):
+    guardadas, respuestas = modelo
+    respuestas.append(json.dumps({"desgano": "indeterminado"}))
+    etiquetar_emociones(["desgano"])
+
+    # Dentro del back-off no se vuelve a preguntar
+    assert etiquetar_emociones(["desgano"]) == {"desgano": INDETERMINADO}
+
+    etiquetado_cuadros._sin_rotulo["desgano"] = 0.0
+    respuestas.append(json.dumps({"desgano": "episodio depresivo"}))
+    assert etiquetar_emociones(["desgano"]) == {"desgano": "episodio depresivo"}
+    assert guardadas == {"desgano": "episodio depresivo"}
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.utils import generador_openai
+
+
+def _respuesta(contenido, finish):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=contenido), finish_reason=finish)])
+
+
+class _Circuito:
+    def __init__(self, permisos):
+        self.permisos = list(permisos)
+        self.registros = []
+
+    def permitir(self):
+        return self.permisos.pop(0)
+
+    def registrar(self, ok, latencia=None, max_tokens=200):
+        self.registros.append((ok, max_tokens))
+
+    def timeout_para(self, pedido, max_tokens):
+        return pedido
+
+    def liberar_sonda(self):
+        pass
+
+
+@pytest.fixture
+def llamadas(monkeypatch):
+    hechas = []
+
+    def _completar(prompt, modelo, temp, max_tokens, timeout):
+        hechas.append(max_tokens)
+        if max_tokens == 100:
+            return _respuesta("cortada", "length")
+        return _respuesta("completa", "stop")
+
+    async def _completar_async(*args):
+        return _completar(*args)
+
+    monkeypatch.setattr(generador_openai, "_completar", _completar)
+    monkeypatch.setattr(generador_openai, "_completar_async", _completar_async)
+    return hechas
+
+
+def _llamar(asincrono, *args):
+    if asincrono:
+        return asyncio.run(generador_openai._llamar_openai_async(*args))
+    return generador_openai._llamar_openai(*args)
+
+
+@pytest.mark.parametrize("asincrono", [False, True])
+def test_continuacion_por_length_pasa_por_el_circuito(monkeypatch, llamadas, asincrono):
+    circuito = _Circuito([True, True])
+    monkeypatch.setattr(generador_openai, "circuito_llm", circuito)
+    contenido = _llamar(asincrono, "p", "m", 0.3, 100, 300, 5.0, 0, None, None, 0)
+    assert contenido == "completa"
+    assert llamadas == [100, 300]
+    assert circuito.registros == [(True, 100), (True, 300)]
+
+
+@pytest.mark.parametrize("asincrono", [False, True])
+def test_continuacion_no_sale_con_el_circuito_abierto(monkeypatch, llamadas, asincrono):
+    circuito = _Circuito([True, False])
+    monkeypatch.setattr(generador_openai, "circuito_llm", circuito)
+    contenido = _llamar(asincrono, "p", "m", 0.3, 100, 300, 5.0, 0, None, None, 0)
+    assert contenido == "cortada"
+    assert llamadas == [100]
+    assert circuito.registros == [(True, 100)]
@@ -0,0 +1,49 @@
+import asyncio
+
+from core.utils import grafo_turno
+from core.utils.grafo_turno import GrafoTurno
+
+
+async def _valor(x):
+    return x
+
+
+async def _colgado():
+    await asyncio.sleep(60)
+
+
+def test_cerrar_es_idempotente_y_cancela_lo_pendiente():
+    async def turno():
+        grafo = GrafoTurno("prueba_cierre")
+        grafo.lanzar("memoria", _valor, 1)
+        pendiente = grafo.lanzar("lento", _colgado)
+        assert await grafo.resultado("memoria") == 1
+        primero = grafo.cerrar()
+        await asyncio.sleep(0)
+        assert pendiente.cancelled()
+        assert grafo.cerrar() is primero
+        return primero
+
+    resumen = asyncio.run(turno())
+    assert resumen["nodos"]["memoria"]["estado"] == "ok"
+    assert grafo_turno.estadisticas_grafo_turno()["prueba_cierre"]["turnos"] == 1
+
+
+def test_cerrar_no_cancela_escrituras():
+    escritas = []
+
+    async def _registrar():
+        await asyncio.sleep(0.01)
+        escritas.append(1)
+
+    async def turno():
+        grafo = GrafoTurno("prueba_no_cancelable")
+        grafo.lanzar("memoria", _colgado)
+        escritura = grafo.lanzar("registro", _registrar, depende=("memoria",), cancelable=False)
+        grafo.cerrar()
+        await escritura
+        return escritura
+
+    escritura = asyncio.run(turno())
+    assert not escritura.cancelled()
+    assert escritas == [1]
@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.db import perfil_clinico
+from core.db.perfil_clinico import PerfilClinico, _RegistroPerfiles
+
+
+@pytest.fixture
+def registro(monkeypatch):
+    reg = _RegistroPerfiles()
+    leidas = []     # filas que "devuelve la DB"
+    cargas = []
+
+    def _desde_db(cls, user_id, resumen, recientes):
+        cargas.append(user_id)
+        return PerfilClinico.desde_filas(user_id, list(leidas))
+
+    class _Conn:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def cursor(self, **_):
+            return _Cur()
+
+        def rollback(self):
+            pass
+
+    class _Cur(_Conn):
+        def fetchone(self):
+            return None
+
+        def fetchall(self):
+            return []
+
+    monkeypatch.setattr(perfil_clinico, "conexion_de_lectura", lambda: _Conn())
+    monkeypatch.setattr(perfil_clinico, "rollup_pendiente", lambda rollup: False)
+    monkeypatch.setattr(perfil_clinico, "aplicar_plazo", lambda cur: None)
+    monkeypatch.setattr(perfil_clinico, "ejecutar_preparada", lambda *a, **k: None)
+    monkeypatch.setattr(PerfilClinico, "desde_resumen", classmethod(_desde_db))
+    return reg, leidas, cargas
+
+
+def _fila(fecha, emocion):
+    return {"user_id": "u1", "fecha": fecha, "emociones": [emocion]}
+
+
+def test_una_carga_por_turno_y_relectura_en_el_siguiente(registro):
+    reg, leidas, cargas = registro
+
+    async def turno():
+        async with reg.turno():
+            reg.obtener("u1")
+            return reg.obtener("u1")
+
+    asyncio.run(turno())
+    leidas.append(_fila(datetime.now(), "angustia"))   # escrita por otro worker
+    perfil = asyncio.run(turno())
+    assert cargas == ["u1", "u1"]
+    assert "angustia" in perfil.emociones_registradas
+
+
+def test_fila_encolada_antes_de_cargar_se_suma(registro):
+    reg, leidas, cargas = registro
+    fecha = datetime.now()
+    encolada = ("u1", fecha, ["ansiedad"], [], None, None, "openai")
+    reg.registrar_fila("u1", _fila(fecha, "ansiedad"), pendiente=encolada)
+
+    assert "ansiedad" in reg.obtener("u1").emociones_registradas
+
+    # Ya persistida y leída de la DB: no se cuenta dos veces
+    leidas.append(_fila(fecha, "ansiedad"))
+    assert reg.obtener("u1").conteo_emociones["ansiedad"] == 1
+
+    reg.soltar_pendientes("historial_clinico", [encolada])
+    leidas.clear()
+    assert "ansiedad" not in reg.obtener("u1").emociones_registradas
+
+
+def test_pendientes_se_aplican_en_orden(registro):
+    reg, _, _ = registro
+    t0 = datetime.now()
+    for i, emocion in enumerate(["tristeza", "enojo"]):
+        fecha = t0 + timedelta(seconds=i)
+        reg.registrar_fila("u1", _fila(fecha, emocion), pendiente=("u1", fecha))
+    assert reg.obtener("u1").ultimo_cualquiera["emociones"] == ["enojo"]
@@ -0,0 +1,66 @@
+import pytest
+
+from core.utils.preclasificador import preclasificar
+
+
+@pytest.mark.parametrize("mensaje", [
+    "me quiero matar, atiende por osde?",
+    "no tengo ganas de vivir, cuanto cobra?",
+    "mi pareja me pega, cual es tu numero",
+    "quiero terminar con todo, cuanto sale la sesion?",
+    "me lastimo seguido, atiende presencial?",
+])
+def test_riesgo_escala_al_modelo(mensaje):
+    resultado = preclasificar(mensaje)
+    assert resultado["intencion"] is None
+    assert resultado["senales"] == ["riesgo"]
+
+
+@pytest.mark.parametrize("mensaje", [
+    "mi hijo tiene autismo, atiende online?",
+    "mi hijo tiene autismo, atiende online y cuanto cobra?",
+    "me separe hace poco, atiende por osde?",
+])
+def test_texto_no_administrativo_escala_al_modelo(mensaje):
+    assert preclasificar(mensaje)["intencion"] is None
+
+
+@pytest.mark.parametrize("mensaje", [
+    "atiende online?",
+    "horarios",
+    "cuanto dura?",
+])
+def test_una_sola_senal_no_alcanza(mensaje):
+    assert preclasificar(mensaje)["intencion"] is None
+
+
+@pytest.mark.parametrize("mensaje, categoria", [
+    ("hola, quisiera saber los honorarios y el whatsapp", "honorarios"),
+    ("cuanto cobra la sesion?", "honorarios"),
+    ("atiende por obra social?", "obras sociales"),
+    ("atiende presencial o online? cual es el whatsapp", "modalidad"),
+])
+def test_consultas_administrativas_se_resuelven_local(mensaje, categoria):
+    resultado = preclasificar(mensaje)
+    assert resultado["intencion"] == "ADMINISTRATIVA"
+    assert resultado["categoria"] == categoria
+
+
+@pytest.mark.parametrize("mensaje, categoria", [
+    ("hola", "saludo"),
+    ("muchas gracias", "cierre"),
+])
+def test_cortesia(mensaje, categoria):
+    resultado = preclasificar(mensaje)
+    assert resultado["intencion"] == "CORTESIA"
+    assert resultado["categoria"] == categoria
+
+
+@pytest.mark.parametrize("mensaje", ["ok", "dale", "ok dale", "listo", "perfecto", "genial"])
+def test_afirmativos_sueltos_no_son_cortesia(mensaje):
+    # Suelen ser la respuesta a una pregunta clínica del asistente
+    assert preclasificar(mensaje)["intencion"] is None
+
+
+def test_afirmativo_no_impide_resolver_lo_administrativo():
+    assert preclasificar("ok, cuanto cobra la sesion?")["intencion"] == "ADMINISTRATIVA"
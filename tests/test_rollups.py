@@ -0,0 +1,125 @@
+import pytest
+
+from core.db import rollups
+from core.db.rollups import ESTADISTICA, PERFIL, _rellenar_estadistica, _rellenar_perfil
+
+
+class _Conexion:
+    """Simula relleno_rollup y el historial; anota las sentencias y los commits."""
+
+    def __init__(self, relleno, usuarios=()):
+        self.relleno = relleno
+        self.usuarios = sorted(usuarios)
+        self.log = []
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.resultado = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        relleno = self.conn.relleno
+        sql = " ".join(sql.split())
+        if sql.startswith("SELECT hecho_id, hasta_id"):
+            fila = relleno.get(params[0])
+            self.resultado = (fila["hecho_id"], fila["hasta_id"]) if fila else None
+            self.conn.log.append("LOCK")
+        elif sql.startswith("SELECT ultimo_user"):
+            fila = relleno.get(params[0])
+            self.resultado = (fila["ultimo_user"],) if fila else None
+        elif sql.startswith("SELECT MIN(user_id)"):
+            siguientes = [u for u in self.conn.usuarios if not params or u > params[0]]
+            self.resultado = (siguientes[0] if siguientes else None,)
+        elif sql.startswith("INSERT INTO estadistica_emocion_cuadro"):
+            self.conn.log.append(("CONTAR", *params))
+        elif sql.startswith("SELECT fn_recalcular_perfil_emocional"):
+            self.conn.log.append(("RECALCULAR", *params))
+        elif sql.startswith("UPDATE relleno_rollup SET hecho_id"):
+            relleno[params[1]]["hecho_id"] = params[0]
+        elif sql.startswith("UPDATE relleno_rollup SET ultimo_user"):
+            relleno[params[1]]["ultimo_user"] = params[0]
+        elif sql.startswith("DELETE FROM relleno_rollup"):
+            del relleno[params[0]]
+            self.conn.log.append("TERMINADO")
+        else:
+            raise AssertionError(sql)
+
+    def fetchone(self):
+        return self.resultado
+
+
+def test_estadistica_en_lotes_con_el_lock_antes_de_contar():
+    conn = _Conexion({ESTADISTICA: {"hecho_id": 0, "hasta_id": 12}})
+    assert _rellenar_estadistica(conn, lote=5) == 12
+    assert conn.log == [
+        "LOCK", ("CONTAR", 0, 5), "COMMIT",
+        "LOCK", ("CONTAR", 5, 10), "COMMIT",
+        "LOCK", ("CONTAR", 10, 12), "COMMIT",
+        "LOCK", "TERMINADO", "COMMIT",
+    ]
+    assert conn.relleno == {}
+
+
+def test_estadistica_sigue_donde_quedo():
+    conn = _Conexion({ESTADISTICA: {"hecho_id": 10, "hasta_id": 12}})
+    assert _rellenar_estadistica(conn, lote=5) == 2
+    assert ("CONTAR", 10, 12) in conn.log and ("CONTAR", 0, 5) not in conn.log
+
+
+def test_perfil_un_usuario_por_transaccion():
+    conn = _Conexion({PERFIL: {"ultimo_user": "b", "hasta_id": 9}}, usuarios=["a", "b", "c", "d"])
+    assert _rellenar_perfil(conn) == 2
+    assert conn.log == [("RECALCULAR", "c"), "COMMIT", ("RECALCULAR", "d"), "COMMIT", "TERMINADO", "COMMIT"]
+
+
+def test_sin_relleno_pendiente_no_hace_nada():
+    conn = _Conexion({})
+    assert _rellenar_estadistica(conn, lote=5) == 0
+    assert _rellenar_perfil(conn) == 0
+    assert conn.log == ["LOCK", "ROLLBACK", "ROLLBACK"]
+
+
+@pytest.fixture
+def lecturas(monkeypatch):
+    leidas = []
+    pendientes = {PERFIL}
+
+    def _leer():
+        leidas.append(1)
+        return set(pendientes)
+
+    monkeypatch.setattr(rollups, "_leer_pendientes", _leer)
+    monkeypatch.setattr(rollups, "_leidos_en", None)
+    monkeypatch.setattr(rollups, "_pendientes", set())
+    return leidas, pendientes
+
+
+def test_pendientes_se_releen_cada_ttl(lecturas, monkeypatch):
+    leidas, pendientes = lecturas
+    reloj = [100.0]
+    monkeypatch.setattr(rollups.time, "monotonic", lambda: reloj[0])
+    assert rollups.rollup_pendiente(PERFIL)
+    assert not rollups.rollup_pendiente(ESTADISTICA)
+    assert len(leidas) == 1
+
+    pendientes.clear()          # el relleno terminó
+    assert rollups.rollup_pendiente(PERFIL)
+    reloj[0] += rollups.TTL_PENDIENTES
+    assert not rollups.rollup_pendiente(PERFIL)
+    assert len(leidas) == 2
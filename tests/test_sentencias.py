@@ -0,0 +1,73 @@
+import pytest
+from psycopg2 import errors, extensions
+
+from core.db import sentencias
+from core.db.sentencias import _a_posicionales, registrar_sentencia, ejecutar_preparada
+
+
+@pytest.mark.parametrize("sql, esperado, n", [
+    ("SELECT * FROM t WHERE a = %s AND b = %s", "SELECT * FROM t WHERE a = $1 AND b = $2", 2),
+    ("SELECT * FROM t WHERE a LIKE %s || '%%'", "SELECT * FROM t WHERE a LIKE $1 || '%'", 1),
+    ("SELECT 10 %% 3", "SELECT 10 % 3", 0),
+    ("SELECT * FROM t WHERE a LIKE 'x%'", "SELECT * FROM t WHERE a LIKE 'x%'", 0),
+])
+def test_placeholders(sql, esperado, n):
+    assert _a_posicionales(sql) == (esperado, n)
+
+
+def test_placeholder_con_nombre_no_se_admite():
+    with pytest.raises(ValueError):
+        _a_posicionales("SELECT %(x)s")
+
+
+class _Conexion:
+    def __init__(self):
+        self.estado = extensions.TRANSACTION_STATUS_IDLE
+        self.servidor = set()     # sentencias preparadas del lado del servidor
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.estado
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.estado = extensions.TRANSACTION_STATUS_IDLE
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self.ejecutadas = []
+
+    def execute(self, sql, params=None):
+        self.ejecutadas.append(sql)
+        self.connection.estado = extensions.TRANSACTION_STATUS_INTRANS
+        if sql.startswith("PREPARE "):
+            self.connection.servidor.add(sql.split()[1])
+        elif sql.startswith("EXECUTE ") and sql.split()[1] not in self.connection.servidor:
+            raise errors.InvalidSqlStatementName("no existe")
+
+
+def _sentencia_que_el_servidor_perdio():
+    nombre = registrar_sentencia("prueba_reintento", "SELECT * FROM t WHERE a = %s")
+    conn = _Conexion()
+    cur = _Cursor(conn)
+    sentencias._preparadas[id(conn)] = {nombre}   # el registro cree que está, el servidor no
+    return nombre, conn, cur
+
+
+def test_reintenta_tras_el_preambulo_de_la_lectura():
+    nombre, conn, cur = _sentencia_que_el_servidor_perdio()
+    preambulo = lambda c: c.execute("SET LOCAL statement_timeout = 1000;")
+    preambulo(cur)
+    ejecutar_preparada(cur, nombre, (1,), preambulo=preambulo)
+    assert conn.rollbacks == 1
+    assert cur.ejecutadas[-3:] == ["SET LOCAL statement_timeout = 1000;", f"PREPARE {nombre} AS SELECT * FROM t WHERE a = $1", f"EXECUTE {nombre} (%s)"]
+
+
+def test_sin_preambulo_no_deshace_trabajo_del_llamador():
+    nombre, conn, cur = _sentencia_que_el_servidor_perdio()
+    cur.execute("INSERT INTO t VALUES (1)")
+    with pytest.raises(errors.InvalidSqlStatementName):
+        ejecutar_preparada(cur, nombre, (1,))
+    assert conn.rollbacks == 0